@@ -5,16 +5,16 @@ import time
 
 sizes ={
     'i08': (1, 960, 960),
-    'i13': (1, 13408, 13408),  
-    'i14_1': (1, 8160, 8160),  
-    'i14_2': (1, 3360, 3360), 
+    'i13': (1, 13408, 13408),
+    'i14_1': (1, 8160, 8160),
+    'i14_2': (1, 3360, 3360),
 }
 
 def run_benchmark(shape):
     megabytes = np.prod(shape) * 8 / 1024 / 1024 * 2
 
     data = np.zeros(shape, dtype=np.complex64)
-    
+
     # average 5 runs
     duration = 0
     for n in range(5):
@@ -29,14 +29,56 @@ def run_benchmark(shape):
 
     return megabytes, duration
 
+def compute(work):
+    # stand-in for the normalization of the object while the probe is reduced
+    np.abs(work, out=work.real)
+
+def run_overlap_benchmark(shape):
+    """
+    Time the two reductions followed by some computation, once with
+    blocking reductions and once with the computation overlapping
+    the non-blocking reductions.
+    """
+    obb = np.zeros(shape, dtype=np.complex64)
+    obn = np.zeros(shape, dtype=np.complex64)
+    work = np.ones(shape, dtype=np.complex64)
+
+    # average 5 runs
+    blocking = 0
+    overlapped = 0
+    for n in range(5):
+        parallel.barrier()
+        t1 = time.perf_counter()
+        parallel.allreduce(obb)
+        parallel.allreduce(obn)
+        compute(work)
+        t2 = time.perf_counter()
+        blocking += t2-t1
+
+        parallel.barrier()
+        t1 = time.perf_counter()
+        requests = [parallel.iallreduce(obb), parallel.iallreduce(obn)]
+        compute(work)
+        parallel.waitall(requests)
+        t2 = time.perf_counter()
+        overlapped += t2-t1
+    blocking /= 5
+    overlapped /= 5
+
+    blocking = parallel.allreduce(blocking, MPI.MAX)
+    overlapped = parallel.allreduce(overlapped, MPI.MAX)
+
+    return blocking, overlapped
+
 res = []
 
 for name,sz in sizes.items():
     mb, dur = run_benchmark(sz)
-    res.append([name, dur, mb, mb/dur])
+    blocking, overlapped = run_overlap_benchmark(sz)
+    res.append([name, dur, mb, mb/dur, blocking, overlapped, blocking/overlapped])
 
 if parallel.rank == 0:
     print('Final results for {} processes'.format(parallel.size))
-    print(','.join(['Name', 'Duration', 'MB', 'MB/s']))
+    print(','.join(['Name', 'Duration', 'MB', 'MB/s', 'Blocking', 'Overlapped', 'Speedup']))
     for r in res:
         print(','.join([str(x) for x in r]))
@@ -15,7 +15,7 @@ import numpy as np
 import time
 
 from ptypy.engines.ML import ML, BaseModel
-from .projectional_serial import serialize_array_access
+from .projectional_serial import AddressTable, ObjectReduction, KernelBackendMixin, FrameBatchMixin, _object_frames
 from ptypy import utils as u
 from ptypy.utils.verbose import logger, log
 from ptypy.utils import parallel
@@ -29,7 +29,7 @@ from ptypy.accelerate.base.array_utils import complex_gaussian_filter, complex_g
 __all__ = ['ML_serial']
 
 @register()
-class ML_serial(ML):
+class ML_serial(ML, KernelBackendMixin, FrameBatchMixin):
 
     """
     Defaults:
@@ -38,6 +38,19 @@ class ML_serial(ML):
     default = convolution
     type = str
     help = Method to be used for smoothing the gradient, choose between ```convolution``` or ```fft```.
+
+    [reduce_bbox]
+    default = False
+    type = bool
+    help = Only reduce the bounding box of the object gradient touched by the views of any rank
+    doc = The object gradient vanishes outside of the pixels touched by the views, so only their bounding box over all ranks is summed across MPI ranks.
+
+    [reduce_precision]
+    default = None
+    type = str
+    help = Transmit the MPI reduction of the object gradient at reduced precision
+    doc = If 'float16' or 'bfloat16', the object gradient is summed across MPI ranks as 16-bit floats. The quantization error of every rank is fed back into its next reduction. If None, the full precision is transmitted.
+    choices = [None, 'float16', 'bfloat16']
     """
 
     def __init__(self, ptycho_parent, pars=None):
@@ -46,11 +59,23 @@ class ML_serial(ML):
         """
         super(ML_serial, self).__init__(ptycho_parent, pars)
 
+        # The serialized models only provide the quadratic line coefficients
+        if self.p.poly_line_coeffs == "all":
+            logger.warning("poly_line_coeffs = 'all' is not supported by %s, using 'quadratic' instead."
+                           % type(self).__name__)
+            self.p.poly_line_coeffs = "quadratic"
+
         self.kernels = {}
         self.diff_info = {}
+        self.addr_tables = {}
         self.cn2_ob_grad = 0.
         self.cn2_pr_grad = 0.
 
+        # Reduced object gradient reductions
+        self.ob_reduction = None
+        if self.p.reduce_bbox or self.p.reduce_precision:
+            self.ob_reduction = ObjectReduction(self.p.reduce_bbox, self.p.reduce_precision)
+
     def engine_initialize(self):
         """
         Prepare for ML reconstruction.
@@ -64,9 +89,9 @@ class ML_serial(ML):
         if self.p.ML_type.lower() == "gaussian":
             self.ML_model = GaussianModel(self)
         elif self.p.ML_type.lower() == "poisson":
-            raise NotImplementedError('Poisson norm model not yet implemented')
+            self.ML_model = PoissonModel(self)
         elif self.p.ML_type.lower() == "euclid":
-            raise NotImplementedError('Euclid norm model not yet implemented')
+            self.ML_model = EuclidModel(self)
         else:
             raise RuntimeError("Unsupported ML_type: '%s'" % self.p.ML_type)
 
@@ -93,8 +118,12 @@ class ML_serial(ML):
             except:
                 nmodes = 1
 
+            # frames are processed in batches of at most this size,
+            # through the propagated exit and the two line directions
+            kern.batch = self._frames_per_batch(fpc, nmodes, geo.shape, 3)
+
             # create buffer arrays
-            ash = (fpc * nmodes,) + tuple(geo.shape)
+            ash = (kern.batch * nmodes,) + tuple(geo.shape)
             aux = np.zeros(ash, dtype=np.complex64)
             kern.aux = aux
             kern.a = np.zeros(ash, dtype=np.complex64)
@@ -104,11 +133,7 @@ class ML_serial(ML):
             kern.GDK = GradientDescentKernel(aux, nmodes)
             kern.GDK.allocate()
 
-            kern.POK = PoUpdateKernel()
-            kern.POK.allocate()
-
-            kern.AWK = AuxiliaryWaveKernel()
-            kern.AWK.allocate()
+            self._setup_po_kernels(kern)
 
             kern.FW = geo.propagator.fw
             kern.BW = geo.propagator.bw
@@ -131,25 +156,26 @@ class ML_serial(ML):
             # they get overridden if self.p.floating_intensities=True
             prep.float_intens_coeff = np.ones((d.data.shape[0],), dtype=np.float32)
 
-        # Unfortunately this needs to be done for all pods, since
-        # the shape of the probe / object was modified.
-        # TODO: possible scaling issue
+        # Only the addresses of new views are computed, existing ones are
+        # patched if the shape of the probe / object was modified.
         for label, d in self.di.storages.items():
             prep = self.diff_info[d.ID]
-            prep.view_IDs, prep.poe_IDs, prep.addr = serialize_array_access(d)
+            if d.ID not in self.addr_tables:
+                self.addr_tables[d.ID] = AddressTable(d)
+            prep.view_IDs, prep.poe_IDs, prep.addr = self.addr_tables[d.ID].serialize()
             # Re-create exit addresses when gradient models (single exit buffer per view) are used
             # TODO: this should not be necessary, kernels should not use exit wave information
             if self.kernels[prep.label].scanmodel in ("GradFull", "BlockGradFull"):
-                for i,addr in enumerate(prep.addr):
-                    nmodes = len(addr[:,2,0])
-                    for j,ea in enumerate(addr[:,2,0]):
-                        prep.addr[i,j,2,0] = i*nmodes+j
+                nviews, nmodes = prep.addr.shape[:2]
+                prep.addr[:,:,2,0] = np.arange(nviews * nmodes).reshape(nviews, nmodes)
             prep.I = d.data
             if self.do_position_refinement:
                 prep.original_addr = np.zeros_like(prep.addr)
                 prep.original_addr[:] = prep.addr
                 prep.ma = self.ma.S[d.ID].data
 
+        if self.fw_cache is not None:
+            self.fw_cache.invalidate()
         self.ML_model.prepare()
 
     def _get_smooth_gradient(self, data, sigma):
@@ -200,7 +226,8 @@ class ML_serial(ML):
         ta = time.time()
         for it in range(num):
             t1 = time.time()
-            error_dct = self.ML_model.new_grad()
+            with u.profiler.region('new_grad'):
+                error_dct = self.ML_model.new_grad()
             tg += time.time() - t1
 
             cn2_new_pr_grad, cdotr_pr_grad = self._replace_pr_grad()
@@ -222,57 +249,46 @@ class ML_serial(ML):
             else:
                 self.scale_p_o = self.p.scale_probe_object
 
-            ############################
-            # Compute next conjugate
-            ############################
-            if self.curiter == 0:
-                bt = 0.
+            if self.lbfgs is not None:
+                self._lbfgs_direction()
             else:
-                bt_num = (self.scale_p_o * (cn2_new_pr_grad - cdotr_pr_grad) + (cn2_new_ob_grad - cdotr_ob_grad))
+                ############################
+                # Compute next conjugate
+                ############################
+                if self.curiter == 0:
+                    bt = 0.
+                else:
+                    bt_num = (self.scale_p_o * (cn2_new_pr_grad - cdotr_pr_grad) + (cn2_new_ob_grad - cdotr_ob_grad))
 
-                bt_denom = self.scale_p_o * self.cn2_pr_grad + self.cn2_ob_grad
+                    bt_denom = self.scale_p_o * self.cn2_pr_grad + self.cn2_ob_grad
 
-                bt = max(0, bt_num / bt_denom)
+                    bt = max(0, bt_num / bt_denom)
 
-            # logger.info('Polak-Ribiere coefficient: %f ' % bt)
+                # logger.info('Polak-Ribiere coefficient: %f ' % bt)
 
-            self.cn2_ob_grad = cn2_new_ob_grad
-            self.cn2_pr_grad = cn2_new_pr_grad
+                dt = self.ptycho.FType
+                # 3. Next conjugate
+                self.ob_h *= dt(bt / self.tmin)
 
-            dt = self.ptycho.FType
-            # 3. Next conjugate
-            self.ob_h *= dt(bt / self.tmin)
+                # Smoothing preconditioner
+                if self.smooth_gradient:
+                    for name, s in self.ob_h.storages.items():
+                        s.data[:] -= self._get_smooth_gradient(self.ob_grad.storages[name].data, self.smooth_gradient.sigma)
+                else:
+                    self.ob_h -= self.ob_grad
 
-            # Smoothing preconditioner
-            if self.smooth_gradient:
-                for name, s in self.ob_h.storages.items():
-                    s.data[:] -= self._get_smooth_gradient(self.ob_grad.storages[name].data, self.smooth_gradient.sigma)
-            else:
-                self.ob_h -= self.ob_grad
+                self.pr_h *= dt(bt / self.tmin)
+                self.pr_grad *= dt(self.scale_p_o)
+                self.pr_h -= self.pr_grad
 
-            self.pr_h *= dt(bt / self.tmin)
-            self.pr_grad *= dt(self.scale_p_o)
-            self.pr_h -= self.pr_grad
+            self.cn2_ob_grad = cn2_new_ob_grad
+            self.cn2_pr_grad = cn2_new_pr_grad
 
-            # In principle, the way things are now programmed this part
-            # could be iterated over in a real Newton-Raphson style.
+            # Line minimization, moves object and probe
             t2 = time.time()
-            B = self.ML_model.poly_line_coeffs(self.ob_h, self.pr_h)
+            self.tmin = self._line_search()
             tc += time.time() - t2
 
-            if np.isinf(B).any() or np.isnan(B).any():
-                logger.warning(
-                    'Warning! inf or nan found! Trying to continue...')
-                B[np.isinf(B)] = 0.
-                B[np.isnan(B)] = 0.
-
-            self.tmin = dt(-.5 * B[1] / B[2])
-            self.ob_h *= self.tmin
-            self.pr_h *= self.tmin
-            self.ob += self.ob_h
-            self.pr += self.pr_h
-            # Newton-Raphson loop would end here
-
             # Refine the scan positions
             self.position_update()
 
@@ -309,12 +325,6 @@ class ML_serial(ML):
                 pr = self.pr.S[pID].data
                 kern = self.kernels[prep.label]
                 aux = kern.aux
-                addr = prep.addr
-                original_addr = prep.original_addr
-                mangled_addr = addr.copy()
-                w = prep.weights
-                I = prep.I
-                err_phot = prep.err_phot
 
                 PCK = kern.PCK
                 FW = kern.FW
@@ -323,24 +333,43 @@ class ML_serial(ML):
                 max_oby = ob.shape[-2] - aux.shape[-2] - 1
                 max_obx = ob.shape[-1] - aux.shape[-1] - 1
 
-                # We need to re-calculate the current error
-                PCK.build_aux(aux, addr, ob, pr)
-                aux[:] = FW(aux)
-                PCK.log_likelihood_ml(aux, addr, I, w, err_phot)
-                error_state = np.zeros_like(err_phot)
-                error_state[:] = err_phot
-                PCK.mangler.setup_shifts(self.curiter, nframes=addr.shape[0])
-
-                log(4, 'Position refinement trial: iteration %s' % (self.curiter))
-                for i in range(PCK.mangler.nshifts):
-                    PCK.mangler.get_address(i, addr, mangled_addr, max_oby, max_obx)
-                    PCK.build_aux(aux, mangled_addr, ob, pr)
-                    aux[:] = FW(aux)
-                    PCK.log_likelihood_ml(aux, mangled_addr, I, w, err_phot)
-                    PCK.update_addr_and_error_state(addr, error_state, mangled_addr, err_phot)
+                error_state = np.zeros_like(prep.err_phot)
+
+                # frames are processed in batches through the same aux buffer
+                for a, b in self._frame_batches(prep):
+                    addr = prep.addr[a:b]
+                    w = prep.weights[a:b]
+                    I = prep.I[a:b]
+                    err_phot = prep.err_phot[a:b]
+
+                    # We need to re-calculate the current error
+                    PCK.build_aux(aux, addr, ob, pr)
+                    FW(aux, out=aux)
+                    PCK.log_likelihood_ml(aux, addr, I, w, err_phot)
+                    error_state[a:b] = err_phot
+                    PCK.mangler.setup_shifts(self.curiter, nframes=addr.shape[0])
+
+                    # Several shifts are evaluated at once with one stacked FFT
+                    nshifts = PCK.mangler.nshifts
+                    nbatch = PCK.batch_size(nshifts, self.p.position_refinement.batch_memory)
+                    PCK.allocate_batch(nbatch, aux.dtype)
+                    baux = aux if nbatch == 1 else PCK.npy.aux_batch
+                    mangled_addr = np.repeat(addr[None], nbatch, axis=0)
+
+                    log(4, 'Position refinement trial: iteration %s' % (self.curiter))
+                    for i in range(0, nshifts, nbatch):
+                        nb = min(nbatch, nshifts - i)
+                        for j in range(nb):
+                            PCK.mangler.get_address(i + j, addr, mangled_addr[j], max_oby, max_obx)
+                        flat_addr = mangled_addr[:nb].reshape((-1,) + addr.shape[1:])
+                        err = PCK.npy.err_batch[:nb, :addr.shape[0]]
+                        PCK.build_aux(baux, flat_addr, ob, pr)
+                        aux_b = baux[:flat_addr.shape[0] * flat_addr.shape[1]]
+                        FW(aux_b, out=aux_b)
+                        PCK.log_likelihood_ml_batched(aux_b, I, w, err)
+                        PCK.update_addr_and_error_state_batched(addr, error_state[a:b], mangled_addr[:nb], err)
 
                 prep.err_phot = error_state
-                prep.addr = addr
 
     def engine_finalize(self):
         """
@@ -350,11 +379,8 @@ class ML_serial(ML):
             for label, d in self.di.storages.items():
                 prep = self.diff_info[d.ID]
                 res = self.kernels[prep.label].resolution
-                for i,view in enumerate(d.views):
-                    for j,(pname, pod) in enumerate(view.pods.items()):
-                        delta = (prep.addr[i][j][1][1:] - prep.original_addr[i][j][1][1:]) * res
-                        pod.ob_view.coord += delta
-                        pod.ob_view.storage.update_views(pod.ob_view)
+                delta = (prep.addr[:, :, 1, 1:] - prep.original_addr[:, :, 1, 1:]) * res
+                self.addr_tables[d.ID].move_object_views(delta)
             self.ptycho.record_positions = True
 
         # Save floating intensities into runtime
@@ -363,12 +389,21 @@ class ML_serial(ML):
             prep = self.diff_info[d.ID]
             float_intens_coeff[label] = prep.float_intens_coeff
         self.ptycho.runtime["float_intens"] = parallel.gather_dict(float_intens_coeff)
+
+        if self.ob_reduction is not None:
+            self.ob_reduction.log_stats()
         super().engine_finalize()
 
 
 class BaseModelSerial(BaseModel):
     """
     Base class for log-likelihood models.
+
+    The gradient and the line coefficients are computed in batches of
+    frames, see :py:meth:`ML_serial._frame_batches`. Subclasses implement
+    the noise-model specific Fourier space parts in
+    :py:meth:`_fourier_gradient`, :py:meth:`_line_coeffs` and
+    :py:meth:`_brenorm`.
     """
 
     def __del__(self):
@@ -377,37 +412,40 @@ class BaseModelSerial(BaseModel):
         """
         pass
 
-
-class GaussianModel(BaseModelSerial):
-    """
-    Gaussian noise model.
-    TODO: feed actual statistical weights instead of using the Poisson statistic heuristic.
-    """
-
-    def __init__(self, MLengine):
+    def _batch_addr(self, prep, a, b):
         """
-        Core functions for ML computation using a Gaussian model.
+        Addresses of the frames `a` to `b` of `prep`, the exit wave of the
+        gradient kernels is the aux buffer of the batch.
         """
-        super(GaussianModel, self).__init__(MLengine)
-
-    def prepare(self):
+        addr = prep.addr[a:b].copy()
+        nmodes = addr.shape[1]
+        addr[:, :, 2, :] = 0
+        addr[:, :, 2, 0] = np.arange((b - a) * nmodes).reshape(b - a, nmodes)
+        return addr
 
-        super(GaussianModel, self).prepare()
+    def _fourier_gradient(self, GDK, aux, addr, prep, sl=slice(None)):
+        """
+        Replace the propagated exit waves in `aux` by the Fourier space
+        gradient of the frames `sl` of `prep` and store their error in
+        ``prep.err_phot``.
+        """
+        raise NotImplementedError
 
-        for label, d in self.engine.ptycho.new_data:
-            prep = self.engine.diff_info[d.ID]
-            prep.weights = (self.Irenorm * self.engine.ma.S[d.ID].data
-                            / (1. / self.Irenorm + d.data)).astype(d.data.dtype)
+    def _line_coeffs(self, GDK, f, a, b, addr, prep, Brenorm, B, sl=slice(None)):
+        """
+        Add the line coefficients of the frames `sl` of `prep` to `B`.
+        """
+        raise NotImplementedError
 
-    def __del__(self):
+    def _brenorm(self):
         """
-        Clean up routine
+        Renormalisation of the line coefficients.
         """
-        super(GaussianModel, self).__del__()
+        return 1. / self.LL[0] ** 2
 
     def new_grad(self):
         """
-        Compute a new gradient direction according to a Gaussian noise model.
+        Compute a new gradient direction according to the noise model.
 
         Note: The negative log-likelihood and local errors are also computed
         here.
@@ -437,36 +475,40 @@ class GaussianModel(BaseModelSerial):
             FW = kern.FW
             BW = kern.BW
 
-            # get addresses and auxilliary array
-            addr = prep.addr
-            w = prep.weights
-            err_phot = prep.err_phot
-            fic = prep.float_intens_coeff
-
             # local references
             ob = self.engine.ob.S[oID].data
             obg = ob_grad.S[oID].data
             pr = self.engine.pr.S[pID].data
             prg = pr_grad.S[pID].data
-            I = prep.I
 
-            # make propagated exit (to buffer)
-            AWK.build_aux_no_ex(aux, addr, ob, pr, add=False)
+            # frames are processed in batches through the same aux buffer
+            for a, b in self.engine._frame_batches(prep):
+                addr = self._batch_addr(prep, a, b)
 
-            # forward prop
-            aux[:] = FW(aux)
+                # make propagated exit (to buffer)
+                AWK.build_aux_no_ex(aux, addr, ob, pr, add=False)
 
-            GDK.make_model(aux, addr)
+                # forward prop
+                FW(aux, out=aux)
+                if self.engine.fw_cache is not None:
+                    self.engine.fw_cache.put((dID, a), aux[:(b - a) * addr.shape[1]])
 
-            if self.p.floating_intensities:
-                GDK.floating_intensity(addr, w, I, fic)
+                self._fourier_gradient(GDK, aux, addr, prep, slice(a, b))
+                BW(aux, out=aux)
 
-            GDK.main(aux, addr, w, I)
-            GDK.error_reduce(addr, err_phot)
-            aux[:] = BW(aux)
+                POK.ob_update_ML(addr, obg, pr, aux)
+                POK.pr_update_ML(addr, prg, ob, aux)
 
-            POK.ob_update_ML(addr, obg, pr, aux)
-            POK.pr_update_ML(addr, prg, ob, aux)
+        # MPI reduction of gradients, overlapped with the error
+        # bookkeeping and the regularizer
+        reduction = self.engine.ob_reduction
+        if reduction is None:
+            requests = ob_grad.allreduce_async() + pr_grad.allreduce_async()
+        else:
+            requests = pr_grad.allreduce_async()
+            for oID, s in ob_grad.storages.items():
+                lo, hi = reduction.touched_box(_object_frames(self.engine.diff_info, self.engine.pr, oID), s.shape)
+                reduction.reduce((oID, 'grad'), s.data, lo, hi)
 
         for dID, prep in self.engine.diff_info.items():
             err_phot = prep.err_phot
@@ -477,17 +519,19 @@ class GaussianModel(BaseModelSerial):
             errs = np.ascontiguousarray(np.vstack([err_fourier, err_phot, err_exit]).T)
             error_dct.update(zip(prep.view_IDs, errs))
 
-        # MPI reduction of gradients
-        ob_grad.allreduce()
-        pr_grad.allreduce()
         parallel.allreduce(LL)
 
         # Object regularizer
+        reg_grad = {}
         if self.regularizer:
             for name, s in self.engine.ob.storages.items():
-                ob_grad.storages[name].data += self.regularizer.grad(s.data)
+                reg_grad[name] = self.regularizer.grad(s.data)
                 LL += self.regularizer.LL
 
+        parallel.waitall(requests)
+        for name, g in reg_grad.items():
+            ob_grad.storages[name].data += g
+
         self.LL = LL / self.tot_measpts
         return error_dct
 
@@ -498,7 +542,7 @@ class GaussianModel(BaseModelSerial):
         """
 
         B = np.zeros((3,), dtype=np.longdouble)
-        Brenorm = 1. / self.LL[0] ** 2
+        Brenorm = self._brenorm()
 
         # Outer loop: through diffraction patterns
         for dID in self.di.S.keys():
@@ -512,37 +556,48 @@ class GaussianModel(BaseModelSerial):
             GDK = kern.GDK
             AWK = kern.AWK
 
-            f = kern.aux
-            a = kern.a
-            b = kern.b
-
             FW = kern.FW
 
-            # get addresses and auxilliary array
-            addr = prep.addr
-            w = prep.weights
-            fic = prep.float_intens_coeff
-
             # local references
             ob = self.ob.S[oID].data
             ob_h = c_ob_h.S[oID].data
             pr = self.pr.S[pID].data
             pr_h = c_pr_h.S[pID].data
-            I = self.di.S[dID].data
-
-            # make propagated exit (to buffer)
-            AWK.build_aux_no_ex(f, addr, ob, pr, add=False)
-            AWK.build_aux_no_ex(a, addr, ob_h, pr, add=False)
-            AWK.build_aux_no_ex(a, addr, ob, pr_h, add=True)
-            AWK.build_aux_no_ex(b, addr, ob_h, pr_h, add=False)
-
-            # forward prop
-            f[:] = FW(f)
-            a[:] = FW(a)
-            b[:] = FW(b)
+            cache = self.engine.fw_cache
+
+            # frames are processed in batches through the same buffers
+            for i0, i1 in self.engine._frame_batches(prep):
+                addr = self._batch_addr(prep, i0, i1)
+                a = kern.a
+                b = kern.b
+
+                # propagated exit and directions, if cached
+                f = None
+                ab = None
+                if cache is not None:
+                    f = cache.get((dID, i0))
+                    ab = cache.get_line((dID, i0))
+                if f is None:
+                    f = kern.aux
+                    AWK.build_aux_no_ex(f, addr, ob, pr, add=False)
+                    FW(f, out=f)
+
+                if ab is None:
+                    # make propagated exit (to buffer)
+                    AWK.build_aux_no_ex(a, addr, ob_h, pr, add=False)
+                    AWK.build_aux_no_ex(a, addr, ob, pr_h, add=True)
+                    AWK.build_aux_no_ex(b, addr, ob_h, pr_h, add=False)
+
+                    # forward prop
+                    FW(a, out=a)
+                    FW(b, out=b)
+                    if cache is not None:
+                        n = (i1 - i0) * addr.shape[1]
+                        cache.put_line((dID, i0), a[:n], b[:n])
+                else:
+                    a, b = ab
 
-            GDK.make_a012(f, a, b, addr, I, fic)
-            GDK.fill_b(addr, Brenorm, w, B)
+                self._line_coeffs(GDK, f, a, b, addr, prep, Brenorm, B, slice(i0, i1))
 
         parallel.allreduce(B)
 
@@ -555,3 +610,141 @@ class GaussianModel(BaseModelSerial):
         self.B = B
 
         return B
+
+
+class GaussianModel(BaseModelSerial):
+    """
+    Gaussian noise model.
+    TODO: feed actual statistical weights instead of using the Poisson statistic heuristic.
+    """
+
+    def __init__(self, MLengine):
+        """
+        Core functions for ML computation using a Gaussian model.
+        """
+        super(GaussianModel, self).__init__(MLengine)
+
+    def prepare(self):
+
+        super(GaussianModel, self).prepare()
+
+        for label, d in self.engine.ptycho.new_data:
+            prep = self.engine.diff_info[d.ID]
+            prep.weights = (self.Irenorm * self.engine.ma.S[d.ID].data
+                            / (1. / self.Irenorm + d.data)).astype(d.data.dtype)
+
+    def __del__(self):
+        """
+        Clean up routine
+        """
+        super(GaussianModel, self).__del__()
+
+    def _fourier_gradient(self, GDK, aux, addr, prep, sl=slice(None)):
+        w = prep.weights[sl]
+        I = prep.I[sl]
+
+        GDK.make_model(aux, addr)
+
+        if self.p.floating_intensities:
+            GDK.floating_intensity(addr, w, I, prep.float_intens_coeff[sl])
+
+        GDK.main(aux, addr, w, I)
+        GDK.error_reduce(addr, prep.err_phot[sl])
+
+    def _line_coeffs(self, GDK, f, a, b, addr, prep, Brenorm, B, sl=slice(None)):
+        GDK.make_a012(f, a, b, addr, prep.I[sl], prep.float_intens_coeff[sl])
+        GDK.fill_b(addr, Brenorm, prep.weights[sl], B)
+
+
+class PoissonModel(BaseModelSerial):
+    """
+    Poisson noise model.
+    """
+
+    def __init__(self, MLengine):
+        """
+        Core functions for ML computation using a Poisson model.
+        """
+        super(PoissonModel, self).__init__(MLengine)
+
+    def prepare(self):
+
+        super(PoissonModel, self).prepare()
+        from scipy import special
+
+        for label, d in self.engine.ptycho.new_data:
+            prep = self.engine.diff_info[d.ID]
+            prep.weights = self.engine.ma.S[d.ID].data.astype(d.data.dtype)
+            prep.LLbase = special.gammaln(d.data + 1).sum(-1).sum(-1)
+
+    def __del__(self):
+        """
+        Clean up routine
+        """
+        super(PoissonModel, self).__del__()
+
+    def _brenorm(self):
+        return 1. / (self.tot_measpts * self.LL[0]) ** 2
+
+    def _fourier_gradient(self, GDK, aux, addr, prep, sl=slice(None)):
+        m = prep.weights[sl]
+        I = prep.I[sl]
+        err_phot = prep.err_phot[sl]
+
+        GDK.make_model(aux, addr)
+
+        if self.p.floating_intensities:
+            GDK.floating_intensity_unweighted(addr, I, prep.float_intens_coeff[sl])
+
+        GDK.main_poisson(aux, addr, m, I)
+        GDK.error_reduce(addr, err_phot)
+        err_phot += prep.LLbase[sl]
+
+    def _line_coeffs(self, GDK, f, a, b, addr, prep, Brenorm, B, sl=slice(None)):
+        GDK.make_a012_model(f, a, b, addr, prep.float_intens_coeff[sl])
+        GDK.fill_b_poisson(addr, Brenorm, prep.weights[sl], prep.I[sl], prep.LLbase[sl], B)
+
+
+class EuclidModel(BaseModelSerial):
+    """
+    Euclidean (Amplitude) noise model.
+    TODO: feed actual statistical weights instead of using a fixed variance.
+    """
+
+    def __init__(self, MLengine):
+        """
+        Core functions for ML computation using a Euclidean model.
+        """
+        super(EuclidModel, self).__init__(MLengine)
+
+    def prepare(self):
+
+        super(EuclidModel, self).prepare()
+
+        for label, d in self.engine.ptycho.new_data:
+            prep = self.engine.diff_info[d.ID]
+            # just the mask for now, as in the python engine
+            prep.weights = self.engine.ma.S[d.ID].data.astype(d.data.dtype)
+            prep.A = np.sqrt(d.data)
+
+    def __del__(self):
+        """
+        Clean up routine
+        """
+        super(EuclidModel, self).__del__()
+
+    def _fourier_gradient(self, GDK, aux, addr, prep, sl=slice(None)):
+        w = prep.weights[sl]
+        A = prep.A[sl]
+
+        GDK.make_amplitude_model(aux, addr)
+
+        if self.p.floating_intensities:
+            GDK.floating_intensity_unweighted(addr, A, prep.float_intens_coeff[sl])
+
+        GDK.main_euclid(aux, addr, w, A)
+        GDK.error_reduce(addr, prep.err_phot[sl])
+
+    def _line_coeffs(self, GDK, f, a, b, addr, prep, Brenorm, B, sl=slice(None)):
+        GDK.make_a012_model(f, a, b, addr, prep.float_intens_coeff[sl])
+        GDK.fill_b_euclid(addr, Brenorm, prep.weights[sl], prep.A[sl], B)
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-threaded Maximum Likelihood reconstruction engine.
+
+This file is part of the PTYPY package.
+
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from ptypy import utils as u
+from ptypy.utils.verbose import logger, log
+from ptypy.utils import parallel
+from ptypy.engines import register
+from ptypy.accelerate.base.kernels import GradientDescentKernel
+from .ML_serial import ML_serial, GaussianModel, PoissonModel, EuclidModel
+from .projectional_threaded import get_num_threads, split_tiles
+
+__all__ = ['ML_threaded']
+
+
+@register()
+class ML_threaded(ML_serial):
+
+    """
+    Multi-threaded version of ML_serial.
+
+    Defaults:
+
+    [name]
+    default = ML_threaded
+    type = str
+    help =
+    doc =
+
+    [num_threads]
+    default = None
+    type = int
+    lowlim = 1
+    help = Number of threads, if None use all cores available to this process
+    """
+
+    def __init__(self, ptycho_parent, pars=None):
+        """
+        Maximum likelihood reconstruction engine.
+        """
+        super(ML_threaded, self).__init__(ptycho_parent, pars)
+        self.nthreads = get_num_threads(self.p.num_threads)
+        self.pool = None
+
+        # thread-local accumulation buffers for the gradients
+        self.obg_acc = None
+        self.prg_acc = None
+
+    def engine_initialize(self):
+        """
+        Prepare for ML reconstruction.
+        """
+        self.pool = ThreadPoolExecutor(max_workers=self.nthreads)
+        super(ML_threaded, self).engine_initialize()
+
+    def _initialize_model(self):
+
+        # Create noise model
+        if self.p.ML_type.lower() == "gaussian":
+            self.ML_model = GaussianModelThreaded(self)
+        elif self.p.ML_type.lower() == "poisson":
+            self.ML_model = PoissonModelThreaded(self)
+        elif self.p.ML_type.lower() == "euclid":
+            self.ML_model = EuclidModelThreaded(self)
+        else:
+            super(ML_threaded, self)._initialize_model()
+
+    def _setup_kernels(self):
+        """
+        Setup kernels, one for each scan and thread.
+        """
+        super(ML_threaded, self)._setup_kernels()
+        for label, scan in self.ptycho.model.scans.items():
+            kern = self.kernels[label]
+            nmodes = kern.GDK.nmodes
+            fpc = scan.max_frames_per_block
+
+            # tiles are not larger than the frame batch of the serial engine
+            kern.tsize = min(-(-fpc // self.nthreads), kern.batch)
+            ash = (kern.tsize * nmodes,) + kern.aux.shape[1:]
+
+            # the line directions are only computed in the thread buffers
+            kern.a = None
+            kern.b = None
+
+            # buffers and gradient kernel per thread
+            kern.tiles = []
+            for t in range(self.nthreads):
+                tk = u.Param()
+                tk.aux = np.zeros(ash, dtype=kern.aux.dtype)
+                tk.a = np.zeros(ash, dtype=kern.aux.dtype)
+                tk.b = np.zeros(ash, dtype=kern.aux.dtype)
+                tk.GDK = GradientDescentKernel(tk.aux, nmodes)
+                tk.GDK.allocate()
+                kern.tiles.append(tk)
+
+    def engine_prepare(self):
+
+        super(ML_threaded, self).engine_prepare()
+
+        for label, d in self.di.storages.items():
+            prep = self.diff_info[d.ID]
+            nframes = prep.addr.shape[0]
+            ntiles = max(self.nthreads, -(-nframes // self.kernels[prep.label].tsize))
+            prep.tiles = split_tiles(nframes, ntiles)
+
+        # (Re-)allocate the accumulation buffers, the storages may have been reformatted
+        self.obg_acc = [{oID: np.zeros_like(s.data) for oID, s in self.ob.storages.items()}
+                        for t in range(self.nthreads)]
+        self.prg_acc = [{pID: np.zeros_like(s.data) for pID, s in self.pr.storages.items()}
+                        for t in range(self.nthreads)]
+
+    def _run_threads(self, func, *args):
+        """
+        Run func(t, *args) for every thread index t and return the results.
+        """
+        futures = [self.pool.submit(func, t, *args) for t in range(self.nthreads)]
+        return [f.result() for f in futures]
+
+    def engine_finalize(self):
+        """
+        Shut down the thread pool and release the thread-local buffers.
+        """
+        super(ML_threaded, self).engine_finalize()
+        self.pool.shutdown()
+        self.pool = None
+        self.obg_acc = None
+        self.prg_acc = None
+
+
+class _ThreadedModel(object):
+    """
+    Mixin for the serial noise models, frames are processed in tiles on a
+    thread pool. Every thread accumulates its gradient contribution into
+    its own buffer.
+    """
+
+    def _grad_tile(self, t):
+        obg_acc = self.engine.obg_acc[t]
+        prg_acc = self.engine.prg_acc[t]
+        for g in obg_acc.values():
+            g.fill(0.)
+        for g in prg_acc.values():
+            g.fill(0.)
+
+        for dID in self.di.S.keys():
+            prep = self.engine.diff_info[dID]
+            pID, oID, eID = prep.poe_IDs
+
+            kern = self.engine.kernels[prep.label]
+            tk = kern.tiles[t]
+            GDK = tk.GDK
+            AWK = kern.AWK
+            POK = kern.POK
+            FW = kern.FW
+            BW = kern.BW
+
+            aux = tk.aux
+
+            ob = self.engine.ob.S[oID].data
+            pr = self.engine.pr.S[pID].data
+
+            for a, b in prep.tiles[t::self.engine.nthreads]:
+                addr = self._batch_addr(prep, a, b)
+
+                # make propagated exit (to buffer)
+                AWK.build_aux_no_ex(aux, addr, ob, pr, add=False)
+
+                # forward prop
+                FW(aux, out=aux)
+                if self.engine.fw_cache is not None:
+                    self.engine.fw_cache.put((dID, a), aux[:(b - a) * addr.shape[1]])
+
+                self._fourier_gradient(GDK, aux, addr, prep, slice(a, b))
+                BW(aux, out=aux)
+
+                POK.ob_update_ML(addr, obg_acc[oID], pr, aux)
+                POK.pr_update_ML(addr, prg_acc[pID], ob, aux)
+
+        return obg_acc, prg_acc
+
+    def new_grad(self):
+        """
+        Compute a new gradient direction according to the noise model.
+
+        Note: The negative log-likelihood and local errors are also computed
+        here.
+        """
+        ob_grad = self.engine.ob_grad_new
+        pr_grad = self.engine.pr_grad_new
+        ob_grad << 0.
+        pr_grad << 0.
+
+        # We need an array for MPI
+        LL = np.array([0.])
+        error_dct = {}
+
+        for obg_acc, prg_acc in self.engine._run_threads(self._grad_tile):
+            for oID, g in obg_acc.items():
+                ob_grad.S[oID].data += g
+            for pID, g in prg_acc.items():
+                pr_grad.S[pID].data += g
+
+        for dID, prep in self.engine.diff_info.items():
+            err_phot = prep.err_phot
+            LL += err_phot.sum()
+            err_phot /= np.prod(prep.weights.shape[-2:])
+            err_fourier = np.zeros_like(err_phot)
+            err_exit = np.zeros_like(err_phot)
+            errs = np.ascontiguousarray(np.vstack([err_fourier, err_phot, err_exit]).T)
+            error_dct.update(zip(prep.view_IDs, errs))
+
+        # MPI reduction of gradients
+        ob_grad.allreduce()
+        pr_grad.allreduce()
+        parallel.allreduce(LL)
+
+        # Object regularizer
+        if self.regularizer:
+            for name, s in self.engine.ob.storages.items():
+                ob_grad.storages[name].data += self.regularizer.grad(s.data)
+                LL += self.regularizer.LL
+
+        self.LL = LL / self.tot_measpts
+        return error_dct
+
+    def _coeffs_tile(self, t, c_ob_h, c_pr_h, Brenorm):
+        B = np.zeros((3,), dtype=np.longdouble)
+
+        for dID in self.di.S.keys():
+            prep = self.engine.diff_info[dID]
+            pID, oID, eID = prep.poe_IDs
+
+            kern = self.engine.kernels[prep.label]
+            tk = kern.tiles[t]
+            GDK = tk.GDK
+            AWK = kern.AWK
+            FW = kern.FW
+
+            ob = self.ob.S[oID].data
+            ob_h = c_ob_h.S[oID].data
+            pr = self.pr.S[pID].data
+            pr_h = c_pr_h.S[pID].data
+            cache = self.engine.fw_cache
+
+            for a, b in prep.tiles[t::self.engine.nthreads]:
+                addr = self._batch_addr(prep, a, b)
+                fa = tk.a
+                fb = tk.b
+
+                # propagated exit and directions, if cached
+                f = None
+                ab = None
+                if cache is not None:
+                    f = cache.get((dID, a))
+                    ab = cache.get_line((dID, a))
+                if f is None:
+                    f = tk.aux
+                    AWK.build_aux_no_ex(f, addr, ob, pr, add=False)
+                    FW(f, out=f)
+
+                if ab is None:
+                    # make propagated exit (to buffer)
+                    AWK.build_aux_no_ex(fa, addr, ob_h, pr, add=False)
+                    AWK.build_aux_no_ex(fa, addr, ob, pr_h, add=True)
+                    AWK.build_aux_no_ex(fb, addr, ob_h, pr_h, add=False)
+
+                    # forward prop
+                    FW(fa, out=fa)
+                    FW(fb, out=fb)
+                    if cache is not None:
+                        n = (b - a) * addr.shape[1]
+                        cache.put_line((dID, a), fa[:n], fb[:n])
+                else:
+                    fa, fb = ab
+
+                self._line_coeffs(GDK, f, fa, fb, addr, prep, Brenorm, B, slice(a, b))
+
+        return B
+
+    def poly_line_coeffs(self, c_ob_h, c_pr_h):
+        """
+        Compute the coefficients of the polynomial for line minimization
+        in direction h
+        """
+        Brenorm = self._brenorm()
+        B = np.sum(self.engine._run_threads(self._coeffs_tile, c_ob_h, c_pr_h, Brenorm), axis=0)
+
+        parallel.allreduce(B)
+
+        # Object regularizer
+        if self.regularizer:
+            for name, s in self.ob.storages.items():
+                B += Brenorm * self.regularizer.poly_line_coeffs(
+                    c_ob_h.storages[name].data, s.data)
+
+        self.B = B
+
+        return B
+
+
+class GaussianModelThreaded(_ThreadedModel, GaussianModel):
+    """
+    Gaussian noise model processed on a thread pool.
+    """
+
+
+class PoissonModelThreaded(_ThreadedModel, PoissonModel):
+    """
+    Poisson noise model processed on a thread pool.
+    """
+
+
+class EuclidModelThreaded(_ThreadedModel, EuclidModel):
+    """
+    Euclidean noise model processed on a thread pool.
+    """
@@ -8,14 +8,14 @@ This file is part of the PTYPY package.
     :license: see LICENSE for details.
 """
 import numpy as np
-import time
 
 from ptypy import utils as u
 from ptypy.utils.verbose import logger, log
 from ptypy.utils import parallel
 from ptypy.engines import register
 from ptypy.engines.projectional import _ProjectionEngine, DMMixin, RAARMixin
-from ptypy.accelerate.base.kernels import FourierUpdateKernel, AuxiliaryWaveKernel, PoUpdateKernel, PositionCorrectionKernel
+from ptypy.accelerate.base.kernels import FourierUpdateKernel, AuxiliaryWaveKernel, PoUpdateKernel, PositionCorrectionKernel, \
+    AuxiliaryWaveKernelVectorized, PoUpdateKernelVectorized
 from ptypy.accelerate.base import array_utils as au
 
 
@@ -48,58 +48,325 @@ def gaussian_kernel(sigma, size=None, sigma_y=None, size_y=None):
     return g / g.sum()
 
 
+def _pod_rows(pod):
+    """
+    Rows of the probe, object, exit, diffraction and mask views of `pod`
+    in the view records of their containers.
+    """
+    return [v.numID for v in (pod.pr_view, pod.ob_view, pod.ex_view, pod.di_view, pod.ma_view)]
+
+
+def _tile_offset(storage):
+    """
+    Position of the first pixel of `storage` in the pixel grid shared by
+    all MPI ranks.
+    """
+    return np.round(-storage.center).astype(int)
+
+
+def _view_rows(view, pr, ob, ex):
+    rows = []
+    for pname, pod in view.pods.items():
+        ## store them for each pod
+        rows.append(_pod_rows(pod))
+
+        if pod.pr_view.storage.ID != pr.ID:
+            log(1, "Splitting probes for one diffraction stack is not supported in " + __name__)
+        if pod.ob_view.storage.ID != ob.ID:
+            log(1, "Splitting objects for one diffraction stack is not supported in " + __name__)
+        if pod.ex_view.storage.ID != ex.ID:
+            log(1, "Splitting exit stacks for one diffraction stack is not supported in " + __name__)
+    return rows
+
+
 def serialize_array_access(diff_storage):
-    # Sort views according to layer in diffraction stack
-    views = diff_storage.views
-    dlayers = [view.dlayer for view in views]
-    views = [views[i] for i in np.argsort(dlayers)]
-    view_IDs = [view.ID for view in views]
-
-    # Master pod
-    mpod = views[0].pod
-
-    # Determine linked storages for probe, object and exit waves
-    pr = mpod.pr_view.storage
-    ob = mpod.ob_view.storage
-    ex = mpod.ex_view.storage
-
-    poe_ID = (pr.ID, ob.ID, ex.ID)
-
-    addr = []
-    for view in views:
-        address = []
-
-        for pname, pod in view.pods.items():
-            ## store them for each pod
-            # create addresses
-            a = np.array(
-                [(pod.pr_view.dlayer, pod.pr_view.dlow[0], pod.pr_view.dlow[1]),
-                 (pod.ob_view.dlayer, pod.ob_view.dlow[0], pod.ob_view.dlow[1]),
-                 (pod.ex_view.dlayer, pod.ex_view.dlow[0], pod.ex_view.dlow[1]),
-                 (pod.di_view.dlayer, pod.di_view.dlow[0], pod.di_view.dlow[1]),
-                 (pod.ma_view.dlayer, pod.ma_view.dlow[0], pod.ma_view.dlow[1])])
-
-            address.append(a)
-
-            if pod.pr_view.storage.ID != pr.ID:
-                log(1, "Splitting probes for one diffraction stack is not supported in " + __name__)
-            if pod.ob_view.storage.ID != ob.ID:
-                log(1, "Splitting objects for one diffraction stack is not supported in " + __name__)
-            if pod.ex_view.storage.ID != ex.ID:
-                log(1, "Splitting exit stacks for one diffraction stack is not supported in " + __name__)
-
-        ## store data for each view
-        # adresses
-        addr.append(address)
-
-    # store them for each storage
-    return view_IDs, poe_ID, np.array(addr).astype(np.int32)
-
-
-class _ProjectionEngine_serial(_ProjectionEngine):
+    """
+    Addresses of all pods of a diffraction storage, sorted according to
+    layer in the diffraction stack. Returns ``(view_IDs, poe_IDs, addr)``.
+    """
+    return AddressTable(diff_storage).serialize()
+
+
+class AddressTable(object):
+    """
+    Address table of a diffraction storage which is built incrementally.
+
+    For every pod the table keeps the rows of its five views (probe,
+    object, exit, diffraction and mask) in the view records of their
+    containers, see :py:attr:`ptypy.core.classes.Container.view_records`.
+    Only the pods of views added since the last call to
+    :py:meth:`serialize` are visited, the addresses themselves are
+    gathered from the records with a vectorized lookup, so a reformat of
+    any storage is picked up automatically. Falls back to a full rebuild
+    if views were removed from the storage.
+    """
+
+    def __init__(self, diff_storage):
+        self.storage = diff_storage
+        self.reset()
+
+    def reset(self):
+        """
+        Drop all addresses, the next call to :py:meth:`serialize` rebuilds the table.
+        """
+        self.nviews = 0
+        self.last_view = None
+        self.view_IDs = []
+        self.poe_IDs = None
+        self.containers = None
+        self.rows = None
+
+    def addresses(self):
+        """
+        Current ``(N, nmodes, 5, 3)`` address array of the table.
+        """
+        addr = np.zeros(self.rows.shape + (3,), dtype=np.int32)
+        for r, C in enumerate(self.containers):
+            recs = C.view_records
+            rows = self.rows[:, :, r]
+            addr[:, :, r, 0] = recs['dlayer'][rows]
+            addr[:, :, r, 1:] = recs['dlow'][rows, :2]
+        return addr
+
+    def serialize(self):
+        """
+        Same as :py:func:`serialize_array_access`, returns
+        ``(view_IDs, poe_IDs, addr)``. `addr` is a new array which can be
+        modified by the engine.
+        """
+        views = self.storage.views
+        if (len(views) < self.nviews) or (self.nviews and views[self.nviews - 1] is not self.last_view):
+            log(4, "Views of storage %s were removed, rebuilding address table" % self.storage.ID)
+            self.reset()
+
+        new_views = views[self.nviews:]
+        if self.rows is None and not new_views:
+            return self.view_IDs, self.poe_IDs, None
+
+        if new_views:
+            if self.rows is None:
+                # Master pod
+                mpod = new_views[0].pod
+                self.poe_IDs = (mpod.pr_view.storage.ID, mpod.ob_view.storage.ID, mpod.ex_view.storage.ID)
+                self.containers = [v.owner for v in (mpod.pr_view, mpod.ob_view, mpod.ex_view,
+                                                     mpod.di_view, mpod.ma_view)]
+                self.rows = np.zeros((0, len(new_views[0].pods), 5), dtype=int)
+
+            pr, ob, ex = (C.S[ID] for C, ID in zip(self.containers, self.poe_IDs))
+            rows = [_view_rows(v, pr, ob, ex) for v in new_views]
+            self.rows = np.concatenate([self.rows, np.array(rows, dtype=int)])
+            self.view_IDs = self.view_IDs + [v.ID for v in new_views]
+            self.nviews = len(views)
+            self.last_view = views[-1]
+
+        addr = self.addresses()
+
+        # Keep the table sorted according to layer in diffraction stack
+        dlayers = addr[:, 0, 3, 0]
+        if (np.diff(dlayers) < 0).any():
+            order = np.argsort(dlayers, kind='stable')
+            addr = addr[order]
+            self.rows = self.rows[order]
+            self.view_IDs = [self.view_IDs[i] for i in order]
+
+        return list(self.view_IDs), self.poe_IDs, addr
+
+    def move_object_views(self, delta):
+        """
+        Shift the object views of all pods by `delta` (physical units,
+        ``(N, nmodes, 2)`` in the order of the table) and update their
+        access information in bulk.
+        """
+        C = self.containers[1]
+        rows = self.rows[:, :, 1].ravel()
+        coord = C.view_records['coord']
+        np.add.at(coord, (rows, slice(0, 2)), np.reshape(delta, (-1, 2)))
+        C.S[self.poe_IDs[1]]._update_view_records(np.unique(rows))
+
+
+def _object_frames(diff_info, pr, oID):
+    """
+    Object addresses and frame shapes of all diffraction storages in
+    `diff_info` that access object storage `oID`.
+    """
+    return [(prep.addr[:, :, 1], pr.S[prep.poe_IDs[0]].shape[-2:])
+            for prep in diff_info.values() if prep.poe_IDs[1] == oID]
+
+
+class ObjectReduction(object):
+    """
+    Sums object shaped arrays across MPI ranks, restricted to the
+    bounding box of the pixels touched by the views of any rank and
+    optionally transmitted as 16-bit floats with error feedback.
+
+    Outside of the bounding box the arrays only hold terms that are
+    identical on all ranks, see the engines for how they are treated.
+    """
+
+    def __init__(self, bbox=True, precision=None):
+        self.bbox = bbox
+        self.precision = precision
+        self.residuals = {}
+        self.nbytes = 0
+        self.nbytes_sent = 0
+
+    def touched_box(self, frames, shape):
+        """
+        Bounding box ``(lo, hi)`` of the pixels touched on any rank.
+
+        Parameters
+        ----------
+        frames : list
+            ``(addr, frame_shape)`` tuples, where `addr` are the object
+            rows of the address arrays of this rank.
+
+        shape : tuple
+            Shape of the object storage.
+        """
+        sh = np.array(shape[-2:])
+        if not self.bbox:
+            return np.zeros(2, dtype=int), sh
+        lo = sh.copy()
+        hi = np.zeros(2, dtype=int)
+        for addr, fsh in frames:
+            if addr.size:
+                pos = addr[..., 1:].reshape(-1, 2)
+                lo = np.minimum(lo, pos.min(0))
+                hi = np.maximum(hi, pos.max(0) + fsh)
+        if parallel.MPIenabled:
+            box = parallel.allreduce(np.concatenate([-lo, hi]), parallel.MPI.MAX)
+            lo, hi = -box[:2], box[2:]
+        return np.maximum(lo, 0), np.minimum(hi, sh)
+
+    def reduce(self, key, a, lo, hi):
+        """
+        Sum the box `lo`:`hi` of array `a` across all ranks, the
+        quantization error is kept under `key`.
+        """
+        residual = None
+        if self.precision is not None:
+            residual = self.residuals.get(key)
+            if residual is None or residual.shape != a.shape:
+                residual = np.zeros(a.shape, dtype=np.complex64 if np.iscomplexobj(a) else np.float32)
+                self.residuals[key] = residual
+        parallel.allreduce_box(a, lo, hi, self.precision, residual)
+
+        self.nbytes += a.nbytes
+        n = a[(Ellipsis,) + tuple(slice(l, h) for l, h in zip(lo, hi))].nbytes
+        self.nbytes_sent += n if self.precision is None else n // a.real.itemsize * 2
+
+    def log_stats(self):
+        """
+        Log the number of bytes saved compared to full reductions.
+        """
+        if self.nbytes:
+            logger.info('Object reductions sent %.1f MB instead of %.1f MB (%.1f%% saved)'
+                        % (self.nbytes_sent / 1e6, self.nbytes / 1e6,
+                           100. * (1 - self.nbytes_sent / self.nbytes)))
+
+
+class KernelBackendMixin:
+    """
+    Choice of the numpy auxiliary wave and probe/object update kernels
+    of the serialized engines.
+
+    Defaults:
+
+    [kernel_backend]
+    default = 'loop'
+    type = str
+    help = Implementation of the auxiliary wave and probe/object update kernels
+    doc = 'loop' iterates over the addresses, 'vectorized' gathers all patches at once and scatter-adds them back (faster for many frames per block, needs one extra aux-sized buffer).
+    choices = ['loop', 'vectorized']
+
+    """
+
+    def _setup_po_kernels(self, kern):
+        """
+        Attach the auxiliary wave and probe/object update kernels to `kern`.
+        """
+        if self.p.kernel_backend == 'vectorized':
+            kern.POK = PoUpdateKernelVectorized()
+            kern.AWK = AuxiliaryWaveKernelVectorized()
+        else:
+            kern.POK = PoUpdateKernel()
+            kern.AWK = AuxiliaryWaveKernel()
+        kern.POK.allocate()
+        kern.AWK.allocate()
+
+
+class FrameBatchMixin:
+    """
+    Processing of the frames of a diffraction storage in batches through
+    the auxiliary wave buffers of the serialized engines.
+
+    Defaults:
+
+    [batch_frames]
+    default = None
+    type = int
+    lowlim = 1
+    help = Maximum number of frames processed at once
+    doc = Every diffraction storage is processed in batches of at most this many frames, which share the auxiliary wave buffers of a scan. If None, all frames of a block are processed at once.
+
+    [max_memory]
+    default = None
+    type = float
+    lowlim = 0
+    help = Memory budget [bytes] of the auxiliary wave buffers of a scan
+    doc = Derives the number of frames processed at once from the size of the complex auxiliary wave buffers, one for the projectional engines and three for ML. If `batch_frames` is given as well, the smaller batch is used. If None, no budget is applied.
+
+    """
+
+    def _frames_per_batch(self, fpc, nmodes, shape, nbuffers=1):
+        """
+        Number of frames which are processed at once, limited by
+        `batch_frames` and by the `max_memory` budget of the `nbuffers`
+        aux buffers.
+        """
+        nframes = fpc
+        if self.p.batch_frames:
+            nframes = min(nframes, self.p.batch_frames)
+        if self.p.max_memory:
+            fbytes = nbuffers * nmodes * np.prod(shape) * np.dtype(np.complex64).itemsize
+            nframes = min(nframes, int(self.p.max_memory // fbytes))
+        return max(int(nframes), 1)
+
+    def _frame_batches(self, prep):
+        """
+        (start, stop) tuples of the frame batches of a diffraction storage.
+        """
+        nframes = prep.addr.shape[0]
+        batch = self.kernels[prep.label].batch
+        return [(a, min(a + batch, nframes)) for a in range(0, nframes, batch)]
+
+
+class _ProjectionEngine_serial(_ProjectionEngine, KernelBackendMixin, FrameBatchMixin):
     """
     A full-fledged Difference Map engine that uses numpy arrays instead of iteration.
 
+    Defaults:
+
+    [object_distribution]
+    default = 'cloned'
+    type = str
+    help = Distribution of the object across MPI ranks
+    doc = If 'cloned', every rank holds the full object and the object update is summed with an allreduce. If 'halo', the scan positions are first redistributed into contiguous domains and every rank only holds the tile of the object covered by its own views, including a halo of the size of the probe. Only the regions where tiles of neighbouring ranks overlap are exchanged. The full object is assembled again at the end of the run. As intermediate saves and plots would only hold the tile of the master node, 'halo' cannot be combined with `io.autosave` or `io.autoplot`. Only available in the projectional engines, ML_serial always sums the full object.
+    choices = ['cloned', 'halo']
+
+    [reduce_bbox]
+    default = False
+    type = bool
+    help = Only reduce the bounding box of the object touched by the views of any rank
+    doc = The object update is summed across MPI ranks only within the bounding box of the pixels touched by the views of all ranks. Outside of it, all ranks hold the same inertia term which needs no communication.
+
+    [reduce_precision]
+    default = None
+    type = str
+    help = Transmit the MPI reduction of the object update at reduced precision
+    doc = If 'float16' or 'bfloat16', the object update is summed across MPI ranks as 16-bit floats. The quantization error of every rank is fed back into its next reduction. If None, the full precision is transmitted.
+    choices = [None, 'float16', 'bfloat16']
+
     """
 
     def __init__(self, ptycho_parent, pars=None):
@@ -119,35 +386,89 @@ class _ProjectionEngine_serial(_ProjectionEngine):
 
         kernel_pars = {'kernel_sh_x' : gauss_kernel.shape[0], 'kernel_sh_y': gauss_kernel.shape[1]}
         """
-        self.benchmark = u.Param()
 
         # Stores all information needed with respect to the diffraction storages.
         self.diff_info = {}
+        self.addr_tables = {}
         self.ob_cfact = {}
         self.pr_cfact = {}
         self.kernels = {}
 
+        # Reduced object reductions
+        self.ob_reduction = None
+        if self.p.reduce_bbox or self.p.reduce_precision:
+            self.ob_reduction = ObjectReduction(self.p.reduce_bbox, self.p.reduce_precision)
+
+        # Exchange of the object tiles if the object is distributed
+        self.halo = {}
+        self.ob_cover_weight = {}
+        self._ob_view_active = {}
+
     def engine_initialize(self):
         """
         Prepare for reconstruction.
         """
 
         super().engine_initialize()
-        self._reset_benchmarks()
         self._setup_kernels()
 
-    def _reset_benchmarks(self):
-        self.benchmark.A_Build_aux = 0.
-        self.benchmark.B_Prop = 0.
-        self.benchmark.C_Fourier_update = 0.
-        self.benchmark.D_iProp = 0.
-        self.benchmark.E_Build_exit = 0.
-        self.benchmark.F_LLerror = 0.
-        self.benchmark.probe_update = 0.
-        self.benchmark.object_update = 0.
-        self.benchmark.calls_fourier = 0
-        self.benchmark.calls_object = 0
-        self.benchmark.calls_probe = 0
+        if self.p.object_distribution == 'halo':
+            io = self.ptycho.p.io
+            if (io.autosave.active and io.autosave.interval > 0) or io.autoplot.active:
+                raise RuntimeError("object_distribution = 'halo' only holds tiles of the object during the run, "
+                                   "disable io.autosave and io.autoplot or use 'cloned'")
+            # each rank works on a contiguous domain of the scan
+            if parallel.MPIenabled:
+                self.ptycho._redistribute_data()
+            self.ob.distribution = 'scattered'
+
+    def _distribute_object(self):
+        """
+        Shrink the object storages to the tiles covered by the active
+        pods of this rank and set up the exchange with the neighbours.
+        """
+        for pod in self.pods.values():
+            v = pod.ob_view
+            self._ob_view_active.setdefault(v.ID, v.active)
+            v.active = pod.active
+        self.ob.reformat(True)
+
+        self.halo = {}
+        self.ob_cover_weight = {}
+        for oID, s in self.ob.storages.items():
+            halo = parallel.HaloExchange(_tile_offset(s), s.shape[1:], s.shape[0])
+            self.halo[oID] = halo
+            # the inertia of the object update is weighted with the node
+            # coverage, so that the sum over the ranks sharing a pixel
+            # matches the allreduce of the full object
+            self.ob_cover_weight[oID] = parallel.size / halo.cover
+
+    def _gather_object(self):
+        """
+        Assemble the full object from the tiles of all ranks and return
+        to a cloned object.
+        """
+        tiles = {oID: (_tile_offset(s), s.data / self.halo[oID].cover)
+                 for oID, s in self.ob.storages.items()}
+        for pod in self.pods.values():
+            pod.ob_view.active = self._ob_view_active.get(pod.ob_view.ID, True)
+        self.ob.distribution = 'cloned'
+        self.ob.reformat()
+
+        for oID, s in self.ob.storages.items():
+            offset, tile = tiles[oID]
+            sl = tuple(slice(i, i + n) for i, n in zip(offset - _tile_offset(s), tile.shape[1:]))
+            data = np.zeros_like(s.data)
+            cover = np.zeros(s.shape[1:])
+            data[(slice(None),) + sl] = tile
+            cover[sl] = 1. / self.halo[oID].cover
+            parallel.allreduce(data)
+            parallel.allreduce(cover)
+            s.data[:] = np.where(cover > .5, data, s.fill_value)
+
+        self.halo = {}
+        self.ob_cover_weight = {}
+        self._ob_view_active = {}
 
     def _setup_kernels(self):
         """
@@ -173,8 +494,11 @@ class _ProjectionEngine_serial(_ProjectionEngine):
             except:
                 nmodes = 1
 
+            # frames are processed in batches of at most this size
+            kern.batch = self._frames_per_batch(fpc, nmodes, geo.shape)
+
             # create buffer arrays
-            ash = (fpc * nmodes,) + tuple(geo.shape)
+            ash = (kern.batch * nmodes,) + tuple(geo.shape)
             aux = np.zeros(ash, dtype=np.complex64)
             kern.aux = aux
 
@@ -182,11 +506,7 @@ class _ProjectionEngine_serial(_ProjectionEngine):
             kern.FUK = FourierUpdateKernel(aux, nmodes)
             kern.FUK.allocate()
 
-            kern.POK = PoUpdateKernel()
-            kern.POK.allocate()
-
-            kern.AWK = AuxiliaryWaveKernel()
-            kern.AWK.allocate()
+            self._setup_po_kernels(kern)
 
             kern.FW = geo.propagator.fw
             kern.BW = geo.propagator.bw
@@ -198,6 +518,9 @@ class _ProjectionEngine_serial(_ProjectionEngine):
 
     def engine_prepare(self):
 
+        if self.p.object_distribution == 'halo':
+            self._distribute_object()
+
         super().engine_prepare()
 
         ## Serialize new data ##
@@ -215,12 +538,13 @@ class _ProjectionEngine_serial(_ProjectionEngine):
             prep.err_fourier = np.zeros_like(prep.ma_sum)
             prep.err_exit = np.zeros_like(prep.ma_sum)
 
-        # Unfortunately this needs to be done for all pods, since
-        # the shape of the probe / object was modified.
-        # TODO: possible scaling issue, remove the need for padding
+        # Only the addresses of new views are computed, existing ones are
+        # patched if the shape of the probe / object was modified.
         for label, d in self.di.storages.items():
             prep = self.diff_info[d.ID]
-            prep.view_IDs, prep.poe_IDs, prep.addr = serialize_array_access(d)
+            if d.ID not in self.addr_tables:
+                self.addr_tables[d.ID] = AddressTable(d)
+            prep.view_IDs, prep.poe_IDs, prep.addr = self.addr_tables[d.ID].serialize()
             if self.do_position_refinement:
                 prep.original_addr = np.zeros_like(prep.addr)
                 prep.original_addr[:] = prep.addr
@@ -256,64 +580,59 @@ class _ProjectionEngine_serial(_ProjectionEngine):
                 FW = kern.FW
                 BW = kern.BW
 
-                # get addresses and buffers
-                addr = prep.addr
-                mag = prep.mag
-                ma_sum = prep.ma_sum
-                err_phot = prep.err_phot
-                err_fourier = prep.err_fourier
-                err_exit = prep.err_exit
                 pbound = self.pbound_scan[prep.label]
                 aux = kern.aux
 
                 # local references
-                ma = prep.ma
                 ob = self.ob.S[oID].data
                 pr = self.pr.S[pID].data
                 ex = self.ex.S[eID].data
 
-                ## compute log-likelihood
-                if self.p.compute_log_likelihood:
-                    t1 = time.time()
-                    AWK.build_aux_no_ex(aux, addr, ob, pr)
-                    aux[:] = FW(aux)
-                    FUK.log_likelihood(aux, addr, mag, ma, err_phot)
-                    self.benchmark.F_LLerror += time.time() - t1
-
-                ## build auxilliary wave
-                t1 = time.time()
-                AWK.make_aux(aux, addr, ob, pr, ex, c_po=self._c, c_e=1-self._c)
-                self.benchmark.A_Build_aux += time.time() - t1
-
-                ## forward FFT
-                t1 = time.time()
-                aux[:] = FW(aux)
-                self.benchmark.B_Prop += time.time() - t1
-
-                ## Deviation from measured data
-                t1 = time.time()
-                FUK.fourier_error(aux, addr, mag, ma, ma_sum)
-                FUK.error_reduce(addr, err_fourier)
-                FUK.fmag_all_update(aux, addr, mag, ma, err_fourier, pbound)
-                self.benchmark.C_Fourier_update += time.time() - t1
-
-                ## backward FFT
-                t1 = time.time()
-                aux[:] = BW(aux)
-                self.benchmark.D_iProp += time.time() - t1
-
-                ## build exit wave
-                t1 = time.time()
-                AWK.make_exit(aux, addr, ob, pr, ex, c_a=self._b, c_po=self._a, c_e=-(self._a+self._b))
-                FUK.exit_error(aux,addr)
-                FUK.error_reduce(addr, err_exit)
-                self.benchmark.E_Build_exit += time.time() - t1
+                # frames are processed in batches through the same aux buffer
+                for a, b in self._frame_batches(prep):
+
+                    # get addresses and buffers
+                    addr = prep.addr[a:b]
+                    mag = prep.mag[a:b]
+                    ma_sum = prep.ma_sum[a:b]
+                    ma = prep.ma[a:b]
+                    err_phot = prep.err_phot[a:b]
+                    err_fourier = prep.err_fourier[a:b]
+                    err_exit = prep.err_exit[a:b]
+
+                    ## compute log-likelihood
+                    if self.p.compute_log_likelihood:
+                        with u.profiler.region('log_likelihood'):
+                            AWK.build_aux_no_ex(aux, addr, ob, pr)
+                            FW(aux, out=aux)
+                            FUK.log_likelihood(aux, addr, mag, ma, err_phot)
+
+                    ## build auxilliary wave
+                    with u.profiler.region('build_aux'):
+                        AWK.make_aux(aux, addr, ob, pr, ex, c_po=self._c, c_e=1-self._c)
+
+                    ## forward FFT
+                    with u.profiler.region('forward_prop'):
+                        FW(aux, out=aux)
+
+                    ## Deviation from measured data
+                    with u.profiler.region('fourier_update'):
+                        FUK.fourier_update_fused(aux, addr, mag, ma, ma_sum, err_fourier, pbound)
+
+                    ## backward FFT
+                    with u.profiler.region('backward_prop'):
+                        BW(aux, out=aux)
+
+                    ## build exit wave
+                    with u.profiler.region('build_exit'):
+                        AWK.make_exit(aux, addr, ob, pr, ex, c_a=self._b, c_po=self._a, c_e=-(self._a+self._b))
+                        FUK.exit_error(aux,addr)
+                        FUK.error_reduce(addr, err_exit)
 
                 # update errors
-                errs = np.ascontiguousarray(np.vstack([err_fourier, err_phot, err_exit]).T)
+                errs = np.ascontiguousarray(np.vstack([prep.err_fourier, prep.err_phot, prep.err_exit]).T)
                 error.update(zip(prep.view_IDs, errs))
 
-                self.benchmark.calls_fourier += 1
 
             parallel.barrier()
 
@@ -356,12 +675,6 @@ class _ProjectionEngine_serial(_ProjectionEngine):
                 pr = self.pr.S[pID].data
                 kern = self.kernels[prep.label]
                 aux = kern.aux
-                addr = prep.addr
-                original_addr = prep.original_addr
-                mangled_addr = addr.copy()
-                mag = prep.mag
-                ma_sum = prep.ma_sum
-                err_fourier = prep.err_fourier
 
                 PCK = kern.PCK
                 FW = kern.FW
@@ -370,32 +683,51 @@ class _ProjectionEngine_serial(_ProjectionEngine):
                 max_oby = ob.shape[-2] - aux.shape[-2] - 1
                 max_obx = ob.shape[-1] - aux.shape[-1] - 1
 
-                # We need to re-calculate the current error
-                PCK.build_aux(aux, addr, ob, pr)
-                aux[:] = FW(aux)
-                if self.p.position_refinement.metric == "fourier":
-                    PCK.fourier_error(aux, addr, mag, ma, ma_sum)
-                    PCK.error_reduce(addr, err_fourier)
-                if self.p.position_refinement.metric == "photon":
-                    PCK.log_likelihood(aux, addr, mag, ma, err_fourier)
-                error_state = np.zeros_like(err_fourier)
-                error_state[:] = err_fourier
-                PCK.mangler.setup_shifts(self.curiter, nframes=addr.shape[0])
-
-                log(4, 'Position refinement trial: iteration %s' % (self.curiter))
-                for i in range(PCK.mangler.nshifts):
-                    PCK.mangler.get_address(i, addr, mangled_addr, max_oby, max_obx)
-                    PCK.build_aux(aux, mangled_addr, ob, pr)
-                    aux[:] = FW(aux)
+                error_state = np.zeros_like(prep.err_fourier)
+
+                # frames are processed in batches through the same aux buffer
+                for a, b in self._frame_batches(prep):
+                    addr = prep.addr[a:b]
+                    mag = prep.mag[a:b]
+                    ma_sum = prep.ma_sum[a:b]
+                    err_fourier = prep.err_fourier[a:b]
+                    ma_b = ma[a:b]
+
+                    # We need to re-calculate the current error
+                    PCK.build_aux(aux, addr, ob, pr)
+                    FW(aux, out=aux)
                     if self.p.position_refinement.metric == "fourier":
-                        PCK.fourier_error(aux, mangled_addr, mag, ma, ma_sum)
-                        PCK.error_reduce(mangled_addr, err_fourier)
+                        PCK.fourier_error(aux, addr, mag, ma_b, ma_sum)
+                        PCK.error_reduce(addr, err_fourier)
                     if self.p.position_refinement.metric == "photon":
-                        PCK.log_likelihood(aux, mangled_addr, mag, ma, err_fourier)
-                    PCK.update_addr_and_error_state(addr, error_state, mangled_addr, err_fourier)
+                        PCK.log_likelihood(aux, addr, mag, ma_b, err_fourier)
+                    error_state[a:b] = err_fourier
+                    PCK.mangler.setup_shifts(self.curiter, nframes=addr.shape[0])
+
+                    # Several shifts are evaluated at once with one stacked FFT
+                    nshifts = PCK.mangler.nshifts
+                    nbatch = PCK.batch_size(nshifts, self.p.position_refinement.batch_memory)
+                    PCK.allocate_batch(nbatch, aux.dtype)
+                    baux = aux if nbatch == 1 else PCK.npy.aux_batch
+                    mangled_addr = np.repeat(addr[None], nbatch, axis=0)
+
+                    log(4, 'Position refinement trial: iteration %s' % (self.curiter))
+                    for i in range(0, nshifts, nbatch):
+                        nb = min(nbatch, nshifts - i)
+                        for j in range(nb):
+                            PCK.mangler.get_address(i + j, addr, mangled_addr[j], max_oby, max_obx)
+                        flat_addr = mangled_addr[:nb].reshape((-1,) + addr.shape[1:])
+                        err = PCK.npy.err_batch[:nb, :addr.shape[0]]
+                        PCK.build_aux(baux, flat_addr, ob, pr)
+                        aux_b = baux[:flat_addr.shape[0] * flat_addr.shape[1]]
+                        FW(aux_b, out=aux_b)
+                        if self.p.position_refinement.metric == "fourier":
+                            PCK.fourier_error_batched(aux_b, mag, ma_b, ma_sum, err)
+                        if self.p.position_refinement.metric == "photon":
+                            PCK.log_likelihood_batched(aux_b, mag, ma_b, err)
+                        PCK.update_addr_and_error_state_batched(addr, error_state[a:b], mangled_addr[:nb], err)
 
                 prep.err_fourier = error_state
-                prep.addr = addr
 
 
     def overlap_update(self, MPI=True):
@@ -428,147 +760,141 @@ class _ProjectionEngine_serial(_ProjectionEngine):
 
     ## object update
     def object_update(self, MPI=False):
-        t1 = time.time()
-
-        for oID, ob in self.ob.storages.items():
-            obn = self.ob_nrm.S[oID]
-            cfact = self.p.object_inertia * self.mean_power
-
-            if self.p.obj_smooth_std is not None:
-                log(4, 'Smoothing object, cfact is %.2f' % cfact)
-                smooth_mfs = [self.p.obj_smooth_std, self.p.obj_smooth_std]
-                ob.data = cfact * au.complex_gaussian_filter(ob.data, smooth_mfs)
-            else:
-                ob.data *= cfact
-
-            obn.data[:] = cfact
-
-        # storage for-loop
-        for dID in self.di.S.keys():
-            prep = self.diff_info[dID]
-
-            POK = self.kernels[prep.label].POK
-            # find probe, object in exit ID in dependence of dID
-            pID, oID, eID = prep.poe_IDs
+        with u.profiler.region('object_update'):
+            for oID, ob in self.ob.storages.items():
+                obn = self.ob_nrm.S[oID]
+                cfact = self.p.object_inertia * self.mean_power
+                if self.halo:
+                    cfact = cfact * self.ob_cover_weight[oID]
+
+                if self.p.obj_smooth_std is not None:
+                    log(4, 'Smoothing object, cfact is %.2f' % cfact)
+                    smooth_mfs = [self.p.obj_smooth_std, self.p.obj_smooth_std]
+                    ob.data = cfact * au.complex_gaussian_filter(ob.data, smooth_mfs)
+                else:
+                    ob.data *= cfact
+
+                obn.data[:] = cfact
+
+            # storage for-loop
+            for dID in self.di.S.keys():
+                prep = self.diff_info[dID]
 
-            # scan for loop
-            ev = POK.ob_update(prep.addr,
-                               self.ob.S[oID].data,
-                               self.ob_nrm.S[oID].data,
-                               self.pr.S[pID].data,
-                               self.ex.S[eID].data)
+                POK = self.kernels[prep.label].POK
+                # find probe, object in exit ID in dependence of dID
+                pID, oID, eID = prep.poe_IDs
 
-        for oID, ob in self.ob.storages.items():
-            obn = self.ob_nrm.S[oID]
-            # MPI test
-            if MPI:
-                parallel.allreduce(ob.data)
-                parallel.allreduce(obn.data)
-                ob.data /= obn.data
-            else:
+                # scan for loop
+                ev = POK.ob_update(prep.addr,
+                                   self.ob.S[oID].data,
+                                   self.ob_nrm.S[oID].data,
+                                   self.pr.S[pID].data,
+                                   self.ex.S[eID].data)
+
+            # Start the reductions of all storages at once, every storage is
+            # normalized as soon as its own reductions are completed
+            requests = {}
+            if MPI and not self.halo and self.ob_reduction is None:
+                for oID, ob in self.ob.storages.items():
+                    requests[oID] = [ob.allreduce_async(), self.ob_nrm.S[oID].allreduce_async()]
+
+            for oID, ob in self.ob.storages.items():
+                obn = self.ob_nrm.S[oID]
+                # MPI test
+                if self.halo:
+                    self.halo[oID].exchange(ob.data, obn.data)
+                elif MPI and self.ob_reduction is not None:
+                    # outside of the touched pixels all ranks hold
+                    # cfact * ob and cfact, i.e. the same ratio
+                    lo, hi = self.ob_reduction.touched_box(_object_frames(self.diff_info, self.pr, oID), ob.shape)
+                    self.ob_reduction.reduce((oID, 'ob'), ob.data, lo, hi)
+                    self.ob_reduction.reduce((oID, 'obn'), obn.data, lo, hi)
+                elif MPI:
+                    parallel.waitall(requests[oID])
                 ob.data /= obn.data
 
-            # Clip object (This call takes like one ms. Not time critical)
-            if self.p.clip_object is not None:
-                clip_min, clip_max = self.p.clip_object
-                ampl_obj = np.abs(ob.data)
-                phase_obj = np.exp(1j * np.angle(ob.data))
-                too_high = (ampl_obj > clip_max)
-                too_low = (ampl_obj < clip_min)
-                ob.data[too_high] = clip_max * phase_obj[too_high]
-                ob.data[too_low] = clip_min * phase_obj[too_low]
-
-        self.benchmark.object_update += time.time() - t1
-        self.benchmark.calls_object += 1
+                # Clip object (This call takes like one ms. Not time critical)
+                if self.p.clip_object is not None:
+                    clip_min, clip_max = self.p.clip_object
+                    ampl_obj = np.abs(ob.data)
+                    phase_obj = np.exp(1j * np.angle(ob.data))
+                    too_high = (ampl_obj > clip_max)
+                    too_low = (ampl_obj < clip_min)
+                    ob.data[too_high] = clip_max * phase_obj[too_high]
+                    ob.data[too_low] = clip_min * phase_obj[too_low]
 
     ## probe update
     def probe_update(self, MPI=False):
-        t1 = time.time()
-
-        # storage for-loop
-        change = 0
+        with u.profiler.region('probe_update'):
+            # storage for-loop
+            change = 0
 
-        for pID, pr in self.pr.storages.items():
-            prn = self.pr_nrm.S[pID]
-            cfact = self.pr_cfact[pID]
-            pr.data *= cfact
-            prn.data.fill(cfact)
+            for pID, pr in self.pr.storages.items():
+                prn = self.pr_nrm.S[pID]
+                cfact = self.pr_cfact[pID]
+                pr.data *= cfact
+                prn.data.fill(cfact)
 
-        for dID in self.di.S.keys():
-            prep = self.diff_info[dID]
+            for dID in self.di.S.keys():
+                prep = self.diff_info[dID]
 
-            POK = self.kernels[prep.label].POK
-            # find probe, object in exit ID in dependence of dID
-            pID, oID, eID = prep.poe_IDs
+                POK = self.kernels[prep.label].POK
+                # find probe, object in exit ID in dependence of dID
+                pID, oID, eID = prep.poe_IDs
 
-            # scan for-loop
-            ev = POK.pr_update(prep.addr,
-                               self.pr.S[pID].data,
-                               self.pr_nrm.S[pID].data,
-                               self.ob.S[oID].data,
-                               self.ex.S[eID].data)
+                # scan for-loop
+                ev = POK.pr_update(prep.addr,
+                                   self.pr.S[pID].data,
+                                   self.pr_nrm.S[pID].data,
+                                   self.ob.S[oID].data,
+                                   self.ex.S[eID].data)
 
-            self.benchmark.probe_update += time.time() - t1
-            self.benchmark.calls_probe += 1
+            # Start the reductions of all storages at once
+            requests = {}
+            if MPI:
+                for pID, pr in self.pr.storages.items():
+                    requests[pID] = [pr.allreduce_async(), self.pr_nrm.S[pID].allreduce_async()]
 
-        for pID, pr in self.pr.storages.items():
+            for pID, pr in self.pr.storages.items():
 
-            buf = self.pr_buf.S[pID]
-            prn = self.pr_nrm.S[pID]
+                buf = self.pr_buf.S[pID]
+                prn = self.pr_nrm.S[pID]
 
-            # MPI test
-            if MPI:
-                # if False:
-                parallel.allreduce(pr.data)
-                parallel.allreduce(prn.data)
-                pr.data /= prn.data
-            else:
+                # MPI test
+                if MPI:
+                    parallel.waitall(requests[pID])
                 pr.data /= prn.data
 
-            self.support_constraint(pr)
+                self.support_constraint(pr)
 
-            change += u.norm2(pr.data - buf.data) / u.norm2(pr.data)
-            buf.data[:] = pr.data
-            if MPI:
-                change = parallel.allreduce(change) / parallel.size
+                change += u.norm2(pr.data - buf.data) / u.norm2(pr.data)
+                buf.data[:] = pr.data
+                if MPI:
+                    change = parallel.allreduce(change) / parallel.size
 
-        return np.sqrt(change)
+            return np.sqrt(change)
 
     def engine_finalize(self, benchmark=True):
         """
         try deleting ever helper contianer
         """
-        if parallel.master and benchmark:
-            print("----- BENCHMARKS ----")
-            acc = 0.
-            for name in sorted(self.benchmark.keys()):
-                t = self.benchmark[name]
-                if name[0] in 'ABCDEFGHI':
-                    print('%20s : %1.3f ms per iteration' % (name, t / self.benchmark.calls_fourier * 1000))
-                    acc += t
-                elif str(name) == 'probe_update':
-                    print('%20s : %1.3f ms per call. %d calls' % (
-                        name, t / self.benchmark.calls_probe * 1000, self.benchmark.calls_probe))
-                elif str(name) == 'object_update':
-                    print('%20s : %1.3f ms per call. %d calls' % (
-                        name, t / self.benchmark.calls_object * 1000, self.benchmark.calls_object))
-
-            print('%20s : %1.3f ms per iteration. %d calls' % (
-                'Fourier_total', acc / self.benchmark.calls_fourier * 1000, self.benchmark.calls_fourier))
-
-        self._reset_benchmarks()
+        if benchmark:
+            self.print_profile()
 
         if self.do_position_refinement and self.p.position_refinement.record:
             for label, d in self.di.storages.items():
                 prep = self.diff_info[d.ID]
                 res = self.kernels[prep.label].resolution
-                for i,view in enumerate(d.views):
-                    for j,(pname, pod) in enumerate(view.pods.items()):
-                        delta = (prep.addr[i][j][1][1:] - prep.original_addr[i][j][1][1:]) * res
-                        pod.ob_view.coord += delta
-                        pod.ob_view.storage.update_views(pod.ob_view)
+                delta = (prep.addr[:, :, 1, 1:] - prep.original_addr[:, :, 1, 1:]) * res
+                self.addr_tables[d.ID].move_object_views(delta)
             self.ptycho.record_positions = True
 
+        if self.halo:
+            self._gather_object()
+
+        if self.ob_reduction is not None:
+            self.ob_reduction.log_stats()
+
         super().engine_finalize()
 
 
@@ -81,8 +81,6 @@ class DM_serial_stream(DM_serial):
 
                 # First cycle: Fourier + object update
                 for dID in self.di.S.keys():
-                    t1 = time.time()
-
                     prep = self.diff_info[dID]
                     # find probe, object in exit ID in dependence of dID
                     pID, oID, eID = prep.poe_IDs
@@ -98,54 +96,51 @@ class DM_serial_stream(DM_serial):
                     FW = kern.FW
                     BW = kern.BW
 
-                    # get addresses and auxilliary array
-                    addr = prep.addr
-                    mag = prep.mag
-                    ma_sum = prep.ma_sum
-                    err_fourier = prep.err_fourier
-
                     # local references
-                    ma = self.ma.S[dID].data
                     ob = self.ob.S[oID].data
                     obn = self.ob_nrm.S[oID].data
                     obb = self.ob_buf.S[oID].data
                     pr = self.pr.S[pID].data
                     ex = self.ex.S[eID].data
 
-                    # Fourier update.
-                    if do_update_fourier:
-                        log(4, '----- Fourier update -----', True)
-                        t1 = time.time()
-                        AWK.make_aux(aux, addr, ob, pr, ex, c_po=self._c, c_e=1-self._c)
-                        self.benchmark.A_Build_aux += time.time() - t1
-
-                        ## FFT
-                        t1 = time.time()
-                        aux[:] = FW(aux)
-                        self.benchmark.B_Prop += time.time() - t1
-
-                        ## Deviation from measured data
-                        t1 = time.time()
-                        FUK.fourier_error(aux, addr, mag, ma, ma_sum)
-                        FUK.error_reduce(addr, err_fourier)
-                        FUK.fmag_all_update(aux, addr, mag, ma, err_fourier, pbound)
-                        self.benchmark.C_Fourier_update += time.time() - t1
-
-                        t1 = time.time()
-                        aux[:] = BW(aux)
-                        self.benchmark.D_iProp += time.time() - t1
-
-                        ## apply changes #2
-                        t1 = time.time()
-                        AWK.make_exit(aux, addr, ob, pr, ex, c_a=self._b, c_po=self._a, c_e=-(self._a+self._b))
-                        self.benchmark.E_Build_exit += time.time() - t1
+                    # frames are processed in batches through the same aux buffer
+                    for a, b in self._frame_batches(prep):
+
+                        # get addresses and auxilliary array
+                        addr = prep.addr[a:b]
+                        mag = prep.mag[a:b]
+                        ma_sum = prep.ma_sum[a:b]
+                        err_fourier = prep.err_fourier[a:b]
+                        ma = self.ma.S[dID].data[a:b]
+
+                        # Fourier update.
+                        if do_update_fourier:
+                            log(4, '----- Fourier update -----', True)
+                            with u.profiler.region('build_aux'):
+                                AWK.make_aux(aux, addr, ob, pr, ex, c_po=self._c, c_e=1-self._c)
+
+                            ## FFT
+                            with u.profiler.region('forward_prop'):
+                                FW(aux, out=aux)
+
+                            ## Deviation from measured data
+                            with u.profiler.region('fourier_update'):
+                                FUK.fourier_update_fused(aux, addr, mag, ma, ma_sum, err_fourier, pbound)
 
+                            with u.profiler.region('backward_prop'):
+                                BW(aux, out=aux)
+
+                            ## apply changes #2
+                            with u.profiler.region('build_exit'):
+                                AWK.make_exit(aux, addr, ob, pr, ex, c_a=self._b, c_po=self._a, c_e=-(self._a+self._b))
+
+                    if do_update_fourier:
+                        err_fourier = prep.err_fourier
                         err_phot = np.zeros_like(err_fourier)
                         err_exit = np.zeros_like(err_fourier)
                         errs = np.ascontiguousarray(np.vstack([err_fourier, err_phot, err_exit]).T)
                         error.update(zip(prep.view_IDs, errs))
 
-                        self.benchmark.calls_fourier += 1
 
                     parallel.barrier()
 
@@ -155,13 +150,9 @@ class DM_serial_stream(DM_serial):
                     if do_update_object:
                         # Update object
                         log(4, prestr + '----- object update -----', True)
-                        t1 = time.time()
-
-                        # scan for loop
-                        ev = POK.ob_update(addr, obb, obn, pr, ex)
-
-                        self.benchmark.object_update += time.time() - t1
-                        self.benchmark.calls_object += 1
+                        with u.profiler.region('object_update'):
+                            # scan for loop
+                            ev = POK.ob_update(prep.addr, obb, obn, pr, ex)
 
                 if do_update_object:
                     for oID, ob in self.ob.storages.items():
@@ -223,13 +214,9 @@ class DM_serial_stream(DM_serial):
                         ex = self.ex.S[eID].data
                         prn = self.pr_nrm.S[pID].data
 
-                        t1 = time.time()
-
-                        # scan for-loop
-                        ev = POK.pr_update(addr, pr, prn, ob, ex)
-
-                        self.benchmark.probe_update += time.time() - t1
-                        self.benchmark.calls_probe += 1
+                        with u.profiler.region('probe_update'):
+                            # scan for-loop
+                            ev = POK.pr_update(addr, pr, prn, ob, ex)
 
                     # synchronize
                     for pID, pr in self.pr.storages.items():
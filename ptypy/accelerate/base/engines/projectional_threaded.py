@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-threaded Difference Map / RAAR reconstruction engines.
+
+Each diffraction storage is split into tiles of frames which are processed
+on a thread pool. Numpy and scipy.fft release the GIL for the heavy lifting,
+so one MPI rank can make use of all cores of a socket.
+
+This file is part of the PTYPY package.
+
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from ptypy import utils as u
+from ptypy.utils.verbose import logger, log
+from ptypy.utils import parallel
+from ptypy.engines import register
+from ptypy.engines.projectional import DMMixin, RAARMixin
+from ptypy.accelerate.base.kernels import FourierUpdateKernel
+from ptypy.accelerate.base import array_utils as au
+from .projectional_serial import _ProjectionEngine_serial, _object_frames
+
+__all__ = ['DM_threaded', 'RAAR_threaded']
+
+
+def get_num_threads(num_threads=None):
+    """
+    Number of threads to use, defaults to the number of cores
+    available to this process.
+    """
+    if num_threads:
+        return int(num_threads)
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def split_tiles(nframes, ntiles):
+    """
+    Split `nframes` frames into at most `ntiles` contiguous tiles.
+    Returns a list of (start, stop) tuples.
+    """
+    bounds = np.linspace(0, nframes, min(ntiles, max(nframes, 1)) + 1).astype(int)
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+class _ProjectionEngine_threaded(_ProjectionEngine_serial):
+    """
+    Multi-threaded version of the serialized projectional engines.
+
+    Defaults:
+
+    [num_threads]
+    default = None
+    type = int
+    lowlim = 1
+    help = Number of threads, if None use all cores available to this process
+
+    """
+
+    def __init__(self, ptycho_parent, pars=None):
+
+        super().__init__(ptycho_parent, pars)
+        self.nthreads = get_num_threads(self.p.num_threads)
+        self.pool = None
+
+        # thread-local accumulation buffers for the overlap update
+        self.ob_acc = None
+        self.pr_acc = None
+
+    def engine_initialize(self):
+        """
+        Prepare for reconstruction.
+        """
+        self.pool = ThreadPoolExecutor(max_workers=self.nthreads)
+        super().engine_initialize()
+
+    def _setup_kernels(self):
+        """
+        Setup kernels, one for each scan and thread.
+        """
+        super()._setup_kernels()
+        for label, scan in self.ptycho.model.scans.items():
+            kern = self.kernels[label]
+            nmodes = kern.FUK.nmodes
+            fpc = scan.max_frames_per_block
+
+            # tiles are not larger than the frame batch of the serial engine
+            kern.tsize = min(-(-fpc // self.nthreads), kern.batch)
+
+            # one aux buffer and fourier kernel per thread
+            kern.tiles = []
+            for t in range(self.nthreads):
+                tk = u.Param()
+                tk.aux = np.zeros((kern.tsize * nmodes,) + kern.aux.shape[1:], dtype=kern.aux.dtype)
+                tk.FUK = FourierUpdateKernel(tk.aux, nmodes)
+                tk.FUK.allocate()
+                kern.tiles.append(tk)
+
+    def engine_prepare(self):
+
+        super().engine_prepare()
+
+        for label, d in self.di.storages.items():
+            prep = self.diff_info[d.ID]
+            nframes = prep.addr.shape[0]
+            ntiles = max(self.nthreads, -(-nframes // self.kernels[prep.label].tsize))
+            prep.tiles = split_tiles(nframes, ntiles)
+
+        # (Re-)allocate the accumulation buffers, the storages may have been reformatted
+        self.ob_acc = [{oID: (np.zeros_like(ob.data), np.zeros(ob.data.shape, dtype=self.ob_nrm.S[oID].data.dtype))
+                        for oID, ob in self.ob.storages.items()} for t in range(self.nthreads)]
+        self.pr_acc = [{pID: (np.zeros_like(pr.data), np.zeros(pr.data.shape, dtype=self.pr_nrm.S[pID].data.dtype))
+                        for pID, pr in self.pr.storages.items()} for t in range(self.nthreads)]
+
+    def _run_threads(self, func):
+        """
+        Run func(t) for every thread index t and wait for completion.
+        """
+        futures = [self.pool.submit(func, t) for t in range(self.nthreads)]
+        return [f.result() for f in futures]
+
+    def _fourier_tile(self, t):
+        """
+        Fourier update of the tiles of thread `t` in every diffraction storage.
+        """
+        for dID in self.di.S.keys():
+            prep = self.diff_info[dID]
+            for a, b in prep.tiles[t::self.nthreads]:
+                self._fourier_update(prep, t, a, b)
+
+    def _fourier_update(self, prep, t, a, b):
+        """
+        Fourier update of frames `a` to `b` of a diffraction storage.
+        """
+        pID, oID, eID = prep.poe_IDs
+
+        kern = self.kernels[prep.label]
+        tk = kern.tiles[t]
+        FUK = tk.FUK
+        AWK = kern.AWK
+        FW = kern.FW
+        BW = kern.BW
+
+        addr = prep.addr[a:b]
+        mag = prep.mag[a:b]
+        ma = prep.ma[a:b]
+        ma_sum = prep.ma_sum[a:b]
+        err_phot = prep.err_phot[a:b]
+        err_fourier = prep.err_fourier[a:b]
+        err_exit = prep.err_exit[a:b]
+        pbound = self.pbound_scan[prep.label]
+        aux = tk.aux[:(b - a) * FUK.nmodes]
+
+        ob = self.ob.S[oID].data
+        pr = self.pr.S[pID].data
+        ex = self.ex.S[eID].data
+
+        ## compute log-likelihood
+        if self.p.compute_log_likelihood:
+            AWK.build_aux_no_ex(aux, addr, ob, pr)
+            FW(aux, out=aux)
+            FUK.log_likelihood(aux, addr, mag, ma, err_phot)
+
+        ## build auxilliary wave, propagate and apply magnitudes
+        AWK.make_aux(aux, addr, ob, pr, ex, c_po=self._c, c_e=1-self._c)
+        FW(aux, out=aux)
+        FUK.fourier_update_fused(aux, addr, mag, ma, ma_sum, err_fourier, pbound)
+        BW(aux, out=aux)
+
+        ## build exit wave
+        AWK.make_exit(aux, addr, ob, pr, ex, c_a=self._b, c_po=self._a, c_e=-(self._a+self._b))
+        FUK.exit_error(aux, addr)
+        FUK.error_reduce(addr, err_exit)
+
+    def engine_iterate(self, num=1):
+        """
+        Compute one iteration.
+        """
+
+        for it in range(num):
+
+            error = {}
+
+            with u.profiler.region('fourier_update'):
+                self._run_threads(self._fourier_tile)
+
+            for dID in self.di.S.keys():
+                prep = self.diff_info[dID]
+                errs = np.ascontiguousarray(np.vstack([prep.err_fourier, prep.err_phot, prep.err_exit]).T)
+                error.update(zip(prep.view_IDs, errs))
+
+            parallel.barrier()
+
+            self.overlap_update(MPI=True)
+
+            # Recenter the probe
+            self.center_probe()
+
+            parallel.barrier()
+
+            self.position_update()
+
+            self.curiter += 1
+
+        self.error = error
+        return error
+
+    def _ob_update_tile(self, t):
+        acc = self.ob_acc[t]
+        for num, den in acc.values():
+            num.fill(0.)
+            den.fill(0.)
+        for dID in self.di.S.keys():
+            prep = self.diff_info[dID]
+            POK = self.kernels[prep.label].POK
+            pID, oID, eID = prep.poe_IDs
+            for a, b in prep.tiles[t::self.nthreads]:
+                POK.ob_update(prep.addr[a:b], acc[oID][0], acc[oID][1],
+                              self.pr.S[pID].data, self.ex.S[eID].data)
+
+    def _pr_update_tile(self, t):
+        acc = self.pr_acc[t]
+        for num, den in acc.values():
+            num.fill(0.)
+            den.fill(0.)
+        for dID in self.di.S.keys():
+            prep = self.diff_info[dID]
+            POK = self.kernels[prep.label].POK
+            pID, oID, eID = prep.poe_IDs
+            for a, b in prep.tiles[t::self.nthreads]:
+                POK.pr_update(prep.addr[a:b], acc[pID][0], acc[pID][1],
+                              self.ob.S[oID].data, self.ex.S[eID].data)
+
+    ## object update
+    def object_update(self, MPI=False):
+        with u.profiler.region('object_update'):
+            for oID, ob in self.ob.storages.items():
+                obn = self.ob_nrm.S[oID]
+                cfact = self.p.object_inertia * self.mean_power
+                if self.halo:
+                    cfact = cfact * self.ob_cover_weight[oID]
+
+                if self.p.obj_smooth_std is not None:
+                    log(4, 'Smoothing object, cfact is %.2f' % cfact)
+                    smooth_mfs = [self.p.obj_smooth_std, self.p.obj_smooth_std]
+                    ob.data = cfact * au.complex_gaussian_filter(ob.data, smooth_mfs)
+                else:
+                    ob.data *= cfact
+
+                obn.data[:] = cfact
+
+            # every thread accumulates into its own buffers
+            self._run_threads(self._ob_update_tile)
+
+            for oID, ob in self.ob.storages.items():
+                obn = self.ob_nrm.S[oID]
+                for acc in self.ob_acc:
+                    ob.data += acc[oID][0]
+                    obn.data += acc[oID][1]
+
+                # MPI test
+                if self.halo:
+                    self.halo[oID].exchange(ob.data, obn.data)
+                elif MPI and self.ob_reduction is not None:
+                    lo, hi = self.ob_reduction.touched_box(_object_frames(self.diff_info, self.pr, oID), ob.shape)
+                    self.ob_reduction.reduce((oID, 'ob'), ob.data, lo, hi)
+                    self.ob_reduction.reduce((oID, 'obn'), obn.data, lo, hi)
+                elif MPI:
+                    parallel.allreduce(ob.data)
+                    parallel.allreduce(obn.data)
+                ob.data /= obn.data
+
+                self.clip_object(ob)
+
+    ## probe update
+    def probe_update(self, MPI=False):
+        with u.profiler.region('probe_update'):
+            change = 0
+
+            for pID, pr in self.pr.storages.items():
+                prn = self.pr_nrm.S[pID]
+                cfact = self.pr_cfact[pID]
+                pr.data *= cfact
+                prn.data.fill(cfact)
+
+            # every thread accumulates into its own buffers
+            self._run_threads(self._pr_update_tile)
+
+            for pID, pr in self.pr.storages.items():
+                buf = self.pr_buf.S[pID]
+                prn = self.pr_nrm.S[pID]
+                for acc in self.pr_acc:
+                    pr.data += acc[pID][0]
+                    prn.data += acc[pID][1]
+
+                # MPI test
+                if MPI:
+                    parallel.allreduce(pr.data)
+                    parallel.allreduce(prn.data)
+                pr.data /= prn.data
+
+                self.support_constraint(pr)
+
+                change += u.norm2(pr.data - buf.data) / u.norm2(pr.data)
+                buf.data[:] = pr.data
+                if MPI:
+                    change = parallel.allreduce(change) / parallel.size
+
+        return np.sqrt(change)
+
+    def engine_finalize(self, benchmark=True):
+        """
+        Shut down the thread pool and release the thread-local buffers.
+        """
+        super().engine_finalize(benchmark)
+        self.pool.shutdown()
+        self.pool = None
+        self.ob_acc = None
+        self.pr_acc = None
+
+
+@register()
+class DM_threaded(_ProjectionEngine_threaded, DMMixin):
+    """
+    A multi-threaded Difference Map engine.
+
+    Defaults:
+
+    [name]
+    default = DM_threaded
+    type = str
+    help =
+    doc =
+
+    """
+
+    def __init__(self, ptycho_parent, pars=None):
+        _ProjectionEngine_threaded.__init__(self, ptycho_parent, pars)
+        DMMixin.__init__(self, self.p.alpha)
+        ptycho_parent.citations.add_article(**self.article)
+
+
+@register()
+class RAAR_threaded(_ProjectionEngine_threaded, RAARMixin):
+    """
+    A multi-threaded RAAR engine.
+
+    Defaults:
+
+    [name]
+    default = RAAR_threaded
+    type = str
+    help =
+    doc =
+
+    """
+
+    def __init__(self, ptycho_parent, pars=None):
+        _ProjectionEngine_threaded.__init__(self, ptycho_parent, pars)
+        RAARMixin.__init__(self, self.p.beta)
@@ -8,7 +8,6 @@ This file is part of the PTYPY package.
     :license: see LICENSE for details.
 """
 import numpy as np
-import time
 
 from ptypy import utils as u
 from ptypy.utils.verbose import logger, log
@@ -16,6 +15,7 @@ from ptypy.utils import parallel
 from ptypy import defaults_tree
 from ptypy.engines import register
 from ptypy.engines.stochastic import _StochasticEngine, EPIEMixin, SDRMixin
+from ptypy.engines.utils import PatchMax
 #from ptypy.core.manager import Full, Vanilla, Bragg3dModel, BlockVanilla, BlockFull
 from ptypy.accelerate.base.engines import projectional_serial
 from ptypy.accelerate.base.kernels import FourierUpdateKernel, AuxiliaryWaveKernel, PoUpdateKernel, PositionCorrectionKernel
@@ -24,7 +24,53 @@ from ptypy.accelerate.base import array_utils as au
 
 __all__ = ["EPIE_serial", "SDR_serial"]
 
-class _StochasticEngineSerial(_StochasticEngine):
+
+def overlap_graph(pos, shape, margin=0):
+    """
+    Neighbours of every view, i.e. the views whose patches of size `shape`
+    at positions `pos` overlap with its own patch if every patch may move
+    by up to `margin` pixels.
+
+    Returns a list with an index array for every view.
+    """
+    pos = np.asarray(pos)
+    ext = np.asarray(shape) + 2 * margin
+    nbrs = []
+    for a in range(0, len(pos), 1024):
+        close = (np.abs(pos[a:a + 1024, None, :] - pos[None, :, :]) < ext).all(-1)
+        for k, row in enumerate(close):
+            row[a + k] = False
+            nbrs.append(np.flatnonzero(row))
+    return nbrs
+
+
+def draw_groups(order, nbrs, size):
+    """
+    Distribute the views in `order` greedily into groups of at most `size`
+    views which are not neighbours in the overlap graph `nbrs`.
+    Within a group, the views keep their order.
+    """
+    group = np.full(len(nbrs), -1)
+    count = []
+    first = 0
+    for v in order:
+        taken = set(group[nbrs[v]].tolist())
+        g = first
+        while g < len(count) and (count[g] >= size or g in taken):
+            g += 1
+        if g == len(count):
+            count.append(0)
+        group[v] = g
+        count[g] += 1
+        while first < len(count) and count[first] >= size:
+            first += 1
+    groups = [[] for g in count]
+    for v in order:
+        groups[group[v]].append(v)
+    return [np.array(g) for g in groups]
+
+
+class _StochasticEngineSerial(_StochasticEngine, projectional_serial.KernelBackendMixin):
     """
     A serialized base implementation of a stochastic algorithm for ptychography
 
@@ -40,6 +86,17 @@ class _StochasticEngineSerial(_StochasticEngine):
     type = bool
     help = A switch for computing the fourier error (this can impact the performance of the engine)
 
+    [views_per_batch]
+    default = 1
+    type = int
+    lowlim = 1
+    help = Number of views updated together
+    doc = The views are drawn into groups of at most this many views whose object patches do not overlap,
+      using an overlap graph of the scan positions. Every group is propagated as one stack of frames.
+      The object update of a view is the same as if the views were processed one by one. The probe is updated
+      once per group, from the probe at the start of the group and with the object norms of all views of the
+      group. With 1, the views are processed one by one.
+
     """
 
     #SUPPORTED_MODELS = [Full, Vanilla, Bragg3dModel, BlockVanilla, BlockFull]
@@ -51,10 +108,10 @@ class _StochasticEngineSerial(_StochasticEngine):
         super().__init__(ptycho_parent, pars)
 
         # keep track of timings
-        self.benchmark = u.Param()
 
         # Stores all information needed with respect to the diffraction storages.
         self.diff_info = {}
+        self.addr_tables = {}
         self.ob_cfact = {}
         self.pr_cfact = {}
         self.kernels = {}
@@ -66,22 +123,8 @@ class _StochasticEngineSerial(_StochasticEngine):
         super().engine_initialize()
 
         self.error = []
-        self._reset_benchmarks()
         self._setup_kernels()
 
-    def _reset_benchmarks(self):
-        self.benchmark.A_Build_aux = 0.
-        self.benchmark.B_Prop = 0.
-        self.benchmark.C_Fourier_update = 0.
-        self.benchmark.D_iProp = 0.
-        self.benchmark.E_Build_exit = 0.
-        self.benchmark.F_LLerror = 0.
-        self.benchmark.probe_update = 0.
-        self.benchmark.object_update = 0.
-        self.benchmark.calls_fourier = 0
-        self.benchmark.calls_object = 0
-        self.benchmark.calls_probe = 0
-
     def _setup_kernels(self):
         """
         Setup kernels, one for each scan. Derive scans from ptycho class
@@ -103,8 +146,8 @@ class _StochasticEngineSerial(_StochasticEngine):
             except:
                 nmodes = 1
 
-            # create buffer arrays
-            ash = (nmodes,) + tuple(geo.shape)
+            # create buffer arrays, large enough for a group of views
+            ash = (nmodes * self.p.views_per_batch,) + tuple(geo.shape)
             aux = np.zeros(ash, dtype=np.complex64)
             kern.aux = aux
 
@@ -112,11 +155,7 @@ class _StochasticEngineSerial(_StochasticEngine):
             kern.FUK = FourierUpdateKernel(aux, nmodes)
             kern.FUK.allocate()
 
-            kern.POK = PoUpdateKernel()
-            kern.POK.allocate()
-
-            kern.AWK = AuxiliaryWaveKernel()
-            kern.AWK.allocate()
+            self._setup_po_kernels(kern)
 
             kern.FW = geo.propagator.fw
             kern.BW = geo.propagator.bw
@@ -152,12 +191,13 @@ class _StochasticEngineSerial(_StochasticEngine):
             prep.err_fourier = np.zeros_like(prep.ma_sum)
             prep.err_exit = np.zeros_like(prep.ma_sum)
 
-        # Unfortunately this needs to be done for all pods, since
-        # the shape of the probe / object was modified.
-        # TODO: possible scaling issue, remove the need for padding
+        # Only the addresses of new views are computed, existing ones are
+        # patched if the shape of the probe / object was modified.
         for label, d in self.di.storages.items():
             prep = self.diff_info[d.ID]
-            prep.view_IDs, prep.poe_IDs, prep.addr = projectional_serial.serialize_array_access(d)
+            if d.ID not in self.addr_tables:
+                self.addr_tables[d.ID] = projectional_serial.AddressTable(d)
+            prep.view_IDs, prep.poe_IDs, prep.addr = self.addr_tables[d.ID].serialize()
             if self.do_position_refinement:
                 prep.original_addr = np.zeros_like(prep.addr)
                 prep.original_addr[:] = prep.addr
@@ -168,6 +208,8 @@ class _StochasticEngineSerial(_StochasticEngine):
             prep.vieworder = np.arange(prep.addr.shape[0])
 
             # Modify addresses, copy pa into ea and remove da/ma
+            # The exit wave addresses are kept for groups of views
+            prep.ea = prep.addr[:,:,2].copy()
             prep.addr_ex = np.vstack([prep.addr[:,0,2,0], prep.addr[:,-1,2,0]+1]).T
             prep.addr[:,:,2] = prep.addr[:,:,0]
             prep.addr[:,:,3:,0] = 0
@@ -175,9 +217,20 @@ class _StochasticEngineSerial(_StochasticEngine):
             # Reference to ex
             prep.ex = self.ex.S[eID].data
 
-            # Object / probe norm
-            prep.obn = np.zeros_like(prep.mag[0,None], dtype=np.float32)
-            prep.prn = np.zeros_like(prep.mag[0,None], dtype=np.float32)
+            # Object / probe norm, one frame per view of a group
+            nviews = self.p.views_per_batch
+            prep.obn = np.zeros((nviews,) + prep.mag.shape[-2:], dtype=np.float32)
+            prep.prn = np.zeros((nviews,) + prep.mag.shape[-2:], dtype=np.float32)
+
+            # Views may share exit frames (e.g. GradFull), a group then
+            # works on its own copy of the exit waves
+            if nviews > 1 and np.unique(prep.ea[:,:,0]).size < prep.ea[:,:,0].size:
+                prep.exb = np.zeros((nviews * prep.ea.shape[1],) + prep.ex.shape[-2:], dtype=prep.ex.dtype)
+            else:
+                prep.exb = None
+
+            # The overlap graph is built when needed
+            prep.nbrs = None
 
     def engine_iterate(self, num=1):
         """
@@ -187,6 +240,9 @@ class _StochasticEngineSerial(_StochasticEngine):
 
             error_dct = {}
 
+            # the global object norm is recomputed exactly once per iteration
+            self._ob_max.clear()
+
             for dID in self.di.S.keys():
 
                 # find probe, object and exit ID in dependence of dID
@@ -201,10 +257,7 @@ class _StochasticEngineSerial(_StochasticEngine):
                 FW = kern.FW
                 BW = kern.BW
 
-                # global aux buffer
-                aux = kern.aux
-
-                # references for ob, pr
+                # references for ob, pr, ex
                 ob = self.ob.S[oID].data
                 pr = self.pr.S[pID].data
 
@@ -212,91 +265,101 @@ class _StochasticEngineSerial(_StochasticEngine):
                 vieworder = prep.vieworder
                 prep.rng.shuffle(vieworder)
 
-                # Iterate through views
-                for i in vieworder:
-
-                    # Get local adress and arrays
-                    addr = prep.addr[i,None]
-                    ex_from, ex_to = prep.addr_ex[i]
-                    ex = prep.ex[ex_from:ex_to]
-                    mag = prep.mag[i,None]
-                    ma = prep.ma[i,None]
-                    ma_sum = prep.ma_sum[i,None]
-                    obn = prep.obn
-                    prn = prep.prn
-                    err_phot = prep.err_phot[i,None]
-                    err_fourier = prep.err_fourier[i,None]
-                    err_exit = prep.err_exit[i,None]
+                # Iterate through groups of views
+                for group in self._view_groups(prep, vieworder):
 
                     # position update
-                    self.position_update_local(prep,i)
+                    for i in group:
+                        self.position_update_local(prep, i)
+
+                    # Get local adresses and arrays, the views of the group
+                    # are stacked in the aux buffer
+                    nviews = len(group)
+                    addr = prep.addr[group]
+                    ea = prep.ea[group]
+                    if prep.exb is None:
+                        addr[:,:,2] = ea
+                        ex = prep.ex
+                    else:
+                        ex = prep.exb[:ea.shape[0] * ea.shape[1]]
+                        ex[:] = prep.ex[ea[:,:,0].ravel()]
+                        addr[:,:,2] = 0
+                        addr[:,:,2,0] = np.arange(ex.shape[0]).reshape(ea.shape[:2])
+                    addr[:,:,3:,0] = np.arange(nviews)[:,None,None]
+                    aux = kern.aux[:nviews * addr.shape[1]]
+                    mag = prep.mag[group]
+                    ma = prep.ma[group]
+                    ma_sum = prep.ma_sum[group]
+                    obn = prep.obn[:nviews]
+                    prn = prep.prn[:nviews]
+                    err_phot = prep.err_phot[group]
+                    err_fourier = prep.err_fourier[group]
+                    err_exit = prep.err_exit[group]
 
                     ## build auxilliary wave
-                    t1 = time.time()
-                    AWK.make_aux(aux, addr, ob, pr, ex, c_po=self._c, c_e=1-self._c)
-                    self.benchmark.A_Build_aux += time.time() - t1
+                    with u.profiler.region('build_aux'):
+                        AWK.make_aux(aux, addr, ob, pr, ex, c_po=self._c, c_e=1-self._c)
 
                     ## forward FFT
-                    t1 = time.time()
-                    aux[:] = FW(aux)
-                    self.benchmark.B_Prop += time.time() - t1
+                    with u.profiler.region('forward_prop'):
+                        FW(aux, out=aux)
 
                     ## Deviation from measured data
-                    t1 = time.time()
-                    if self.p.compute_fourier_error:
-                        FUK.fourier_error(aux, addr, mag, ma, ma_sum)
-                        FUK.error_reduce(addr, err_fourier)
-                    else:
-                        FUK.fourier_deviation(aux, addr, mag)
-                    FUK.fmag_update_nopbound(aux, addr, mag, ma)
-                    self.benchmark.C_Fourier_update += time.time() - t1
+                    with u.profiler.region('fourier_update'):
+                        if self.p.compute_fourier_error:
+                            FUK.fourier_error(aux, addr, mag, ma, ma_sum)
+                            FUK.error_reduce(addr, err_fourier)
+                        else:
+                            FUK.fourier_deviation(aux, addr, mag)
+                        FUK.fmag_update_nopbound(aux, addr, mag, ma)
 
                     ## backward FFT
-                    t1 = time.time()
-                    aux[:] = BW(aux)
-                    self.benchmark.D_iProp += time.time() - t1
+                    with u.profiler.region('backward_prop'):
+                        BW(aux, out=aux)
 
                     ## build exit wave
-                    t1 = time.time()
-                    AWK.make_exit(aux, addr, ob, pr, ex, c_a=self._b, c_po=self._a, c_e=-(self._a+self._b))
-                    if self.p.compute_exit_error:
-                        FUK.exit_error(aux,addr)
-                        FUK.error_reduce(addr, err_exit)
-                    self.benchmark.E_Build_exit += time.time() - t1
-                    self.benchmark.calls_fourier += 1
+                    with u.profiler.region('build_exit'):
+                        AWK.make_exit(aux, addr, ob, pr, ex, c_a=self._b, c_po=self._a, c_e=-(self._a+self._b))
+                        if self.p.compute_exit_error:
+                            FUK.exit_error(aux,addr)
+                            FUK.error_reduce(addr, err_exit)
 
                     ## build auxilliary wave (ob * pr product)
-                    t1 = time.time()
-                    AWK.build_aux_no_ex(aux, addr, ob, pr)
-                    self.benchmark.A_Build_aux += time.time() - t1
+                    with u.profiler.region('build_aux'):
+                        AWK.build_aux_no_ex(aux, addr, ob, pr)
 
                     # object update
-                    t1 = time.time()
-                    POK.pr_norm_local(addr, pr, prn)
-                    POK.ob_update_local(addr, ob, pr, ex, aux, prn, a=self._ob_a, b=self._ob_b)
-                    self.benchmark.object_update += time.time() - t1
-                    self.benchmark.calls_object += 1
+                    with u.profiler.region('object_update'):
+                        POK.pr_norm_local(addr, pr, prn)
+                        POK.ob_update_local(addr, ob, pr, ex, aux, prn, a=self._ob_a, b=self._ob_b)
 
                     # probe update
-                    t1 = time.time()
-                    if self._object_norm_is_global and self._pr_a == 0:
-                        obn_max = au.max_abs2(ob)
-                        obn[:] = 0
-                    else:
-                        POK.ob_norm_local(addr, ob, obn)
-                        obn_max = obn.max()
-                    if self.p.probe_update_start <= self.curiter:
-                        POK.pr_update_local(addr, pr, ob, ex, aux, obn, obn_max, a=self._pr_a, b=self._pr_b)
-                    self.benchmark.probe_update += time.time() - t1
-                    self.benchmark.calls_probe += 1
+                    with u.profiler.region('probe_update'):
+                        # the probe update of a group is normalised by the
+                        # object norms of all its views
+                        if self._object_norm_is_global and self._pr_a == 0:
+                            obn_max = self._global_object_norm(oID, ob, addr, pr.shape[-2:]) * nviews
+                            obn[:] = 0
+                        else:
+                            POK.ob_norm_local(addr, ob, obn)
+                            obn_max = obn.max(axis=(-2,-1)).sum()
+                            if nviews > 1:
+                                obn[:] = obn.sum(0)
+                        if self.p.probe_update_start <= self.curiter:
+                            POK.pr_update_local(addr, pr, ob, ex, aux, obn, obn_max, a=self._pr_a, b=self._pr_b)
 
                     ## compute log-likelihood
                     if self.p.compute_log_likelihood:
-                        t1 = time.time()
-                        aux[:] = FW(aux)
-                        FUK.log_likelihood(aux, addr, mag, ma, err_phot)
-                        self.benchmark.F_LLerror += time.time() - t1
+                        with u.profiler.region('log_likelihood'):
+                            FW(aux, out=aux)
+                            FUK.log_likelihood(aux, addr, mag, ma, err_phot)
+
+                    if prep.exb is not None:
+                        prep.ex[ea[:,:,0].ravel()] = ex
 
+                    prep.err_phot[group] = err_phot
+                    prep.err_fourier[group] = err_fourier
+                    prep.err_exit[group] = err_exit
 
                 # update errors
                 errs = np.ascontiguousarray(np.vstack([np.hstack(prep.err_fourier),
@@ -312,6 +375,36 @@ class _StochasticEngineSerial(_StochasticEngine):
         #error = parallel.gather_dict(error_dct)
         return error_dct
 
+    def _global_object_norm(self, oID, ob, addr, shape):
+        """
+        Maximum of the object power summed over modes. It is tracked across
+        the local object updates, only the patches in `addr` are reduced.
+        """
+        ob_max = self._ob_max.get(oID)
+        if ob_max is None:
+            power = lambda sl: au.abs2(ob[(slice(None),) + sl]).sum(axis=0)
+            ob_max = PatchMax(power, self.p.object_norm_tolerance)
+            self._ob_max[oID] = ob_max
+            return ob_max.value
+        corners = np.unique(addr[:, :, 1, 1:].reshape(-1, 2), axis=0)
+        return ob_max.update(corners, shape)
+
+    def _view_groups(self, prep, vieworder):
+        """
+        Groups of views without overlapping object patches, drawn in
+        the order of `vieworder`.
+        """
+        nviews = self.p.views_per_batch
+        if nviews == 1:
+            return vieworder[:,None]
+
+        # Views move by at most the maximum shift of the position refinement
+        # per iteration, with refinement the graph is rebuilt every time
+        if prep.nbrs is None or self.do_position_refinement:
+            margin = self.kernels[prep.label].PCK.mangler.max_bound if self.do_position_refinement else 0
+            prep.nbrs = overlap_graph(prep.addr[:,0,1,1:], prep.mag.shape[-2:], margin)
+        return draw_groups(vieworder, prep.nbrs, nviews)
+
     def position_update_local(self, prep, i):
         """
         Position refinement update for current view.
@@ -334,10 +427,9 @@ class _StochasticEngineSerial(_StochasticEngine):
             ob = self.ob.S[oID].data
             pr = self.pr.S[pID].data
             kern = self.kernels[prep.label]
-            aux = kern.aux
             addr = prep.addr[i,None]
+            aux = kern.aux[:addr.shape[1]]
             original_addr = prep.original_addr[i,None]
-            mangled_addr = addr.copy()
             err_fourier = prep.err_fourier[i,None]
 
             PCK = kern.PCK
@@ -349,7 +441,7 @@ class _StochasticEngineSerial(_StochasticEngine):
 
             # We first need to calculate the current error
             PCK.build_aux(aux, addr, ob, pr)
-            aux[:] = FW(aux)
+            FW(aux, out=aux)
             if self.p.position_refinement.metric == "fourier":
                 PCK.fourier_error(aux, addr, mag, ma, ma_sum)
                 PCK.error_reduce(addr, err_fourier)
@@ -359,17 +451,28 @@ class _StochasticEngineSerial(_StochasticEngine):
             error_state[:] = err_fourier
             PCK.mangler.setup_shifts(self.curiter, nframes=addr.shape[0])
 
+            # Several shifts are evaluated at once with one stacked FFT
+            nshifts = PCK.mangler.nshifts
+            nbatch = PCK.batch_size(nshifts, self.p.position_refinement.batch_memory)
+            PCK.allocate_batch(nbatch, aux.dtype)
+            baux = aux if nbatch == 1 else PCK.npy.aux_batch
+            mangled_addr = np.repeat(addr[None], nbatch, axis=0)
+
             #log(4, 'Position refinement trial: iteration %s' % (self.curiter))
-            for i in range(PCK.mangler.nshifts):
-                PCK.mangler.get_address(i, addr, mangled_addr, max_oby, max_obx)
-                PCK.build_aux(aux, mangled_addr, ob, pr)
-                aux[:] = FW(aux)
+            for k in range(0, nshifts, nbatch):
+                nb = min(nbatch, nshifts - k)
+                for j in range(nb):
+                    PCK.mangler.get_address(k + j, addr, mangled_addr[j], max_oby, max_obx)
+                flat_addr = mangled_addr[:nb].reshape((-1,) + addr.shape[1:])
+                err = PCK.npy.err_batch[:nb, :addr.shape[0]]
+                PCK.build_aux(baux, flat_addr, ob, pr)
+                aux_b = baux[:flat_addr.shape[0] * flat_addr.shape[1]]
+                FW(aux_b, out=aux_b)
                 if self.p.position_refinement.metric == "fourier":
-                    PCK.fourier_error(aux, mangled_addr, mag, ma, ma_sum)
-                    PCK.error_reduce(mangled_addr, err_fourier)
+                    PCK.fourier_error_batched(aux_b, mag, ma, ma_sum, err)
                 if self.p.position_refinement.metric == "photon":
-                    PCK.log_likelihood(aux, mangled_addr, mag, ma, err_fourier)
-                PCK.update_addr_and_error_state(addr, error_state, mangled_addr, err_fourier)
+                    PCK.log_likelihood_batched(aux_b, mag, ma, err)
+                PCK.update_addr_and_error_state_batched(addr, error_state, mangled_addr[:nb], err)
 
             prep.err_fourier[i,None] = error_state
             prep.addr[i,None] = addr
@@ -378,35 +481,14 @@ class _StochasticEngineSerial(_StochasticEngine):
         """
         try deleting ever helper contianer
         """
-        if parallel.master and self.benchmark.calls_fourier:
-            print("----- BENCHMARKS ----")
-            acc = 0.
-            for name in sorted(self.benchmark.keys()):
-                t = self.benchmark[name]
-                if name[0] in 'ABCDEFGHI':
-                    print('%20s : %1.3f ms per iteration' % (name, t / self.benchmark.calls_fourier * 1000))
-                    acc += t
-                elif str(name) == 'probe_update':
-                    print('%20s : %1.3f ms per call. %d calls' % (
-                        name, t / self.benchmark.calls_probe * 1000, self.benchmark.calls_probe))
-                elif str(name) == 'object_update':
-                    print('%20s : %1.3f ms per call. %d calls' % (
-                        name, t / self.benchmark.calls_object * 1000, self.benchmark.calls_object))
-
-            print('%20s : %1.3f ms per iteration. %d calls' % (
-                'Fourier_total', acc / self.benchmark.calls_fourier * 1000, self.benchmark.calls_fourier))
-
-        self._reset_benchmarks()
+        self.print_profile()
 
         if self.do_position_refinement and self.p.position_refinement.record:
             for label, d in self.di.storages.items():
                 prep = self.diff_info[d.ID]
                 res = self.kernels[prep.label].resolution
-                for i,view in enumerate(d.views):
-                    for j,(pname, pod) in enumerate(view.pods.items()):
-                        delta = (prep.addr[i][j][1][1:] - prep.original_addr[i][j][1][1:]) * res
-                        pod.ob_view.coord += delta
-                        pod.ob_view.storage.update_views(pod.ob_view)
+                delta = (prep.addr[:, :, 1, 1:] - prep.original_addr[:, :, 1, 1:]) * res
+                self.addr_tables[d.ID].move_object_views(delta)
             self.ptycho.record_positions = True
 
 
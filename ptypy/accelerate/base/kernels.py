@@ -2,6 +2,28 @@ import numpy as np
 from ptypy.utils.verbose import logger, log
 from .array_utils import max_abs2, abs2
 
+
+def _gather(arr, coords, rows, cols):
+    """
+    Gather the patches ``arr[c[0], c[1]:c[1] + rows, c[2]:c[2] + cols]``
+    for all rows ``c`` of `coords` into a new (N, rows, cols) stack.
+    """
+    win = np.lib.stride_tricks.sliding_window_view(arr, (rows, cols), axis=(-2, -1))
+    return win[coords[:, 0], coords[:, 1], coords[:, 2]]
+
+
+def _scatter_add(arr, coords, vals):
+    """
+    Scatter-add the (N, rows, cols) stack `vals` into `arr` at the patch
+    positions given by `coords`. Overlapping patches are accumulated in
+    the order of `coords`, i.e. exactly like a sequential loop would.
+    """
+    rows, cols = vals.shape[-2:]
+    iy = coords[:, 1, None, None] + np.arange(rows)[None, :, None]
+    ix = coords[:, 2, None, None] + np.arange(cols)[None, None, :]
+    np.add.at(arr, (coords[:, 0, None, None], iy, ix), vals)
+
+
 class Adict(object):
 
     def __init__(self):
@@ -30,6 +52,9 @@ class FourierUpdateKernel(BaseKernel):
         ash = aux.shape
         self.fshape = (ash[0] // nmodes, ash[1], ash[2])
 
+        # working set of one frame block in fourier_update_fused [bytes]
+        self.block_bytes = 2**20
+
         # temporary buffer arrays
         self.npy.fdev = None
         self.npy.ferr = None
@@ -156,6 +181,54 @@ class FourierUpdateKernel(BaseKernel):
         aux[:] = (aux.reshape(ish[0] // nmodes, nmodes, ish[1], ish[2]) * fm[:, np.newaxis, :, :]).reshape(ish)
         return
 
+    def fourier_update_fused(self, b_aux, addr, mag, mask, mask_sum, err_sum, pbound=0.0):
+        """
+        Same as `fourier_error`, `error_reduce` and `fmag_all_update` in
+        sequence, but in a single pass over the aux stack. Frames are
+        processed in blocks whose working set fits into `block_bytes`,
+        such that the temporaries stay in cache.
+        """
+        sh = self.fshape
+        nmodes = self.nmodes
+
+        # stopper
+        maxz = mag.shape[0]
+
+        # batch buffers
+        fdev = self.npy.fdev[:maxz]
+        ferr = self.npy.ferr[:maxz]
+        aux = b_aux[:maxz * nmodes].reshape(maxz, nmodes, sh[1], sh[2])
+
+        fbytes = sh[1] * sh[2] * (nmodes * aux.itemsize + 4 * fdev.itemsize)
+        step = int(max(1, self.block_bytes // fbytes))
+
+        for a in range(0, maxz, step):
+            b = min(a + step, maxz)
+            tf = aux[a:b]
+            g_mag = mag[a:b]
+            g_mask = mask[a:b]
+            g_fdev = fdev[a:b]
+            g_ferr = ferr[a:b]
+            g_err = err_sum[a:b]
+
+            # fourier_error
+            af = np.sqrt((np.abs(tf) ** 2).sum(1))
+            np.subtract(af, g_mag, out=g_fdev)
+            g_ferr[:] = g_mask * np.abs(g_fdev) ** 2 / mask_sum[a:b].reshape((b - a, 1, 1))
+
+            # error_reduce
+            g_err[:] = g_ferr.sum(-1).sum(-1)
+
+            # fmag_all_update
+            renorm = np.ones((b - a,), np.float32)
+            ind = g_err > pbound
+            renorm[ind] = np.sqrt(pbound / g_err[ind])
+            renorm = renorm.reshape((b - a, 1, 1))
+            af = g_fdev + g_mag
+            fm = ((1 - g_mask) + g_mask * (g_mag + g_fdev * renorm) / (af + self.denom)).astype(np.float32, copy=False)
+            tf *= fm[:, np.newaxis, :, :]
+        return
+
     def fmag_update_nopbound(self, b_aux, addr, mag, mask):
 
         sh = self.fshape
@@ -237,11 +310,18 @@ class GradientDescentKernel(BaseKernel):
 
         self.kernels = [
             'make_model',
+            'make_amplitude_model',
             'error_reduce',
             'make_a012',
+            'make_a012_model',
             'fill_b',
+            'fill_b_poisson',
+            'fill_b_euclid',
             'main',
-            'floating_intensity'
+            'main_poisson',
+            'main_euclid',
+            'floating_intensity',
+            'floating_intensity_unweighted'
         ]
 
     def allocate(self):
@@ -269,6 +349,19 @@ class GradientDescentKernel(BaseKernel):
         tf = aux.reshape(sh[0], self.nmodes, sh[1], sh[2])
         Imodel[:] = ((tf * tf.conj()).real).sum(1)
 
+    def make_amplitude_model(self, b_aux, addr):
+
+        # reference shape (= GPU global dims)
+        sh = self.fshape
+
+        # batch buffers
+        Amodel = self.npy.Imodel
+        aux = b_aux
+
+        ## Actual math ## (sum of the mode amplitudes)
+        tf = aux.reshape(sh[0], self.nmodes, sh[1], sh[2])
+        Amodel[:] = np.sqrt((tf * tf.conj()).real).sum(1)
+
     def make_a012(self, b_f, b_a, b_b, addr, I, fic):
 
         # reference shape (= GPU global dims)
@@ -301,6 +394,36 @@ class GradientDescentKernel(BaseKernel):
         A2[:maxz] = tf.reshape(maxz, self.nmodes, sh[1], sh[2]).sum(1) * fc
         return
 
+    def make_a012_model(self, b_f, b_a, b_b, addr, fic):
+
+        # stopper
+        maxz = fic.shape[0]
+        sh = (maxz,) + self.fshape[1:]
+
+        A0 = self.npy.Imodel
+        A1 = self.npy.LLerr
+        A2 = self.npy.LLden
+
+        # batch buffers
+        f = b_f[:maxz * self.nmodes]
+        a = b_a[:maxz * self.nmodes]
+        b = b_b[:maxz * self.nmodes]
+
+        ## Actual math ## (as make_a012, without subtracting the data)
+        fc = fic.reshape((maxz,1,1))
+        A0.fill(0.)
+        tf = np.real(f * f.conj()).astype(self.ftype)
+        A0[:maxz] = tf.reshape(maxz, self.nmodes, sh[1], sh[2]).sum(1) * fc
+
+        A1.fill(0.)
+        tf = 2. * np.real(f * a.conj())
+        A1[:maxz] = tf.reshape(maxz, self.nmodes, sh[1], sh[2]).sum(1) * fc
+
+        A2.fill(0.)
+        tf = 2. * np.real(f * b.conj()) + np.real(a * a.conj())
+        A2[:maxz] = tf.reshape(maxz, self.nmodes, sh[1], sh[2]).sum(1) * fc
+        return
+
     def fill_b(self, addr, Brenorm, w, B):
 
         # don't know the best dims but this element wise anyway
@@ -321,6 +444,43 @@ class GradientDescentKernel(BaseKernel):
         B[2] += np.dot(w.flat, (A1 ** 2 + 2 * A0 * A2).flat) * Brenorm
         return
 
+    def fill_b_poisson(self, addr, Brenorm, m, I, LLbase, B):
+
+        # stopper
+        maxz = I.shape[0]
+
+        A0 = self.npy.Imodel[:maxz]
+        A1 = self.npy.LLerr[:maxz]
+        A2 = self.npy.LLden[:maxz]
+
+        ## Actual math ##
+        A0 += 1e-6
+        DI = 1. - I / A0
+
+        B[0] += (LLbase.sum() + np.dot(m.flat, (A0 - I * np.log(A0)).flat)) * Brenorm
+        B[1] += np.dot(m.flat, (A1 * DI).flat) * Brenorm
+        B[2] += (np.dot(m.flat, (A2 * DI).flat) + 0.5 * np.dot(m.flat, (I * (A1 / A0) ** 2).flat)) * Brenorm
+        return
+
+    def fill_b_euclid(self, addr, Brenorm, w, A, B):
+
+        # stopper
+        maxz = A.shape[0]
+
+        A0 = self.npy.Imodel[:maxz]
+        A1 = self.npy.LLerr[:maxz]
+        A2 = self.npy.LLden[:maxz]
+
+        ## Actual math ##
+        A0 += 1e-12
+        sA0 = np.sqrt(A0)
+        DA = 1. - A / sA0
+
+        B[0] += np.dot(w.flat, ((sA0 - A) ** 2).flat) * Brenorm
+        B[1] += np.dot(w.flat, (A1 * DA).flat) * Brenorm
+        B[2] += (np.dot(w.flat, (A2 * DA).flat) + 0.25 * np.dot(w.flat, (A1 ** 2 * A / A0 ** 1.5).flat)) * Brenorm
+        return
+
     def error_reduce(self, addr, err_sum):
 
         # reference shape  (= GPU global dims)
@@ -360,6 +520,18 @@ class GradientDescentKernel(BaseKernel):
         fic/=fic_tmp
         Imodel *= fic.reshape(Imodel.shape[0], 1, 1)
 
+    def floating_intensity_unweighted(self, addr, I, fic):
+
+        # stopper
+        maxz = fic.shape[0]
+
+        # internal buffers
+        Imodel = self.npy.Imodel[:maxz]
+
+        ## math ##
+        fic[:] = I.sum(-1).sum(-1) / Imodel.sum(-1).sum(-1)
+        Imodel *= fic.reshape(Imodel.shape[0], 1, 1)
+
     def main(self, b_aux, addr, w, I):
 
         nmodes = self.nmodes
@@ -382,6 +554,50 @@ class GradientDescentKernel(BaseKernel):
         aux[:] = (aux.reshape(ish[0] // nmodes, nmodes, ish[1], ish[2]) * tmp[:, np.newaxis, :, :]).reshape(ish)
         return
 
+    def main_poisson(self, b_aux, addr, m, I):
+
+        nmodes = self.nmodes
+        # stopper
+        maxz = I.shape[0]
+
+        # batch buffers
+        err = self.npy.LLerr[:maxz]
+        Imodel = self.npy.Imodel[:maxz]
+        aux = b_aux[:maxz*nmodes]
+
+        # write-to shape  (= GPU global dims)
+        ish = aux.shape
+
+        ## math ##
+        Imodel += 1e-6
+        DI = m * (1. - I / Imodel)
+        err[:] = m * (Imodel - I * np.log(Imodel))
+
+        aux[:] = (aux.reshape(ish[0] // nmodes, nmodes, ish[1], ish[2]) * DI[:, np.newaxis, :, :]).reshape(ish)
+        return
+
+    def main_euclid(self, b_aux, addr, w, A):
+
+        nmodes = self.nmodes
+        # stopper
+        maxz = A.shape[0]
+
+        # batch buffers
+        err = self.npy.LLerr[:maxz]
+        Amodel = self.npy.Imodel[:maxz]
+        aux = b_aux[:maxz*nmodes]
+
+        # write-to shape  (= GPU global dims)
+        ish = aux.shape
+
+        ## math ##
+        Amodel += 1e-6
+        tmp = w * (1. - A / Amodel)
+        err[:] = w * (Amodel - A) ** 2
+
+        aux[:] = (aux.reshape(ish[0] // nmodes, nmodes, ish[1], ish[2]) * tmp[:, np.newaxis, :, :]).reshape(ish)
+        return
+
 
 class AuxiliaryWaveKernel(BaseKernel):
 
@@ -545,6 +761,79 @@ class AuxiliaryWaveKernel(BaseKernel):
                 aux[ind, :, :] = tmp
         return
 
+class AuxiliaryWaveKernelVectorized(AuxiliaryWaveKernel):
+    """
+    Same as AuxiliaryWaveKernel, but gathers all object/probe patches
+    in one pass instead of looping over the addresses.
+    Assumes that the exit wave addresses do not overlap.
+    """
+
+    def make_aux(self, b_aux, addr, ob, pr, ex, c_po=1.0, c_e=0.0):
+
+        sh = addr.shape
+
+        nmodes = sh[1]
+
+        # stopper
+        maxz = sh[0]
+
+        # batch buffers
+        aux = b_aux[:maxz * nmodes]
+        flat_addr = addr.reshape(maxz * nmodes, sh[2], sh[3])
+        rows, cols = ex.shape[-2:]
+        prc, obc, exc = flat_addr[:, 0], flat_addr[:, 1], flat_addr[:, 2]
+        aux[:] = _gather(ob, obc, rows, cols) * pr[prc[:, 0], :, :] * c_po + \
+                 _gather(ex, exc, rows, cols) * c_e
+        return
+
+    def make_exit(self, b_aux, addr, ob, pr, ex, c_a=1.0, c_po=0.0, c_e=-1.0):
+
+        sh = addr.shape
+
+        nmodes = sh[1]
+
+        # stopper
+        maxz = sh[0]
+
+        # batch buffers
+        aux = b_aux[:maxz * nmodes]
+
+        flat_addr = addr.reshape(maxz * nmodes, sh[2], sh[3])
+        rows, cols = ex.shape[-2:]
+        prc, obc, exc = flat_addr[:, 0], flat_addr[:, 1], flat_addr[:, 2]
+
+        dex = c_a * aux + c_po * \
+              _gather(ob, obc, rows, cols) * \
+              _gather(pr, prc, rows, cols) + c_e * \
+              _gather(ex, exc, rows, cols)
+
+        _scatter_add(ex, exc, dex)
+        aux[:] = dex
+        return
+
+    def build_aux_no_ex(self, b_aux, addr, ob, pr, fac=1.0, add=False):
+
+        sh = addr.shape
+
+        nmodes = sh[1]
+
+        # stopper
+        maxz = sh[0]
+
+        # batch buffers
+        aux = b_aux[:maxz * nmodes]
+        flat_addr = addr.reshape(maxz * nmodes, sh[2], sh[3])
+        rows, cols = b_aux.shape[-2:]
+        prc, obc = flat_addr[:, 0], flat_addr[:, 1]
+
+        tmp = _gather(ob, obc, rows, cols) * _gather(pr, prc, rows, cols) * fac
+        if add:
+            aux[:] += tmp
+        else:
+            aux[:] = tmp
+        return
+
+
 class PoUpdateKernel(BaseKernel):
 
     def __init__(self):
@@ -695,6 +984,134 @@ class PoUpdateKernel(BaseKernel):
         arr[:] = np.where(is_zero, nmr, nmr / dnm)
 
 
+class PoUpdateKernelVectorized(PoUpdateKernel):
+    """
+    Same as PoUpdateKernel, but gathers all patches in one pass and
+    scatter-adds them back with ``np.add.at`` instead of looping over
+    the addresses. Overlapping contributions are summed in address order,
+    so results are identical to the loop version.
+    """
+
+    def ob_update(self, addr, ob, obn, pr, ex):
+
+        sh = addr.shape
+        flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
+        rows, cols = ex.shape[-2:]
+        prc, obc, exc = flat_addr[:, 0], flat_addr[:, 1], flat_addr[:, 2]
+        pr_g = _gather(pr, prc, rows, cols)
+        _scatter_add(ob, obc, pr_g.conj() * _gather(ex, exc, rows, cols))
+        _scatter_add(obn, obc, (pr_g.conj() * pr_g).real)
+        return
+
+    def pr_update(self, addr, pr, prn, ob, ex):
+
+        sh = addr.shape
+        flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
+        rows, cols = ex.shape[-2:]
+        prc, obc, exc = flat_addr[:, 0], flat_addr[:, 1], flat_addr[:, 2]
+        ob_g = _gather(ob, obc, rows, cols)
+        _scatter_add(pr, prc, ob_g.conj() * _gather(ex, exc, rows, cols))
+        _scatter_add(prn, prc, (ob_g.conj() * ob_g).real)
+        return
+
+    def ob_update_ML(self, addr, ob, pr, ex, fac=2.0):
+
+        sh = addr.shape
+        flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
+        rows, cols = ex.shape[-2:]
+        prc, obc, exc = flat_addr[:, 0], flat_addr[:, 1], flat_addr[:, 2]
+        _scatter_add(ob, obc, _gather(pr, prc, rows, cols).conj() * \
+                     _gather(ex, exc, rows, cols) * fac)
+        return
+
+    def pr_update_ML(self, addr, pr, ob, ex, fac=2.0):
+
+        sh = addr.shape
+        flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
+        rows, cols = ex.shape[-2:]
+        prc, obc, exc = flat_addr[:, 0], flat_addr[:, 1], flat_addr[:, 2]
+        _scatter_add(pr, prc, _gather(ob, obc, rows, cols).conj() * \
+                     _gather(ex, exc, rows, cols) * fac)
+        return
+
+    def ob_update_local(self, addr, ob, pr, ex, aux, prn, a=0., b=1.):
+        sh = addr.shape
+        flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
+        rows, cols = ex.shape[-2:]
+        prc, obc, exc, dic = flat_addr[:, 0], flat_addr[:, 1], flat_addr[:, 2], flat_addr[:, 3]
+        pr_norm = (1 - a) * prn.max() + a * prn
+        _scatter_add(ob, obc, (a + b) * _gather(pr, prc, rows, cols).conj() * \
+                     (_gather(ex, exc, rows, cols) - aux[:flat_addr.shape[0]]) / \
+                     _gather(pr_norm, dic, rows, cols))
+        return
+
+    def pr_update_local(self, addr, pr, ob, ex, aux, obn, obn_max, a=0., b=1.):
+        sh = addr.shape
+        flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
+        rows, cols = ex.shape[-2:]
+        prc, obc, exc, dic = flat_addr[:, 0], flat_addr[:, 1], flat_addr[:, 2], flat_addr[:, 3]
+        ob_norm = (1 - a) * obn_max + a * obn
+        _scatter_add(pr, prc, (a + b) * _gather(ob, obc, rows, cols).conj() * \
+                     (_gather(ex, exc, rows, cols) - aux[:flat_addr.shape[0]]) / \
+                     _gather(ob_norm, dic, rows, cols))
+        return
+
+    def ob_norm_local(self, addr, ob, obn):
+        sh = addr.shape
+        flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
+        rows, cols = obn.shape[-2:]
+        obn[:] = 0.
+        # each object mode should only be counted once
+        flat_addr = flat_addr[flat_addr[:, 0, 0] == 0]
+        ob_g = _gather(ob, flat_addr[:, 1], rows, cols)
+        _scatter_add(obn, flat_addr[:, 3], (ob_g.conj() * ob_g).real)
+        return
+
+    def pr_norm_local(self, addr, pr, prn):
+        sh = addr.shape
+        flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
+        rows, cols = prn.shape[-2:]
+        prn[:] = 0.
+        # each probe mode should only be counted once
+        flat_addr = flat_addr[flat_addr[:, 1, 0] == 0]
+        pr_g = _gather(pr, flat_addr[:, 0], rows, cols)
+        _scatter_add(prn, flat_addr[:, 3], (pr_g.conj() * pr_g).real)
+        return
+
+    def ob_update_wasp(self, addr, ob, pr, ex, aux, ob_sum_nmr, ob_sum_dnm, alpha=1):
+        sh = addr.shape
+        flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
+        rows, cols = ex.shape[-2:]
+        prc, obc, exc = flat_addr[:, 0], flat_addr[:, 1], flat_addr[:, 2]
+
+        pr_g = _gather(pr, prc, rows, cols)
+        ex_g = _gather(ex, exc, rows, cols)
+        pr_conj = pr_g.conj()
+        pr_abs2 = abs2(pr_g)
+        deltaEW = ex_g - aux[:flat_addr.shape[0]]
+        pr_mean = pr_abs2.mean(axis=(-2, -1), keepdims=True)
+
+        _scatter_add(ob, obc, 0.5 * pr_conj * deltaEW / (pr_mean * alpha + pr_abs2))
+        _scatter_add(ob_sum_nmr, obc, pr_conj * ex_g)
+        _scatter_add(ob_sum_dnm, obc, pr_abs2)
+
+    def pr_update_wasp(self, addr, pr, ob, ex, aux, pr_sum_nmr, pr_sum_dnm, beta=1):
+        sh = addr.shape
+        flat_addr = addr.reshape(sh[0] * sh[1], sh[2], sh[3])
+        rows, cols = ex.shape[-2:]
+        prc, obc, exc = flat_addr[:, 0], flat_addr[:, 1], flat_addr[:, 2]
+
+        ob_g = _gather(ob, obc, rows, cols)
+        ex_g = _gather(ex, exc, rows, cols)
+        ob_conj = ob_g.conj()
+        ob_abs2 = abs2(ob_g)
+        deltaEW = ex_g - aux[:flat_addr.shape[0]]
+
+        _scatter_add(pr, prc, ob_conj * deltaEW / (beta + ob_abs2))
+        _scatter_add(pr_sum_nmr, prc, ob_conj * ex_g)
+        _scatter_add(pr_sum_dnm, prc, ob_abs2)
+
+
 class PositionCorrectionKernel(BaseKernel):
     from ptypy.accelerate.base import address_manglers
 
@@ -709,6 +1126,8 @@ class PositionCorrectionKernel(BaseKernel):
         self.fshape = (ash[0] // nmodes, ash[1], ash[2])
         self.npy.ferr = None
         self.npy.fdev = None
+        self.npy.aux_batch = None
+        self.npy.err_batch = None
         self.addr = None
         self.nmodes = nmodes
         self.param = parameters
@@ -847,3 +1266,72 @@ class PositionCorrectionKernel(BaseKernel):
         #log(4, "Position correction: updating %s indices" % np.sum(update_indices))
         addr[update_indices] = mangled_addr[update_indices]
         error_state[update_indices] = err_sum[update_indices]
+
+    def batch_size(self, nshifts, max_memory=None):
+        """
+        Number of shifts which are evaluated at once, such that the stacked
+        exit waves and intensities fit into `max_memory` bytes.
+        """
+        if not max_memory:
+            return 1
+        nframes, rows, cols = self.fshape
+        per_shift = nframes * rows * cols * (self.nmodes * np.dtype(np.complex64).itemsize
+                                             + 2 * np.dtype(np.float32).itemsize)
+        return int(max(1, min(nshifts, max_memory // per_shift)))
+
+    def allocate_batch(self, nbatch, dtype=np.complex64):
+        """
+        Buffers for the stacked exit waves and errors of `nbatch` shifts.
+        """
+        nframes, rows, cols = self.fshape
+        if self.npy.err_batch is None or self.npy.err_batch.shape[0] < nbatch:
+            self.npy.err_batch = np.zeros((nbatch, nframes), dtype=np.float32)
+            self.npy.aux_batch = None
+        if nbatch > 1 and (self.npy.aux_batch is None or self.npy.aux_batch.shape[0] < nbatch * nframes * self.nmodes):
+            self.npy.aux_batch = np.zeros((nbatch * nframes * self.nmodes, rows, cols), dtype=dtype)
+
+    def _batched_intensity(self, b_aux, nbatch, maxz):
+        sh = self.fshape
+        tf = b_aux[:nbatch * maxz * self.nmodes].reshape(nbatch, maxz, self.nmodes, sh[1], sh[2])
+        return (np.abs(tf) ** 2).sum(2)
+
+    def fourier_error_batched(self, b_aux, mag, mask, mask_sum, err_sum):
+        """
+        Same as fourier_error followed by error_reduce, for a stack of
+        `nbatch` candidate shifts. `err_sum` has shape (nbatch, nframes).
+        """
+        nbatch, maxz = err_sum.shape
+        af = np.sqrt(self._batched_intensity(b_aux, nbatch, maxz))
+        fdev = af - mag
+        ferr = mask * np.abs(fdev) ** 2 / mask_sum.reshape((maxz, 1, 1))
+        err_sum[:] = ferr.sum(-1).sum(-1)
+
+    def log_likelihood_batched(self, b_aux, mag, mask, err_sum):
+        """
+        Same as log_likelihood, for a stack of candidate shifts.
+        """
+        nbatch, maxz = err_sum.shape
+        LL = self._batched_intensity(b_aux, nbatch, maxz)
+        I = mag**2
+        err_sum[:] = ((mask * (LL - I)**2 / (I + 1.)).sum(-1).sum(-1) / np.prod(LL.shape[-2:]))
+
+    def log_likelihood_ml_batched(self, b_aux, I, weights, err_sum):
+        """
+        Same as log_likelihood_ml, for a stack of candidate shifts.
+        """
+        nbatch, maxz = err_sum.shape
+        LL = self._batched_intensity(b_aux, nbatch, maxz)
+        err_sum[:] = ((weights * (LL - I)**2).sum(-1).sum(-1) / np.prod(LL.shape[-2:]))
+
+    def update_addr_and_error_state_batched(self, addr, error_state, mangled_addr, err_sum):
+        """
+        Picks the shift with the smallest error for every frame and updates
+        the addresses and error state where it improves on the current one.
+        `mangled_addr` has shape (nbatch,) + addr.shape.
+        """
+        best = np.argmin(err_sum, axis=0)
+        frames = np.arange(addr.shape[0])
+        best_err = err_sum[best, frames]
+        update_indices = best_err < error_state
+        addr[update_indices] = mangled_addr[best[update_indices], frames[update_indices]]
+        error_state[update_indices] = best_err[update_indices]
@@ -73,6 +73,8 @@ class ML_pycuda(ML_serial):
         Maximum likelihood reconstruction engine.
         """
         super().__init__(ptycho_parent, pars)
+        if self.p.search_direction == 'lbfgs':
+            raise NotImplementedError("L-BFGS search directions are not supported on the GPU")
 
     def engine_initialize(self):
         """
@@ -171,8 +171,6 @@ class DM_ocl(projectional_serial.DM_serial):
             error_dct = {}
 
             for dID in self.di.S.keys():
-                t1 = time.time()
-
                 prep = self.diff_info[dID]
                 # find probe, object in exit ID in dependence of dID
                 pID, oID, eID = prep.poe_IDs
@@ -201,45 +199,37 @@ class DM_ocl(projectional_serial.DM_serial):
 
                 queue = self.queue
 
-                t1 = time.time()
-                AWK.build_aux(aux, addr, ob, pr, ex, alpha=self.p.alpha)
-                queue.finish()
-
-                self.benchmark.A_Build_aux += time.time() - t1
+                with u.profiler.region('build_aux'):
+                    AWK.build_aux(aux, addr, ob, pr, ex, alpha=self.p.alpha)
+                    queue.finish()
 
                 ## FFT
-                t1 = time.time()
-                FW(aux, aux)
-                queue.finish()
-                self.benchmark.B_Prop += time.time() - t1
+                with u.profiler.region('forward_prop'):
+                    FW(aux, aux)
+                    queue.finish()
 
                 ## Deviation from measured data
-                t1 = time.time()
-                FUK.fourier_error(aux, addr, mag, ma, ma_sum)
-                FUK.error_reduce(addr, err_fourier)
-                FUK.fmag_all_update(aux, addr, mag, ma, err_fourier, pbound)
-                queue.finish()
-                self.benchmark.C_Fourier_update += time.time() - t1
+                with u.profiler.region('fourier_update'):
+                    FUK.fourier_error(aux, addr, mag, ma, ma_sum)
+                    FUK.error_reduce(addr, err_fourier)
+                    FUK.fmag_all_update(aux, addr, mag, ma, err_fourier, pbound)
+                    queue.finish()
 
                 ## iFFT
-                t1 = time.time()
-                BW(aux, aux)
-                queue.finish()
-
-                self.benchmark.D_iProp += time.time() - t1
+                with u.profiler.region('backward_prop'):
+                    BW(aux, aux)
+                    queue.finish()
 
                 ## apply changes #2
-                t1 = time.time()
-                AWK.build_exit(aux, addr, ob, pr, ex)
-                queue.finish()
-                self.benchmark.E_Build_exit += time.time() - t1
+                with u.profiler.region('build_exit'):
+                    AWK.build_exit(aux, addr, ob, pr, ex)
+                    queue.finish()
 
                 err_phot = np.zeros_like(err_fourier)
                 err_exit = np.zeros_like(err_fourier)
                 errs = np.array(list(zip(err_fourier.get(self.queue), err_phot, err_exit)))
                 error = dict(zip(prep.view_IDs, errs))
 
-                self.benchmark.calls_fourier += 1
 
             parallel.barrier()
 
@@ -266,138 +256,130 @@ class DM_ocl(projectional_serial.DM_serial):
 
     ## object update
     def object_update(self, MPI=False):
-        t1 = time.time()
-        queue = self.queue
-        queue.finish()
-        for oID, ob in self.ob.storages.items():
-            obn = self.ob_nrm.S[oID]
-            """
-            if self.p.obj_smooth_std is not None:
-                logger.info('Smoothing object, cfact is %.2f' % cfact)
-                t2 = time.time()
-                self.prg.gaussian_filter(queue, (info[3],info[4]), None, obj_gpu.data, self.gauss_kernel_gpu.data)
-                queue.finish()
-                obj_gpu *= cfact
-                print 'gauss: '  + str(time.time()-t2)
-            else:
-                obj_gpu *= cfact
-            """
-            cfact = self.ob_cfact[oID]
-            ob.gpu *= cfact
-            # obn.gpu[:] = cfact
-            obn.gpu.fill(cfact)
+        with u.profiler.region('object_update'):
+            queue = self.queue
             queue.finish()
+            for oID, ob in self.ob.storages.items():
+                obn = self.ob_nrm.S[oID]
+                """
+                if self.p.obj_smooth_std is not None:
+                    logger.info('Smoothing object, cfact is %.2f' % cfact)
+                    t2 = time.time()
+                    self.prg.gaussian_filter(queue, (info[3],info[4]), None, obj_gpu.data, self.gauss_kernel_gpu.data)
+                    queue.finish()
+                    obj_gpu *= cfact
+                    print 'gauss: '  + str(time.time()-t2)
+                else:
+                    obj_gpu *= cfact
+                """
+                cfact = self.ob_cfact[oID]
+                ob.gpu *= cfact
+                # obn.gpu[:] = cfact
+                obn.gpu.fill(cfact)
+                queue.finish()
 
-        # storage for-loop
-        for dID in self.di.S.keys():
-            prep = self.diff_info[dID]
-
-            POK = self.kernels[prep.label].POK
-            # find probe, object in exit ID in dependence of dID
-            pID, oID, eID = prep.poe_IDs
+            # storage for-loop
+            for dID in self.di.S.keys():
+                prep = self.diff_info[dID]
 
-            # scan for loop
-            ev = POK.ob_update(prep.addr,
-                               self.ob.S[oID].gpu,
-                               self.ob_nrm.S[oID].gpu,
-                               self.pr.S[pID].gpu,
-                               self.ex.S[eID].gpu)
-            queue.finish()
+                POK = self.kernels[prep.label].POK
+                # find probe, object in exit ID in dependence of dID
+                pID, oID, eID = prep.poe_IDs
 
-        for oID, ob in self.ob.storages.items():
-            obn = self.ob_nrm.S[oID]
-            # MPI test
-            if MPI:
-                ob.data[:] = ob.gpu.get(queue=queue)
-                obn.data[:] = obn.gpu.get(queue=queue)
+                # scan for loop
+                ev = POK.ob_update(prep.addr,
+                                   self.ob.S[oID].gpu,
+                                   self.ob_nrm.S[oID].gpu,
+                                   self.pr.S[pID].gpu,
+                                   self.ex.S[eID].gpu)
                 queue.finish()
-                parallel.allreduce(ob.data)
-                parallel.allreduce(obn.data)
-                ob.data /= obn.data
-
-                # Clip object (This call takes like one ms. Not time critical)
-                if self.p.clip_object is not None:
-                    clip_min, clip_max = self.p.clip_object
-                    ampl_obj = np.abs(ob.data)
-                    phase_obj = np.exp(1j * np.angle(ob.data))
-                    too_high = (ampl_obj > clip_max)
-                    too_low = (ampl_obj < clip_min)
-                    ob.data[too_high] = clip_max * phase_obj[too_high]
-                    ob.data[too_low] = clip_min * phase_obj[too_low]
-                ob.gpu.set(ob.data)
-            else:
-                ob.gpu /= obn.gpu
 
-            queue.finish()
+            for oID, ob in self.ob.storages.items():
+                obn = self.ob_nrm.S[oID]
+                # MPI test
+                if MPI:
+                    ob.data[:] = ob.gpu.get(queue=queue)
+                    obn.data[:] = obn.gpu.get(queue=queue)
+                    queue.finish()
+                    parallel.allreduce(ob.data)
+                    parallel.allreduce(obn.data)
+                    ob.data /= obn.data
+
+                    # Clip object (This call takes like one ms. Not time critical)
+                    if self.p.clip_object is not None:
+                        clip_min, clip_max = self.p.clip_object
+                        ampl_obj = np.abs(ob.data)
+                        phase_obj = np.exp(1j * np.angle(ob.data))
+                        too_high = (ampl_obj > clip_max)
+                        too_low = (ampl_obj < clip_min)
+                        ob.data[too_high] = clip_max * phase_obj[too_high]
+                        ob.data[too_low] = clip_min * phase_obj[too_low]
+                    ob.gpu.set(ob.data)
+                else:
+                    ob.gpu /= obn.gpu
 
-        # print 'object update: ' + str(time.time()-t1)
-        self.benchmark.object_update += time.time() - t1
-        self.benchmark.calls_object += 1
+                queue.finish()
 
     ## probe update
     def probe_update(self, MPI=False):
-        t1 = time.time()
-        queue = self.queue
-
-        # storage for-loop
-        change = 0
-        cfact = self.p.probe_inertia
-        for pID, pr in self.pr.storages.items():
-            prn = self.pr_nrm.S[pID]
-            cfact = self.pr_cfact[pID]
-            pr.gpu *= cfact
-            prn.gpu.fill(cfact)
-
-        for dID in self.di.S.keys():
-            prep = self.diff_info[dID]
-
-            POK = self.kernels[prep.label].POK
-            # find probe, object in exit ID in dependence of dID
-            pID, oID, eID = prep.poe_IDs
-
-            # scan for-loop
-            ev = POK.pr_update(prep.addr,
-                               self.pr.S[pID].gpu,
-                               self.pr_nrm.S[pID].gpu,
-                               self.ob.S[oID].gpu,
-                               self.ex.S[eID].gpu)
-            queue.finish()
+        with u.profiler.region('probe_update'):
+            queue = self.queue
+
+            # storage for-loop
+            change = 0
+            cfact = self.p.probe_inertia
+            for pID, pr in self.pr.storages.items():
+                prn = self.pr_nrm.S[pID]
+                cfact = self.pr_cfact[pID]
+                pr.gpu *= cfact
+                prn.gpu.fill(cfact)
 
-        for pID, pr in self.pr.storages.items():
+            for dID in self.di.S.keys():
+                prep = self.diff_info[dID]
 
-            buf = self.pr_buf.S[pID]
-            prn = self.pr_nrm.S[pID]
+                POK = self.kernels[prep.label].POK
+                # find probe, object in exit ID in dependence of dID
+                pID, oID, eID = prep.poe_IDs
 
-            # MPI test
-            if MPI:
-                # if False:
-                pr.data[:] = pr.gpu.get(queue=queue)
-                prn.data[:] = prn.gpu.get(queue=queue)
+                # scan for-loop
+                ev = POK.pr_update(prep.addr,
+                                   self.pr.S[pID].gpu,
+                                   self.pr_nrm.S[pID].gpu,
+                                   self.ob.S[oID].gpu,
+                                   self.ex.S[eID].gpu)
                 queue.finish()
-                parallel.allreduce(pr.data)
-                parallel.allreduce(prn.data)
-                pr.data /= prn.data
 
-                self.support_constraint(pr)
+            for pID, pr in self.pr.storages.items():
 
-                pr.gpu.set(pr.data)
-            else:
-                pr.gpu /= prn.gpu
-                # ca. 0.3 ms
-                # self.pr.S[pID].gpu = probe_gpu
-                pr.data[:] = pr.gpu.get(queue=queue)
+                buf = self.pr_buf.S[pID]
+                prn = self.pr_nrm.S[pID]
 
-            ## this should be done on GPU
+                # MPI test
+                if MPI:
+                    # if False:
+                    pr.data[:] = pr.gpu.get(queue=queue)
+                    prn.data[:] = prn.gpu.get(queue=queue)
+                    queue.finish()
+                    parallel.allreduce(pr.data)
+                    parallel.allreduce(prn.data)
+                    pr.data /= prn.data
 
-            queue.finish()
-            change += u.norm2(pr.data - buf.data) / u.norm2(pr.data)
-            buf.data[:] = pr.data
-            if MPI:
-                change = parallel.allreduce(change) / parallel.size
-
-        # print 'probe update: ' + str(time.time()-t1)
-        self.benchmark.probe_update += time.time() - t1
-        self.benchmark.calls_probe += 1
+                    self.support_constraint(pr)
+
+                    pr.gpu.set(pr.data)
+                else:
+                    pr.gpu /= prn.gpu
+                    # ca. 0.3 ms
+                    # self.pr.S[pID].gpu = probe_gpu
+                    pr.data[:] = pr.gpu.get(queue=queue)
+
+                ## this should be done on GPU
+
+                queue.finish()
+                change += u.norm2(pr.data - buf.data) / u.norm2(pr.data)
+                buf.data[:] = pr.data
+                if MPI:
+                    change = parallel.allreduce(change) / parallel.size
 
         return np.sqrt(change)
 
@@ -45,6 +45,7 @@ except ImportError:
 from .. import utils as u
 from ..utils.verbose import logger
 from ..utils.parameters import PARAM_PREFIX
+from ..io.h5rw import LazyDataset
 
 __all__ = ['Container', 'Storage', 'View', 'POD', 'Base', 'DEFAULT_PSIZE',
            'DEFAULT_SHAPE']  # IDManager']
@@ -180,14 +181,40 @@ class Base(object):
         l = len(recs)
         if idx >= l:
             nl = l + 8192 if idx > 10000 else 2*l
-            recs = np.resize(recs,(nl,))
-            self._recs[prefix] = recs
+            recs = self._grow_records(prefix, nl)
         rec = recs[idx] 
         obj._record = rec
         rec['ID'] = nID
         
         return
+
+    def _grow_records(self, prefix, size):
+        """
+        Enlarge the records of objects with `prefix` to `size` rows.
+        The records of the registered objects are moved along, so that
+        the record array stays the registry of their current state.
+        """
+        recs = np.resize(self._recs[prefix], (size,))
+        self._recs[prefix] = recs
+        for obj in self._pool[prefix].values():
+            if obj.numID is not None and obj.numID < size:
+                obj._record = recs[obj.numID]
+        return recs
         
+    def _reserve_records(self, cls, num):
+        """
+        Make room for `num` more objects of class `cls` in the records.
+        The records of objects registered next are then views into one
+        and the same array and can be filled in bulk.
+        """
+        prefix = cls._PREFIX
+        if self._pool.get(prefix) is None:
+            self._pool[prefix] = OrderedDict()
+            self._recs[prefix] = np.zeros((8,), dtype=cls._fields)
+        size = len(self._pool[prefix]) + num + 1
+        if size > len(self._recs[prefix]):
+            self._grow_records(prefix, size)
+
     @staticmethod
     def _num_to_id(num):
         """
@@ -322,6 +349,11 @@ class Storage(Base):
 
     _PREFIX = STORAGE_PREFIX
 
+    # Data buffer, and the dataset it is read from at first access
+    # if the storage was loaded lazily from file.
+    _data = None
+    _lazy = None
+
     def __init__(self, container, ID=None, data=None, shape=DEFAULT_SHAPE, 
                  fill=0., psize=1., origin=None, layermap=None, padonly=False,
                  padding=0, **kwargs):
@@ -429,6 +461,9 @@ class Storage(Base):
             layermap = list(range(len(self.data)))
         self.layermap = layermap
 
+        # Hash map input layer -> index in data buffer, see layer_index()
+        self._layer_index = None
+
         # This is most often not accurate. Set this quantity from the outside
         self.nlayers = len(layermap)
 
@@ -568,9 +603,16 @@ class Storage(Base):
             the view is actually on self. Use cautiously.
         """
         if v is None:
-            for v in self.views:
-                self.update_views(v)
-            return
+            views = self.views
+            if not views:
+                return
+            for v in views:
+                if not self.ndim == v.ndim:
+                    break
+            else:
+                # All views at once, through the view records of the container
+                self._update_view_records(self._view_rows(views))
+                return
 
         if not self.ndim == v.ndim:
             raise ValueError(
@@ -597,6 +639,37 @@ class Storage(Base):
         # else:
         #     v.slayer = self.layermap.index(v.layer)
 
+    def _view_rows(self, views):
+        """
+        Rows of `views` in the view records of the container.
+        """
+        return np.fromiter((v.numID for v in views), dtype=int, count=len(views))
+
+    def _update_view_records(self, rows):
+        """
+        Same as :py:meth:`update_views` for the views with records `rows`.
+        """
+        ndim = self.ndim
+        recs = self.owner.original.view_records
+
+        # Synchronize pixel size
+        recs['psize'][rows, :ndim] = self.psize
+
+        # Convert the physical coordinates of the views to pixel coordinates
+        pcoord = self._to_pix(recs['coord'][rows, :ndim])
+
+        # Integer part (note that np.round is not stable for odd arrays)
+        dcoord = np.round(pcoord + 0.00001).astype(int)
+        shape = recs['shape'][rows, :ndim]
+
+        # These are the important attributes used when accessing the data
+        recs['dcoord'][rows, :ndim] = dcoord
+        recs['dlow'][rows, :ndim] = dcoord - shape // 2
+        recs['dhigh'][rows, :ndim] = dcoord + (shape + 1) // 2
+
+        # Subpixel offset
+        recs['sp'][rows, :ndim] = pcoord - dcoord
+
     def reformat(self, newID=None, update=True):
         """
         Crop or pad if required.
@@ -637,28 +710,27 @@ class Storage(Base):
 
         sh = self.data.shape
 
-        # Loop through all active views to get individual boundaries
+        # Get the individual boundaries of all active views
         dlow_fov = [np.inf] * self.ndim
         dhigh_fov = [-np.inf] * self.ndim
-        layers = []
         dims = list(range(self.ndim))
-        for v in views:
-            if not v.active:
-                continue
+        rows = self._view_rows(views)
+        recs = self.owner.original.view_records
+        if views:
+            rows = rows[recs['active'][rows]]
 
+        if len(rows):
             # Accumulate the regions of interest to
             # compute the full field of view
-            for d in dims:
-                dlow_fov[d] = min(dlow_fov[d], v.dlow[d])
-                dhigh_fov[d] = max(dhigh_fov[d], v.dhigh[d])
-                
-            # Gather a (unique) list of layers
-            if v.layer not in layers:
-                layers.append(v.layer)
+            dlow_fov[:] = recs['dlow'][rows, :self.ndim].min(0).tolist()
+            dhigh_fov[:] = recs['dhigh'][rows, :self.ndim].max(0).tolist()
+
+        # Gather a (unique) list of layers
+        layers = np.unique(recs['layer'][rows]).tolist() if len(rows) else []
 
         # Check if storage is scattered
         # A storage is "scattered" if and only if layer maps are different across nodes.
-        new_layermap = sorted(layers)
+        new_layermap = layers
 
         # Update boundaries
         if not self._is_scattered and u.parallel.MPIenabled:
@@ -731,9 +803,9 @@ class Storage(Base):
         if self.layermap != new_layermap:
             relaid_data = []
             for i in new_layermap:
-                if i in self.layermap:
+                if i in self._layers():
                     # This layer already exists
-                    d = new_data[self.layermap.index(i)]
+                    d = new_data[self.layer_index(i)]
                 else:
                     # A new layer
                     d = np.empty(new_shape[-self.ndim:], self.dtype)
@@ -746,8 +818,8 @@ class Storage(Base):
         self.nlayers = len(new_layermap)
         
         # set layer index in the view
-        for v in views:
-            v.dlayer = self.layermap.index(v.layer)
+        layer_index = self._layers()
+        recs['dlayer'][rows] = [layer_index[l] for l in recs['layer'][rows].tolist()]
 
         logger.debug('%s[%s] :: shape: %s -> %s'
                      % (self.owner.ID, self.ID, str(sh), str(new_shape)))
@@ -756,6 +828,74 @@ class Storage(Base):
         self.shape = new_shape
         self.center = new_center
                 
+    def _layers(self):
+        """
+        Dictionary mapping input layers to their index in the data buffer.
+        Rebuilt whenever the layermap has been replaced or resized.
+        """
+        index = self.__dict__.get('_layer_index')
+        if index is None or index[0] is not self.layermap or len(index[1]) != len(self.layermap):
+            index = (self.layermap, {l: i for i, l in enumerate(self.layermap)})
+            self._layer_index = index
+        return index[1]
+
+    def layer_index(self, layer):
+        """
+        Index of input layer `layer` in the data buffer.
+        Equivalent to ``self.layermap.index(layer)`` at constant cost.
+
+        Raises
+        ------
+        ValueError
+            If `layer` is not in the layermap.
+        """
+        try:
+            return self._layers()[layer]
+        except KeyError:
+            raise ValueError("Layer '%s' is not present in storage %s"
+                             % (layer, self.ID))
+
+    @property
+    def data(self):
+        """
+        Three/four or potentially N-dimensional array as data buffer.
+        A :py:class:`~ptypy.io.h5rw.LazyDataset` assigned to it is read
+        at first access.
+        """
+        if self._lazy is not None:
+            self._data = self._lazy.load()
+            self._lazy = None
+        return self._data
+
+    @data.setter
+    def data(self, v):
+        if isinstance(v, LazyDataset):
+            self._lazy = v
+            self._data = None
+        else:
+            self._lazy = None
+            self._data = v
+
+    @property
+    def is_loaded(self):
+        """
+        False if the data buffer still needs to be read from file.
+        """
+        return self._lazy is None
+
+    def _post_dict_import(self):
+        # _from_dict() has put the buffer into the instance dictionary
+        if 'data' in self.__dict__:
+            self.data = self.__dict__.pop('data')
+
+    def _to_dict(self):
+        res = super(Storage, self)._to_dict()
+        res.pop('_layer_index', None)
+        res.pop('_lazy', None)
+        res.pop('_data', None)
+        res['data'] = self.data
+        return res
+
     def _to_pix(self, coord):
         """
         Transforms physical coordinates `coord` to pixel coordinates.
@@ -854,6 +994,23 @@ class Storage(Base):
         if not self._is_scattered:
             u.parallel.allreduce(self.data, op=op)
 
+    def allreduce_async(self, op=None):
+        """
+        Starts a non-blocking MPI ``allreduce`` of ``self.data``.
+        The data must not be used before the returned request is
+        completed with :py:func:`ptypy.utils.parallel.waitall`.
+
+        :param op: Reduction operation. If ``None`` uses sum.
+        :returns: Request handle, None if there is nothing to reduce.
+
+        See also
+        --------
+        ptypy.utils.parallel.iallreduce
+        Storage.allreduce
+        """
+        if not self._is_scattered:
+            return u.parallel.iallreduce(self.data, op=op)
+
     def zoom_to_psize(self, new_psize, **kwargs):
         """
         Changes pixel size and zooms the data buffer along last two axis
@@ -1050,8 +1207,8 @@ class Storage(Base):
                 return shift(self.data[
                              v.dlayer, v.dlow[0]:v.dhigh[0], v.dlow[1]:v.dhigh[1],
                              v.dlow[2]:v.dhigh[2]], v.sp)
-        elif v in self.layermap:
-            return self.data[self.layermap.index(v)]
+        elif v in self._layers():
+            return self.data[self.layer_index(v)]
         else:
             raise ValueError("View or layer '%s' is not present in storage %s"
                              % (v, self.ID))
@@ -1102,8 +1259,8 @@ class Storage(Base):
                           v.dlow[2]:v.dhigh[2],
                           v.dlow[3]:v.dhigh[3],
                           v.dlow[4]:v.dhigh[4]] = (shift(newdata, -v.sp))
-        elif v in self.layermap:
-            self.data[self.layermap.index(v)] = newdata
+        elif v in self._layers():
+            self.data[self.layer_index(v)] = newdata
         else:
             raise ValueError("View or layer '%s' is not present in storage %s"
                              % (v, self.ID))
@@ -1289,7 +1446,10 @@ class View(Base):
 
     def copy(self,ID=None, update = True):
         nView = View(self.owner, ID)
-        nView._record = self._record.copy()
+        # Copy the access information into the record of the new view
+        nID = nView._record['ID']
+        self.owner._recs[VIEW_PREFIX][nView.numID] = self._record
+        nView._record['ID'] = nID
         nView._ndim = self._ndim
         nView.storage = self.storage
         nView.storageID = self.storageID
@@ -1587,6 +1747,24 @@ class Container(Base):
         # boolean parameter for distributed containers
         self._is_scattered = (distribution == "scattered")
 
+    @property
+    def distribution(self):
+        """
+        "scattered" if the storages are distributed across MPI processes,
+        "cloned" if all processes hold the same copy. Setting it applies
+        to all storages of this container and its copies, the storages
+        follow the new distribution on their next reformat.
+        """
+        return "scattered" if self._is_scattered else "cloned"
+
+    @distribution.setter
+    def distribution(self, distribution):
+        self._is_scattered = (distribution == "scattered")
+        for c in [self] + self.copies:
+            c._is_scattered = self._is_scattered
+            for s in c.storages.values():
+                s._is_scattered = self._is_scattered
+
     @property
     def copies(self):
         """
@@ -1698,6 +1876,20 @@ class Container(Base):
                 sz += s.data.nbytes
         return sz
 
+    @property
+    def view_records(self):
+        """
+        Registry of the access information of all views of this container.
+
+        A structured array with the fields of :py:attr:`View._fields`
+        (ID, active, dlayer, layer, dlow, dhigh, shape, dcoord, psize,
+        coord, sp), the record of view ``v`` is row ``v.numID``. The view
+        properties read and write this array, so it can be used to get or
+        set the state of many views with vectorized operations.
+        Copies of a container share the registry of the original.
+        """
+        return self.original._recs.get(VIEW_PREFIX)
+
     def views_in_storage(self, s, active_only=True):
         """
         Return a list of views on :any:`Storage` `s`.
@@ -1739,7 +1931,8 @@ class Container(Base):
         data_type = self.data_type if dtype is None else dtype
         new_cont = type(self)(self.owner,
                               ID=ID,
-                              data_type=data_type)
+                              data_type=data_type,
+                              distribution=self.distribution)
         new_cont.original = self
 
         # If changing data type, avoid casting by producing empty buffers
@@ -1779,6 +1972,22 @@ class Container(Base):
         for s in self.storages.values():
             s.allreduce(op=op)
 
+    def allreduce_async(self, op=None):
+        """
+        Starts non-blocking MPI ``allreduce`` operations for all
+        :any:`Storage` instances held by *self*.
+
+        :param op: Reduction operation. If ``None`` uses sum.
+        :returns: List of request handles, to be completed with
+                  :py:func:`ptypy.utils.parallel.waitall`.
+
+        See also
+        --------
+        ptypy.utils.parallel.iallreduce
+        Storage.allreduce_async
+        """
+        return [s.allreduce_async(op=op) for s in self.storages.values()]
+
     def clear(self):
         """
         Reduce / delete all data in attached storages
@@ -1812,6 +2021,97 @@ class Container(Base):
         # Return new storage
         return s
 
+    def new_views(self, coords, layers, storageID=None, shape=None,
+                  psize=None, active=True):
+        """
+        Create and register many views on one storage at once.
+
+        Equivalent to creating a :any:`View` for every entry of
+        `layers` but the access information of all views is written
+        into the records in one vectorized pass.
+
+        Parameters
+        ----------
+        coords : array-like
+            Physical coordinates of the view centers, ``(N, ndim)``
+            or a single coordinate for all views.
+
+        layers : array-like of int
+            Layer of every view, length ``N``.
+
+        storageID : str
+            ID of storage, if the Storage does not exist it will be
+            created.
+
+        shape : int or tuple of int
+            Shape of the views in pixels. If None, the views span
+            the full frame of the storage.
+
+        psize : float or tuple of float
+            Pixel size, required for storage initialization.
+
+        active : bool or array-like of bool
+            Active state of every view.
+
+        Returns
+        -------
+        views : list
+            The new :any:`View` instances, in the order of `layers`.
+        """
+        layers = np.asarray(layers, dtype=int)
+        num = len(layers)
+        if np.isscalar(shape):
+            shape = (int(shape),) * self.ndim
+        ndim = len(shape) if shape is not None else self.ndim
+        coords = np.broadcast_to(np.asarray(coords, dtype=float), (num, ndim))
+        active = np.broadcast_to(np.asarray(active, dtype=bool), (num,))
+
+        # Look for storage, create one if necessary
+        s = self.storages.get(storageID, None)
+        if s is None:
+            sh = (1,) + tuple(shape) if shape is not None else None
+            s = self.new_storage(ID=storageID, psize=psize,
+                                 origin=coords[0] if num else None, shape=sh)
+        if shape is None:
+            shape = s.shape[1:]
+            coords = np.broadcast_to(s._to_phys(np.array(shape) / 2.), (num, ndim))
+        shape = np.array(shape, dtype=int)
+
+        if (psize is not None
+                and not np.allclose(s.psize, u.expectN(psize, ndim))):
+            logger.warning(
+                'Inconsistent pixel size when creating views.\n (%s vs %s)'
+                % (str(s.psize), str(psize)))
+
+        self._reserve_records(View, num)
+        views = [View(self) for i in range(num)]
+        if not views:
+            return views
+        for v in views:
+            v._ndim = ndim
+            v.storage = s
+            v.storageID = storageID
+
+        # Records of the new views are consecutive
+        first = views[0].numID
+        recs = self._recs[VIEW_PREFIX][first:first + num]
+        recs['active'] = active
+        recs['layer'] = layers
+        recs['shape'][:, :ndim] = shape
+        recs['psize'][:, :ndim] = psize if psize is not None else 0.
+        recs['coord'][:, :ndim] = coords
+
+        # Same as Storage.update_views() for the active views
+        pcoord = s._to_pix(coords[active])
+        dcoord = np.round(pcoord + 0.00001).astype(int)
+        recs['psize'][active, :ndim] = s.psize
+        recs['dcoord'][active, :ndim] = dcoord
+        recs['dlow'][active, :ndim] = dcoord - shape // 2
+        recs['dhigh'][active, :ndim] = dcoord + (shape + 1) // 2
+        recs['sp'][active, :ndim] = pcoord - dcoord
+
+        return views
+
     def reformat(self, also_in_copies=False):
         """
         Reformats all storages in this container.
@@ -20,6 +20,7 @@ This file is part of the PTYPY package.
 import numpy as np
 import os
 import h5py
+from concurrent.futures import ThreadPoolExecutor
 from . import geometry
 from . import xy
 from .. import utils as u
@@ -46,7 +47,133 @@ CODES = {WAIT: 'Scan unfinished. More frames available after a pause',
          EOS: 'End of scan reached'}
 
 __all__ = ['PtyScan', 'PTYD', 'PtydScan',
-           'MoonFlowerScan']
+           'MoonFlowerScan', 'FrameStack']
+
+
+def _stacked(frames):
+    """
+    Returns a 3D view of `frames` if they lie consecutively in the
+    memory of one array, None otherwise.
+    """
+    f0 = frames[0]
+    if (type(f0) is not np.ndarray or f0.base is None
+            or not f0.flags.c_contiguous or not f0.nbytes):
+        return None
+    addr = f0.__array_interface__['data'][0]
+    for i, f in enumerate(frames):
+        if (type(f) is not np.ndarray or f.base is not f0.base or f.shape != f0.shape
+                or f.dtype != f0.dtype or not f.flags.c_contiguous
+                or f.__array_interface__['data'][0] != addr + i * f0.nbytes):
+            return None
+    return np.lib.stride_tricks.as_strided(f0, shape=(len(frames),) + f0.shape,
+                                           strides=(f0.nbytes,) + f0.strides,
+                                           writeable=f0.flags.writeable)
+
+
+class FrameStack(object):
+    """
+    A chunk of frames together with their scan point indices.
+
+    The frames are either one 3D array or a list of 2D arrays, one
+    per index. For compatibility with the dictionary chunk format,
+    a FrameStack behaves like a read-only dictionary ``{index: frame}``.
+    :py:meth:`PtyScan.load` may return a FrameStack instead of a
+    dictionary to avoid copying the frames into one array later on.
+    """
+
+    def __init__(self, indices, frames):
+        """
+        Parameters
+        ----------
+        indices : list or ndarray
+            Scan point indices.
+
+        frames : ndarray or list
+            3D array or list of 2D arrays, one frame per index.
+        """
+        self.indices = [int(i) for i in indices]
+        self.frames = frames
+        self._pos = None
+        assert len(self.indices) == len(frames), (
+            'Got %d indices for %d frames' % (len(self.indices), len(frames)))
+
+    @classmethod
+    def from_dict(cls, dct, indices=None):
+        """
+        Create from a dictionary ``{index: frame}``, ordered as `indices`
+        where present, followed by the other keys of `dct`. No frame
+        is copied.
+        """
+        keys = list(dct.keys())
+        if indices is not None:
+            first = [k for k in indices if k in dct]
+            rest = set(first)
+            keys = first + [k for k in keys if k not in rest]
+        indices = keys
+        if isinstance(dct, cls) and indices == dct.indices:
+            return dct
+        frames = [dct[k] for k in indices]
+        stack = _stacked(frames) if frames else None
+        return cls(indices, stack if stack is not None else frames)
+
+    def subset(self, indices):
+        """
+        The frames to those of `indices` that are present, in that order.
+        """
+        keep = [k for k in indices if k in self]
+        if keep == self.indices:
+            return self
+        rows = [self._index()[k] for k in keep]
+        if self.is_stacked:
+            return FrameStack(keep, self.frames[rows])
+        return FrameStack(keep, [self.frames[r] for r in rows])
+
+    @property
+    def is_stacked(self):
+        """
+        True if the frames are one 3D array.
+        """
+        return isinstance(self.frames, np.ndarray)
+
+    def stack(self):
+        """
+        The frames as one 3D array. A list of frames is copied into one
+        array once.
+        """
+        if not self.is_stacked:
+            self.frames = np.array(self.frames)
+        return self.frames
+
+    def _index(self):
+        if self._pos is None:
+            self._pos = {k: i for i, k in enumerate(self.indices)}
+        return self._pos
+
+    def __getitem__(self, index):
+        return self.frames[self._index()[index]]
+
+    def get(self, index, default=None):
+        i = self._index().get(index)
+        return default if i is None else self.frames[i]
+
+    def __contains__(self, index):
+        return index in self._index()
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        return iter(self.indices)
+
+    def keys(self):
+        return list(self.indices)
+
+    def values(self):
+        return [f for f in self.frames]
+
+    def items(self):
+        return list(zip(self.indices, self.frames))
+
 
 
 @defaults_tree.parse_doc('scandata.PtyScan')
@@ -143,6 +270,45 @@ class PtyScan(object):
     choices = [0, 1, 2, 3, 4, 5, 6, 7]
     userlevel = 1
 
+    [preprocess]
+    type = Param
+    default =
+    help = Streaming preprocessing of the frames
+    doc = Corrections registered with :py:meth:`PtyScan.add_preprocess_stage`, cropping,
+      reorientation, rebinning and the final type cast are applied to blocks of frames
+      on a pool of worker threads.
+    userlevel = 2
+
+    [preprocess.num_threads]
+    type = int
+    default = 1
+    help = Number of worker threads applying the preprocessing stages
+    userlevel = 2
+    lowlim = 1
+
+    [preprocess.block]
+    type = int
+    default = 64
+    help = Number of frames handed to a worker at a time
+    userlevel = 2
+    lowlim = 1
+
+    [preprocess.dtype]
+    type = str
+    default = None
+    help = Cast the frames to this data type after preprocessing
+    doc = For example ``'float32'``. If ``None`` the type is kept.
+    userlevel = 2
+
+    [preprocess.prefetch]
+    type = bool
+    default = False
+    help = Prepare the next chunk in the background
+    doc = While the frames of a chunk are inserted into the model and the engine iterates,
+      the next chunk is loaded and preprocessed in a background thread. Only used
+      without MPI, as preparing a chunk involves collective communication.
+    userlevel = 2
+
     [min_frames]
     type = int
     default = 1
@@ -254,6 +420,11 @@ class PtyScan(object):
         p.update(pars)
         p.update(kwargs)
 
+        # Partially given preprocessing parameters keep the other defaults
+        preprocess = self.DEFAULT.preprocess.copy(99)
+        preprocess.update(p.preprocess)
+        p.preprocess = preprocess
+
         # Attempt to get number of frames.
         self.num_frames = p.num_frames
         """ Total number of frames to prepare / load.
@@ -310,6 +481,16 @@ class PtyScan(object):
         self.orientation = self.info.orientation
         self.rebin = self.info.rebin
 
+        # Preprocessing stages, (name, stage) tuples
+        self.preprocess_stages = []
+        self._workers = None
+
+        # Background preparation of the next chunk
+        self._prefetcher = None
+        self._next_chunk = None
+        if self.info.preprocess.prefetch and parallel.MPIenabled:
+            logger.warning('Prefetching of data chunks is not available with MPI.')
+
         # Initialize flags
         self._flags = np.array([0, 0, 0], dtype=int)
         self.is_initialized = False
@@ -455,6 +636,13 @@ class PtyScan(object):
         if self.info.save is not None and parallel.master:
             io.h5append(self.info.dfile, info=dict(self.info))
 
+        # No more chunks to prepare
+        for pool in (self._workers, self._prefetcher):
+            if pool is not None:
+                pool.shutdown()
+        self._workers = None
+        self._prefetcher = None
+
     def load_weight(self):
         """
         **Override in subclass for custom implementation**
@@ -672,6 +860,9 @@ class PtyScan(object):
         has_data = (len(data) > 0)
         has_weights = (len(weights) > 0) and len(list(weights.values())[0]) > 0
 
+        # From here on, frames are kept in scan point order of this node
+        data = FrameStack.from_dict(data, indices.node)
+
         if has_data:
             dsh = np.array(list(data.values())[0].shape[-2:])
         else:
@@ -690,12 +881,20 @@ class PtyScan(object):
                     altweight = self.info.weight2d
                 except:
                     altweight = np.ones(dsh)
-            weights = dict.fromkeys(data.keys(), altweight)
+            # One weight for all frames, not copied
+            altweight = np.asarray(altweight)
+            weights = FrameStack(data.indices, np.broadcast_to(altweight, (len(data),) + altweight.shape))
+        else:
+            weights = FrameStack.from_dict(weights, data.indices)
 
         assert len(weights) == len(data), (
             'Data and Weight frames unbalanced %d vs %d'
             % (len(data), len(weights)))
 
+        # Registered corrections, e.g. dark and flat field
+        if has_data:
+            data, weights = self._preprocess(self.preprocess_stages, data, weights)
+
         sh = self.info.shape
         # Adapt roi if not set
         if sh is None:
@@ -751,77 +950,11 @@ class PtyScan(object):
             'Optical axes (center = (%.1f, %.1f) outside diffraction image '
             'frame (%d, %d).' % (tuple(cen) + tuple(dsh)))
 
-        # Determine if the arrays require further processing
-        do_flip = (self.orientation is not None
-                   and np.array(self.orientation).any())
-        do_crop = (np.abs(sh - dsh) > 0.5).any()
-        do_rebin = self.rebin is not None and (self.rebin != 1)
-
-        if do_flip or do_crop or do_rebin:
-            logger.info(
-                'Enter preprocessing '
-                '(crop/pad %s, rebin %s, flip/rotate %s) ... \n'
-                % (str(do_crop), str(do_rebin), str(do_flip)))
-
-            # We proceed with numpy arrays.That is probably now more memory
-            # intensive but shorter in writing
-            if has_data:
-                d = np.array([data[ind] for ind in indices.node])
-                w = np.array([weights[ind] for ind in indices.node])
-            else:
-                d = np.ones((1,) + tuple(dsh))
-                w = np.ones((1,) + tuple(dsh))
-
-            # Crop data
-            d, tmp = u.crop_pad_symmetric_2d(d, sh, cen)
-
-            # Check if provided mask has the same shape as data, if not,
-            # use the mask's center for cropping the mask. The latter is
-            # also needed if no mask is provided, as weights is then
-            # created using the requested cropping shape and thus might
-            # have a different center than the raw data.
-            # NOTE: Maybe distinguish between no mask provided and mask
-            # with wrong size in warning
-
-            if (dsh == np.array(w[0].shape)).all():
-                w, cen = u.crop_pad_symmetric_2d(w, sh, cen)
-            else:
-                logger.warning('Mask does not have the same shape as data. '
-                               'Will use mask center for cropping mask.')
-                cen = np.array(w[0].shape) // 2
-                w, cen = u.crop_pad_symmetric_2d(w, sh, cen)
-
-            # Flip, rotate etc.
-            d, tmp = u.switch_orientation(d, self.orientation, cen)
-            w, cen = u.switch_orientation(w, self.orientation, cen)
-
-            # Rebin, check if rebinning is neither to strong nor impossible
-            rebin = self.rebin
-            if rebin <= 1:
-                pass
-            elif (rebin in range(2, 32+1)
-                  and (((sh / float(rebin)) % 1) == 0.0).all()):
-                mask = w > 0
-                d = u.rebin_2d(d, rebin)
-                w = u.rebin_2d(w, rebin)
-                mask = u.rebin_2d(mask, rebin)
-                # We keep only the pixels that do not include a masked pixel
-                # w[mask < mask.max()] = 0
-                # TODO: apply this operation when weights actually are weights
-                w = (mask == mask.max())
-            else:
-                raise RuntimeError(
-                    'Binning (%d) is to large or incompatible with array '
-                    'shape (%s).' % (rebin, str(tuple(sh))))
-
-            # restore contiguity of the cropped/padded/rotated/flipped array
-            d = np.ascontiguousarray(d)
-            w = np.ascontiguousarray(w)
-
-            if has_data:
-                # Translate back to dictionaries
-                data = dict(zip(indices.node, d))
-                weights = dict(zip(indices.node, w))
+        # Crop, orientation, rebinning and type cast
+        wsh = np.array(np.shape(weights.frames[0])) if len(weights) else dsh
+        stages, cen = self._geometric_stages(sh, cen, dsh, wsh)
+        if has_data:
+            data, weights = self._preprocess(stages, data, weights)
 
         # Adapt geometric info
         self.meta.center = cen / float(self.rebin)
@@ -881,6 +1014,177 @@ class PtyScan(object):
 
         return chunk
 
+    def add_preprocess_stage(self, stage, name=None):
+        """
+        Appends `stage` to the preprocessing applied to every chunk of data.
+
+        Registered stages follow :py:meth:`correct` and precede the
+        automatic centering, cropping, reorientation and rebinning.
+
+        Parameters
+        ----------
+        stage : callable
+            ``stage(indices, frames, weights)`` gets the scan point `indices`
+            of a block of frames, the `frames` as a 3d array and their
+            `weights`, which may also be a single frame valid for all frames
+            of the block. It returns new ``(frames, weights)`` of the same
+            frame shape. Stages may run concurrently on different blocks
+            and must not change their input in place.
+
+        name : str, optional
+            Name of the stage used for profiling.
+        """
+        if name is None:
+            name = getattr(stage, '__name__', 'stage%d' % len(self.preprocess_stages))
+        self.preprocess_stages.append((name, stage))
+
+    def _geometric_stages(self, sh, cen, dsh, wsh):
+        """
+        Preprocessing stages cropping / padding frames of shape `dsh` with
+        weights of shape `wsh` to shape `sh` around `cen`, switching the
+        orientation, rebinning and casting the frames.
+
+        Returns
+        -------
+        stages : list
+            (name, stage) tuples, see :py:meth:`add_preprocess_stage`
+        cen : ndarray
+            Center in the processed frames, before rebinning
+        """
+        stages = []
+
+        # Determine if the arrays require further processing
+        do_flip = (self.orientation is not None
+                   and np.array(self.orientation).any())
+        do_crop = (np.abs(sh - dsh) > 0.5).any()
+        do_rebin = self.rebin is not None and (self.rebin != 1)
+
+        if do_flip or do_crop or do_rebin:
+            logger.info(
+                'Enter preprocessing '
+                '(crop/pad %s, rebin %s, flip/rotate %s) ... \n'
+                % (str(do_crop), str(do_rebin), str(do_flip)))
+
+            # Check if provided mask has the same shape as data, if not,
+            # use the mask's center for cropping the mask. The latter is
+            # also needed if no mask is provided, as weights is then
+            # created using the requested cropping shape and thus might
+            # have a different center than the raw data.
+            # NOTE: Maybe distinguish between no mask provided and mask
+            # with wrong size in warning
+            dcen = cen
+            if (dsh == wsh).all():
+                wcen = cen
+            else:
+                logger.warning('Mask does not have the same shape as data. '
+                               'Will use mask center for cropping mask.')
+                wcen = wsh // 2
+
+            def crop(indices, d, w):
+                d, tmp = u.crop_pad_symmetric_2d(d, sh, dcen)
+                w, tmp = u.crop_pad_symmetric_2d(w, sh, wcen)
+                return d, w
+
+            stages.append(('crop', crop))
+            cen = u.expect2(sh) // 2
+
+            # Flip, rotate etc.
+            orientation = self.orientation
+
+            def orient(indices, d, w):
+                return (u.switch_orientation(d, orientation),
+                        u.switch_orientation(w, orientation))
+
+            stages.append(('orientation', orient))
+            tmp, cen = u.switch_orientation(np.empty((0,) + tuple(sh)), orientation, cen)
+
+            # Rebin, check if rebinning is neither to strong nor impossible
+            rebin = self.rebin
+            if rebin <= 1:
+                pass
+            elif (rebin in range(2, 32+1)
+                  and (((sh / float(rebin)) % 1) == 0.0).all()):
+
+                def rebin_frames(indices, d, w):
+                    mask = u.rebin_2d(w > 0, rebin)
+                    # We keep only the pixels that do not include a masked pixel
+                    # w[mask < mask.max()] = 0
+                    # TODO: apply this operation when weights actually are weights
+                    return u.rebin_2d(d, rebin), (mask == mask.max())
+
+                stages.append(('rebin', rebin_frames))
+            else:
+                raise RuntimeError(
+                    'Binning (%d) is to large or incompatible with array '
+                    'shape (%s).' % (rebin, str(tuple(sh))))
+
+        dtype = self.info.preprocess.dtype
+        if dtype is not None:
+            dtype = np.dtype(dtype)
+
+            def cast(indices, d, w):
+                return d.astype(dtype, copy=False), w
+
+            stages.append(('cast', cast))
+
+        return stages, cen
+
+    def _map(self, func, items):
+        """
+        Calls `func` for all `items` on the preprocessing workers.
+        """
+        nthreads = self.info.preprocess.num_threads
+        if nthreads > 1 and len(items) > 1:
+            if self._workers is None:
+                self._workers = ThreadPoolExecutor(max_workers=nthreads)
+            return list(self._workers.map(func, items))
+        return [func(item) for item in items]
+
+    def _preprocess(self, stages, data, weights):
+        """
+        Applies preprocessing `stages` to blocks of the frame stacks `data`
+        and `weights`.
+
+        Returns
+        -------
+        data, weights : FrameStack
+            The processed frames, contiguous in memory. A weight common to
+            all frames is only processed once and stays a broadcast view.
+        """
+        if not stages or not len(data):
+            return data, weights
+
+        indices = data.indices
+        common = weights.is_stacked and not weights.frames.strides[0]
+        nb = self.info.preprocess.block
+        blocks = [(a, min(a + nb, len(indices))) for a in range(0, len(indices), nb)]
+
+        def frames(stack, a, b):
+            if stack.is_stacked:
+                return stack.frames[a:b]
+            return np.array([stack[k] for k in indices[a:b]])
+
+        def work(block):
+            a, b = block
+            d = frames(data, a, b)
+            w = weights.frames[:1] if common else frames(weights, a, b)
+            with u.profiler.region('preprocess'):
+                for name, stage in stages:
+                    with u.profiler.region(name):
+                        d, w = stage(indices[a:b], d, w)
+            return d, w
+
+        with u.profiler.region('preprocess_chunk'):
+            out = self._map(work, blocks)
+            d = np.concatenate([o[0] for o in out]) if len(out) > 1 else np.ascontiguousarray(out[0][0])
+            if common:
+                w = np.ascontiguousarray(out[0][1][0])
+                w = np.broadcast_to(w, (len(d),) + w.shape)
+            else:
+                w = np.concatenate([o[1] for o in out]) if len(out) > 1 else np.ascontiguousarray(out[0][1])
+
+        return FrameStack(indices, d), FrameStack(indices, w)
+
     def auto(self, frames):
         """
         Repeated calls to this function will process the data.
@@ -899,8 +1203,12 @@ class PtyScan(object):
               - EOS, if scan's end is reached
               - a data package otherwise
         """
-        # attempt to get data:
-        msg = self.get_data_chunk(frames)
+        # attempt to get data, it may have been prepared in the background
+        if self._next_chunk is not None:
+            msg = self._next_chunk.result()
+            self._next_chunk = None
+        else:
+            msg = self.get_data_chunk(frames)
         if msg == WAIT:
             return msg
         elif msg == EOS:
@@ -916,6 +1224,11 @@ class PtyScan(object):
                 self._mpi_save_chunk(self.info.save, msg)
             # delete chunk
             del self.chunk
+            # prepare the next chunk while this one is used
+            if self.info.preprocess.prefetch and not parallel.MPIenabled:
+                if self._prefetcher is None:
+                    self._prefetcher = ThreadPoolExecutor(max_workers=1)
+                self._next_chunk = self._prefetcher.submit(self.get_data_chunk, frames)
             return out
 
     def _make_data_package(self, chunk):
@@ -928,34 +1241,49 @@ class PtyScan(object):
 
         # The "raw" part. Might replace the iterable in future.
         out['chunk'] = chunk
-        
-        # The "iterable" part
+
+        # Masks of all frames of this node at once
+        chunk.mask = self._chunk_mask(chunk)
+
+        # The "iterable" part, frames and masks are views into the chunk
         iterables = []
         for pos, index in zip(chunk.positions, chunk.indices):
             frame = {'index': index,
                      'data': chunk.data.get(index),
-                     'position': pos}
-
-            if frame['data'] is None:
-                frame['mask'] = None
-            else:
-                # Ok, we now know that we need a mask since data is not None
-                # First look in chunk for a weight to this index, then
-                # look for a 2d-weight in meta, then arbitrarily set
-                # weight to ones.
-                try:
-                    fallback = self.weight2d
-                except AttributeError:
-                    fallback = np.ones_like(frame['data'])
-                w = chunk.weights.get(index, fallback)
-                frame['mask'] = (w > 0)
-
+                     'position': pos,
+                     'mask': chunk.mask.get(index)}
             iterables.append(frame)
 
         out['iterable'] = iterables
 
         return out
 
+    def _chunk_mask(self, chunk):
+        """
+        Masks ``weights > 0`` for the frames in `chunk`.
+        """
+        data = FrameStack.from_dict(chunk.data).subset(chunk.indices)
+        weights = chunk.weights
+        if not len(data):
+            return FrameStack([], [])
+
+        # First look in chunk for a weight to each index, then
+        # look for a 2d-weight in meta, then arbitrarily set
+        # weight to ones.
+        if all(k in weights for k in data.indices):
+            weights = FrameStack.from_dict(weights).subset(data.indices)
+            w = weights.frames
+            if weights.is_stacked and not w.strides[0]:
+                # The same weight for all frames
+                return FrameStack(data.indices, np.broadcast_to(w[0] > 0, w.shape))
+            elif weights.is_stacked:
+                return FrameStack(data.indices, w > 0)
+        try:
+            fallback = self.weight2d
+        except AttributeError:
+            fallback = np.ones_like(data.frames[0])
+        return FrameStack(data.indices, [weights.get(k, fallback) > 0 for k in data.indices])
+
     def _mpi_pipeline_with_dictionaries(self, indices):
         """
         Example processing pipeline using dictionaries.
@@ -980,9 +1308,11 @@ class PtyScan(object):
                 raw = {}
                 pos = {}
                 weights = {}
-            # Distribute raw data across nodes according to indices
-            raw = parallel.bcast_dict(raw, indices.node)
-            weights = parallel.bcast_dict(weights, indices.node)
+            # Scatter raw data across nodes according to indices, every
+            # node only receives its own frames
+            keys = [[indices.chunk[k] for k in lm] for lm in indices.lm]
+            raw = parallel.scatter_dict(raw, keys)
+            weights = parallel.scatter_dict(weights, keys)
 
         # (re)distribute position information - every node should now be
         # aware of all positions
@@ -1077,7 +1407,8 @@ class PtyScan(object):
         raw, positions, weight : dict
             Dictionaries whose keys are the given scan point `indices`
             and whose values are the respective frame / position according
-            to the scan point index. `weight` and `positions` may be empty
+            to the scan point index. `weight` and `positions` may be empty.
+            `raw` and `weight` may also be a :py:class:`FrameStack`.
 
         Note
         ----
@@ -1184,6 +1515,7 @@ class PtyScan(object):
         todisk = dict(c)
         num = todisk.pop('num')
         ind = todisk.pop('indices_node')
+        todisk.pop('mask', None)
 
         for k in ['data', 'weights']:
             if k in c.keys():
@@ -116,6 +116,14 @@ class Geo(Base):
     choices = 'numpy', 'scipy', 'fftw'
     userlevel = 1
 
+    [fft_workers]
+    type = int
+    default = None
+    help = Number of threads of the FFTs
+    doc = Passed as ``workers`` to scipy.fft, None uses the scipy default. Only used with the 'scipy' ffttype.
+    lowlim = 1
+    userlevel = 2
+
     [shape]
     type = int, tuple
     default = 256
@@ -437,6 +445,7 @@ def get_propagator(geo_dct, **kwargs):
     """
     Helper function to determine propagator to be attached to Geometry class.
     """
+    kwargs.setdefault('workers', geo_dct.get('fft_workers'))
     if geo_dct['propagation'] == 'farfield':
         return BasicFarfieldPropagator(geo_dct, ffttype=geo_dct["ffttype"], **kwargs)
     else:
@@ -448,7 +457,7 @@ class FFTchooser(object):
     Chooses the desired FFT algo, and assigns scaling.
     If pyFFTW is not available, falls back to scipy.
     """
-    def __init__(self, ffttype='scipy'):
+    def __init__(self, ffttype='scipy', workers=None):
         """
         Parameters
         ----------
@@ -460,23 +469,31 @@ class FFTchooser(object):
             - 'scipy' for scipy.fft.fft2
             - 2 or 4-tuple of (forward_fft2(), inverse_fft2(),
               [scaling, inverse_scaling])
+
+        workers : int or None
+            Number of threads used by scipy.fft, None for the scipy default.
         """
         self.ffttype = ffttype
+        self.workers = workers
 
     def _FFTW_fft(self):
         pyfftw.interfaces.cache.enable()
         pyfftw.interfaces.cache.set_keepalive_time(15.0)
         pe = 'FFTW_MEASURE'
-        self.fft = lambda x: fftw_np.fft2(x, planner_effort=pe)
-        self.ifft = lambda x: fftw_np.ifft2(x, planner_effort=pe)
+        self.fft = lambda x, overwrite_x=False: fftw_np.fft2(x, planner_effort=pe, overwrite_input=overwrite_x)
+        self.ifft = lambda x, overwrite_x=False: fftw_np.ifft2(x, planner_effort=pe, overwrite_input=overwrite_x)
 
     def _scipy_fft(self):
-        self.fft = lambda x: scipy.fft.fft2(x).astype(x.dtype)
-        self.ifft = lambda x: scipy.fft.ifft2(x).astype(x.dtype)
+        # scipy.fft computes single precision input in single precision,
+        # the cast is only a safeguard and does not copy
+        self.fft = lambda x, overwrite_x=False: scipy.fft.fft2(
+            x, overwrite_x=overwrite_x, workers=self.workers).astype(x.dtype, copy=False)
+        self.ifft = lambda x, overwrite_x=False: scipy.fft.ifft2(
+            x, overwrite_x=overwrite_x, workers=self.workers).astype(x.dtype, copy=False)
 
     def _numpy_fft(self):
-        self.fft = lambda x: np.ascontiguousarray(np.fft.fft2(x).astype(x.dtype))
-        self.ifft = lambda x: np.ascontiguousarray(np.fft.ifft2(x).astype(x.dtype))
+        self.fft = lambda x, overwrite_x=False: np.ascontiguousarray(np.fft.fft2(x).astype(x.dtype, copy=False))
+        self.ifft = lambda x, overwrite_x=False: np.ascontiguousarray(np.fft.ifft2(x).astype(x.dtype, copy=False))
 
     def assign_scaling(self, shape):
         if isinstance(self.ffttype, tuple) and len(self.ffttype) > 2:
@@ -499,8 +516,9 @@ class FFTchooser(object):
         elif str(self.ffttype) == 'numpy':
             self._numpy_fft()
         elif isinstance(self.ffttype, tuple):
-            self.fft = self.ffttype[0]
-            self.ifft = self.ffttype[1]
+            fft, ifft = self.ffttype[:2]
+            self.fft = lambda x, overwrite_x=False: fft(x)
+            self.ifft = lambda x, overwrite_x=False: ifft(x)
 
         return (self.fft, self.ifft)
 
@@ -543,13 +561,16 @@ class BasicFarfieldPropagator(object):
         self.pre_ifft = None
         self.post_ifft = None
 
+        # Phase factors cast to the dtype of the propagated stacks
+        self._plans = {}
+
         # Get default parameters and update
         self.p = u.Param(Geo.DEFAULT)
         if 'dtype' in kwargs:
             self.dtype = kwargs['dtype']
         else:
             self.dtype = np.complex128
-        self.FFTch = FFTchooser(ffttype)
+        self.FFTch = FFTchooser(ffttype, kwargs.get('workers'))
         self.fft, self.ifft = self.FFTch.assign_fft()
         self.update(geo_pars, **kwargs)
 
@@ -630,45 +651,69 @@ class BasicFarfieldPropagator(object):
         self.pre_ifft = self.post_fft.conj()
         self.post_ifft = self.pre_fft.conj()
         self.sc, self.isc = self.FFTch.assign_scaling(self.sh)
+        self._plans = {}
 
+    def _get_plan(self, shape, dtype):
+        """
+        Phase factors for frames of `shape` and `dtype`, with the
+        fft scaling fused into the post factors.
+        """
+        key = (tuple(shape), np.dtype(dtype))
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = u.Param()
+            plan.pre_fft = self.pre_fft.astype(dtype)
+            plan.post_fft = (self.post_fft * self.sc).astype(dtype)
+            plan.pre_ifft = self.pre_ifft.astype(dtype)
+            plan.post_ifft = (self.isc * self.post_ifft).astype(dtype)
+            self._plans[key] = plan
+        return plan
 
-    def fw(self, W):
+    def fw(self, W, out=None):
         """
         Computes forward propagated wavefront of input wavefront W.
+        If `out` is given, the result is written into it (may be W).
         """
-        # Check for cropping
+        if u.profiler.enabled:
+            u.profiler.count('fft_frames', W.size // (W.shape[-2] * W.shape[-1]))
 
+        # Check for cropping
         if (self.crop_pad != 0).any():
             w = u.crop_pad(W, self.crop_pad)
-        else:
-            w = W
-
-        w = self.post_fft * self.sc * self.fft(self.pre_fft * w)
+            w = self.post_fft * self.sc * self.fft(self.pre_fft * w)
+            w = u.crop_pad(w, -self.crop_pad)
+            if out is None:
+                return w
+            out[:] = w
+            return out
 
-        # Cropping again
-        if (self.crop_pad != 0).any():
-            return u.crop_pad(w, -self.crop_pad)
-        else:
-            return w
+        plan = self._get_plan(W.shape[-2:], np.result_type(W.dtype, self.dtype))
+        w = np.multiply(plan.pre_fft, W, out=out)
+        w = self.fft(w, overwrite_x=True)
+        return np.multiply(plan.post_fft, w, out=w if out is None else out)
 
-    def bw(self, W):
+    def bw(self, W, out=None):
         """
         Computes backward propagated wavefront of input wavefront W.
+        If `out` is given, the result is written into it (may be W).
         """
+        if u.profiler.enabled:
+            u.profiler.count('fft_frames', W.size // (W.shape[-2] * W.shape[-1]))
+
         # Check for cropping
         if (self.crop_pad != 0).any():
             w = u.crop_pad(W, self.crop_pad)
-        else:
-            w = W
+            w = self.ifft(self.pre_ifft * w) * self.isc * self.post_ifft
+            w = u.crop_pad(w, -self.crop_pad)
+            if out is None:
+                return w
+            out[:] = w
+            return out
 
-        # Compute transform
-        w = self.ifft(self.pre_ifft * w) * self.isc * self.post_ifft
-
-        # Cropping again
-        if (self.crop_pad != 0).any():
-            return u.crop_pad(w, -self.crop_pad)
-        else:
-            return w
+        plan = self._get_plan(W.shape[-2:], np.result_type(W.dtype, self.dtype))
+        w = np.multiply(plan.pre_ifft, W, out=out)
+        w = self.ifft(w, overwrite_x=True)
+        return np.multiply(plan.post_ifft, w, out=w if out is None else out)
 
 
 def translate_to_pix(sh, center):
@@ -717,11 +762,14 @@ class BasicNearfieldPropagator(object):
         self.kernel = None
         self.ikernel = None
 
+        # Kernels cast to the dtype of the propagated stacks
+        self._plans = {}
+
         # Get default parameters and update
         self.p = u.Param(Geo.DEFAULT)
         self.dtype = kwargs['dtype'] if 'dtype' in kwargs else np.complex128
         self.update(geo_pars, **kwargs)
-        self.FFTch = FFTchooser(ffttype)
+        self.FFTch = FFTchooser(ffttype, kwargs.get('workers'))
         self.fft, self.ifft = self.FFTch.assign_fft()
 
     def update(self, geo_pars=None, **kwargs):
@@ -758,18 +806,45 @@ class BasicNearfieldPropagator(object):
             2j * np.pi * (p.distance / p.lam) * (np.sqrt(1-a2) - 1)).astype(self.dtype)
         # self.kernel = np.fft.fftshift(self.kernel)
         self.ikernel = self.kernel.conj()
+        self._plans = {}
+
+    def _get_plan(self, shape, dtype):
+        """
+        Propagation kernels for frames of `shape` and `dtype`.
+        """
+        key = (tuple(shape), np.dtype(dtype))
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = u.Param()
+            plan.kernel = self.kernel.astype(dtype)
+            plan.ikernel = self.ikernel.astype(dtype)
+            self._plans[key] = plan
+        return plan
+
+    def _propagate(self, W, name, out):
+        if u.profiler.enabled:
+            u.profiler.count('fft_frames', 2 * W.size // (W.shape[-2] * W.shape[-1]))
+        w = self.fft(W)
+        w = np.multiply(w, self._get_plan(w.shape[-2:], w.dtype)[name], out=w)
+        w = self.ifft(w, overwrite_x=True)
+        if out is None:
+            return w
+        out[:] = w
+        return out
 
-    def fw(self, W):
+    def fw(self, W, out=None):
         """
         Computes forward propagated wavefront of input wavefront W.
+        If `out` is given, the result is written into it (may be W).
         """
-        return self.ifft(self.fft(W) * self.kernel)
+        return self._propagate(W, 'kernel', out)
 
-    def bw(self, W):
+    def bw(self, W, out=None):
         """
         Computes backward propagated wavefront of input wavefront W.
+        If `out` is given, the result is written into it (may be W).
         """
-        return self.ifft(self.fft(W) * self.ikernel)
+        return self._propagate(W, 'ikernel', out)
 
 
 ############
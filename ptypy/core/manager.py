@@ -13,6 +13,7 @@ This file is part of the PTYPY package.
     :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
     :license: see LICENSE for details.
 """
+import logging
 import numpy as np
 import time
 from collections import OrderedDict
@@ -218,7 +219,9 @@ class ScanModel(object):
         #dp = self.ptyscan.auto(self.frames_per_call)
 
         self.data_available = (dp != data.EOS)
-        logger.debug(u.verbose.report(dp))
+        # The report of a large data package is expensive, only build it if needed
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(u.verbose.report(dp))
 
         if dp == data.WAIT or not self.data_available:
             return None
@@ -244,46 +247,31 @@ class ScanModel(object):
             # This scan is brand new so we create storages for it
             self.diff = self.Cdiff.new_storage(shape=sh, psize=self.psize, padonly=True,
                                                layermap=None)
-            old_diff_views = []
-            old_diff_layers = []
+            old_diff_views = {}
         else:
             # ok storage exists already. Views most likely also. We store them so we can update their status later.
-            old_diff_views = self.Cdiff.views_in_storage(self.diff, active_only=False)
-            old_diff_layers = []
-            for v in old_diff_views:
-                old_diff_layers.append(v.layer)
+            old_diff_views = {v.layer: v for v in self.Cdiff.views_in_storage(self.diff, active_only=False)}
 
         # Same for mask
         if self.mask is None:
             self.mask = self.Cmask.new_storage(shape=sh, psize=self.psize, padonly=True,
                                                layermap=None)
-            old_mask_views = []
-            old_mask_layers = []
+            old_mask_views = {}
         else:
-            old_mask_views = self.Cmask.views_in_storage(self.mask, active_only=False)
-            old_mask_layers = []
-            for v in old_mask_views:
-                old_mask_layers.append(v.layer)
+            old_mask_views = {v.layer: v for v in self.Cmask.views_in_storage(self.mask, active_only=False)}
 
         # this is a hack for now
         dp = self._new_data_extra_analysis(dp)
         if dp is None:
             return None
 
-        # Prepare for View generation
-        AR_diff = DEFAULT_ACCESSRULE.copy()
-        AR_diff.shape = self.diff_shape
-        AR_diff.coord = 0.0
-        AR_diff.psize = self.psize
-        AR_mask = AR_diff.copy()
-        AR_diff.storageID = self.diff.ID
-        AR_mask.storageID = self.mask.ID
-
-        diff_views = []
-        mask_views = []
         positions = []
+        diff_layers = []
+        diff_active = []
+        mask_layers = []
+        mask_active = []
 
-        # First pass: create or update views and reformat corresponding storage
+        # First pass: update existing views and collect the new ones
         for dct in dp['iterable']:
 
             index = dct['index']
@@ -294,35 +282,34 @@ class ScanModel(object):
             if pos is None:
                 logger.warning('No position set to scan point %d of scan %s' % (index, label))
 
-            AR_diff.layer = index
-            AR_mask.layer = index
-            AR_diff.active = active
-            AR_mask.active = active
-
             # check here: is there already a view to this layer? Is it active?
-            try:
-                old_view = old_diff_views[old_diff_layers.index(index)]
+            old_view = old_diff_views.get(index)
+            if old_view is not None:
                 old_active = old_view.active
                 old_view.active = active
 
                 logger.debug(
                     'Diff view with layer/index %s of scan %s exists. \nSetting view active state from %s to %s' % (
                         index, label, old_active, active))
-            except ValueError:
-                v = View(self.Cdiff, accessrule=AR_diff)
-                diff_views.append(v)
-                logger.debug(
-                    'Diff view with layer/index %s of scan %s does not exist. \nCreating view with ID %s and set active state to %s' % (
-                        index, label, v.ID, active))
+            else:
+                diff_layers.append(index)
+                diff_active.append(active)
                 # append position also
                 positions.append(pos)
 
-            try:
-                old_view = old_mask_views[old_mask_layers.index(index)]
+            old_view = old_mask_views.get(index)
+            if old_view is not None:
                 old_view.active = active
-            except ValueError:
-                v = View(self.Cmask, accessrule=AR_mask)
-                mask_views.append(v)
+            else:
+                mask_layers.append(index)
+                mask_active.append(active)
+
+        # Create the new views in bulk
+        diff_views = self.Cdiff.new_views(0.0, diff_layers, storageID=self.diff.ID, shape=self.diff_shape,
+                                          psize=self.psize, active=diff_active)
+        mask_views = self.Cmask.new_views(0.0, mask_layers, storageID=self.mask.ID, shape=self.diff_shape,
+                                          psize=self.psize, active=mask_active)
+        logger.debug('Created %d new diff views for scan %s' % (len(diff_views), label))
 
         # so now we should have the right views to this storages. Let them reformat()
         # that will create the right sizes and the datalist access
@@ -331,17 +318,20 @@ class ScanModel(object):
         report_time('creating views and storages')
         logger.info('Inserting data in diff and mask storages')
 
-        # Second pass: copy the data 
-        # Benchmark: scales quadratic (!!) with number of frames per node.
-        for dct in dp['iterable']:
-            if dct['data'] is None:
-                continue
-            diff_data = dct['data']
-            idx = dct['index']
+        # Second pass: copy the data, straight from the chunk if possible
+        chunk = dp.get('chunk')
+        if chunk is not None and isinstance(chunk.get('mask'), data.FrameStack):
+            self._insert_frames(self.diff, data.FrameStack.from_dict(chunk.data).subset(chunk.mask.indices))
+            self._insert_frames(self.mask, chunk.mask)
+        else:
+            for dct in dp['iterable']:
+                if dct['data'] is None:
+                    continue
+                diff_data = dct['data']
+                idx = dct['index']
 
-            # FIXME: Find a more transparent way than this.
-            self.diff.data[self.diff.layermap.index(idx)][:] = diff_data
-            self.mask.data[self.mask.layermap.index(idx)][:] = dct.get('mask', np.ones_like(diff_data))
+                self.diff.data[self.diff.layer_index(idx)][:] = diff_data
+                self.mask.data[self.mask.layer_index(idx)][:] = dct.get('mask', np.ones_like(diff_data))
 
         # Update maximum nr. of frames in a block
         self.max_frames_per_block = self.diff.nlayers
@@ -376,6 +366,24 @@ class ScanModel(object):
 
         return self.diff, new_probe_ids, new_object_ids, new_pods
 
+    @staticmethod
+    def _insert_frames(storage, frames):
+        """
+        Copy the frames of a :py:class:`~ptypy.core.data.FrameStack` into
+        their layers of `storage`, with one slice assignment if the layers
+        are consecutive.
+        """
+        if not len(frames):
+            return
+        layers = np.array([storage.layer_index(i) for i in frames.indices])
+        if frames.is_stacked and (np.diff(layers) == 1).all():
+            storage.data[layers[0]:layers[-1] + 1] = frames.frames
+        elif frames.is_stacked:
+            storage.data[layers] = frames.frames
+        else:
+            for l, f in zip(layers, frames.frames):
+                storage.data[l] = f
+
     def _new_data_extra_analysis(self, dp):
         """
         This is a hack for 3d Bragg. Extra analysis on the incoming
@@ -575,8 +583,8 @@ class BlockScanModel(ScanModel):
         dv = None
         mv = None
 
-        data = chunk['data']
-        weights = chunk['weights']
+        frames = data.FrameStack.from_dict(chunk['data']).subset(chunk['indices'])
+        weights = data.FrameStack.from_dict(chunk['weights']).subset(frames.indices)
 
         # First pass: create or update views and reformat corresponding storage
         for index in chunk['indices']:
@@ -588,8 +596,7 @@ class BlockScanModel(ScanModel):
                 dv = dv.copy()
                 mv = mv.copy()
 
-            maybe_data = data.get(index)
-            active = maybe_data is not None
+            active = index in frames
 
             dv.active = active
             mv.active = active
@@ -600,13 +607,18 @@ class BlockScanModel(ScanModel):
             mask_views.append(mv)
 
             if active:
-                l = indices_node.index(index)
+                l = diff.layer_index(index)
                 dv.dlayer = l
                 mv.dlayer = l
-                dv.data[:] = maybe_data
-                mv.data[:] = weights.get(index, np.ones_like(maybe_data))
 
-                # positions
+        # Second pass: copy the data
+        self._insert_frames(diff, frames)
+        if len(weights) == len(frames):
+            self._insert_frames(mask, weights)
+        else:
+            for index, frame in frames.items():
+                mask.data[mask.layer_index(index)] = weights.get(index, np.ones_like(frame))
+
         positions = chunk.positions
 
         ## warning message for empty postions?
@@ -701,8 +713,7 @@ class _Vanilla(object):
         ndim = self.Cdiff.ndim
 
         # Loop through diffraction patterns
-        for i in range(len(self.new_diff_views)):
-            dv, mv = self.new_diff_views.pop(0), self.new_mask_views.pop(0)
+        for i, (dv, mv) in enumerate(zip(self.new_diff_views, self.new_mask_views)):
 
             # Create views
             # if True:
@@ -762,6 +773,9 @@ class _Vanilla(object):
 
             new_pods.append(pod)
 
+        self.new_diff_views = []
+        self.new_mask_views = []
+
         return new_pods, new_probe_ids, new_object_ids
 
     def _initialize_geo(self, common):
@@ -954,102 +968,108 @@ class _Full(object):
         object_id = 'S' + self.label
         probe_id = 'S' + self.label
 
-        # Loop through diffraction patterns
-        for i in range(len(self.new_diff_views)):
-            dv, mv = self.new_diff_views.pop(0), self.new_mask_views.pop(0)
+        diff_views = self.new_diff_views
+        mask_views = self.new_mask_views
+        nviews = len(diff_views)
 
-            # For stochastic engines (e.g. ePIE) we only need one exit buffer
-            if self._single_exit_buffer_for_all_views:
-                index = 0
-            else:
-                index = dv.layer
+        # For stochastic engines (e.g. ePIE) we only need one exit buffer
+        if self._single_exit_buffer_for_all_views:
+            indices = np.zeros((nviews,), dtype=int)
+        else:
+            indices = np.array([dv.layer for dv in diff_views], dtype=int)
+        active = np.array([dv.active for dv in diff_views], dtype=bool)
+
+        # Object and probe position
+        pos_pr = u.expect2(0.0)
+        if 'empty' not in self.p.tags:
+            pos_obj = np.array([u.expect2(0.0) if pos is None else pos
+                                for pos in self.new_positions], dtype=float).reshape(nviews, 2)
+        else:
+            pos_obj = 0.0
 
-            # Object and probe position
-            pos_pr = u.expect2(0.0)
-            pos_obj = self.new_positions[i] if 'empty' not in self.p.tags else 0.0
+        # Views of every pod, by frame
+        pod_views = [[] for i in range(nviews)]
 
-            # For multiwavelength reconstructions: loop here over
-            # geometries, and modify probe_id and object_id.
-            for ii, geometry in enumerate(self.geometries):
-                # Make new IDs and keep them in record
-                # sharing_rules is not aware of IDs with suffix
+        # For multiwavelength reconstructions: loop here over
+        # geometries, and modify probe_id and object_id.
+        for ii, geometry in enumerate(self.geometries):
+            # Make new IDs and keep them in record
+            # sharing_rules is not aware of IDs with suffix
 
-                pdis = self.p.coherence.probe_dispersion
+            pdis = self.p.coherence.probe_dispersion
 
-                if pdis is None or str(pdis) == 'achromatic':
-                    gind = 0
-                else:
-                    gind = ii
+            if pdis is None or str(pdis) == 'achromatic':
+                gind = 0
+            else:
+                gind = ii
 
-                probe_id_suf = probe_id + 'G%02d' % gind
-                if (probe_id_suf not in new_probe_ids.keys()
-                        and probe_id_suf not in existing_probes):
-                    new_probe_ids[probe_id_suf] = True
+            probe_id_suf = probe_id + 'G%02d' % gind
+            if (probe_id_suf not in new_probe_ids.keys()
+                    and probe_id_suf not in existing_probes):
+                new_probe_ids[probe_id_suf] = True
 
-                odis = self.p.coherence.object_dispersion
+            odis = self.p.coherence.object_dispersion
 
-                if odis is None or str(odis) == 'achromatic':
-                    gind = 0
-                else:
-                    gind = ii
-
-                object_id_suf = object_id + 'G%02d' % gind
-                if (object_id_suf not in new_object_ids.keys()
-                        and object_id_suf not in existing_objects):
-                    new_object_ids[object_id_suf] = True
-
-                # Loop through modes
-                for pm in range(self.p.coherence.num_probe_modes):
-                    for om in range(self.p.coherence.num_object_modes):
-                        # Make a unique layer index for exit view
-                        # The actual number does not matter due to the
-                        # layermap access
-                        exit_index = index * 10000 + pm * 100 + om
-
-                        # Create views
-                        # Please note that mostly references are passed,
-                        # i.e. the views do mostly not own the accessrule
-                        # contents
-                        pv = View(container=self.ptycho.probe,
-                                  accessrule={'shape': self.probe_shape,
-                                              'psize': geometry.resolution,
-                                              'coord': pos_pr,
-                                              'storageID': probe_id_suf,
-                                              'layer': pm,
-                                              'active': True})
-
-                        ov = View(container=self.ptycho.obj,
-                                  accessrule={'shape': self.object_shape,
-                                              'psize': geometry.resolution,
-                                              'coord': pos_obj,
-                                              'storageID': object_id_suf,
-                                              'layer': om,
-                                              'active': True})
-
-                        ev = View(container=self.ptycho.exit,
-                                  accessrule={'shape': self.exit_shape,
-                                              'psize': geometry.resolution,
-                                              'coord': pos_pr,
-                                              'storageID': (dv.storageID +
-                                                            'G%02d' % ii),
-                                              'layer': exit_index,
-                                              'active': dv.active})
-
-                        views = {'probe': pv,
-                                 'obj': ov,
-                                 'diff': dv,
-                                 'mask': mv,
-                                 'exit': ev}
-
-                        pod = POD(ptycho=self.ptycho,
-                                  ID=None,
-                                  views=views,
-                                  geometry=geometry)  # , meta=meta)
-
-                        new_pods.append(pod)
-
-                        pod.probe_weight = 1.0
-                        pod.object_weight = 1.0
+            if odis is None or str(odis) == 'achromatic':
+                gind = 0
+            else:
+                gind = ii
+
+            object_id_suf = object_id + 'G%02d' % gind
+            if (object_id_suf not in new_object_ids.keys()
+                    and object_id_suf not in existing_objects):
+                new_object_ids[object_id_suf] = True
+
+            # Loop through modes
+            for pm in range(self.p.coherence.num_probe_modes):
+                for om in range(self.p.coherence.num_object_modes):
+                    # Make a unique layer index for exit view
+                    # The actual number does not matter due to the
+                    # layermap access
+                    exit_indices = indices * 10000 + pm * 100 + om
+
+                    # Create the views of all frames at once
+                    pvs = self.ptycho.probe.new_views(pos_pr, [pm] * nviews,
+                                                      storageID=probe_id_suf,
+                                                      shape=self.probe_shape,
+                                                      psize=geometry.resolution)
+
+                    ovs = self.ptycho.obj.new_views(pos_obj, [om] * nviews,
+                                                    storageID=object_id_suf,
+                                                    shape=self.object_shape,
+                                                    psize=geometry.resolution)
+
+                    evs = self.ptycho.exit.new_views(pos_pr, exit_indices,
+                                                     storageID=(self.diff.ID +
+                                                                'G%02d' % ii),
+                                                     shape=self.exit_shape,
+                                                     psize=geometry.resolution,
+                                                     active=active)
+
+                    for i in range(nviews):
+                        pod_views[i].append((geometry, pvs[i], ovs[i], evs[i]))
+
+        # Connect the views of each diffraction pattern through new pods
+        for dv, mv, views_ in zip(diff_views, mask_views, pod_views):
+            for geometry, pv, ov, ev in views_:
+                views = {'probe': pv,
+                         'obj': ov,
+                         'diff': dv,
+                         'mask': mv,
+                         'exit': ev}
+
+                pod = POD(ptycho=self.ptycho,
+                          ID=None,
+                          views=views,
+                          geometry=geometry)  # , meta=meta)
+
+                new_pods.append(pod)
+
+                pod.probe_weight = 1.0
+                pod.object_weight = 1.0
+
+        self.new_diff_views = []
+        self.new_mask_views = []
 
         return new_pods, new_probe_ids, new_object_ids
 
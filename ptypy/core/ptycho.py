@@ -10,6 +10,9 @@ This file is part of the PTYPY package.
 import numpy as np
 import time
 import json
+import os
+import queue
+import threading
 from . import paths
 from collections import OrderedDict
 
@@ -208,6 +211,21 @@ class Ptycho(Base):
     help = Auto-save file name (or format string)
     doc = Auto-save file name or format string (constructed against runtime dictionary)
 
+    [io.autosave.asynchronous]
+    default = False
+    type = bool
+    help = Write auto-save files in the background
+    doc = If ``True`` probe, object and runtime information are copied and the file is written by a
+          background thread while the reconstruction continues. Pending auto-saves are completed
+          before the final save.
+
+    [io.autosave.queue_size]
+    default = 1
+    type = int
+    help = Maximum number of pending background auto-saves
+    doc = If this many auto-saves are waiting to be written, the next one blocks until there is room.
+    lowlim = 1
+
     [io.autoplot]
     default = Param
     type = Param
@@ -267,6 +285,45 @@ class Ptycho(Base):
     doc = Switch to request the production of a movie from the dumped plots at the end of the
       reconstruction.
 
+    [io.autoplot.preview]
+    default = Param
+    type = Param
+    help = Live monitoring previews
+    doc = Instead of requesting the full object and probe at every update, the plotting client
+      subscribes to downsampled previews which the server only sends when they have changed.
+
+    [io.autoplot.preview.active]
+    default = False
+    type = bool
+    help = Plot previews instead of the full arrays
+
+    [io.autoplot.preview.step]
+    default = 2
+    type = int
+    lowlim = 1
+    help = Downsampling factor of the previews
+
+    [io.autoplot.preview.codec]
+    default = None
+    type = str
+    help = Compression of the previews
+    doc = ``'lz4'`` falls back to ``'zlib'`` if the lz4 package is not installed on the server.
+    choices = [None, 'zlib', 'lz4']
+
+    [io.autoplot.preview.interval]
+    default = 0.
+    type = float
+    lowlim = 0.
+    help = Minimum interval between two previews, in seconds
+    doc = The server enforces at least :py:data:`.io.interaction.server.monitor_interval`.
+
+    [io.autoplot.preview.timeout]
+    default = 60.
+    type = float
+    lowlim = 0.
+    help = Time to wait for the first previews, in seconds
+    doc = The plotting client gives up if the first preview of every monitored array has not arrived by then.
+
     [io.benchmark]
     default = None
     type = str
@@ -276,6 +333,17 @@ class Ptycho(Base):
     choices = ['all', 'loading', 'engine_init', 'engine_prepare', 'engine_iterate', 'engine_finalize']
     userlevel = 2
 
+    [io.profile]
+    default = None
+    type = str
+    help = File name for a profile of the reconstruction
+    doc = If set, data loading, engines and propagators record nested timing regions and counters
+        (e.g. propagated frames, bytes reduced through MPI) on :py:data:`ptypy.utils.profiler`.
+        At the end of every run a Chrome trace with the events of all ranks and a summary
+        (min / max / mean across ranks) is written to this file, relative to ``io.home``.
+        Nothing is recorded if None.
+    userlevel = 2
+
     [scans]
     default = None
     type = Param
@@ -363,6 +431,7 @@ class Ptycho(Base):
         self.plotter = None
         self.record_positions = False
         self._jupyter_client = None
+        self._saver = None
 
         # Early boot strapping
         self._configure()
@@ -454,6 +523,10 @@ class Ptycho(Base):
             self.benchmark.engine_iterate = 0
             self.benchmark.engine_finalize = 0
 
+        # Profiling
+        if self.p.io.profile:
+            u.profiler.enable()
+
     def init_communication(self):
         """
         Called on __init__ if ``level >= 3``.
@@ -535,7 +608,7 @@ class Ptycho(Base):
         """
         # Load the data. This call creates automatically the scan managers,
         # which create the views and the PODs. Sets self.new_data
-        with LogTime(self.p.io.benchmark == 'all') as t:
+        with LogTime(self.p.io.benchmark == 'all') as t, u.profiler.region('data_load'):
             while not self.new_data:
                 self.new_data = self.model.new_data()
         if (self.p.io.benchmark == 'all') and parallel.master: self.benchmark.data_load += t.duration
@@ -658,14 +731,14 @@ class Ptycho(Base):
 
             # Prepare the engine
             ilog_message('%s: initializing engine' %engine.p.name)
-            with LogTime(self.p.io.benchmark == 'all') as t:
+            with LogTime(self.p.io.benchmark == 'all') as t, u.profiler.region('engine_initialize'):
                 engine.initialize()
             if (self.p.io.benchmark == 'all') and parallel.master: self.benchmark.engine_init += t.duration
 
             # One .prepare() is always executed, as Ptycho may hold data
             ilog_message('%s: preparing engine' %engine.p.name)
             self.new_data = [(d.label, d) for d in self.diff.S.values()]
-            with LogTime(self.p.io.benchmark == 'all') as t:
+            with LogTime(self.p.io.benchmark == 'all') as t, u.profiler.region('engine_prepare'):
                 engine.prepare()
             if (self.p.io.benchmark == 'all') and parallel.master: self.benchmark.engine_prepare += t.duration
 
@@ -679,14 +752,14 @@ class Ptycho(Base):
                 parallel.barrier()
 
                 # Check for new data
-                with LogTime(self.p.io.benchmark == 'all') as t:
+                with LogTime(self.p.io.benchmark == 'all') as t, u.profiler.region('data_load'):
                     self.new_data = self.model.new_data()
                 if (self.p.io.benchmark == 'all') and parallel.master: self.benchmark.data_load += t.duration
 
                 # Last minute preparation before a contiguous block of
                 # iterations
                 if self.new_data:
-                    with LogTime(self.p.io.benchmark == 'all') as t:
+                    with LogTime(self.p.io.benchmark == 'all') as t, u.profiler.region('engine_prepare'):
                         engine.prepare()
                     if (self.p.io.benchmark == 'all') and parallel.master: self.benchmark.engine_prepare += t.duration
 
@@ -699,7 +772,7 @@ class Ptycho(Base):
                     if engine.curiter % auto_save.interval == 0:
                         auto = self.paths.auto_file(self.runtime)
                         logger.info(headerline('Autosaving'))
-                        self.save_run(auto, 'dump')
+                        self.save_run(auto, 'dump', asynchronous=auto_save.asynchronous)
                         self.runtime.last_save = engine.curiter
                         logger.info(headerline())
 
@@ -709,7 +782,7 @@ class Ptycho(Base):
                     engine.numiter += engine.p.numiter_contiguous
 
                 # One iteration
-                with LogTime(self.p.io.benchmark == 'all') as t:
+                with LogTime(self.p.io.benchmark == 'all') as t, u.profiler.region('engine_iterate'):
                     engine.iterate()
                 if (self.p.io.benchmark == 'all') and parallel.master: self.benchmark.engine_iterate += t.duration
 
@@ -739,8 +812,12 @@ class Ptycho(Base):
 
             ilog_newline()
 
+            # Make sure all auto-saves are on disk
+            if self._saver is not None:
+                self._saver.flush()
+
             # Done. Let the engine finish up
-            with LogTime(self.p.io.benchmark == 'all') as t:
+            with LogTime(self.p.io.benchmark == 'all') as t, u.profiler.region('engine_finalize'):
                 engine.finalize()
             if (self.p.io.benchmark == 'all') and parallel.master: self.benchmark.engine_finalize += t.duration
 
@@ -761,6 +838,12 @@ class Ptycho(Base):
                 except Exception as e:
                     logger.warning("Failed to write benchmarks to file: %s" %e)
 
+            # Save profile
+            if self.p.io.profile:
+                profile_file = os.path.join(self.paths.home, self.p.io.profile)
+                u.profiler.save(profile_file)
+                logger.info("Profile has been written to %s" % profile_file)
+
         elif epars is not None:
             # A fresh set of engine parameters arrived.
             label = self.init_engine(epars=epars)
@@ -803,6 +886,9 @@ class Ptycho(Base):
             self.interactor.stop()
         except BaseException:
             pass
+        if self._saver is not None:
+            saver, self._saver = self._saver, None
+            saver.stop()
 
         # Hint at citations (for all log levels)
         citation_info = '\n'.join([headerline('This reconstruction relied on the following work', 'l', '='),
@@ -818,7 +904,7 @@ class Ptycho(Base):
         return inst
 
     @classmethod
-    def load_run(cls, runfile, load_data=True):
+    def load_run(cls, runfile, load_data=True, lazy=True):
         """
         Load a previous run.
 
@@ -829,6 +915,9 @@ class Ptycho(Base):
         load_data : bool
                 If `True` also load data (thus regenerating pods & views
                 for 'minimal' dump
+        lazy : bool
+                If `True`, probe and object buffers of a 'minimal' dump
+                are only read from file when first accessed
 
         Returns
         -------
@@ -850,7 +939,12 @@ class Ptycho(Base):
         header = u.Param(io.h5read(runfile, 'header')['header'])
         if header['kind'] == 'minimal' or header['kind'] == 'dls':
             logger.info('Found minimal ptypy dump')
-            content = io.h5read(runfile, 'content')['content']
+            if lazy:
+                # Parameters and runtime are needed right away
+                content = u.Param(io.h5read(runfile, 'content.pars', 'content.runtime'))
+                content.update(io.h5read(runfile, 'content.probe', 'content.obj', lazy=True))
+            else:
+                content = io.h5read(runfile, 'content')['content']
 
             logger.info('Creating new Ptycho instance')
             P = Ptycho(content.pars, level=1)
@@ -887,7 +981,8 @@ class Ptycho(Base):
             P.init_data()
         return P
 
-    def save_run(self, alt_file=None, kind='minimal', force_overwrite=True):
+    def save_run(self, alt_file=None, kind='minimal', force_overwrite=True,
+                 asynchronous=False):
         """
         Save run to file.
 
@@ -905,6 +1000,11 @@ class Ptycho(Base):
                   storages, positions and runtime information is saved.
                 - *'full_flat'*, (almost) complete environment
 
+        asynchronous : bool
+            If True, the content is copied and written to file by a
+            background thread, see :py:class:`BackgroundSaver`. Not
+            available for *'fullflat'*.
+
         """
         from . import save_load
         from .. import io
@@ -1039,11 +1139,17 @@ class Ptycho(Base):
                 for ID, S in self.obj.storages.items():
                     content.positions[ID] = np.array([v.coord for v in S.views if v.pod.pr_view.layer==0])
 
-            h5opt = io.h5options['UNSUPPORTED']
-            io.h5options['UNSUPPORTED'] = 'ignore'
-            logger.info('Saving to %s' % dest_file)
-            io.h5write(dest_file, header=header, content=content)
-            io.h5options['UNSUPPORTED'] = h5opt
+            if asynchronous and kind != 'fullflat':
+                if self._saver is None:
+                    self._saver = BackgroundSaver(self.p.io.autosave.queue_size)
+                logger.info('Saving to %s in the background' % dest_file)
+                self._saver.put(dest_file, header, BackgroundSaver.snapshot(content))
+            else:
+                # Pending background saves go first
+                if self._saver is not None:
+                    self._saver.flush()
+                logger.info('Saving to %s' % dest_file)
+                BackgroundSaver.write(dest_file, header, content)
         else:
             pass
         # We have to wait for all processes, just in case the script isn't
@@ -1288,3 +1394,89 @@ class Ptycho(Base):
         Work out the best arrangement of domains for a given number of
         nodes. Assumes a roughly square scan.
         """
+
+
+class BackgroundSaver(object):
+    """
+    Writes save files from a background thread.
+
+    At most `maxsize` files wait in the queue, :py:meth:`put` blocks
+    until there is room for another one. A failed write is raised again
+    by the next call to :py:meth:`flush` or :py:meth:`stop`.
+    """
+
+    def __init__(self, maxsize=1):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name='BackgroundSaver')
+        self.thread.daemon = True
+        self.thread.start()
+
+    @staticmethod
+    def snapshot(content):
+        """
+        Copy the arrays of the probe and object storages and the runtime
+        lists in `content`, so that the reconstruction can continue to
+        modify them while the file is written.
+        """
+        for key in ['probe', 'obj']:
+            for ID, dct in content[key].items():
+                content[key][ID] = OrderedDict(
+                    (k, v.copy() if isinstance(v, np.ndarray) else v)
+                    for k, v in dct.items())
+        content.runtime = content.runtime.copy()
+        for k, v in content.runtime.items():
+            if isinstance(v, list):
+                content.runtime[k] = list(v)
+        return content
+
+    @staticmethod
+    def write(dest_file, header, content):
+        """
+        Write `content` to `dest_file`, unsupported types are ignored.
+        """
+        from .. import io
+        io.h5write(dest_file, header=header, content=content, unsupported='ignore')
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self.write(*item)
+                logger.info('Saved to %s' % item[0])
+            except Exception as e:
+                logger.error('Background save to %s failed: %s' % (item[0], e))
+                if self.error is None:
+                    self.error = e
+            finally:
+                self.queue.task_done()
+
+    def _raise_error(self):
+        error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def put(self, dest_file, header, content):
+        """
+        Queue `content` for writing to `dest_file`.
+        """
+        self.queue.put((dest_file, header, content))
+
+    def flush(self):
+        """
+        Wait until all queued files are written, raises the first
+        error of a failed write.
+        """
+        self.queue.join()
+        self._raise_error()
+
+    def stop(self):
+        """
+        Write the remaining files and stop the thread, raises the first
+        error of a failed write.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        self._raise_error()
@@ -1,5 +1,4 @@
 import numpy as np
-import time
 
 from ..engines import register
 from .WASP import WASP
@@ -40,10 +39,10 @@ class WASP_serial(WASP):
     def __init__(self, ptycho_parent, pars=None):
         super().__init__(ptycho_parent, pars)
 
-        self.benchmark = u.Param()
 
         # Stores all information needed with respect to the diffraction storages.
         self.diff_info = {}
+        self.addr_tables = {}
         self.kernels = {}
 
     def engine_initialize(self):
@@ -52,24 +51,8 @@ class WASP_serial(WASP):
         """
 
         super().engine_initialize()
-        self._reset_benchmarks()
         self._setup_kernels()
 
-    def _reset_benchmarks(self):
-        """(Copied from _ProjectionEngine_serial, almost)
-        """
-        self.benchmark.A_Build_aux = 0.
-        self.benchmark.B_Prop = 0.
-        self.benchmark.C_Fourier_update = 0.
-        self.benchmark.D_iProp = 0.
-        self.benchmark.E_Build_exit = 0.
-        self.benchmark.F_LLerror = 0.
-        self.benchmark.wasp_ob_pr_update = 0.
-        self.benchmark.wasp_averaging = 0.
-        self.benchmark.calls_fourier = 0
-        self.benchmark.calls_wasp_ob_pr_update = 0
-        self.benchmark.calls_wasp_averaging = 0
-
     def _setup_kernels(self):
         """
         Setup kernels, one for each scan. Derive scans from ptycho class
@@ -147,12 +130,13 @@ class WASP_serial(WASP):
             prep.err_fourier = np.zeros_like(prep.ma_sum)
             prep.err_exit = np.zeros_like(prep.ma_sum)
 
-        # Unfortunately this needs to be done for all pods, since
-        # the shape of the probe / object was modified.
-        # TODO: possible scaling issue, remove the need for padding
+        # Only the addresses of new views are computed, existing ones are
+        # patched if the shape of the probe / object was modified.
         for label, d in self.di.storages.items():
             prep = self.diff_info[d.ID]
-            prep.view_IDs, prep.poe_IDs, prep.addr = projectional_serial.serialize_array_access(d)
+            if d.ID not in self.addr_tables:
+                self.addr_tables[d.ID] = projectional_serial.AddressTable(d)
+            prep.view_IDs, prep.poe_IDs, prep.addr = self.addr_tables[d.ID].serialize()
             if self.do_position_refinement:
                 prep.original_addr = np.zeros_like(prep.addr)
                 prep.original_addr[:] = prep.addr
@@ -248,62 +232,50 @@ class WASP_serial(WASP):
                     err_exit = prep.err_exit[i,None]
 
                     ## build auxilliary wave
-                    t1 = time.time()
-                    AWK.make_aux(aux, addr, ob, pr, ex, c_po=self._c, c_e=1-self._c)
-                    self.benchmark.A_Build_aux += time.time() - t1
+                    with u.profiler.region('build_aux'):
+                        AWK.make_aux(aux, addr, ob, pr, ex, c_po=self._c, c_e=1-self._c)
 
                     ## forward FFT
-                    t1 = time.time()
-                    aux[:] = FW(aux)
-                    self.benchmark.B_Prop += time.time() - t1
+                    with u.profiler.region('forward_prop'):
+                        FW(aux, out=aux)
 
                     ## Deviation from measured data
-                    t1 = time.time()
-                    if self.p.compute_fourier_error:
-                        FUK.fourier_error(aux, addr, mag, ma, ma_sum)
-                        FUK.error_reduce(addr, err_fourier)
-                    else:
-                        FUK.fourier_deviation(aux, addr, mag)
-                    FUK.fmag_update_nopbound(aux, addr, mag, ma)
-                    self.benchmark.C_Fourier_update += time.time() - t1
+                    with u.profiler.region('fourier_update'):
+                        if self.p.compute_fourier_error:
+                            FUK.fourier_error(aux, addr, mag, ma, ma_sum)
+                            FUK.error_reduce(addr, err_fourier)
+                        else:
+                            FUK.fourier_deviation(aux, addr, mag)
+                        FUK.fmag_update_nopbound(aux, addr, mag, ma)
 
                     ## backward FFT
-                    t1 = time.time()
-                    aux[:] = BW(aux)
-                    self.benchmark.D_iProp += time.time() - t1
+                    with u.profiler.region('backward_prop'):
+                        BW(aux, out=aux)
 
                     ## build exit wave
-                    t1 = time.time()
-                    AWK.make_exit(aux, addr, ob, pr, ex, c_a=self._b, c_po=self._a, c_e=-(self._a+self._b))
-                    if self.p.compute_exit_error:
-                        FUK.exit_error(aux,addr)
-                        FUK.error_reduce(addr, err_exit)
-                    self.benchmark.E_Build_exit += time.time() - t1
-                    self.benchmark.calls_fourier += 1
+                    with u.profiler.region('build_exit'):
+                        AWK.make_exit(aux, addr, ob, pr, ex, c_a=self._b, c_po=self._a, c_e=-(self._a+self._b))
+                        if self.p.compute_exit_error:
+                            FUK.exit_error(aux,addr)
+                            FUK.error_reduce(addr, err_exit)
 
                     ## build auxilliary wave (ob * pr product)
-                    t1 = time.time()
-                    AWK.build_aux_no_ex(aux, addr, ob, pr)
-                    self.benchmark.A_Build_aux += time.time() - t1
+                    with u.profiler.region('build_aux'):
+                        AWK.build_aux_no_ex(aux, addr, ob, pr)
 
                     # WASP ob and pr local update
-                    t1 = time.time()
-
-                    ob_old = ob.copy()
-                    POK.ob_update_wasp(addr, ob, pr, ex, aux, ob_sum_nmr,
-                                       ob_sum_dnm, alpha=self.p.alpha)
-                    POK.pr_update_wasp(addr, pr, ob_old, ex, aux, pr_sum_nmr,
-                                       pr_sum_dnm, beta=self.p.beta)
-
-                    self.benchmark.wasp_ob_pr_update += time.time() - t1
-                    self.benchmark.calls_wasp_ob_pr_update += 1
+                    with u.profiler.region('wasp_ob_pr_update'):
+                        ob_old = ob.copy()
+                        POK.ob_update_wasp(addr, ob, pr, ex, aux, ob_sum_nmr,
+                                           ob_sum_dnm, alpha=self.p.alpha)
+                        POK.pr_update_wasp(addr, pr, ob_old, ex, aux, pr_sum_nmr,
+                                           pr_sum_dnm, beta=self.p.beta)
 
                     ## compute log-likelihood
                     if self.p.compute_log_likelihood:
-                        t1 = time.time()
-                        aux[:] = FW(aux)
-                        FUK.log_likelihood(aux, addr, mag, ma, err_phot)
-                        self.benchmark.F_LLerror += time.time() - t1
+                        with u.profiler.region('log_likelihood'):
+                            FW(aux, out=aux)
+                            FUK.log_likelihood(aux, addr, mag, ma, err_phot)
 
                 # update errors
                 errs = np.ascontiguousarray(np.vstack([np.hstack(prep.err_fourier),
@@ -312,19 +284,15 @@ class WASP_serial(WASP):
                 error_dct.update(zip(prep.view_IDs, errs))
 
                 # WASP averaging
-                t1 = time.time()
+                with u.profiler.region('wasp_averaging'):
+                    # collect the sums
+                    parallel.allreduce(ob_sum_nmr)
+                    parallel.allreduce(ob_sum_dnm)
+                    parallel.allreduce(pr_sum_nmr)
+                    parallel.allreduce(pr_sum_dnm)
 
-                # collect the sums
-                parallel.allreduce(ob_sum_nmr)
-                parallel.allreduce(ob_sum_dnm)
-                parallel.allreduce(pr_sum_nmr)
-                parallel.allreduce(pr_sum_dnm)
-
-                POK.avg_wasp(ob, ob_sum_nmr, ob_sum_dnm)
-                POK.avg_wasp(pr, pr_sum_nmr, pr_sum_dnm)
-
-                self.benchmark.wasp_averaging += time.time() - t1
-                self.benchmark.calls_wasp_averaging += 1
+                    POK.avg_wasp(ob, ob_sum_nmr, ob_sum_dnm)
+                    POK.avg_wasp(pr, pr_sum_nmr, pr_sum_dnm)
 
                 # Clip object (This call takes like one ms. Not time critical)
                 if self.p.clip_object is not None:
@@ -374,7 +342,6 @@ class WASP_serial(WASP):
                 aux = kern.aux
                 addr = prep.addr
                 original_addr = prep.original_addr
-                mangled_addr = addr.copy()
                 mag = prep.mag
                 ma_sum = prep.ma_sum
                 err_fourier = prep.err_fourier
@@ -388,7 +355,7 @@ class WASP_serial(WASP):
 
                 # We need to re-calculate the current error
                 PCK.build_aux(aux, addr, ob, pr)
-                aux[:] = FW(aux)
+                FW(aux, out=aux)
                 if self.p.position_refinement.metric == "fourier":
                     PCK.fourier_error(aux, addr, mag, ma, ma_sum)
                     PCK.error_reduce(addr, err_fourier)
@@ -398,17 +365,28 @@ class WASP_serial(WASP):
                 error_state[:] = err_fourier
                 PCK.mangler.setup_shifts(self.curiter, nframes=addr.shape[0])
 
+                # Several shifts are evaluated at once with one stacked FFT
+                nshifts = PCK.mangler.nshifts
+                nbatch = PCK.batch_size(nshifts, self.p.position_refinement.batch_memory)
+                PCK.allocate_batch(nbatch, aux.dtype)
+                baux = aux if nbatch == 1 else PCK.npy.aux_batch
+                mangled_addr = np.repeat(addr[None], nbatch, axis=0)
+
                 log(4, 'Position refinement trial: iteration %s' % (self.curiter))
-                for i in range(PCK.mangler.nshifts):
-                    PCK.mangler.get_address(i, addr, mangled_addr, max_oby, max_obx)
-                    PCK.build_aux(aux, mangled_addr, ob, pr)
-                    aux[:] = FW(aux)
+                for i in range(0, nshifts, nbatch):
+                    nb = min(nbatch, nshifts - i)
+                    for j in range(nb):
+                        PCK.mangler.get_address(i + j, addr, mangled_addr[j], max_oby, max_obx)
+                    flat_addr = mangled_addr[:nb].reshape((-1,) + addr.shape[1:])
+                    err = PCK.npy.err_batch[:nb, :addr.shape[0]]
+                    PCK.build_aux(baux, flat_addr, ob, pr)
+                    aux_b = baux[:flat_addr.shape[0] * flat_addr.shape[1]]
+                    FW(aux_b, out=aux_b)
                     if self.p.position_refinement.metric == "fourier":
-                        PCK.fourier_error(aux, mangled_addr, mag, ma, ma_sum)
-                        PCK.error_reduce(mangled_addr, err_fourier)
+                        PCK.fourier_error_batched(aux_b, mag, ma, ma_sum, err)
                     if self.p.position_refinement.metric == "photon":
-                        PCK.log_likelihood(aux, mangled_addr, mag, ma, err_fourier)
-                    PCK.update_addr_and_error_state(addr, error_state, mangled_addr, err_fourier)
+                        PCK.log_likelihood_batched(aux_b, mag, ma, err)
+                    PCK.update_addr_and_error_state_batched(addr, error_state, mangled_addr[:nb], err)
 
                 prep.err_fourier = error_state
                 prep.addr = addr
@@ -417,34 +395,13 @@ class WASP_serial(WASP):
         """
         try deleting ever helper contianer
         """
-        if parallel.master and self.benchmark.calls_fourier:
-            print("----- BENCHMARKS ----")
-            acc = 0.
-            for name in sorted(self.benchmark.keys()):
-                t = self.benchmark[name]
-                if name[0] in 'ABCDEFGHI':
-                    print('%20s : %1.3f ms per iteration' % (name, t / self.benchmark.calls_fourier * 1000))
-                    acc += t
-                elif str(name) == 'wasp_ob_pr_update':
-                    print('%20s : %1.3f ms per call. %d calls' % (
-                        name, t / self.benchmark.calls_wasp_ob_pr_update * 1000, self.benchmark.calls_wasp_ob_pr_update))
-                elif str(name) == 'wasp_averaging':
-                    print('%20s : %1.3f ms per call. %d calls' % (
-                        name, t / self.benchmark.calls_wasp_averaging * 1000, self.benchmark.calls_wasp_averaging))
-
-            print('%20s : %1.3f ms per iteration. %d calls' % (
-                'Fourier_total', acc / self.benchmark.calls_fourier * 1000, self.benchmark.calls_fourier))
-
-        self._reset_benchmarks()
+        self.print_profile()
 
         if self.do_position_refinement:
             for label, d in self.di.storages.items():
                 prep = self.diff_info[d.ID]
                 res = self.kernels[prep.label].resolution
-                for i,view in enumerate(d.views):
-                    for j,(pname, pod) in enumerate(view.pods.items()):
-                        delta = (prep.original_addr[i][j][1][1:] - prep.addr[i][j][1][1:]) * res
-                        pod.ob_view.coord += delta
-                        pod.ob_view.storage.update_views(pod.ob_view)
+                delta = (prep.original_addr[:, :, 1, 1:] - prep.addr[:, :, 1, 1:]) * res
+                self.addr_tables[d.ID].move_object_views(delta)
 
         super().engine_finalize()
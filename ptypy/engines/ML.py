@@ -17,7 +17,7 @@ import time
 from .. import utils as u
 from ..utils.verbose import logger
 from ..utils import parallel
-from .utils import Cnorm2, Cdot
+from .utils import Cnorm2, Cdot, ForwardCache
 from . import register
 from .base import BaseEngine, PositionCorrectionEngine
 from ..core.manager import Full, Vanilla, Bragg3dModel, BlockVanilla, BlockFull, GradFull, BlockGradFull
@@ -106,6 +106,56 @@ class ML(PositionCorrectionEngine):
     help = How many coefficients to be used in the the linesearch
     doc = choose between the 'quadratic' approximation (default) or 'all'
 
+    [search_direction]
+    default = polak-ribiere
+    type = str
+    help = Method for the search direction
+    doc = Either nonlinear conjugate gradients with the 'polak-ribiere' update or the quasi-Newton 'lbfgs'
+          (limited-memory BFGS) direction.
+    choices = ['polak-ribiere', 'lbfgs']
+
+    [lbfgs_memory]
+    default = 5
+    type = int
+    lowlim = 1
+    help = Number of past steps used to build the L-BFGS direction
+
+    [line_search_steps]
+    default = 1
+    type = int
+    lowlim = 1
+    help = Maximum number of steps of the line search
+    doc = Every step after the first is a Newton step from the line coefficients re-evaluated at
+          the trial point, and is only kept if the next evaluation confirms the decrease of the
+          log-likelihood. With `cache_forward` the propagated waves are moved along the line
+          instead of being recomputed.
+
+    [line_search_tol]
+    default = 1e-3
+    type = float
+    lowlim = 0.0
+    help = Relative length of a Newton step at which the line search stops
+
+    [cache_forward]
+    default = False
+    type = bool
+    help = Reuse the propagated exit waves of the gradient in the line search
+    doc = Saves the forward propagation of the current exit waves in the computation of the
+          line coefficients at the expense of storing them for every frame.
+
+    [cache_ram_limit]
+    default = 1024.
+    type = float
+    lowlim = 0.0
+    help = Memory budget of the exit wave cache in MB
+    doc = Exit waves beyond this budget are stored in a memory-mapped scratch file.
+
+    [cache_dir]
+    default = None
+    type = str
+    help = Directory for the scratch file of the exit wave cache
+    doc = If None, the default temporary directory is used.
+
     """
 
     SUPPORTED_MODELS = [Full, Vanilla, Bragg3dModel, BlockVanilla, BlockFull, GradFull, BlockGradFull]
@@ -141,6 +191,8 @@ class ML(PositionCorrectionEngine):
         # Other
         self.tmin = None
         self.ML_model = None
+        self.fw_cache = None
+        self.lbfgs = None
         self.smooth_gradient = None
         self.scale_p_o = None
         self.scale_p_o_memory = .9
@@ -174,6 +226,12 @@ class ML(PositionCorrectionEngine):
 
         self.tmin = 1.
 
+        if self.p.cache_forward:
+            self.fw_cache = ForwardCache(int(self.p.cache_ram_limit * 2**20), self.p.cache_dir,
+                                         keep_lines=self.p.line_search_steps > 1)
+
+        self.lbfgs = LBFGS(self.p.lbfgs_memory) if self.p.search_direction == 'lbfgs' else None
+
         # Other options
         self.smooth_gradient = prepare_smoothing_preconditioner(
             self.p.smooth_gradient)
@@ -202,6 +260,10 @@ class ML(PositionCorrectionEngine):
         # - # fill object with coverage of views
         # - for name,s in self.ob_viewcover.S.items():
         # -    s.fill(s.get_view_coverage())
+        if self.fw_cache is not None:
+            self.fw_cache.invalidate()
+        if self.lbfgs is not None:
+            self.lbfgs.reset()
         self.ML_model.prepare()
 
     def engine_iterate(self, num=1):
@@ -216,7 +278,8 @@ class ML(PositionCorrectionEngine):
         ta = time.time()
         for it in range(num):
             t1 = time.time()
-            error_dct = self.ML_model.new_grad()
+            with u.profiler.region('new_grad'):
+                error_dct = self.ML_model.new_grad()
             new_ob_grad, new_pr_grad = self.ob_grad_new, self.pr_grad_new
             tg += time.time() - t1
 
@@ -254,69 +317,50 @@ class ML(PositionCorrectionEngine):
             else:
                 self.scale_p_o = self.p.scale_probe_object
 
-            ############################
-            # Compute next conjugate
-            ############################
-            if self.curiter == 0:
-                bt = 0.
+            if self.lbfgs is not None:
+                self.ob_grad << new_ob_grad
+                self.pr_grad << new_pr_grad
+                self._lbfgs_direction()
             else:
-                bt_num = (self.scale_p_o
-                          * (Cnorm2(new_pr_grad)
-                             - np.real(Cdot(new_pr_grad, self.pr_grad)))
-                          + (Cnorm2(new_ob_grad)
-                             - np.real(Cdot(new_ob_grad, self.ob_grad))))
+                ############################
+                # Compute next conjugate
+                ############################
+                if self.curiter == 0:
+                    bt = 0.
+                else:
+                    bt_num = (self.scale_p_o
+                              * (Cnorm2(new_pr_grad)
+                                 - np.real(Cdot(new_pr_grad, self.pr_grad)))
+                              + (Cnorm2(new_ob_grad)
+                                 - np.real(Cdot(new_ob_grad, self.ob_grad))))
 
-                bt_denom = self.scale_p_o*Cnorm2(self.pr_grad) + Cnorm2(self.ob_grad)
+                    bt_denom = self.scale_p_o*Cnorm2(self.pr_grad) + Cnorm2(self.ob_grad)
 
-                bt = max(0, bt_num/bt_denom)
+                    bt = max(0, bt_num/bt_denom)
 
-            # logger.info('Polak-Ribiere coefficient: %f ' % bt)
+                # logger.info('Polak-Ribiere coefficient: %f ' % bt)
 
-            self.ob_grad << new_ob_grad
-            self.pr_grad << new_pr_grad
+                self.ob_grad << new_ob_grad
+                self.pr_grad << new_pr_grad
 
-            dt = self.ptycho.FType
-            # 3. Next conjugate
-            self.ob_h *= bt / self.tmin
+                # 3. Next conjugate
+                self.ob_h *= bt / self.tmin
 
-            # Smoothing preconditioner
-            if self.smooth_gradient:
-                for name, s in self.ob_h.storages.items():
-                    s.data[:] -= self.smooth_gradient(self.ob_grad.storages[name].data)
-            else:
-                self.ob_h -= self.ob_grad
+                # Smoothing preconditioner
+                if self.smooth_gradient:
+                    for name, s in self.ob_h.storages.items():
+                        s.data[:] -= self.smooth_gradient(self.ob_grad.storages[name].data)
+                else:
+                    self.ob_h -= self.ob_grad
 
-            self.pr_h *= bt / self.tmin
-            self.pr_grad *= self.scale_p_o
-            self.pr_h -= self.pr_grad
+                self.pr_h *= bt / self.tmin
+                self.pr_grad *= self.scale_p_o
+                self.pr_h -= self.pr_grad
 
-            # In principle, the way things are now programmed this part
-            # could be iterated over in a real Newton-Raphson style.
+            # Line minimization, moves object and probe
             t2 = time.time()
-            if self.p.poly_line_coeffs == "all":
-                B = self.ML_model.poly_line_all_coeffs(self.ob_h, self.pr_h)
-                diffB = np.arange(1,len(B))*B[1:] # coefficients of poly derivative
-                roots = np.roots(np.flip(diffB.astype(np.double))) # roots only supports double
-                real_roots = np.real(roots[np.isreal(roots)]) # not interested in complex roots
-                if real_roots.size == 1: # single real root
-                    self.tmin = dt(real_roots[0])
-                else: # find real root with smallest poly objective
-                    evalp = lambda root: np.polyval(np.flip(B),root)
-                    self.tmin = dt(min(real_roots, key=evalp)) # root with smallest poly objective
-            elif self.p.poly_line_coeffs == "quadratic":
-                B = self.ML_model.poly_line_coeffs(self.ob_h, self.pr_h)
-                # same as above but quicker when poly quadratic
-                self.tmin = dt(-0.5 * B[1] / B[2])
-            else:
-                raise NotImplementedError("poly_line_coeffs should be 'quadratic' or 'all'")
-                
+            self.tmin = self._line_search()
             tc += time.time() - t2
-                
-            self.ob_h *= self.tmin
-            self.pr_h *= self.tmin
-            self.ob += self.ob_h
-            self.pr += self.pr_h
-            # Newton-Raphson loop would end here
 
             # Position correction
             self.position_update()
@@ -337,6 +381,120 @@ class ML(PositionCorrectionEngine):
         """
         pass
 
+    def _lbfgs_direction(self):
+        """
+        Replace the search directions `ob_h` and `pr_h` by the L-BFGS
+        direction of the current gradients. The last step taken is
+        still held in the search directions.
+        """
+        grad = ([s.data for s in self.ob_grad.storages.values()]
+                + [s.data for s in self.pr_grad.storages.values()])
+        h = ([s.data for s in self.ob_h.storages.values()]
+             + [s.data for s in self.pr_h.storages.values()])
+        precond = [1.] * len(self.ob_h.storages) + [self.scale_p_o] * len(self.pr_h.storages)
+        direction = self.lbfgs.direction(grad, h if self.curiter > 0 else None, precond)
+        for hs, d in zip(h, direction):
+            hs[:] = d
+
+    def _line_coeffs(self):
+        """
+        Coefficients of the polynomial approximating the log-likelihood
+        along the search direction at the current object and probe.
+        """
+        if self.p.poly_line_coeffs == "all":
+            B = self.ML_model.poly_line_all_coeffs(self.ob_h, self.pr_h)
+        elif self.p.poly_line_coeffs == "quadratic":
+            with u.profiler.region('poly_line_coeffs'):
+                B = self.ML_model.poly_line_coeffs(self.ob_h, self.pr_h)
+        else:
+            raise NotImplementedError("poly_line_coeffs should be 'quadratic' or 'all'")
+
+        if np.isinf(B).any() or np.isnan(B).any():
+            logger.warning(
+                'Warning! inf or nan found! Trying to continue...')
+            B[np.isinf(B)] = 0.
+            B[np.isnan(B)] = 0.
+        return B
+
+    @staticmethod
+    def _poly_minimum(B):
+        """
+        Position of the minimum of the polynomial with coefficients `B`
+        (in increasing order).
+        """
+        if len(B) == 3:
+            return -0.5 * B[1] / B[2]
+        diffB = np.arange(1,len(B))*B[1:] # coefficients of poly derivative
+        roots = np.roots(np.flip(diffB.astype(np.double))) # roots only supports double
+        real_roots = np.real(roots[np.isreal(roots)]) # not interested in complex roots
+        if real_roots.size == 1: # single real root
+            return real_roots[0]
+        else: # find real root with smallest poly objective
+            evalp = lambda root: np.polyval(np.flip(B),root)
+            return min(real_roots, key=evalp) # root with smallest poly objective
+
+    def _line_step(self, t):
+        """
+        Move object and probe by `t` along the search direction.
+        """
+        for name, s in self.ob.storages.items():
+            s.data += self.ob_h.storages[name].data * t
+        for name, s in self.pr.storages.items():
+            s.data += self.pr_h.storages[name].data * t
+        if self.fw_cache is not None:
+            self.fw_cache.advance(t)
+
+    def _line_search(self):
+        """
+        Minimize the log-likelihood along the search direction. The first
+        step goes to the minimum of the line polynomial, up to
+        `line_search_steps` - 1 Newton steps follow, each re-evaluating the
+        line coefficients at the trial point. A Newton step is only kept
+        if the next evaluation confirms a lower log-likelihood, otherwise
+        it is halved. Object and probe are moved to the minimum and the
+        search directions scaled to the total step.
+
+        Returns
+        -------
+        tmin : float
+            Total step along the search direction.
+        """
+        dt = self.ptycho.FType
+        nsteps = self.p.line_search_steps
+        t = dt(self._poly_minimum(self._line_coeffs()))
+        self._line_step(t)
+        tmin = t_accepted = t
+
+        LL = None
+        for step in range(1, nsteps + 1 if nsteps > 1 else 1):
+            B = self._line_coeffs()
+            if LL is not None and B[0] > LL:
+                # The last step increased the log-likelihood, go back
+                # halfway to the last confirmed point
+                t = dt(-0.5 * (tmin - t_accepted))
+            else:
+                LL = B[0]
+                t_accepted = tmin
+                # Newton steps need a positive curvature
+                if step == nsteps or (len(B) == 3 and B[2] <= 0):
+                    break
+                t = dt(self._poly_minimum(B))
+                if abs(t) <= self.p.line_search_tol * abs(tmin):
+                    break
+            self._line_step(t)
+            tmin += t
+
+        # Return to the last confirmed point
+        if tmin != t_accepted:
+            self._line_step(t_accepted - tmin)
+            tmin = t_accepted
+
+        self.ob_h *= tmin
+        self.pr_h *= tmin
+        if self.fw_cache is not None:
+            self.fw_cache.invalidate()
+        return tmin
+
     def engine_finalize(self):
         """
         Delete temporary containers.
@@ -354,6 +512,10 @@ class ML(PositionCorrectionEngine):
         del self.ptycho.containers[self.pr_h.ID]
         del self.pr_h
 
+        if self.fw_cache is not None:
+            self.fw_cache.close()
+            self.fw_cache = None
+
         # Save floating intensities into runtime
         self.ptycho.runtime["float_intens"] = parallel.gather_dict(self.ML_model.float_intens_coeff)
 
@@ -426,6 +588,46 @@ class BaseModel(object):
             except:
                 pass
 
+    def propagate(self, name, pod):
+        """
+        Propagated exit wave of `pod`, kept in the engine's cache if
+        enabled.
+        """
+        f = pod.fw(pod.probe * pod.object)
+        if self.engine.fw_cache is not None:
+            self.engine.fw_cache.put(name, f)
+        return f
+
+    def cached_propagate(self, name, pod):
+        """
+        Propagated exit wave of `pod`, taken from the engine's cache
+        if it is still valid.
+        """
+        f = None
+        if self.engine.fw_cache is not None:
+            f = self.engine.fw_cache.get(name)
+        if f is None:
+            f = pod.fw(pod.probe * pod.object)
+        return f
+
+    def cached_propagate_line(self, name, pod, ob_h, pr_h):
+        """
+        Propagated line search directions of `pod` for the object and
+        probe directions `ob_h` and `pr_h`, taken from the engine's cache
+        if they are still valid.
+        """
+        cache = self.engine.fw_cache
+        if cache is not None:
+            ab = cache.get_line(name)
+            if ab is not None:
+                return ab
+        a = pod.fw(pod.probe * ob_h[pod.ob_view]
+                   + pr_h[pod.pr_view] * pod.object)
+        b = pod.fw(pr_h[pod.pr_view] * ob_h[pod.ob_view])
+        if cache is not None:
+            cache.put_line(name, a, b)
+        return a, b
+
     def new_grad(self):
         """
         Compute a new gradient direction according to the noise model.
@@ -511,7 +713,7 @@ class GaussianModel(BaseModel):
             for name, pod in diff_view.pods.items():
                 if not pod.active:
                     continue
-                f[name] = pod.fw(pod.probe * pod.object)
+                f[name] = self.propagate(name, pod)
                 Imodel += pod.downsample(u.abs2(f[name]))
 
             # Floating intensity option
@@ -575,10 +777,8 @@ class GaussianModel(BaseModel):
             for name, pod in diff_view.pods.items():
                 if not pod.active:
                     continue
-                f = pod.fw(pod.probe * pod.object)
-                a = pod.fw(pod.probe * ob_h[pod.ob_view]
-                           + pr_h[pod.pr_view] * pod.object)
-                b = pod.fw(pr_h[pod.pr_view] * ob_h[pod.ob_view])
+                f = self.cached_propagate(name, pod)
+                a, b = self.cached_propagate_line(name, pod, ob_h, pr_h)
 
                 if A0 is None:
                     A0 = u.abs2(f).astype(np.longdouble)
@@ -648,10 +848,8 @@ class GaussianModel(BaseModel):
                 for name, pod in diff_view.pods.items():
                     if not pod.active:
                         continue
-                    f = pod.fw(pod.probe * pod.object)
-                    a = pod.fw(pod.probe * ob_h[pod.ob_view]
-                            + pr_h[pod.pr_view] * pod.object)
-                    b = pod.fw(pr_h[pod.pr_view] * ob_h[pod.ob_view])
+                    f = self.cached_propagate(name, pod)
+                    a, b = self.cached_propagate_line(name, pod, ob_h, pr_h)
 
                     if A0 is None:
                         A0 = u.abs2(f).astype(np.longdouble)
@@ -754,7 +952,7 @@ class PoissonModel(BaseModel):
             for name, pod in diff_view.pods.items():
                 if not pod.active:
                     continue
-                f[name] = pod.fw(pod.probe * pod.object)
+                f[name] = self.propagate(name, pod)
                 Imodel += u.abs2(f[name])
 
             # Floating intensity option
@@ -818,10 +1016,8 @@ class PoissonModel(BaseModel):
             for name, pod in diff_view.pods.items():
                 if not pod.active:
                     continue
-                f = pod.fw(pod.probe * pod.object)
-                a = pod.fw(pod.probe * ob_h[pod.ob_view]
-                           + pr_h[pod.pr_view] * pod.object)
-                b = pod.fw(pr_h[pod.pr_view] * ob_h[pod.ob_view])
+                f = self.cached_propagate(name, pod)
+                a, b = self.cached_propagate_line(name, pod, ob_h, pr_h)
 
                 if A0 is None:
                     A0 = u.abs2(f).astype(np.longdouble)
@@ -889,10 +1085,8 @@ class PoissonModel(BaseModel):
             for name, pod in diff_view.pods.items():
                 if not pod.active:
                     continue
-                f = pod.fw(pod.probe * pod.object)
-                a = pod.fw(pod.probe * ob_h[pod.ob_view]
-                           + pr_h[pod.pr_view] * pod.object)
-                b = pod.fw(pr_h[pod.pr_view] * ob_h[pod.ob_view])
+                f = self.cached_propagate(name, pod)
+                a, b = self.cached_propagate_line(name, pod, ob_h, pr_h)
 
                 if A0 is None:
                     A0 = u.abs2(f).astype(np.longdouble)
@@ -1010,7 +1204,7 @@ class EuclidModel(BaseModel):
             for name, pod in diff_view.pods.items():
                 if not pod.active:
                     continue
-                f[name] = pod.fw(pod.probe * pod.object)
+                f[name] = self.propagate(name, pod)
                 Amodel += np.sqrt(u.abs2(f[name]))
 
             # Floating intensity option
@@ -1074,10 +1268,8 @@ class EuclidModel(BaseModel):
             for name, pod in diff_view.pods.items():
                 if not pod.active:
                     continue
-                f = pod.fw(pod.probe * pod.object)
-                a = pod.fw(pod.probe * ob_h[pod.ob_view]
-                           + pr_h[pod.pr_view] * pod.object)
-                b = pod.fw(pr_h[pod.pr_view] * ob_h[pod.ob_view])
+                f = self.cached_propagate(name, pod)
+                a, b = self.cached_propagate_line(name, pod, ob_h, pr_h)
 
                 if A0 is None:
                     A0 = u.abs2(f).astype(np.longdouble)
@@ -1146,10 +1338,8 @@ class EuclidModel(BaseModel):
             for name, pod in diff_view.pods.items():
                 if not pod.active:
                     continue
-                f = pod.fw(pod.probe * pod.object)
-                a = pod.fw(pod.probe * ob_h[pod.ob_view]
-                           + pr_h[pod.pr_view] * pod.object)
-                b = pod.fw(pr_h[pod.pr_view] * ob_h[pod.ob_view])
+                f = self.cached_propagate(name, pod)
+                a, b = self.cached_propagate_line(name, pod, ob_h, pr_h)
 
                 if A0 is None:
                     A0 = u.abs2(f).astype(np.longdouble)
@@ -1210,6 +1400,107 @@ class EuclidModel(BaseModel):
         return B
 
 
+class LBFGS(object):
+    """
+    Limited-memory BFGS search directions.
+
+    Vectors are lists of complex arrays, one for every object and probe
+    storage, and are treated as real vectors. The initial inverse Hessian
+    is diagonal with one scale per array (e.g. the probe/object scaling
+    preconditioner).
+    """
+
+    def __init__(self, memory):
+        """
+        Parameters
+        ----------
+        memory : int
+            Number of past steps and gradient changes kept.
+        """
+        self.memory = memory
+        self.reset()
+
+    def reset(self):
+        """
+        Forget all past steps.
+        """
+        self.s = []
+        self.y = []
+        self.rho = []
+        self.grad = None
+
+    @staticmethod
+    def _dot(v1, v2):
+        return sum(np.real(np.vdot(a, b)) for a, b in zip(v1, v2))
+
+    def direction(self, grad, step=None, precond=None):
+        """
+        Search direction for the gradient `grad`.
+
+        Parameters
+        ----------
+        grad : list of arrays
+            Current gradient.
+
+        step : list of arrays
+            Step taken since the last call, None to start afresh.
+
+        precond : list of float
+            Diagonal of the initial inverse Hessian, one value per array.
+
+        Returns
+        -------
+        direction : list of arrays
+        """
+        if precond is None:
+            precond = [1.] * len(grad)
+        if step is None:
+            self.reset()
+        elif self.grad is not None:
+            y = [g - g0 for g, g0 in zip(grad, self.grad)]
+            sy = self._dot(step, y)
+            # Skip pairs violating the curvature condition
+            if sy > 0:
+                self.s.append([a.copy() for a in step])
+                self.y.append(y)
+                self.rho.append(1. / sy)
+                if len(self.s) > self.memory:
+                    self.s.pop(0)
+                    self.y.pop(0)
+                    self.rho.pop(0)
+            else:
+                logger.debug('L-BFGS: skipping step with negative curvature.')
+        self.grad = [g.copy() for g in grad]
+
+        # Two-loop recursion
+        q = [g.copy() for g in grad]
+        alpha = []
+        for s, y, rho in zip(self.s[::-1], self.y[::-1], self.rho[::-1]):
+            a = rho * self._dot(s, q)
+            alpha.append(a)
+            for qi, yi in zip(q, y):
+                qi -= a * yi
+
+        gamma = 1.
+        if self.s:
+            y = self.y[-1]
+            gamma = self._dot(self.s[-1], y) / sum(p * np.real(np.vdot(a, a)) for p, a in zip(precond, y))
+        r = [gamma * p * qi for p, qi in zip(precond, q)]
+
+        for s, y, rho, a in zip(self.s, self.y, self.rho, alpha[::-1]):
+            b = rho * self._dot(y, r)
+            for ri, si in zip(r, s):
+                ri += (a - b) * si
+
+        direction = [-ri for ri in r]
+        if self._dot(direction, grad) >= 0:
+            logger.debug('L-BFGS: no descent direction, restarting.')
+            self.reset()
+            self.grad = [g.copy() for g in grad]
+            direction = [-p * g for p, g in zip(precond, grad)]
+        return direction
+
+
 class Regul_del2(object):
     """\
     Squared gradient regularizer (Gaussian prior).
@@ -293,6 +293,17 @@ class BaseEngine(object):
         self.engine_finalize()
         pass
 
+    def print_profile(self):
+        """
+        Print the time spent in the regions recorded on
+        :py:data:`ptypy.utils.profiler`, if profiling is enabled.
+        """
+        if not (u.profiler.enabled and parallel.master):
+            return
+        print("----- PROFILE ----")
+        for path, (calls, t) in sorted(u.profiler.totals().items()):
+            print('%40s : %1.3f ms per call, %d calls' % (path, t / calls * 1000, calls))
+
     def engine_initialize(self):
         """
         Engine-specific initialization.
@@ -388,6 +399,15 @@ class PositionCorrectionEngine(BaseEngine):
     default = False
     type = bool
     help = record movement of positions
+
+    [position_refinement.batch_memory]
+    default = None
+    type = float
+    help = Memory budget [bytes] for evaluating several shifts at once
+    doc = If set, the serial engines evaluate as many shifts as fit into this budget with one
+          stacked FFT and keep the best one per frame. Within a batch all shifts are relative
+          to the positions before the batch. If None, shifts are evaluated one after the other.
+    lowlim = 0
     """
 
     POSREF_ENGINES = {
@@ -194,22 +194,25 @@ class _ProjectionEngine(PositionCorrectionEngine):
             t1 = time.time()
 
             # Fourier update
-            error_dct = self.fourier_update()
+            with u.profiler.region('fourier_update'):
+                error_dct = self.fourier_update()
 
             t2 = time.time()
             tf += t2 - t1
 
             # Overlap update
-            self.overlap_update()
+            with u.profiler.region('overlap_update'):
+                self.overlap_update()
 
-            # Recenter the probe
-            self.center_probe()
+                # Recenter the probe
+                self.center_probe()
 
             t3 = time.time()
             to += t3 - t2
 
             # Position update
-            self.position_update()
+            with u.profiler.region('position_update'):
+                self.position_update()
 
             t4 = time.time()
             tp += t4 - t3
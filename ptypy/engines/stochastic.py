@@ -12,7 +12,7 @@ import time
 from .. import utils as u
 from ..utils.verbose import logger, log
 from ..utils import parallel
-from .utils import projection_update_generalized, log_likelihood
+from .utils import projection_update_generalized, log_likelihood, PatchMax
 from .base import PositionCorrectionEngine
 from . import register
 from ..core.manager import Full, Vanilla, Bragg3dModel, BlockVanilla, BlockFull, GradFull, BlockGradFull
@@ -68,6 +68,9 @@ class _StochasticEngine(PositionCorrectionEngine):
         # By default the object norm is based on the local object
         self._object_norm_is_global = False
 
+        # Running maxima of the object power for the global object norm
+        self._ob_max = {}
+
     def engine_prepare(self):
         """
         Last minute initialization.
@@ -88,6 +91,9 @@ class _StochasticEngine(PositionCorrectionEngine):
             error_dct = {}
             rng.shuffle(vieworder)
 
+            # the global object norm is recomputed exactly once per iteration
+            self._ob_max.clear()
+
             for name in vieworder:
                 view = self.di.views[name]
                 if not view.active:
@@ -273,7 +279,7 @@ class _StochasticEngine(PositionCorrectionEngine):
         # Calculate the object norm based on the global object
         # This only works if a = 0.
         if self._object_norm_is_global and a == 0:
-            object_norm = np.max(u.abs2(view.pod.ob_view.storage.data).sum(axis=0))
+            object_norm = self._global_object_norm(view)
         # Calculate the object norm based on the local object
         else:
             object_power = 0
@@ -283,6 +289,21 @@ class _StochasticEngine(PositionCorrectionEngine):
         for name, pod in view.pods.items():
             pod.probe += (a + b) * np.conj(pod.object) * (pod.exit - exit_wave[name]) / object_norm
 
+    def _global_object_norm(self, view):
+        """
+        Maximum of the object power summed over modes. It is tracked across
+        the local object updates, only the patches of `view` are reduced.
+        """
+        s = view.pod.ob_view.storage
+        ob_max = self._ob_max.get(s.ID)
+        if ob_max is None:
+            power = lambda sl: u.abs2(s.data[(slice(None),) + sl]).sum(axis=0)
+            ob_max = PatchMax(power, self.p.object_norm_tolerance)
+            self._ob_max[s.ID] = ob_max
+            return ob_max.value
+        corners = [pod.ob_view.dlow for pod in view.pods.values()]
+        return ob_max.update(corners, view.pod.ob_view.shape)
+
 class EPIEMixin:
     """
     Defaults:
@@ -304,6 +325,17 @@ class EPIEMixin:
     type = bool
     help = Calculate the object norm based on the global object instead of the local object
 
+    [object_norm_tolerance]
+    default = 0.0
+    type = float
+    lowlim = 0.0
+    uplim = 0.9
+    help = Relative tolerance of the global object norm
+    doc = The maximum of the object power is tracked across the local object updates instead of
+      being recomputed for every view. It may exceed the true maximum by a factor of
+      ``1 / (1 - object_norm_tolerance)`` before the full object is reduced again. A value
+      of 0 keeps the norm exact. Only used with ``object_norm_is_global``.
+
     """
     SUPPORTED_MODELS = [Full, Vanilla, Bragg3dModel, BlockVanilla, BlockFull, GradFull, BlockGradFull]
 
@@ -8,9 +8,12 @@ This file is part of the PTYPY package.
     :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
     :license: see LICENSE for details.
 """
+import tempfile
+import threading
 import numpy as np
 from .. import utils as u
 from .. import parallel
+from ..utils.verbose import logger
 from scipy.sparse.linalg import eigsh
 
 # This dynamic loas could easily be generalized to other types.
@@ -539,3 +542,216 @@ def Cdot(c1, c2):
         r += np.vdot(c1.storages[name].data.flat, c2.storages[name].data.flat)
     return r
 
+
+
+class ForwardCache(object):
+    """
+    Keeps arrays, e.g. propagated exit waves, between two stages of an
+    iteration. Arrays are held in memory up to a budget of `ram_limit`
+    bytes, beyond that they are stored in a memory-mapped scratch file.
+
+    Buffers are allocated once per key and reused, :py:meth:`invalidate`
+    only marks their content as outdated.
+
+    If `keep_lines` is set, the propagated line search directions
+    ``a = FW(pr * ob_h + pr_h * ob)`` and ``b = FW(pr_h * ob_h)`` can be
+    stored alongside the exit wave ``f = FW(pr * ob)`` of a key. Moving
+    object and probe by `t` along the line then only needs
+    :py:meth:`advance` instead of new propagations.
+    """
+
+    def __init__(self, ram_limit, scratch_dir=None, keep_lines=False):
+        """
+        Parameters
+        ----------
+        ram_limit : int
+            Number of bytes kept in memory.
+
+        scratch_dir : str
+            Directory of the scratch file, system default if None.
+
+        keep_lines : bool
+            Store the line search directions passed to :py:meth:`put_line`.
+        """
+        self.ram_limit = ram_limit
+        self.scratch_dir = scratch_dir
+        self.keep_lines = keep_lines
+        self.buffers = {}
+        self.valid = set()
+        self.line_buffers = {}
+        self.lines = set()
+        self.ram = 0
+        self.spilled = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _allocate(self, shape, dtype):
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if self.ram + nbytes <= self.ram_limit:
+            self.ram += nbytes
+            return np.empty(shape, dtype=dtype)
+
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix='ptypy_cache_', dir=self.scratch_dir)
+            logger.info('Forward cache exceeds %.1f MB, spilling to scratch file.' % (self.ram_limit / 2.**20))
+        offset = self.spilled
+        self.spilled += nbytes
+        self._file.truncate(self.spilled)
+        return np.memmap(self._file, dtype=dtype, mode='r+', offset=offset, shape=shape)
+
+    def _buffer(self, buffers, key, a):
+        buf = buffers.get(key)
+        if buf is None or buf.shape != a.shape or buf.dtype != a.dtype:
+            if buf is not None and not isinstance(buf, np.memmap):
+                self.ram -= buf.nbytes
+            buf = self._allocate(a.shape, a.dtype)
+            buffers[key] = buf
+        return buf
+
+    def put(self, key, a):
+        """
+        Store a copy of array `a` under `key`.
+        """
+        with self._lock:
+            buf = self._buffer(self.buffers, key, a)
+            self.valid.add(key)
+        buf[:] = a
+
+    def put_line(self, key, a, b):
+        """
+        Store copies of the line search directions `a` and `b` of `key`,
+        does nothing unless the cache keeps lines.
+        """
+        if not self.keep_lines:
+            return
+        with self._lock:
+            bufa = self._buffer(self.line_buffers, (key, 'a'), a)
+            bufb = self._buffer(self.line_buffers, (key, 'b'), b)
+            self.lines.add(key)
+        bufa[:] = a
+        bufb[:] = b
+
+    def get(self, key):
+        """
+        Array stored under `key` or None if there is no valid entry.
+        """
+        if key in self.valid:
+            return self.buffers[key]
+        return None
+
+    def get_line(self, key):
+        """
+        Line search directions ``(a, b)`` of `key` or None if there is no
+        valid entry.
+        """
+        if key in self.lines:
+            return self.line_buffers[(key, 'a')], self.line_buffers[(key, 'b')]
+        return None
+
+    def advance(self, t):
+        """
+        Account for a step of object and probe by `t` along the cached
+        lines. Exit waves without line directions become outdated.
+        """
+        self.lines &= self.valid
+        for key in list(self.valid):
+            if key not in self.lines:
+                self.valid.discard(key)
+                continue
+            f = self.buffers[key]
+            a, b = self.get_line(key)
+            f += t * a + t ** 2 * b
+            a += 2 * t * b
+
+    def invalidate(self):
+        """
+        Mark all entries as outdated.
+        """
+        self.valid.clear()
+        self.lines.clear()
+
+    def close(self):
+        """
+        Release all buffers and delete the scratch file.
+        """
+        self.invalidate()
+        self.buffers = {}
+        self.line_buffers = {}
+        self.ram = 0
+        self.spilled = 0
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class PatchMax(object):
+    """
+    Running maximum of a 2d power map, e.g. the object power summed
+    over modes, which is modified in rectangular patches only.
+
+    After every update only the modified patches are reduced. The estimate
+    :py:attr:`value` never falls below the true maximum and exceeds it by
+    at most a factor ``1 / (1 - tolerance)``; the full map is reduced again
+    only if this can no longer be guaranteed.
+    """
+
+    def __init__(self, power, tolerance=0.):
+        """
+        Parameters
+        ----------
+        power : callable
+            ``power(sl)`` returns the power map of the region selected by
+            the tuple of two slices `sl`.
+
+        tolerance : float
+            Relative tolerance of the maximum, 0 keeps it exact.
+        """
+        self.power = power
+        self.tolerance = tolerance
+        self.value = 0.
+        self.loc = None
+        self.refreshes = 0
+        self.refresh()
+
+    def refresh(self):
+        """
+        Reduce the full power map.
+        """
+        p = self.power((slice(None), slice(None)))
+        self.loc = np.unravel_index(np.argmax(p), p.shape)
+        self.value = p[self.loc]
+        self.refreshes += 1
+        return self.value
+
+    def update(self, corners, shape):
+        """
+        Account for patches of `shape` with upper left `corners`
+        having changed and return the new maximum.
+        """
+        h, w = shape
+        pmax = -1.
+        ploc = None
+        touched = False
+        for y, x in corners:
+            y, x = int(y), int(x)
+            p = self.power((slice(y, y + h), slice(x, x + w)))
+            i, j = np.unravel_index(np.argmax(p), p.shape)
+            if p[i, j] > pmax:
+                pmax = p[i, j]
+                ploc = (y + i, x + j)
+            touched |= (y <= self.loc[0] < y + h) and (x <= self.loc[1] < x + w)
+
+        if pmax >= self.value:
+            self.value, self.loc = pmax, ploc
+        elif touched:
+            # The maximum may have decreased, keep the estimate as long
+            # as a value within the tolerance remains.
+            y, x = self.loc
+            lowlim = (1. - self.tolerance) * self.value
+            if self.power((slice(y, y + 1), slice(x, x + 1)))[0, 0] >= lowlim:
+                pass
+            elif pmax >= lowlim:
+                self.loc = ploc
+            else:
+                self.refresh()
+        return self.value
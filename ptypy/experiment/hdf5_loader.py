@@ -346,7 +346,7 @@ class Hdf5Loader(PtyScan):
         self.normalisation = None
         self.normalisation_laid_out_like_positions = None
         self.darkfield_laid_out_like_data = None
-        self.flatfield_field_laid_out_like_data = None
+        self.flatfield_laid_out_like_data = None
         self.mask_laid_out_like_data = None
         self.preview_indices = None
         self.framefilter = None
@@ -361,6 +361,10 @@ class Hdf5Loader(PtyScan):
         self.fhandle_normalisation = None
         self.fhandle_mask = None
 
+        # single frame dark- and flatfield applied as preprocessing stages
+        self.darkfield_frame = None
+        self.flatfield_frame = None
+
         self._params_check()
         log(4, u.verbose.report(self.info))
         self._spectro_scan_check()
@@ -373,6 +377,7 @@ class Hdf5Loader(PtyScan):
         self._prepare_normalisation()
         self._prepare_meta_info()
         self._prepare_center()
+        self._prepare_preprocess_stages()
 
         # For electron data, convert energy
         if self.p.electron_data:
@@ -622,6 +627,35 @@ class Hdf5Loader(PtyScan):
             log(3, "center is %s, auto_center: %s" % (self.info.center, self.info.auto_center))
             log(3, "The loader will not do any cropping.")
 
+    def _prepare_preprocess_stages(self):
+        """
+        Dark- and flatfield which are the same for all frames are applied
+        to blocks of frames by the preprocessing stages of the PtyScan,
+        unless a per-frame correction has to be applied in between.
+        """
+        per_frame = (self.darkfield_laid_out_like_data or self.flatfield_laid_out_like_data
+                     or self.normalisation is not None)
+        if per_frame:
+            return
+
+        pad = tuple(self.pad.reshape(2, 2)) if self.p.padding else ((0, 0), (0, 0))
+        if self.darkfield is not None:
+            self.darkfield_frame = np.pad(self.darkfield[self.frame_slices].squeeze(), pad, mode='constant')
+            self.add_preprocess_stage(self._darkfield_stage, 'darkfield')
+            log(3, "The darkfield is applied as preprocessing stage.")
+
+        if self.flatfield is not None:
+            self.flatfield_frame = np.pad(self.flatfield[self.frame_slices].squeeze(), pad,
+                                          mode='constant', constant_values=1)
+            self.add_preprocess_stage(self._flatfield_stage, 'flatfield')
+            log(3, "The flatfield is applied as preprocessing stage.")
+
+    def _darkfield_stage(self, indices, frames, weights):
+        return self.subtract_dark(frames, self.darkfield_frame), weights
+
+    def _flatfield_stage(self, indices, frames, weights):
+        return (frames / self.flatfield_frame).astype(frames.dtype, copy=False), weights
+
     def _reorder_preview_indices(self):
         if self.p.frameorder.indices is None:
             return
@@ -693,14 +727,14 @@ class Hdf5Loader(PtyScan):
         intensity = self.intensities[indexed_frame_slices].squeeze()
 
         # TODO: Remove these logic blocks into something a bit more sensible.
-        if self.darkfield is not None:
+        if self.darkfield is not None and self.darkfield_frame is None:
             if self.darkfield_laid_out_like_data:
                 df = self.darkfield[indexed_frame_slices].squeeze()
             else:
                 df = self.darkfield[self.frame_slices].squeeze()
             intensity = self.subtract_dark(intensity, df)
 
-        if self.flatfield is not None:
+        if self.flatfield is not None and self.flatfield_frame is None:
             if self.flatfield_laid_out_like_data:
                 intensity[:] = intensity / self.flatfield[indexed_frame_slices].squeeze()
             else:
@@ -909,6 +943,30 @@ class Hdf5Loader(PtyScan):
 
 @register()
 class Hdf5LoaderFast(Hdf5Loader):
+    """
+    Hdf5Loader which reads the frames on a pool of worker processes.
+
+    The pool is started on the first call to load and is kept until the
+    loader is finalized. Every worker opens the files once and reads
+    contiguous runs of frames, cut at the chunk boundaries of the
+    intensities dataset, into shared memory. While the current block of
+    frames is being processed, the next one is read in the background.
+
+    Defaults:
+
+    [name]
+    default = 'Hdf5LoaderFast'
+    type = str
+    help =
+
+    [prefetch]
+    default = True
+    type = bool
+    help = Read the next block of frames in the background
+    doc = The indices of the next block are guessed from the current one,
+          assuming consecutive blocks of frames. A wrong guess is discarded.
+    """
+
     def __init__(self, pars=None, **kwargs):
         super().__init__(pars=pars, **kwargs)
         self.cpu_count_per_rank = max(len(os.sched_getaffinity(0)) // parallel.size,1)
@@ -916,6 +974,13 @@ class Hdf5LoaderFast(Hdf5Loader):
         self.intensities_array = None
         self.weights_array = None
 
+        # Worker pool and the two shared buffers it reads into
+        self._pool = None
+        self._buffers = None
+        self._buffer_frames = 0
+        self._current_buffer = 0
+        self._prefetched = None
+
     @staticmethod
     def subtract_dark(raw, dark):
         """
@@ -927,122 +992,216 @@ class Hdf5LoaderFast(Hdf5Loader):
         return corr
 
     @staticmethod
-    def _init_worker(intensities_raw_array, weights_raw_array,
-                     intensities_handle,
-                     weights_handle,
-                     darkfield_handle,
-                     flatfield_handle,
-                     intensities_dtype, weights_dtype,
-                     array_shape,
-                     mask_laid_out_like_data,
-                     darkfield_laid_out_like_data,
-                     flatfield_laid_out_like_data):
-        Hdf5LoaderFast.worker_intensities_handle = intensities_handle
-        Hdf5LoaderFast.worker_intensities_array = np.frombuffer(intensities_raw_array, intensities_dtype, -1).reshape(array_shape)
-        Hdf5LoaderFast.worker_weights_handle = weights_handle
-        Hdf5LoaderFast.worker_weights_array = np.frombuffer(weights_raw_array, weights_dtype, -1).reshape(array_shape) if weights_raw_array else None
-        Hdf5LoaderFast.worker_mask_laid_out_like_data = mask_laid_out_like_data
-        Hdf5LoaderFast.worker_darkfield_handle = darkfield_handle
-        Hdf5LoaderFast.worker_darkfield_laid_out_like_data = darkfield_laid_out_like_data
-        Hdf5LoaderFast.worker_flatfield_handle = flatfield_handle
-        Hdf5LoaderFast.worker_flatfield_laid_out_like_data = flatfield_laid_out_like_data
+    def _init_worker(raw_buffers, intensities_dtype, weights_dtype,
+                     array_shape, sources, swmr):
+        """
+        Attach to the shared buffers and open the files once per worker.
+        `sources` maps a name to (file, key, laid_out_like_data).
+        """
+        Hdf5LoaderFast.worker_buffers = [
+            (np.frombuffer(iraw, intensities_dtype, -1).reshape(array_shape),
+             np.frombuffer(wraw, weights_dtype, -1).reshape(array_shape) if wraw is not None else None)
+            for iraw, wraw in raw_buffers]
+        Hdf5LoaderFast.worker_files = []
+        Hdf5LoaderFast.worker_datasets = {}
+        Hdf5LoaderFast.worker_laid_out_like_data = {}
+        for name, (fname, key, laid_out_like_data) in sources.items():
+            f = h5.File(fname, 'r', swmr=swmr)
+            Hdf5LoaderFast.worker_files.append(f)
+            dset = f[key]
+            if not laid_out_like_data:
+                # Single frame, keep it in memory
+                dset = dset[()]
+                if dset.ndim > 2:
+                    dset = dset[0]
+            Hdf5LoaderFast.worker_datasets[name] = dset
+            Hdf5LoaderFast.worker_laid_out_like_data[name] = laid_out_like_data
 
     @staticmethod
-    def _read_intensities_and_weights(slices):
+    def _read_intensities_and_weights(task):
         '''
-        Copy intensities/weights into memory and correct for
-        darkfield/flatfield if they exist
+        Copy a contiguous run of intensities/weights into memory and
+        correct for darkfield/flatfield if they exist
         '''
-        indexed_frame_slices, dest_slices = slices
-        frame_slices = tuple(np.array(indexed_frame_slices)[-2:])
-
-        # Handle / target array for intensities
-        src_intensities  = Hdf5LoaderFast.worker_intensities_handle
-        dest_intensities = Hdf5LoaderFast.worker_intensities_array
-
-        # Handle / target array for mask/weights
-        src_weights  = Hdf5LoaderFast.worker_weights_handle
-        dest_weights = Hdf5LoaderFast.worker_weights_array
-        mask_laid_out_like_data = Hdf5LoaderFast.worker_mask_laid_out_like_data
+        buffer_index, src_slices, dest_slices = task
+        frame_slices = src_slices[-2:]
+        datasets = Hdf5LoaderFast.worker_datasets
+        laid_out_like_data = Hdf5LoaderFast.worker_laid_out_like_data
 
-        # Handle for darkfield
-        src_darkfield = Hdf5LoaderFast.worker_darkfield_handle
-        darkfield_laid_out_like_data = Hdf5LoaderFast.worker_darkfield_laid_out_like_data
-
-        # Handle for flatfield
-        src_flatfield = Hdf5LoaderFast.worker_flatfield_handle
-        flatfield_laid_out_like_data = Hdf5LoaderFast.worker_flatfield_laid_out_like_data
+        # Target arrays for intensities and mask/weights
+        dest_intensities, dest_weights = Hdf5LoaderFast.worker_buffers[buffer_index]
 
         # Copy intensities and weights
-        src_intensities.read_direct(dest_intensities, indexed_frame_slices, dest_slices)
-        if src_weights is not None:
-            if mask_laid_out_like_data:
-                src_weights.read_direct(dest_weights, indexed_frame_slices, dest_slices)
+        datasets['intensities'].read_direct(dest_intensities, src_slices, dest_slices)
+        if 'weights' in datasets:
+            if laid_out_like_data['weights']:
+                datasets['weights'].read_direct(dest_weights, src_slices, dest_slices)
             else:
-                src_weights.read_direct(dest_weights, frame_slices, dest_slices)
+                dest_weights[dest_slices] = datasets['weights'][frame_slices]
 
         # Correct darkfield
-        if src_darkfield is not None:
-            if darkfield_laid_out_like_data:
-                df = src_darkfield[indexed_frame_slices].squeeze()
-            else:
-                df = src_darkfield[frame_slices].squeeze()
+        if 'darkfield' in datasets:
+            sl = src_slices if laid_out_like_data['darkfield'] else frame_slices
+            df = datasets['darkfield'][sl]
             dest_intensities[dest_slices] = Hdf5LoaderFast.subtract_dark(dest_intensities[dest_slices], df)
 
         # Correct flatfield
-        if src_flatfield is not None:
-            if flatfield_laid_out_like_data:
-                dest_intensities[dest_slices] /= src_flatfield[indexed_frame_slices].squeeze()
-            else:
-                dest_intensities[dest_slices] /= src_flatfield[frame_slices].squeeze()
+        if 'flatfield' in datasets:
+            sl = src_slices if laid_out_like_data['flatfield'] else frame_slices
+            dest_intensities[dest_slices] /= datasets['flatfield'][sl]
 
-    def _setup_raw_intensity_buffer(self, dtype, sh):
-        npixels = int(np.prod(sh))
-        if (self.intensities_array is not None) and (self.intensities_array.size == npixels):
+    def _sources(self):
+        """
+        File names and keys of the datasets read by the workers.
+        """
+        sources = {'intensities': (self.p.intensities.file, self.p.intensities.key, True)}
+        if self.mask is not None:
+            sources['weights'] = (self.p.mask.file, self.p.mask.key, self.mask_laid_out_like_data)
+        # single frame dark- and flatfield are left to the preprocessing stages
+        if self.darkfield is not None and self.darkfield_frame is None:
+            sources['darkfield'] = (self.p.darkfield.file, self.p.darkfield.key, self.darkfield_laid_out_like_data)
+        if self.flatfield is not None and self.flatfield_frame is None:
+            sources['flatfield'] = (self.p.flatfield.file, self.p.flatfield.key, self.flatfield_laid_out_like_data)
+        return sources
+
+    def _setup_pool(self, nframes):
+        """
+        Start the worker pool with two shared buffers of at least
+        `nframes` frames each. The pool is only restarted if the
+        buffers are too small.
+        """
+        if (self._pool is not None) and (nframes <= self._buffer_frames):
             return
-        self._intensities_raw_array = RawArray(np.ctypeslib.as_ctypes_type(dtype), npixels)
-        self.intensities_array = np.frombuffer(self._intensities_raw_array, self.intensities_dtype, -1).reshape(sh)
+        self._close_pool()
 
-    def _setup_raw_weights_buffer(self, dtype, sh):
+        sh = (nframes,) + tuple(int(s) for s in u.expect2(self.frame_shape))
         npixels = int(np.prod(sh))
-        if (self.weights_array is not None) and (self.weights_array.size == npixels):
-            return
-        if self.mask is not None:
-            self._weights_raw_array = RawArray(np.ctypeslib.as_ctypes_type(dtype), npixels)
-            self.weights_array = np.frombuffer(self._weights_raw_array, dtype, -1).reshape(sh)
+        raw_buffers = []
+        self._buffers = []
+        for i in range(2):
+            iraw = RawArray(np.ctypeslib.as_ctypes_type(self.intensities_dtype), npixels)
+            intensities = np.frombuffer(iraw, self.intensities_dtype, -1).reshape(sh)
+            if self.mask is not None:
+                wraw = RawArray(np.ctypeslib.as_ctypes_type(self.mask_dtype), npixels)
+                weights = np.frombuffer(wraw, self.mask_dtype, -1).reshape(sh)
+            else:
+                wraw = None
+                weights = np.ones(sh, dtype=int)
+            raw_buffers.append((iraw, wraw))
+            self._buffers.append((intensities, weights))
+        self._buffer_frames = nframes
+
+        self._pool = Pool(self.cpu_count_per_rank,
+                          initializer=Hdf5LoaderFast._init_worker,
+                          initargs=(raw_buffers, self.intensities_dtype, self.mask_dtype,
+                                    sh, self._sources(), self._is_swmr))
+
+    def _close_pool(self):
+        """
+        Wait for a pending prefetch and shut down the worker pool.
+        """
+        if self._prefetched is not None:
+            self._prefetched[1].wait()
+            self._prefetched = None
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _read_tasks(self, buffer_index, src_slices):
+        """
+        Group the frames into runs which are contiguous along the frame
+        axis and do not cross a chunk boundary of the intensities dataset.
+        Without chunking, the frames are split evenly among the workers.
+        """
+        chunks = self.intensities.chunks
+        maxlen = max(-(-len(src_slices) // self.cpu_count_per_rank), 1)
+
+        def same_run(prev, cur, length):
+            axis = len(cur) - 3
+            if cur[:axis] != prev[:axis] or cur[axis] != prev[axis] + 1:
+                return False
+            if chunks is None:
+                return length < maxlen
+            return cur[axis] // chunks[axis] == prev[axis] // chunks[axis]
+
+        tasks = []
+        start = 0
+        for k in range(1, len(src_slices) + 1):
+            if k < len(src_slices) and same_run(src_slices[k-1], src_slices[k], k - start):
+                continue
+            first, last = src_slices[start], src_slices[k-1]
+            axis = len(first) - 3
+            run = first[:axis] + (slice(first[axis], last[axis] + 1),) + first[-2:]
+            tasks.append((buffer_index, run, np.s_[start:k]))
+            start = k
+        return tasks
+
+    def load_multiprocessing(self, src_slices, next_slices=None):
+        """
+        Read the frames selected by `src_slices` into shared memory. If
+        `next_slices` is given, these frames are read into the other
+        buffer in the background and picked up by the next call.
+        """
+        next_slices = next_slices or []
+        self._setup_pool(max(len(src_slices), len(next_slices)))
+
+        # Prefetched frames always go into the buffer not handed out last
+        buffer_index = 1 - self._current_buffer
+        prefetched, self._prefetched = self._prefetched, None
+        if (prefetched is not None) and (prefetched[0] == src_slices):
+            prefetched[1].get()
         else:
-            self._weights_raw_array = None
-            self.weights_array = np.ones(sh, dtype=int)
-
-    def load_multiprocessing(self, src_slices):
-        sh = (len(src_slices),) + self.frame_shape
-        self._setup_raw_intensity_buffer(self.intensities_dtype, sh)
-        self._setup_raw_weights_buffer(self.mask_dtype, sh)
-        dest_slices = [np.s_[i:i+1] for i in range(len(src_slices))]
-
-        with Pool(self.cpu_count_per_rank,
-                  initializer=Hdf5LoaderFast._init_worker,
-                  initargs=(self._intensities_raw_array, self._weights_raw_array,
-                            self.intensities, self.mask, self.darkfield, self.flatfield,
-                            self.intensities_dtype, self.mask_dtype,
-                            sh, self.mask_laid_out_like_data,
-                            self.darkfield_laid_out_like_data,
-                            self.flatfield_field_laid_out_like_data)) as p:
-            p.map(self._read_intensities_and_weights, zip(src_slices, dest_slices))
-
-    def load_unmapped_raster_scan(self, indices):
+            if prefetched is not None:
+                log(4, 'Discarding prefetched frames.')
+                prefetched[1].wait()
+            self._pool.map(Hdf5LoaderFast._read_intensities_and_weights,
+                           self._read_tasks(buffer_index, src_slices))
+
+        self._current_buffer = buffer_index
+        intensities, weights = self._buffers[buffer_index]
+        self.intensities_array = intensities[:len(src_slices)]
+        self.weights_array = weights[:len(src_slices)]
+
+        if next_slices:
+            tasks = self._read_tasks(1 - buffer_index, next_slices)
+            self._prefetched = (next_slices, self._pool.map_async(
+                Hdf5LoaderFast._read_intensities_and_weights, tasks))
+
+    def _next_indices(self, indices):
+        """
+        Guess the indices of the next call to load, assuming the scan is
+        read in consecutive blocks of frames.
+        """
+        if not self.p.prefetch:
+            return []
+        chunk = getattr(self, 'indices', None)
+        step = len(chunk.chunk) if chunk is not None else len(indices)
+        return [ii + step for ii in indices if ii + step < self.num_frames]
 
+    def _indexed_frame_slices(self, indices):
+        """
+        Source selection in the intensities dataset for every index.
+        """
         slices = []
         for ii in indices:
-            slow_idx, fast_idx = self.preview_indices[:, ii]
-            jj = slow_idx * self.slow_axis.shape[1] + fast_idx
-            indexed_frame_slices = (jj,)
+            if self._ismapped and self._scantype == 'arb':
+                indexed_frame_slices = (int(self.preview_indices[ii]),)
+            elif self._ismapped:
+                indexed_frame_slices = tuple(int(i) for i in self.preview_indices[:, ii])
+            else:
+                slow_idx, fast_idx = self.preview_indices[:, ii]
+                indexed_frame_slices = (int(slow_idx * self.slow_axis.shape[1] + fast_idx),)
             indexed_frame_slices += self.frame_slices
             if self._is_spectro_scan and self.p.outer_index is not None:
                 indexed_frame_slices = (self.p.outer_index,) + indexed_frame_slices
             slices.append(indexed_frame_slices)
+        return slices
 
-        self.load_multiprocessing(slices)
+    def load_unmapped_raster_scan(self, indices):
+
+        slices = self._indexed_frame_slices(indices)
+        self.load_multiprocessing(slices, self._indexed_frame_slices(self._next_indices(indices)))
 
         intensities = {}
         positions = {}
@@ -1057,16 +1216,8 @@ class Hdf5LoaderFast(Hdf5Loader):
 
     def load_mapped_and_raster_scan(self, indices):
 
-        slices = []
-        for ii in indices:
-            index = self.preview_indices[:, ii]
-            indexed_frame_slices = tuple(index)
-            indexed_frame_slices += self.frame_slices
-            if self._is_spectro_scan and self.p.outer_index is not None:
-                indexed_frame_slices = (self.p.outer_index,) + indexed_frame_slices
-            slices.append(indexed_frame_slices)
-
-        self.load_multiprocessing(slices)
+        slices = self._indexed_frame_slices(indices)
+        self.load_multiprocessing(slices, self._indexed_frame_slices(self._next_indices(indices)))
 
         intensities = {}
         positions = {}
@@ -1081,16 +1232,8 @@ class Hdf5LoaderFast(Hdf5Loader):
 
     def load_mapped_and_arbitrary_scan(self, indices):
 
-        slices = []
-        for ii in indices:
-            jj = self.preview_indices[ii]
-            indexed_frame_slices = (jj,)
-            indexed_frame_slices += self.frame_slices
-            if self._is_spectro_scan and self.p.outer_index is not None:
-                indexed_frame_slices = (self.p.outer_index,) + indexed_frame_slices
-            slices.append(indexed_frame_slices)
-
-        self.load_multiprocessing(slices)
+        slices = self._indexed_frame_slices(indices)
+        self.load_multiprocessing(slices, self._indexed_frame_slices(self._next_indices(indices)))
 
         intensities = {}
         positions = {}
@@ -1103,10 +1246,21 @@ class Hdf5LoaderFast(Hdf5Loader):
         log(3, 'Data loaded successfully.')
         return intensities, positions, weights
 
+    def _finalize(self):
+        """
+        Shut down the worker pool and close any open HDF5 files.
+        """
+        self._close_pool()
+        super()._finalize()
+
     def get_corrected_intensities(self, weights, intensities, index, indexed_frame_slice):
         '''
         Corrects the intensities for normalisation and padding
         '''
+        # The frames live in the shared buffers, which a later prefetch
+        # overwrites, so only copies are handed out.
+        intensities = intensities.copy()
+        weights = weights.copy()
 
         if self.normalisation is not None:
             if self.normalisation_laid_out_like_positions:
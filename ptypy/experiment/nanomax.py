@@ -14,6 +14,19 @@ except ImportError:
 import h5py
 import os.path
 
+
+def _I0_stage(normdata, rounding=False):
+    """
+    Preprocessing stage normalising the frames by the I0 channel.
+    """
+    def normalise(indices, frames, weights):
+        frames = frames / normdata[indices][:, None, None]
+        if rounding:
+            frames = np.round(frames).astype(int)
+        return frames, weights
+    return normalise
+
+
 @register()
 class NanomaxStepscanNov2018(PtyScan):
     """
@@ -146,6 +159,16 @@ class NanomaxStepscanNov2018(PtyScan):
         return positions
 
 
+    def load_common(self):
+        # every process needs the I0 channel for the normalisation
+        if self.info.I0:
+            return {'normdata': self.normdata}
+        return {}
+
+    def post_initialize(self):
+        if self.info.I0:
+            self.add_preprocess_stage(_I0_stage(self.common.normdata), 'I0')
+
     def load(self, indices):
         raw, weights, positions = {}, {}, {}
 
@@ -163,8 +186,6 @@ class NanomaxStepscanNov2018(PtyScan):
             fullfilename = os.path.join(self.info.path, filename)
             with h5py.File(fullfilename, 'r') as fp:
                 raw[ind] = fp[hdfpath % frame][0]
-                if self.info.I0:
-                    raw[ind] = raw[ind] / self.normdata[ind]
 
         return raw, positions, weights
 
@@ -343,6 +364,16 @@ class NanomaxFlyscanMay2019(PtyScan):
         positions = - np.vstack((y, x)).T * 1e-6
         return positions
 
+    def load_common(self):
+        # every process needs the I0 channel for the normalisation
+        if self.info.I0:
+            return {'normdata': self.normdata}
+        return {}
+
+    def post_initialize(self):
+        if self.info.I0:
+            self.add_preprocess_stage(_I0_stage(self.common.normdata, rounding=True), 'I0')
+
     def load(self, indices):
 
         raw, weights, positions = {}, {}, {}
@@ -358,8 +389,6 @@ class NanomaxFlyscanMay2019(PtyScan):
             with h5py.File(fullfilename, 'r') as hf:
                 data = hf[hdfpath % line][image]
             raw[ind] = data
-            if self.info.I0:
-                raw[ind] = np.round(raw[ind] / self.normdata[ind]).astype(int)
 
         logger.info('loaded %d images' % len(raw))
         return raw, positions, weights
@@ -526,6 +555,16 @@ class NanomaxStepscanSep2019(PtyScan):
         return positions
 
 
+    def load_common(self):
+        # every process needs the I0 channel for the normalisation
+        if self.info.I0:
+            return {'normdata': self.normdata}
+        return {}
+
+    def post_initialize(self):
+        if self.info.I0:
+            self.add_preprocess_stage(_I0_stage(self.common.normdata), 'I0')
+
     def load(self, indices):
         raw, weights, positions = {}, {}, {}
 
@@ -536,8 +575,6 @@ class NanomaxStepscanSep2019(PtyScan):
         with h5py.File(fullfilename, 'r') as fp:
             for ind in indices:
                 raw[ind] = fp[hdfpath % ind][0]
-                if self.info.I0:
-                    raw[ind] = raw[ind] / self.normdata[ind]
 
         return raw, positions, weights
 
@@ -637,8 +674,6 @@ class NanomaxFlyscanDec2019(NanomaxFlyscanMay2019):
             with h5py.File(fullfilename, 'r') as hf:
                 data = hf['entry/measurement/%s/%06u'%(self.info.detector, line)][image]
             raw[ind] = data
-            if self.info.I0:
-                raw[ind] = np.round(raw[ind] / self.normdata[ind]).astype(int)
 
         logger.info('loaded %d images' % len(raw))
         return raw, positions, weights
@@ -695,8 +730,6 @@ class NanomaxContrast(NanomaxStepscanSep2019):
             self.meta.energy = fp['entry/snapshot/energy'][:] * 1e-3
             for ind in indices:
                 raw[ind] = fp['entry/measurement/%s/frames'%self.info.detector][ind]
-                if self.info.I0:
-                    raw[ind] = raw[ind] / self.normdata[ind]
 
         return raw, positions, weights
 
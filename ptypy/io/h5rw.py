@@ -17,17 +17,85 @@ import pickle
 from ..utils import Param
 from ..utils.verbose import logger
 
-__all__ = ['h5write', 'h5append', 'h5read', 'h5info', 'h5options']
+__all__ = ['h5write', 'h5append', 'h5read', 'h5info', 'h5options', 'LazyDataset']
 
 h5options = dict(
     H5RW_VERSION='0.1',
     H5PY_VERSION=h5py.version.version,
     # UNSUPPORTED = 'ignore',
     UNSUPPORTED='fail',
-    SLASH_ESCAPE='_SLASH_')
+    SLASH_ESCAPE='_SLASH_',
+    # Smaller arrays are always read right away by h5read(..., lazy=True)
+    LAZY_MIN_BYTES=65536)
 STR_CONVERT = [type]
 
 
+class LazyDataset(object):
+    """
+    Proxy for an array dataset of a hdf5 file, returned by
+    ``h5read(..., lazy=True)``. Nothing is read until the proxy is
+    sliced or :py:meth:`load` is called. The file is opened again for
+    every read, so the proxy stays valid after h5read returned.
+
+    Contiguous, uncompressed datasets are read through a read-only
+    ``np.memmap`` of the file, all others through h5py.
+    """
+
+    def __init__(self, dset):
+        self.filename = dset.file.filename
+        self.name = dset.name
+        self.shape = dset.shape
+        self.dtype = dset.dtype
+        self.offset = None
+        if dset.chunks is None and dset.compression is None and self.dtype.kind in 'biufc':
+            self.offset = dset.id.get_offset()
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return '<LazyDataset %s%s %s in %s>' % (self.name, str(self.shape), self.dtype.str, self.filename)
+
+    def memmap(self):
+        """
+        Read-only memory map of the dataset, None if it is chunked
+        or compressed.
+        """
+        if self.offset is None:
+            return None
+        return np.memmap(self.filename, dtype=self.dtype, mode='r', offset=self.offset, shape=self.shape)
+
+    def __getitem__(self, sl):
+        mm = self.memmap()
+        if mm is not None:
+            return np.array(mm[sl])
+        with h5py.File(self.filename, 'r') as f:
+            return f[self.name][sl]
+
+    def __array__(self, dtype=None):
+        a = self.load()
+        return a if dtype is None else a.astype(dtype)
+
+    def load(self):
+        """
+        Read the whole dataset into memory.
+        """
+        return np.asarray(self[...])
+
+
+
 def sdebug(f):
     """
     debugging decorator for _store functions
@@ -53,7 +121,7 @@ class Str_to_Slice(object):
 str_to_slice = Str_to_Slice()
 
 
-def _h5write(filename, mode, *args, **kwargs):
+def _h5write(filename, mode, *args, unsupported=None, **kwargs):
     """\
     _h5write(filename, mode, {'var1'=..., 'var2'=..., ...})
     _h5write(filename, mode, var1=..., var2=..., ...)
@@ -71,12 +139,16 @@ def _h5write(filename, mode, *args, **kwargs):
     * dictionaries
 
     (Setting the option UNSUPPORTED equal to 'ignore' eliminates
-    unsupported types. Default is 'fail', which raises an error.)
+    unsupported types. Default is 'fail', which raises an error.
+    The keyword `unsupported` overrides the option for this call.)
 
     The file mode can be chosen according to the h5py documentation.
     It defaults to overwriting an existing file.
     """
 
+    if unsupported is None:
+        unsupported = h5options['UNSUPPORTED']
+
     filename = os.path.abspath(os.path.expanduser(filename))
 
     ctime = time.asctime()
@@ -250,9 +322,9 @@ def _h5write(filename, mode, *args, **kwargs):
         elif type(a) in STR_CONVERT:
             dset = _store_string(group, str(a), name)
         else:
-            if h5options['UNSUPPORTED'] == 'fail':
+            if unsupported == 'fail':
                 raise RuntimeError('Unsupported data type : %s' % type(a))
-            elif h5options['UNSUPPORTED'] == 'pickle':
+            elif unsupported == 'pickle':
                 dset = _store_pickle(group, a, name)
             else:
                 dset = None
@@ -279,7 +351,7 @@ def _h5write(filename, mode, *args, **kwargs):
     return
 
 
-def h5write(filename, *args, **kwargs):
+def h5write(filename, *args, unsupported=None, **kwargs):
     """\
     h5write(filename, {'var1'=..., 'var2'=..., ...})
     h5write(filename, var1=..., var2=..., ...)
@@ -296,17 +368,18 @@ def h5write(filename, *args, **kwargs):
     * dictionaries
 
     (Setting the option UNSUPPORTED equal to 'ignore' eliminates
-    unsupported types. Default is 'fail', which raises an error.)
+    unsupported types. Default is 'fail', which raises an error.
+    The keyword `unsupported` overrides the option for this call.)
 
     The file mode can be chosen according to the h5py documentation.
     It defaults to overwriting an existing file.
     """
 
-    _h5write(filename, 'w', *args, **kwargs)
+    _h5write(filename, 'w', *args, unsupported=unsupported, **kwargs)
     return
 
 
-def h5append(filename, *args, **kwargs):
+def h5append(filename, *args, unsupported=None, **kwargs):
     """\
     h5append(filename, {'var1'=..., 'var2'=..., ...})
     h5append(filename, var1=..., var2=..., ...)
@@ -323,13 +396,14 @@ def h5append(filename, *args, **kwargs):
     * dictionaries
 
     (Setting the option UNSUPPORTED equal to 'ignore' eliminates
-    unsupported types. Default is 'fail', which raises an error.)
+    unsupported types. Default is 'fail', which raises an error.
+    The keyword `unsupported` overrides the option for this call.)
 
     The file mode can be chosen according to the h5py documentation.
     It defaults to overwriting an existing file.
     """
 
-    _h5write(filename, 'a', *args, **kwargs)
+    _h5write(filename, 'a', *args, unsupported=unsupported, **kwargs)
     return
 
 
@@ -360,8 +434,13 @@ def h5read(filename, *args, **kwargs):
     h5read(filename_with_wildcard, ... , doglob=True)
     Reads sequentially all globbed filenames.
 
+    h5read(filename, ..., lazy=True)
+    Returns a :py:class:`LazyDataset` instead of reading arrays of at
+    least h5options['LAZY_MIN_BYTES'] bytes.
+
     """
     doglob = kwargs.pop('doglob', None)
+    lazy = kwargs.pop('lazy', False)
     depth = kwargs.pop('depth', None)
     depth = 99 if depth is None else depth + 1
 
@@ -423,6 +502,8 @@ def h5read(filename, *args, **kwargs):
     def _load_numpy(dset, sl=None):
         if sl is not None:
             return dset[sl]
+        elif lazy and dset.shape and dset.size * dset.dtype.itemsize >= h5options['LAZY_MIN_BYTES']:
+            return LazyDataset(dset)
         else:
             return dset[...]
 
@@ -484,7 +565,7 @@ def h5read(filename, *args, **kwargs):
         elif dset_type == 'array':
             val = _load_numpy(dset, sl)
         elif dset_type == 'arraylist':
-            val = [x for x in _load_numpy(dset)]
+            val = [x for x in dset[...]]
             if sl is not None:
                 val = val[sl]
         elif dset_type == 'tuple':
@@ -492,7 +573,7 @@ def h5read(filename, *args, **kwargs):
             if sl is not None:
                 val = val[sl]
         elif dset_type == 'arraytuple':
-            val = tuple(_load_numpy(dset).tolist())
+            val = tuple(dset[...].tolist())
             if sl is not None:
                 val = val[sl]
         elif dset_type == 'string':
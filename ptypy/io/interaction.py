@@ -15,16 +15,23 @@ import time
 import string
 import random
 import sys
-from threading import Thread, Event
+from threading import Thread, Event, Lock
 import queue
 import numpy as np
 import re
 import json
+import zlib
+import hashlib
+
+try:
+    import lz4.frame as lz4
+except ImportError:
+    lz4 = None
 
 from ..utils.verbose import logger
 from .. import defaults_tree
 
-__all__ = ['Server', 'Client']
+__all__ = ['Server', 'Client', 'make_preview', 'encode_preview', 'decode_preview']
 
 DEBUG = lambda x: None
 
@@ -107,6 +114,105 @@ def numpy_replace(obj, arraylist):
         return obj
 
 
+def make_preview(a, step=1, roi=None):
+    """
+    Downsampled copy of an array for live monitoring.
+
+    The last two axes are cropped to `roi` and decimated by `step`, all
+    leading axes are stacked into the first axis of the returned 3D array.
+    Only the preview is copied, which is cheap enough for the main thread.
+
+    Parameters
+    ----------
+    a : array-like
+        Array to preview, at least 2D.
+
+    step : int
+        Keep every `step`-th pixel along the last two axes.
+
+    roi : list or None
+        ``[[y0, y1], [x0, x1]]`` region of the last two axes to keep,
+        or None for all of it.
+    """
+    a = np.asarray(a)
+    if a.ndim < 2:
+        raise ValueError('Previews need at least 2D arrays, got shape %s' % str(a.shape))
+    roi = roi if roi is not None else [[None, None], [None, None]]
+    sl = tuple(slice(r[0], r[1], step) for r in roi)
+    out = np.ascontiguousarray(a[(Ellipsis,) + sl])
+    return out.reshape((-1,) + out.shape[-2:])
+
+
+def _frame_digests(frames):
+    return [hashlib.blake2b(f.tobytes(), digest_size=8).hexdigest() for f in frames]
+
+
+def encode_preview(frames, state=None, codec=None):
+    """
+    Encode the frames of a preview that changed since the last one sent.
+
+    Parameters
+    ----------
+    frames : ndarray
+        3D preview as returned by :py:func:`make_preview`.
+
+    state : tuple or None
+        State returned by the previous call for the same client, None to
+        send all frames.
+
+    codec : str or None
+        Compress the frames with ``'zlib'`` or ``'lz4'``.
+
+    Returns
+    -------
+    msg, state : dict or None, tuple
+        The message for :py:func:`decode_preview`, None if no frame
+        changed, and the state to pass to the next call.
+    """
+    digests = _frame_digests(frames)
+    if state is not None and state[0] == frames.shape and state[1] == frames.dtype.str:
+        layers = [i for i, (d, old) in enumerate(zip(digests, state[2])) if d != old]
+    else:
+        layers = list(range(len(frames)))
+    state = (frames.shape, frames.dtype.str, digests)
+    if not layers:
+        return None, state
+
+    payload = frames if len(layers) == len(frames) else frames[layers]
+    if codec == 'lz4':
+        payload = np.frombuffer(lz4.compress(payload.tobytes()), dtype=np.uint8)
+    elif codec == 'zlib':
+        payload = np.frombuffer(zlib.compress(payload.tobytes(), 1), dtype=np.uint8)
+
+    msg = {'shape': list(frames.shape), 'dtype': frames.dtype.str,
+           'layers': layers, 'codec': codec, 'payload': payload}
+    return msg, state
+
+
+def decode_preview(msg, previous=None):
+    """
+    Rebuild a preview from a message of :py:func:`encode_preview`.
+    Frames that were not sent are taken from `previous`. A new array is
+    returned, `previous` is left untouched.
+    """
+    shape = tuple(msg['shape'])
+    dtype = np.dtype(msg['dtype'])
+    layers = msg['layers']
+    payload = msg['payload']
+    if msg['codec'] == 'lz4':
+        payload = np.frombuffer(lz4.decompress(payload.tobytes()), dtype=dtype)
+    elif msg['codec'] == 'zlib':
+        payload = np.frombuffer(zlib.decompress(payload.tobytes()), dtype=dtype)
+    payload = np.asarray(payload).view(dtype).reshape((len(layers),) + shape[1:])
+
+    if previous is not None and previous.shape == shape and previous.dtype == dtype:
+        out = previous.copy()
+    else:
+        out = np.zeros(shape, dtype=dtype)
+    out[layers] = payload
+    return out
+
+
 def numpy_zmq_send(out_socket, obj):
     """
     Send the given object using JSON, taking care of numpy arrays.
@@ -212,6 +318,14 @@ class Server(object):
     help = Ping time out
     doc = Ping time out: client disconnected after this period, in seconds.
 
+    [monitor_interval]
+    default = 0.5
+    type = float
+    lowlim = 0.0
+    help = Minimum interval between two previews sent to a client
+    doc = Live monitoring previews (see :py:meth:`Client.monitor`) are sent to each client at most
+      once per interval, in seconds. Clients may ask for a longer interval.
+
     """
 
     def __init__(self, pars=None, **kwargs):
@@ -243,6 +357,9 @@ class Server(object):
         pingtimeout : float
             Ping time out: client disconnected after this period (in seconds).
 
+        monitor_interval : float
+            Minimum interval between two previews sent to a client (in seconds).
+
         """
         #################################
         # Initialize all parameters
@@ -280,6 +397,10 @@ class Server(object):
         # Command queue
         self.queue = queue.Queue()
 
+        # Live monitoring subscriptions {(ID, ticket): subscription}
+        self.monitors = {}
+        self._monitor_lock = Lock()
+
         # Initialize flags to communicate state between threads.
         self._need_process = False
         self._can_process = False
@@ -297,6 +418,8 @@ class Server(object):
                      'SET': self._cmd_queue_set,          # Set an object sent by the client (synchronous)
                      'PING': self._cmd_ping,              # Regular ping from client
                      'AVAIL': self._cmd_avail,            # Send list of available objects
+                     'MONITOR': self._cmd_monitor,        # Subscribe to previews of an object
+                     'UNMONITOR': self._cmd_unmonitor,    # Cancel a subscription
                      'SHUTDOWN': self._cmd_shutdown}      # Shut down the server
 
         self.make_ID_pool()
@@ -414,6 +537,9 @@ class Server(object):
                 self._can_process = False
                 self._process()
 
+            # Send the previews taken by the main thread
+            self._publish_monitors()
+
             # Check for new requests
             if self.poller.poll(self.poll_timeout):
 
@@ -493,6 +619,9 @@ class Server(object):
         sock.close()
         self.pings.pop(ID)
         self.names.pop(ID)
+        with self._monitor_lock:
+            for key in [k for k in self.monitors if k[0] == ID]:
+                del self.monitors[key]
         logger.debug('Client ID=%s disconnected.' % ID)
 
         # Recycle port, generate new ID
@@ -519,6 +648,44 @@ class Server(object):
         DEBUG('Processing an AVAIL command')
         return {'status': 'ok', 'avail': list(self.objects.keys())}
 
+    def _cmd_monitor(self, ID, args):
+        """\
+        Process a MONITOR command.
+        Subscribe the client to previews of an object.
+        """
+        DEBUG('Processing a MONITOR command')
+        codec = args.get('codec')
+        if codec == 'lz4' and lz4 is None:
+            logger.debug('lz4 is not available, compressing previews with zlib.')
+            codec = 'zlib'
+        elif codec not in [None, 'zlib', 'lz4']:
+            return {'status': 'Error: unknown codec %s' % str(codec)}
+
+        monitor = {'ID': ID,
+                   'ticket': args['ticket'],
+                   'str': args['str'],
+                   'step': max(int(args.get('step') or 1), 1),
+                   'roi': args.get('roi'),
+                   'codec': codec,
+                   'interval': max(args.get('interval') or 0., self.p.monitor_interval),
+                   'last': 0.,
+                   'snapshot': None,
+                   'state': None,
+                   'version': 0}
+        with self._monitor_lock:
+            self.monitors[(ID, args['ticket'])] = monitor
+        return {'status': 'ok', 'codec': codec}
+
+    def _cmd_unmonitor(self, ID, args):
+        """\
+        Process an UNMONITOR command.
+        Cancel a subscription to previews.
+        """
+        DEBUG('Processing an UNMONITOR command')
+        with self._monitor_lock:
+            self.monitors.pop((ID, args['ticket']), None)
+        return {'status': 'ok'}
+
     def _cmd_ping(self, ID, args):
         """\
         Process a PING command
@@ -659,6 +826,50 @@ class Server(object):
             logger.debug('Time spent : %f' % (time.time() - t0))
         return
 
+    def _snapshot_monitors(self):
+        """\
+        Take previews for the subscriptions that are due.
+        (runs on the main thread, between two iterations)
+        """
+        now = time.time()
+        with self._monitor_lock:
+            for m in self.monitors.values():
+                # Rate limit, and never pile up previews the client has not received yet.
+                if m['snapshot'] is not None or now - m['last'] < m['interval']:
+                    continue
+                try:
+                    m['snapshot'] = ('ok', make_preview(eval(m['str'], {}, self.objects), m['step'], m['roi']))
+                except:
+                    m['snapshot'] = (repr(sys.exc_info()[1]), None)
+                m['last'] = now
+
+    def _publish_monitors(self):
+        """\
+        Compare, compress and send the previews taken by the main thread.
+        Only the frames that changed since the previous preview are sent.
+        (runs on the separate thread)
+        """
+        with self._monitor_lock:
+            due = [m for m in self.monitors.values() if m['snapshot'] is not None]
+            snapshots = [m['snapshot'] for m in due]
+            for m in due:
+                m['snapshot'] = None
+
+        for m, (status, frames) in zip(due, snapshots):
+            out = None
+            if frames is not None:
+                out, m['state'] = encode_preview(frames, m['state'], m['codec'])
+                if out is None:
+                    # Nothing has changed
+                    continue
+                m['version'] += 1
+                out.update(version=m['version'], step=m['step'], roi=m['roi'])
+
+            socktuple = self.out_sockets.get(m['ID'])
+            if socktuple is None:
+                continue
+            self._send(socktuple[0], {'ticket': m['ticket'], 'status': status, 'out': out})
+
     def register(self, obj, name):
         """\
         Exposes the content of an object for transmission and interaction.
@@ -673,7 +884,12 @@ class Server(object):
         """\
         Give permission to the serving thread to send objects and
         wait for it to complete (safer!)
+        Previews for live monitoring are taken here but sent
+        without waiting.
         """
+        if self.monitors:
+            self._snapshot_monitors()
+
         if self._need_process:
             # Set flag to allow sending objects
             self._can_process = True
@@ -774,6 +990,9 @@ class Client(object):
         self.tickets_to_tags = {}
         self.tags_to_tickets = {}
 
+        # Live monitoring subscriptions {ticket: latest preview}
+        self.monitors = {}
+
         self.lastping = 0
 
         self._thread = None
@@ -906,6 +1125,10 @@ class Client(object):
         message = self._recv(self.bind_socket)
         ticket = message['ticket']
 
+        if ticket in self.monitors:
+            self._read_preview(ticket, message)
+            return
+
         # Store data
         self.data[ticket] = message['out']
         self.status[ticket] = message['status']
@@ -927,6 +1150,24 @@ class Client(object):
             # We are being sent something we didn't ask for (warning or error)
             self.unexpected_ticket(ticket)
 
+    def _read_preview(self, ticket, message):
+        """
+        Merge a preview sent for a monitoring subscription.
+        """
+        mon = self.monitors[ticket]
+        out = message['out']
+        if out is not None:
+            mon['data'] = decode_preview(out, mon['data'])
+            mon['version'] = out['version']
+            mon['step'] = out['step']
+            mon['roi'] = out['roi']
+
+        self.data[ticket] = mon['data']
+        self.status[ticket] = message['status']
+        if mon['tag'] is not None:
+            self.datatag[mon['tag']] = mon['data']
+        self.newdata(ticket)
+
     def flush(self):
         """
         Delete all stored data (and accompanying status).
@@ -1065,6 +1306,45 @@ class Client(object):
                 return ticket, self.data[ticket]
         return ticket
 
+    def monitor(self, evalstr, step=1, roi=None, codec=None, interval=0., tag=None):
+        """
+        Subscribe to previews of an array using an eval string.
+
+        The server takes a preview (see :py:func:`make_preview`) at most
+        every `interval` seconds and sends it only if it changed, and then
+        only the frames that changed. The latest preview is kept in
+        ``self.monitors[ticket]['data']`` (and in self.data / self.datatag
+        when it arrives). This function returns the ticket.
+
+        Parameters
+        ----------
+        step : int
+            Downsampling factor of the last two axes.
+
+        roi : list or None
+            ``[[y0, y1], [x0, x1]]`` region of the last two axes.
+
+        codec : str or None
+            Compress the previews with ``'zlib'`` or ``'lz4'``.
+
+        interval : float
+            Minimum interval between two previews, in seconds.
+        """
+        ticket = self.masterticket + 1
+        self.masterticket += 1
+        self.monitors[ticket] = {'data': None, 'version': 0, 'step': step, 'roi': roi, 'tag': tag}
+        self.cmds.append({'ID': self.ID, 'cmd': 'MONITOR',
+                          'args': {'ticket': ticket, 'str': evalstr, 'step': step, 'roi': roi,
+                                   'codec': codec, 'interval': interval}})
+        return ticket
+
+    def unmonitor(self, ticket):
+        """
+        Cancel a subscription to previews.
+        """
+        self.monitors.pop(ticket, None)
+        self.cmds.append({'ID': self.ID, 'cmd': 'UNMONITOR', 'args': {'ticket': ticket}})
+
     def get_now(self, evalstr):
         """
         Synchronous get. May be dangerous, but should be safe for small objects like parameters.
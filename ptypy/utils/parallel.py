@@ -26,9 +26,11 @@ MPIenabled = not (size == 1)
 master = (rank == 0)
 
 __all__ = ['MPIenabled', 'comm', 'MPI', 'master','barrier',
-           'LoadManager', 'loadmanager','allreduce','send','receive','bcast',
-           'bcast_dict', 'gather_dict', 'gather_list', 
-           'MPIrand_normal', 'MPIrand_uniform','MPInoise2d']
+           'LoadManager', 'loadmanager','allreduce','iallreduce','waitall',
+           'allreduce_lowp', 'allreduce_box',
+           'send','receive','bcast',
+           'bcast_dict', 'scatter_dict', 'gather_dict', 'gather_list', 
+           'MPIrand_normal', 'MPIrand_uniform','MPInoise2d', 'HaloExchange']
 
 
 def useMPI(do=None):
@@ -187,6 +189,7 @@ def allreduce(a, op=None):
     isscalar = np.isscalar(a)
     if isscalar:
         a = np.array(a)
+    profiler.count('mpi_allreduce_bytes', a.nbytes)
     if op is None:
         # print a.shape
         comm.Allreduce(MPI.IN_PLACE, a)
@@ -197,6 +200,161 @@ def allreduce(a, op=None):
     else:
         return a
 
+def iallreduce(a, op=None):
+    """
+    Non-blocking version of :py:func:`allreduce`, always in place.
+
+    Parameters
+    ----------
+    a : numpy-ndarray
+        The array to operate on. It must not be touched until the
+        reduction is completed with :py:func:`waitall`.
+
+    op : operation
+        MPI operation to execute. If None, uses MPI.SUM.
+
+    Returns
+    -------
+    request : MPI.Request or None
+        Request handle of the reduction, None if MPI is disabled.
+    """
+    if not MPIenabled:
+        return None
+    profiler.count('mpi_allreduce_bytes', a.nbytes)
+    if op is None:
+        return comm.Iallreduce(MPI.IN_PLACE, a)
+    else:
+        return comm.Iallreduce(MPI.IN_PLACE, a, op=op)
+
+def waitall(requests):
+    """
+    Wait for the completion of all request handles in `requests`,
+    entries which are None are skipped.
+    """
+    requests = [r for r in requests if r is not None]
+    if requests:
+        MPI.Request.Waitall(requests)
+
+def _float16_pack(x):
+    return x.astype(np.float16).view(np.uint16)
+
+def _float16_unpack(h):
+    return h.view(np.float16).astype(np.float32)
+
+def _bfloat16_pack(x):
+    # upper half of the float32, rounded to nearest even
+    b = x.view(np.uint32)
+    return ((b + (0x7FFF + ((b >> 16) & 1))) >> 16).astype(np.uint16)
+
+def _bfloat16_unpack(h):
+    return (h.astype(np.uint32) << 16).view(np.float32)
+
+_CODECS = {'float16': (_float16_pack, _float16_unpack),
+           'bfloat16': (_bfloat16_pack, _bfloat16_unpack)}
+_LOWP_OPS = {}
+
+def _lowp_sum(precision):
+    """
+    MPI sum operation on 16-bit floats stored as uint16.
+    """
+    op = _LOWP_OPS.get(precision)
+    if op is None:
+        pack, unpack = _CODECS[precision]
+
+        def _sum(inbuf, inoutbuf, datatype):
+            a = np.frombuffer(inbuf, dtype=np.uint16)
+            b = np.frombuffer(inoutbuf, dtype=np.uint16)
+            b[:] = pack(unpack(a) + unpack(b))
+
+        op = _LOWP_OPS[precision] = MPI.Op.Create(_sum, commute=True)
+    return op
+
+def allreduce_lowp(a, precision='bfloat16', residual=None):
+    """
+    Sum of `a` across all processes, in place, transmitting the values
+    as 16-bit floats.
+
+    Parameters
+    ----------
+    a : numpy-ndarray
+        Contiguous real or complex array to operate on.
+
+    precision : str
+        'bfloat16' keeps the range of float32 at 8 bits of mantissa,
+        'float16' keeps 11 bits of mantissa, the values are scaled
+        to fit the range of float16.
+
+    residual : numpy-ndarray
+        Optional float32 (complex64 if `a` is complex) array of the shape
+        of `a`. The quantization error of this process is added to it and
+        fed back into the next reduction.
+    """
+    if not MPIenabled:
+        return a
+    pack, unpack = _CODECS[precision]
+    real = a.real.dtype
+    x = a.view(real).astype(np.float32)
+    if residual is not None:
+        x += residual.view(np.float32)
+
+    scale = 1.
+    if precision == 'float16':
+        # the sum over all processes needs to stay within the float16 range
+        scale = comm.allreduce(float(np.abs(x).max(initial=0.)), MPI.MAX) * size / 6e4
+        if scale > 0:
+            x /= scale
+        else:
+            scale = 1.
+
+    h = pack(x)
+    if residual is not None:
+        residual.view(np.float32)[:] = (x - unpack(h)) * scale
+
+    profiler.count('mpi_allreduce_bytes', h.nbytes)
+    profiler.count('mpi_allreduce_bytes_saved', a.nbytes - h.nbytes)
+    comm.Allreduce(MPI.IN_PLACE, h, op=_lowp_sum(precision))
+
+    a[...] = (unpack(h) * scale).astype(real).view(a.dtype).reshape(a.shape)
+    return a
+
+def allreduce_box(a, lo, hi, precision=None, residual=None):
+    """
+    Sum of the box ``a[..., lo[0]:hi[0], lo[1]:hi[1], ...]`` across all
+    processes, in place, the rest of `a` is left untouched.
+
+    Parameters
+    ----------
+    a : numpy-ndarray
+        The array to operate on.
+
+    lo, hi : array_like
+        Corners of the box in the trailing dimensions of `a`, need to be
+        the same on all processes.
+
+    precision : str or None
+        If None, the box is reduced at full precision, otherwise
+        see :py:func:`allreduce_lowp`.
+
+    residual : numpy-ndarray
+        Quantization error of the shape of `a`, see :py:func:`allreduce_lowp`.
+    """
+    if not MPIenabled:
+        return a
+    sl = (Ellipsis,) + tuple(slice(int(l), int(h)) for l, h in zip(lo, hi))
+    buf = np.ascontiguousarray(a[sl])
+    if buf.size == 0:
+        return a
+    profiler.count('mpi_allreduce_bytes_saved', a.nbytes - buf.nbytes)
+    if precision is None:
+        allreduce(buf)
+    else:
+        res = None if residual is None else np.ascontiguousarray(residual[sl])
+        allreduce_lowp(buf, precision, res)
+        if res is not None:
+            residual[sl] = res
+    a[sl] = buf
+    return a
+
 def allreduceC(c):
     """
     Performs MPI parallel ``allreduce`` with a sum as reduction
@@ -518,6 +676,88 @@ def bcast_dict(dct, keys='all', source=0):
                 out[k] = v
         return out
 
+def scatter_dict(dct, keys, source=0):
+    """
+    Scatters the arrays in dict `dct` from ``rank==source``. Each node
+    receives only the items whose keys are in its list ``keys[rank]``.
+
+    Unlike :any:`bcast_dict`, the arrays are packed into one contiguous
+    stack at the source and every node is sent only its own part with a
+    single ``comm.Scatterv``. This needs all values to be arrays of the
+    same shape and data type, otherwise :any:`bcast_dict` is used.
+
+    Parameters
+    ----------
+    dct : dict
+        Dictionary of arrays, only needed at ``rank==source``.
+
+    keys : list
+        List of key lists, one for every rank. Must be the same on all
+        nodes.
+
+    source : int
+        Rank of node / process which scatters.
+
+    Returns
+    -------
+    dct : dict
+        A smaller dictionary with values to ``keys[rank]`` if that key
+        was in the source dictionary. The values are views into one
+        contiguous array.
+
+    See also
+    --------
+    bcast_dict
+    """
+    if not MPIenabled:
+        return {k: dct[k] for k in keys[rank] if k in dct}
+
+    # Communicate which keys are sent to which node and how
+    if rank == source:
+        sel = [[k for k in ks if k in dct] for ks in keys]
+        values = [dct[k] for ks in sel for k in ks]
+        if not values:
+            header = ('array', sel, (0,), '<f8')
+        elif all(type(v) is np.ndarray and v.shape == values[0].shape and v.dtype == values[0].dtype
+                 for v in values):
+            header = ('array', sel, values[0].shape, values[0].dtype.str)
+        else:
+            header = ('pickle',)
+        comm.bcast(header, source)
+    else:
+        header = comm.bcast(None, source)
+
+    if header[0] == 'pickle':
+        return bcast_dict(dct, keys[rank], source)
+
+    sel, shape, dtypestr = header[1:]
+    counts = [len(ks) for ks in sel]
+    if not sum(counts):
+        return {}
+
+    newdtype = '|u1' if dtypestr == '|b1' else dtypestr
+    recv = np.empty((counts[rank],) + tuple(shape), dtype=newdtype)
+
+    # One frame is one element, avoids overflowing the counts for large chunks
+    frame = MPI.BYTE.Create_contiguous(int(np.prod(shape)) * np.dtype(newdtype).itemsize)
+    frame.Commit()
+    try:
+        if rank == source:
+            sendbuf = np.empty((sum(counts),) + tuple(shape), dtype=newdtype)
+            for i, v in enumerate(values):
+                sendbuf[i] = v
+            displs = np.cumsum([0] + counts[:-1]).tolist()
+            comm.Scatterv([sendbuf, counts, displs, frame], [recv, counts[rank], frame], root=source)
+        else:
+            comm.Scatterv(None, [recv, counts[rank], frame], root=source)
+    finally:
+        frame.Free()
+
+    if dtypestr == '|b1':
+        recv = recv.astype('bool')
+
+    return dict(zip(sel[rank], recv))
+
 def allgather_dict(dct):
     """
     Allgather dict in place.
@@ -963,3 +1203,106 @@ def _bcast_dict(dct, keys_accepted='all', source=0):
                 dct[k] = v
 
         return dct
+
+
+def tile_overlaps(tiles, rank):
+    """
+    Overlaps of tile `rank` with all other tiles.
+
+    Parameters
+    ----------
+    tiles : list
+        One ``(offset, shape)`` tuple per rank describing a rectangular
+        tile of a common pixel grid.
+
+    rank : int
+        Index of the local tile.
+
+    Returns
+    -------
+    out : list
+        ``(other_rank, slices)`` tuples, where `slices` selects the
+        overlap within the local tile.
+    """
+    lo = np.asarray(tiles[rank][0])
+    hi = lo + np.asarray(tiles[rank][1])
+    out = []
+    for other, (offset, shape) in enumerate(tiles):
+        if other == rank:
+            continue
+        a = np.maximum(lo, offset)
+        b = np.minimum(hi, np.asarray(offset) + np.asarray(shape))
+        if np.all(b > a):
+            out.append((other, tuple(slice(int(i - l), int(j - l)) for i, j, l in zip(a, b, lo))))
+    return out
+
+
+class HaloExchange(object):
+    """
+    Sums arrays which cover different, possibly overlapping, tiles of
+    a common pixel grid on each rank.
+
+    Only the overlapping regions are sent to the ranks that hold the
+    neighbouring tiles. After :py:meth:`exchange`, every pixel holds the
+    sum over all ranks whose tile contains it, which is what an
+    :py:func:`allreduce` of the full grid gives within the tile.
+    """
+
+    def __init__(self, offset, shape, layers=1):
+        """
+        Needs to be created on all ranks.
+
+        Parameters
+        ----------
+        offset : array_like
+            Position of the first pixel of the local tile in the grid.
+
+        shape : tuple
+            Shape of the local tile.
+
+        layers : int
+            Number of layers in front of the tile dimensions, needs to
+            match on ranks with overlapping tiles.
+        """
+        self.offset = np.asarray(offset, dtype=int)
+        self.shape = tuple(int(n) for n in shape)
+        tile = (self.offset.tolist(), self.shape, int(layers))
+        tiles = comm.allgather(tile) if MPIenabled else [tile]
+
+        self.neighbours = tile_overlaps([t[:2] for t in tiles], rank)
+        for other, sl in self.neighbours:
+            if tiles[other][2] != layers:
+                raise RuntimeError('Tiles of rank %d and %d overlap but hold a different number of layers (%d, %d)'
+                                   % (rank, other, layers, tiles[other][2]))
+
+        #: Node coverage, number of ranks whose tile contains each pixel
+        self.cover = np.ones(self.shape, dtype=np.int32)
+        for other, sl in self.neighbours:
+            self.cover[sl] += 1
+
+    def exchange(self, *arrays):
+        """
+        Sum the overlapping regions of `arrays` with the neighbouring
+        ranks, in place. The trailing dimensions of each array need to
+        match the tile shape. Needs to be called on all ranks.
+        """
+        if not self.neighbours:
+            return
+        requests = []
+        received = []
+        for other, sl in self.neighbours:
+            for tag, a in enumerate(arrays):
+                sl_a = (Ellipsis,) + sl
+                sendbuf = np.ascontiguousarray(a[sl_a])
+                recvbuf = np.empty_like(sendbuf)
+                requests.append(comm.Isend(sendbuf, dest=other, tag=tag))
+                requests.append(comm.Irecv(recvbuf, source=other, tag=tag))
+                received.append((a, sl_a, sendbuf, recvbuf))
+                profiler.count('mpi_halo_bytes', sendbuf.nbytes)
+        MPI.Request.Waitall(requests)
+        for a, sl_a, sendbuf, recvbuf in received:
+            a[sl_a] += recvbuf
+
+
+# imported last, the profiler reports across ranks
+from .profiling import profiler
@@ -121,6 +121,8 @@ class PlotClient(object):
     A client that connects and continually gets the data required for plotting.
     Note: all data is transferred as soon as the server provides it. This might
     be a waste of bandwidth if all that is required is a client that plots "on demand"...
+    With `preview` active, object and probe are monitored as downsampled previews
+    which are only transferred when they changed.
 
     This PlotClient doesn't actually plot.
     """
@@ -129,9 +131,10 @@ class PlotClient(object):
     DATA = 2
     STOPPED = 0
 
-    def __init__(self, client_pars=None, in_thread=False):
+    def __init__(self, client_pars=None, in_thread=False, preview=None):
         """
         Create a client and attempt to connect to a running reconstruction server.
+        `preview` are the io.autoplot.preview parameters.
         """
         # This avoids circular imports.
         from ptypy.io.interaction import Client
@@ -145,6 +148,10 @@ class PlotClient(object):
         # When the data associated with a ticket arrives it is places in buffer[key].
         self.cmd_dct = {}
 
+        # Monitored data, self.mon_dct['cmd'] = [ticket, buffer, key]
+        self.preview = preview if preview is not None and preview.get('active') else None
+        self.mon_dct = {}
+
         # Initialize data containers. Here we use our own "Param" class, which adds attribute access
         # on top of dictionary.
         self.pr = Param()  # Probe
@@ -274,7 +281,7 @@ class PlotClient(object):
         for ID in ob_IDs:
             S = Param()
             self.ob[ID] = S
-            self.cmd_dct["Ptycho.obj.S['%s'].data" % str(ID)] = [None, S, 'data']
+            self._add_data_request("Ptycho.obj.S['%s'].data" % str(ID), S)
             self.cmd_dct["Ptycho.obj.S['%s'].psize" % str(ID)] = [None, S, 'psize']
             self.cmd_dct["Ptycho.obj.S['%s'].center" % str(ID)] = [None, S, 'center']
 
@@ -286,7 +293,7 @@ class PlotClient(object):
         for ID in pr_IDs:
             S = Param()
             self.pr[ID] = S
-            self.cmd_dct["Ptycho.probe.S['%s'].data" % str(ID)] = [None, S, 'data']
+            self._add_data_request("Ptycho.probe.S['%s'].data" % str(ID), S)
             self.cmd_dct["Ptycho.probe.S['%s'].psize" % str(ID)] = [None, S, 'psize']
             self.cmd_dct["Ptycho.probe.S['%s'].center" % str(ID)] = [None, S, 'center']
 
@@ -299,6 +306,35 @@ class PlotClient(object):
         # Get info if it's all over
         self.cmd_dct["Ptycho.runtime.get('allstop') is not None"] = [None, self.__dict__, '_stopping']
 
+        # Wait for the first previews
+        self._wait_for_previews()
+
+    def _wait_for_previews(self):
+        """
+        Wait until the first preview of every monitored array has arrived.
+        Raises if the server reports an error or after the preview timeout.
+        """
+        t0 = time.time()
+        for cmd, item in self.mon_dct.items():
+            while self.client.monitors[item[0]]['data'] is None:
+                status = self.client.status.get(item[0])
+                if status not in (None, 'ok'):
+                    raise RuntimeError("Monitoring %s failed on the server: %s" % (cmd, status))
+                if time.time() - t0 > self.preview.timeout:
+                    raise RuntimeError("No preview of %s within %.1f seconds" % (cmd, self.preview.timeout))
+                time.sleep(.1)
+
+    def _add_data_request(self, cmd, S):
+        """
+        Request the data of a storage, either in full at every update or
+        as a preview.
+        """
+        if self.preview is None:
+            self.cmd_dct[cmd] = [None, S, 'data']
+        else:
+            ticket = self.client.monitor(cmd, step=self.preview.step, codec=self.preview.codec,
+                                         interval=self.preview.interval)
+            self.mon_dct[cmd] = [ticket, S, 'data']
 
     def _request_data(self):
         """
@@ -314,6 +350,13 @@ class PlotClient(object):
         with self._lock:
             for cmd, item in self.cmd_dct.items():
                 item[1][item[2]] = self.client.data[item[0]]
+            for cmd, item in self.mon_dct.items():
+                mon = self.client.monitors[item[0]]
+                S = item[1]
+                S[item[2]] = mon['data']
+                # Pixels of the preview are larger
+                S['psize'] = np.asarray(S['psize']) * mon['step']
+                S['center'] = np.asarray(S['center']) / mon['step']
             # An extra step for the error. This should be handled differently at some point.
             # self.error = np.array([info['error'].sum(0) for info in self.runtime.iter_info])
             self._new_data = True
@@ -659,7 +702,7 @@ class MPLClient(MPLplotter):
 
         super(MPLClient,self).__init__(pars = layout, in_thread = in_thread)
 
-        self.pc = PlotClient(client_pars,in_thread=in_thread)
+        self.pc = PlotClient(client_pars, in_thread=in_thread, preview=self.config.get('preview'))
         self.pc.start()
         self._framefile= None
         self.is_slave = is_slave
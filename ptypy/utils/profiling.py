@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of reconstruction runs.
+
+Engines, data loading and the propagators mark nested named regions and
+bump counters (e.g. number of propagated frames, bytes sent through MPI)
+on the global :py:data:`profiler`. Recording is switched off by default,
+in which case a region is a shared no-op context manager and a counter
+update returns immediately.
+
+A recorded run can be summarized across MPI ranks (min / max / mean of
+every region and counter) and saved as a Chrome trace file, which can be
+opened with chrome://tracing or https://ui.perfetto.dev.
+
+This file is part of the PTYPY package.
+
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+import json
+import threading
+from time import perf_counter
+
+import numpy as np
+
+from . import parallel
+
+__all__ = ['Profiler', 'profiler']
+
+
+class _NullRegion(object):
+    """
+    Region returned by a disabled profiler, does nothing.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        return False
+
+
+_NULL_REGION = _NullRegion()
+
+
+class _Region(object):
+    __slots__ = ('profiler', 'name', 'path', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        stack = self.profiler._stack()
+        stack.append(self.name)
+        self.path = '/'.join(stack)
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        duration = perf_counter() - self.start
+        self.profiler._stack().pop()
+        self.profiler._record(self.path, self.start, duration)
+        return False
+
+
+class Profiler(object):
+    """
+    Records nested named regions and counters.
+
+    Regions started within another region are recorded under the path
+    ``'outer/inner'``. Every thread keeps its own region stack.
+
+    Example
+    -------
+    >>> from ptypy.utils import profiler
+    >>> profiler.enable()
+    >>> with profiler.region('fourier_update'):
+    ...     profiler.count('fft', 32)
+    >>> profiler.report()['regions']['fourier_update']['calls']['max']
+    1.0
+    """
+
+    def __init__(self, enabled=False, max_events=1000000):
+        """
+        Parameters
+        ----------
+        enabled : bool
+            Start recording right away.
+
+        max_events : int
+            Maximum number of region events kept for the trace. The
+            accumulated times and counters are not limited.
+        """
+        self.enabled = enabled
+        self.max_events = max_events
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.clear()
+
+    def enable(self, enabled=True):
+        """
+        Switch recording on or off.
+        """
+        self.enabled = enabled
+
+    def clear(self):
+        """
+        Drop everything recorded so far.
+        """
+        with self._lock:
+            self.t0 = perf_counter()
+            self.timers = {}
+            self.counters = {}
+            self.events = []
+
+    def region(self, name):
+        """
+        Context manager measuring the time spent in region `name`.
+        """
+        if not self.enabled:
+            return _NULL_REGION
+        return _Region(self, name)
+
+    def count(self, name, value=1):
+        """
+        Add `value` to counter `name`.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def _record(self, path, start, duration):
+        with self._lock:
+            t = self.timers.get(path)
+            if t is None:
+                self.timers[path] = [1, duration]
+            else:
+                t[0] += 1
+                t[1] += duration
+            if len(self.events) < self.max_events:
+                self.events.append((path, threading.get_ident(), start - self.t0, duration))
+
+    def totals(self, prefix=None):
+        """
+        Number of calls and accumulated time [s] of all regions of this
+        rank, optionally only of those whose path starts with `prefix`.
+
+        Returns
+        -------
+        out : dict
+            ``{path: (calls, seconds)}``
+        """
+        with self._lock:
+            return {k: tuple(v) for k, v in self.timers.items()
+                    if prefix is None or k.startswith(prefix)}
+
+    def report(self):
+        """
+        Minimum, maximum and mean over all MPI ranks of the time and
+        number of calls of every region and of every counter. Needs to
+        be called on all ranks.
+
+        Returns
+        -------
+        out : dict
+            ``{'regions': {path: {'time': stats, 'calls': stats}},
+            'counters': {name: stats}}`` where `stats` is a dict with
+            keys ``'min'``, ``'max'`` and ``'mean'``.
+        """
+        with self._lock:
+            local = {'time': {k: v[1] for k, v in self.timers.items()},
+                     'calls': {k: v[0] for k, v in self.timers.items()},
+                     'counters': dict(self.counters)}
+        if parallel.MPIenabled:
+            ranks = parallel.comm.allgather(local)
+        else:
+            ranks = [local]
+
+        def stats(kind, key):
+            v = np.array([r[kind].get(key, 0) for r in ranks], dtype=np.float64)
+            return {'min': v.min(), 'max': v.max(), 'mean': v.mean()}
+
+        paths = sorted(set().union(*[r['time'].keys() for r in ranks]))
+        names = sorted(set().union(*[r['counters'].keys() for r in ranks]))
+        return {'regions': {p: {'time': stats('time', p), 'calls': stats('calls', p)} for p in paths},
+                'counters': {n: stats('counters', n) for n in names}}
+
+    def trace(self):
+        """
+        Chrome trace of the events of all ranks, one process per rank.
+        Needs to be called on all ranks, the trace is only complete
+        on the master node.
+        """
+        with self._lock:
+            events = list(self.events)
+            counters = dict(self.counters)
+            end = perf_counter() - self.t0
+        local = []
+        for path, tid, start, duration in events:
+            local.append({'name': path.rsplit('/', 1)[-1], 'cat': 'ptypy', 'ph': 'X',
+                          'ts': start * 1e6, 'dur': duration * 1e6,
+                          'pid': parallel.rank, 'tid': tid, 'args': {'path': path}})
+        for name, value in counters.items():
+            local.append({'name': name, 'ph': 'C', 'ts': end * 1e6,
+                          'pid': parallel.rank, 'args': {name: value}})
+
+        if parallel.MPIenabled:
+            gathered = parallel.comm.gather(local, root=0)
+            if not parallel.master:
+                return {'traceEvents': []}
+            local = [e for r in gathered for e in r]
+        return {'traceEvents': local, 'displayTimeUnit': 'ms'}
+
+    def save(self, filename):
+        """
+        Write the Chrome trace of all ranks together with the summary of
+        :py:meth:`report` to the JSON file `filename`. Needs to be called
+        on all ranks, only the master node writes.
+        """
+        out = self.trace()
+        out['otherData'] = self.report()
+        if parallel.master:
+            with open(filename, 'w') as f:
+                json.dump(out, f)
+
+
+profiler = Profiler()
+"""Global profiler used throughout ptypy."""
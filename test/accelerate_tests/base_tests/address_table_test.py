@@ -0,0 +1,99 @@
+'''
+Checks the incrementally built address tables against the addresses of the views.
+'''
+
+import unittest
+import numpy as np
+from ptypy import utils as u
+from ptypy.core import Ptycho
+from ptypy.accelerate.base.engines.projectional_serial import serialize_array_access, AddressTable
+
+
+def view_addresses(diff_storage):
+    # Walk the pods of all views, sorted according to layer in diffraction stack
+    views = sorted(diff_storage.views, key=lambda v: v.dlayer)
+    addr = [[[(v.dlayer, v.dlow[0], v.dlow[1])
+              for v in (pod.pr_view, pod.ob_view, pod.ex_view, pod.di_view, pod.ma_view)]
+             for pod in view.pods.values()] for view in views]
+    return [v.ID for v in views], np.array(addr, dtype=np.int32)
+
+
+class AddressTableTest(unittest.TestCase):
+
+    def get_ptycho(self):
+        p = u.Param()
+        p.verbose_level = "critical"
+        p.io = u.Param()
+        p.io.interaction = u.Param(active=False)
+        p.io.autoplot = u.Param(active=False)
+        p.io.autosave = u.Param(active=False)
+        p.scans = u.Param()
+        p.scans.MF = u.Param()
+        p.scans.MF.name = 'Full'
+        p.scans.MF.propagation = 'farfield'
+        p.scans.MF.coherence = u.Param(num_probe_modes=2)
+        p.scans.MF.data = u.Param()
+        p.scans.MF.data.name = 'MoonFlowerScan'
+        p.scans.MF.data.num_frames = 70
+        p.scans.MF.data.shape = 32
+        p.scans.MF.data.save = None
+        return Ptycho(p, level=1)
+
+    def new_data(self, P, nframes=20):
+        # Load one block of frames, like ModelManager.new_data when streaming
+        if not P.model.scans['MF'].new_data(nframes):
+            return False
+        P.probe.reformat(True)
+        P.obj.reformat(True)
+        P.exit.reformat(True)
+        return True
+
+    def test_incremental_matches_full(self):
+        P = self.get_ptycho()
+        tables = {}
+        ncalls = 0
+        while self.new_data(P):
+            for d in P.diff.storages.values():
+                if d.ID not in tables:
+                    tables[d.ID] = AddressTable(d)
+                view_IDs, poe_IDs, addr = tables[d.ID].serialize()
+                ref_view_IDs, ref_addr = view_addresses(d)
+                self.assertListEqual(view_IDs, ref_view_IDs)
+                self.assertTupleEqual(poe_IDs, serialize_array_access(d)[1])
+                np.testing.assert_array_equal(addr, ref_addr)
+            ncalls += 1
+        self.assertGreater(ncalls, 2)
+
+    def test_rebuild_after_reset(self):
+        P = self.get_ptycho()
+        self.new_data(P)
+        d = list(P.diff.storages.values())[0]
+        table = AddressTable(d)
+        addr = table.serialize()[2]
+        addr[:] = 0
+        np.testing.assert_array_equal(table.serialize()[2], view_addresses(d)[1])
+        table.reset()
+        np.testing.assert_array_equal(table.serialize()[2], view_addresses(d)[1])
+
+    def test_move_object_views(self):
+        P = self.get_ptycho()
+        self.new_data(P, 70)
+        d = list(P.diff.storages.values())[0]
+        table = AddressTable(d)
+        view_IDs, poe_IDs, addr = table.serialize()
+        res = P.obj.S[poe_IDs[1]].psize
+        delta = np.random.randint(-3, 4, size=addr.shape[:2] + (2,)) * res
+        coords = {pod.ob_view.ID: pod.ob_view.coord.copy()
+                  for ID in view_IDs for pod in d.owner.V[ID].pods.values()}
+        table.move_object_views(delta)
+        for i, ID in enumerate(view_IDs):
+            for j, pod in enumerate(d.owner.V[ID].pods.values()):
+                np.testing.assert_allclose(pod.ob_view.coord, coords[pod.ob_view.ID] + delta[i, j])
+        new_addr = table.serialize()[2]
+        np.testing.assert_array_equal(new_addr, view_addresses(d)[1])
+        np.testing.assert_array_equal(new_addr[:, :, 1, 1:] - addr[:, :, 1, 1:],
+                                      np.round(delta / res).astype(int))
+
+
+if __name__ == '__main__':
+    unittest.main()
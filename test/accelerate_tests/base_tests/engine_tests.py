@@ -167,5 +167,17 @@ class MLSerialTest(unittest.TestCase):
                                            scanmodel="BlockFull", autosave=False, verbose_level="critical"))
         self.check_engine_output(out, plotting=False, debug=False)
 
+    def test_ML_serial_all_line_coeffs(self):
+        # the serialized models fall back to the quadratic line coefficients
+        engine_params = u.Param()
+        engine_params.name = "ML_serial"
+        engine_params.numiter = 10
+        engine_params.poly_line_coeffs = "all"
+        P = tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                scanmodel="BlockFull", autosave=False, verbose_level="critical")
+        self.assertEqual(P.engines["engine00"].p.poly_line_coeffs, "quadratic")
+        LL = np.array([P.runtime["iter_info"][i]["error"][1] for i in range(10)])
+        self.assertLess(LL[-1], LL[0])
+
 if __name__ == "__main__":
     unittest.main()
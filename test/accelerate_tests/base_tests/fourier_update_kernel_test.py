@@ -566,5 +566,40 @@ class FourierUpdateKernelTest(unittest.TestCase):
                                               "for the fourier_update_kernel.fourier_error emthods")
 
 
+    def test_fourier_update_fused(self):
+        rng = np.random.default_rng(42)
+        nframes, nmodes, sh = 11, 3, 8
+        aux = (rng.standard_normal((nframes * nmodes, sh, sh)) +
+               1j * rng.standard_normal((nframes * nmodes, sh, sh))).astype(COMPLEX_TYPE)
+        mag = (3 * rng.random((nframes, sh, sh))).astype(FLOAT_TYPE)
+        mask = (rng.random((nframes, sh, sh)) > 0.1).astype(FLOAT_TYPE)
+        mask_sum = mask.sum(-1).sum(-1)
+        addr = np.zeros((nframes, nmodes, 5, 3), dtype=INT_TYPE)
+
+        FUK = FourierUpdateKernel(aux, nmodes=nmodes)
+        FUK.allocate()
+        # several frame blocks, the last one incomplete
+        FUK.block_bytes = 4 * sh * sh * (nmodes * 8 + 16)
+
+        for pbound in [0.0, 0.5, 100.0]:
+            aux1, aux2 = aux.copy(), aux.copy()
+            err1 = np.zeros((nframes,), dtype=FLOAT_TYPE)
+            err2 = np.zeros((nframes,), dtype=FLOAT_TYPE)
+
+            FUK.fourier_error(aux1, addr, mag, mask, mask_sum)
+            FUK.error_reduce(addr, err1)
+            FUK.fmag_all_update(aux1, addr, mag, mask, err1, pbound)
+            fdev, ferr = FUK.npy.fdev.copy(), FUK.npy.ferr.copy()
+
+            FUK.fourier_update_fused(aux2, addr, mag, mask, mask_sum, err2, pbound)
+
+            np.testing.assert_array_equal(err1, err2,
+                                          err_msg="fourier_update_fused gives a different error for pbound=%s" % pbound)
+            np.testing.assert_array_equal(aux1, aux2,
+                                          err_msg="fourier_update_fused gives a different aux for pbound=%s" % pbound)
+            np.testing.assert_array_equal(fdev, FUK.npy.fdev)
+            np.testing.assert_array_equal(ferr, FUK.npy.ferr)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -273,6 +273,60 @@ class GradientDescentKernelTest(unittest.TestCase):
                                       err_msg="LogLikelihood error has not been updated as expected")
         return
 
+    def test_make_a012_model(self):
+        b_f, b_a, b_b, I, w, err_sum, addr = self.prepare_arrays()
+        fic = np.ones((3,), dtype=I.dtype)
+        fic[1] = 2.
+
+        GDK = GradientDescentKernel(b_f, addr.shape[1])
+        GDK.allocate()
+        GDK.make_a012(b_f, b_a, b_b, addr, I, fic)
+        exp = [GDK.npy.Imodel[:3] + I, GDK.npy.LLerr[:3].copy(), GDK.npy.LLden[:3].copy()]
+
+        GDK.make_a012_model(b_f, b_a, b_b, addr, fic)
+        for e, A in zip(exp, [GDK.npy.Imodel, GDK.npy.LLerr, GDK.npy.LLden]):
+            np.testing.assert_array_almost_equal(e, A[:3],
+                                                 err_msg="The model coefficients have not been updated as expected")
+
+    def test_main_poisson(self):
+        b_f, b_a, b_b, I, w, err_sum, addr = self.prepare_arrays()
+        aux = b_f.copy()
+
+        GDK = GradientDescentKernel(b_f, addr.shape[1])
+        GDK.allocate()
+        GDK.make_model(b_f, addr)
+        Imodel = GDK.npy.Imodel[:3] + 1e-6
+        GDK.main_poisson(b_f, addr, w, I)
+
+        DI = w * (1. - I / Imodel)
+        exp_LL = w * (Imodel - I * np.log(Imodel))
+        exp_b_f = (aux[:6].reshape(3, 2, 3, 3) * DI[:, None]).reshape(6, 3, 3)
+        np.testing.assert_allclose(exp_b_f, b_f[:6], rtol=1e-5,
+                                   err_msg="Auxiliary has not been updated as expected")
+        np.testing.assert_allclose(exp_LL, GDK.npy.LLerr[:3], rtol=1e-5,
+                                   err_msg="LogLikelihood error has not been updated as expected")
+
+    def test_fill_b_euclid(self):
+        b_f, b_a, b_b, I, w, err_sum, addr = self.prepare_arrays()
+        A = np.sqrt(I)
+        fic = np.ones((3,), dtype=I.dtype)
+
+        GDK = GradientDescentKernel(b_f, addr.shape[1])
+        GDK.allocate()
+        GDK.make_a012_model(b_f, b_a, b_b, addr, fic)
+        A0 = GDK.npy.Imodel[:3].astype(np.float64) + 1e-12
+        A1 = GDK.npy.LLerr[:3].astype(np.float64)
+        A2 = GDK.npy.LLden[:3].astype(np.float64)
+        B = np.zeros((3,), dtype=np.float64)
+        GDK.fill_b_euclid(addr, 1., w, A, B)
+
+        DA = 1. - A / np.sqrt(A0)
+        exp_B = [(w * (np.sqrt(A0) - A) ** 2).sum(),
+                 (w * A1 * DA).sum(),
+                 (w * A2 * DA).sum() + 0.25 * (w * A1 ** 2 * A / A0 ** 1.5).sum()]
+        np.testing.assert_allclose(exp_B, B, rtol=1e-5,
+                                   err_msg="The line coefficients have not been computed as expected")
+
 
 
 if __name__ == '__main__':
@@ -322,5 +322,61 @@ class PositionCorrectionKernelTest(unittest.TestCase):
                                                                    "is not behaving as expected.")
 
 
+    def test_batched_errors_match_sequential(self):
+        rng = np.random.default_rng(0)
+        nframes, nmodes, nbatch, sh = 4, 2, 3, 5
+        aux = np.zeros((nframes * nmodes, sh, sh), dtype=COMPLEX_TYPE)
+        PCK = PositionCorrectionKernel(aux, nmodes, self.params, self.resolution)
+        PCK.allocate()
+        PCK.allocate_batch(nbatch)
+
+        b_aux = (rng.standard_normal((nbatch * nframes * nmodes, sh, sh)) +
+                 1j * rng.standard_normal((nbatch * nframes * nmodes, sh, sh))).astype(COMPLEX_TYPE)
+        mag = rng.random((nframes, sh, sh)).astype(FLOAT_TYPE)
+        mask = (rng.random((nframes, sh, sh)) > 0.2).astype(FLOAT_TYPE)
+        mask_sum = mask.sum(-1).sum(-1)
+        addr = np.zeros((nframes, nmodes, 5, 3), dtype=INT_TYPE)
+
+        err = PCK.npy.err_batch[:nbatch, :nframes]
+        ref = np.zeros((nframes,), dtype=FLOAT_TYPE)
+        for metric in ['fourier', 'photon', 'ml']:
+            if metric == 'fourier':
+                PCK.fourier_error_batched(b_aux, mag, mask, mask_sum, err)
+            elif metric == 'photon':
+                PCK.log_likelihood_batched(b_aux, mag, mask, err)
+            else:
+                PCK.log_likelihood_ml_batched(b_aux, mag, mask, err)
+            for j in range(nbatch):
+                aux[:] = b_aux[j * nframes * nmodes:(j + 1) * nframes * nmodes]
+                if metric == 'fourier':
+                    PCK.fourier_error(aux, addr, mag, mask, mask_sum)
+                    PCK.error_reduce(addr, ref)
+                elif metric == 'photon':
+                    PCK.log_likelihood(aux, addr, mag, mask, ref)
+                else:
+                    PCK.log_likelihood_ml(aux, addr, mag, mask, ref)
+                np.testing.assert_allclose(err[j], ref, rtol=1e-5,
+                                           err_msg="The batched %s error does not match the sequential one" % metric)
+
+    def test_update_addr_and_error_state_batched(self):
+        nframes, nmodes = 3, 1
+        aux = np.zeros((nframes * nmodes, 2, 2), dtype=COMPLEX_TYPE)
+        PCK = PositionCorrectionKernel(aux, nmodes, self.params, self.resolution)
+
+        addr = np.zeros((nframes, nmodes, 5, 3), dtype=INT_TYPE)
+        mangled_addr = np.repeat(addr[None], 3, axis=0)
+        for j in range(3):
+            mangled_addr[j, :, :, 1, 1] = j + 1
+        error_state = np.array([1.0, 1.0, 0.1], dtype=FLOAT_TYPE)
+        err_sum = np.array([[0.5, 2.0, 0.5],
+                            [0.2, 3.0, 0.6],
+                            [0.2, 4.0, 0.7]], dtype=FLOAT_TYPE)
+
+        PCK.update_addr_and_error_state_batched(addr, error_state, mangled_addr, err_sum)
+        # first occurrence of the smallest error wins, no improvement keeps the old address
+        np.testing.assert_array_equal(addr[:, 0, 1, 1], [2, 0, 0])
+        np.testing.assert_allclose(error_state, [0.2, 1.0, 0.1])
+
+
 if __name__ == '__main__':
     unittest.main()
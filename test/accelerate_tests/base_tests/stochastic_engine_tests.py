@@ -0,0 +1,93 @@
+"""
+Test for the serial stochastic engines.
+
+This file is part of the PTYPY package.
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+import unittest
+
+from test import utils as tu
+from ptypy import utils as u
+import ptypy
+ptypy.load_gpu_engines("serial")
+from ptypy.accelerate.base.engines.stochastic import overlap_graph, draw_groups
+import tempfile
+import shutil
+import numpy as np
+
+class StochasticEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.outpath = tempfile.mkdtemp(suffix="stochastic_engine_test")
+
+    def tearDown(self):
+        shutil.rmtree(self.outpath)
+
+    def test_overlap_groups(self):
+        pos = np.array([[0, 0], [0, 5], [0, 10], [10, 0], [20, 20], [3, 3]])
+        nbrs = overlap_graph(pos, (8, 8))
+        np.testing.assert_array_equal(nbrs[0], [1, 5])
+        np.testing.assert_array_equal(nbrs[2], [1, 5])
+        np.testing.assert_array_equal(nbrs[4], [])
+        # with a margin, patches touch earlier
+        np.testing.assert_array_equal(overlap_graph(pos, (8, 8), margin=2)[0], [1, 2, 3, 5])
+
+        order = np.array([5, 4, 3, 2, 1, 0])
+        groups = draw_groups(order, nbrs, 2)
+        self.assertEqual(sorted(np.concatenate(groups).tolist()), list(range(6)))
+        for g in groups:
+            self.assertLessEqual(len(g), 2)
+            for v in g:
+                self.assertFalse(np.isin(nbrs[v], g).any())
+        # the draw order is kept within the groups
+        np.testing.assert_array_equal(groups[0], [5, 4])
+
+    def _run(self, eng, views_per_batch, scanmodel="BlockFull", **kwargs):
+        engine_params = u.Param()
+        engine_params.name = eng
+        engine_params.numiter = 10
+        engine_params.compute_log_likelihood = True
+        engine_params.views_per_batch = views_per_batch
+        engine_params.update(kwargs)
+        np.random.seed(1)
+        P = tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                scanmodel=scanmodel, autosave=False, verbose_level="critical")
+        numiter = len(P.runtime["iter_info"])
+        return np.array([P.runtime["iter_info"][i]["error"][1] for i in range(numiter)])
+
+    def test_EPIE_batched(self):
+        LL = self._run("EPIE_serial", 1)
+        LL_batched = self._run("EPIE_serial", 8)
+        self.assertTrue(np.isfinite(LL_batched).all())
+        self.assertLess(LL_batched[-1], LL_batched[0])
+        # the groups converge about as fast as the single views
+        self.assertLess(LL_batched[-1], 2 * LL[-1])
+
+    def test_EPIE_batched_shared_exit(self):
+        # all views of a GradFull model share one exit frame
+        LL = self._run("EPIE_serial", 1, scanmodel="BlockGradFull")
+        LL_batched = self._run("EPIE_serial", 8, scanmodel="BlockGradFull")
+        self.assertTrue(np.isfinite(LL_batched).all())
+        self.assertLess(LL_batched[-1], 2 * LL[-1])
+
+    def test_EPIE_batched_position_refinement(self):
+        pos_ref = u.Param(start=2, stop=8, interval=1)
+        LL = self._run("EPIE_serial", 8, position_refinement=pos_ref)
+        self.assertTrue(np.isfinite(LL).all())
+        self.assertLess(LL[-1], LL[0])
+
+    def test_EPIE_global_object_norm(self):
+        LL = self._run("EPIE_serial", 1, object_norm_is_global=True)
+        LL_tol = self._run("EPIE_serial", 1, object_norm_is_global=True, object_norm_tolerance=0.1)
+        self.assertTrue(np.isfinite(LL_tol).all())
+        self.assertLess(LL_tol[-1], LL_tol[0])
+        self.assertLess(LL_tol[-1], 2 * LL[-1])
+
+    def test_SDR_batched(self):
+        LL = self._run("SDR_serial", 4, numiter=5)
+        self.assertTrue(np.isfinite(LL).all())
+        self.assertLess(LL[-1], LL[0])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,283 @@
+"""
+Test for the multi-threaded engines.
+
+This file is part of the PTYPY package.
+    :copyright: Copyright 2014 by the PTYPY team, see AUTHORS.
+    :license: see LICENSE for details.
+"""
+import unittest
+
+from test import utils as tu
+from ptypy import utils as u
+import ptypy
+ptypy.load_gpu_engines("serial")
+import tempfile
+import shutil
+import numpy as np
+
+class ThreadedEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.outpath = tempfile.mkdtemp(suffix="threaded_engine_test")
+
+    def tearDown(self):
+        shutil.rmtree(self.outpath)
+
+    def check_engine_output(self, output):
+        P_serial, P_threaded = output
+        numiter = len(P_serial.runtime["iter_info"])
+        ERR_serial = np.array([P_serial.runtime["iter_info"][i]["error"] for i in range(numiter)])
+        ERR_threaded = np.array([P_threaded.runtime["iter_info"][i]["error"] for i in range(numiter)])
+        crop = 42
+        OBJ_serial = P_serial.obj.S["SMFG00"].data[0,crop:-crop,crop:-crop]
+        OBJ_threaded = P_threaded.obj.S["SMFG00"].data[0,crop:-crop,crop:-crop]
+        PRB_serial = P_serial.probe.S["SMFG00"].data[0]
+        PRB_threaded = P_threaded.probe.S["SMFG00"].data[0]
+        RMSE_ob = (np.mean(np.abs(OBJ_threaded - OBJ_serial)**2))
+        RMSE_pr = (np.mean(np.abs(PRB_threaded - PRB_serial)**2))
+        np.testing.assert_allclose(RMSE_ob, 0.0, atol=1e-2,
+                                    err_msg="The object arrays are not matching as expected")
+        np.testing.assert_allclose(RMSE_pr, 0.0, atol=1e-2,
+                                    err_msg="The probe arrays are not matching as expected")
+        np.testing.assert_allclose(ERR_threaded, ERR_serial, rtol=1e-2, atol=1e-6,
+                                    err_msg="The errors are not matching as expected")
+
+    def test_DM_threaded(self):
+        out = []
+        for eng in ["DM_serial", "DM_threaded"]:
+            engine_params = u.Param()
+            engine_params.name = eng
+            engine_params.numiter = 10
+            if eng == "DM_threaded":
+                engine_params.num_threads = 3
+            # same simulated data for both runs
+            np.random.seed(1)
+            out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                           scanmodel="BlockFull", autosave=False, verbose_level="critical"))
+        self.check_engine_output(out)
+
+    def test_DM_batched(self):
+        out = []
+        for eng, batch in [("DM_serial", None), ("DM_serial", 7), ("DM_threaded", 7)]:
+            engine_params = u.Param()
+            engine_params.name = eng
+            engine_params.numiter = 10
+            engine_params.batch_frames = batch
+            if eng == "DM_threaded":
+                engine_params.num_threads = 3
+            # same simulated data for all runs
+            np.random.seed(1)
+            out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                           scanmodel="BlockFull", autosave=False, verbose_level="critical"))
+        self.check_engine_output(out[:2])
+        self.check_engine_output(out[::2])
+
+    def test_DM_object_halo(self):
+        out = []
+        for eng, dist in [("DM_serial", "cloned"), ("DM_threaded", "halo")]:
+            engine_params = u.Param()
+            engine_params.name = eng
+            engine_params.numiter = 10
+            engine_params.object_distribution = dist
+            if eng == "DM_threaded":
+                engine_params.num_threads = 3
+            # same simulated data for both runs
+            np.random.seed(1)
+            out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                           scanmodel="BlockFull", autosave=False, verbose_level="critical"))
+        self.check_engine_output(out)
+        self.assertEqual(out[1].obj.distribution, "cloned")
+        self.assertTupleEqual(out[1].obj.S["SMFG00"].shape, out[0].obj.S["SMFG00"].shape)
+
+    def test_DM_object_halo_autosave(self):
+        engine_params = u.Param()
+        engine_params.name = "DM_serial"
+        engine_params.numiter = 10
+        engine_params.object_distribution = "halo"
+        with self.assertRaises(RuntimeError):
+            tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                scanmodel="BlockFull", autosave=True, verbose_level="critical")
+
+    def test_frames_per_batch(self):
+        from ptypy.accelerate.base.engines.projectional_serial import _ProjectionEngine_serial
+        fbytes = 2 * 64 * 64 * 8
+        eng = u.Param(p=u.Param(batch_frames=None, max_memory=None))
+        self.assertEqual(_ProjectionEngine_serial._frames_per_batch(eng, 50, 2, (64, 64)), 50)
+        eng.p.max_memory = 7.5 * fbytes
+        self.assertEqual(_ProjectionEngine_serial._frames_per_batch(eng, 50, 2, (64, 64)), 7)
+        eng.p.batch_frames = 5
+        self.assertEqual(_ProjectionEngine_serial._frames_per_batch(eng, 50, 2, (64, 64)), 5)
+        # at least one frame, even if it exceeds the budget
+        eng.p.batch_frames = None
+        eng.p.max_memory = 1.
+        self.assertEqual(_ProjectionEngine_serial._frames_per_batch(eng, 50, 2, (64, 64)), 1)
+
+    def _run_DM_serial(self, **kwargs):
+        engine_params = u.Param()
+        engine_params.name = "DM_serial"
+        engine_params.numiter = 10
+        engine_params.update(kwargs)
+        # same simulated data for all runs
+        np.random.seed(1)
+        P = tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                scanmodel="BlockFull", autosave=False, verbose_level="critical")
+        return P, list(P.engines["engine00"].kernels.values())[0]
+
+    def test_DM_max_memory(self):
+        P, kern = self._run_DM_serial()
+        nmodes = kern.FUK.nmodes
+        fbytes = kern.aux[:nmodes].nbytes
+        P_batched, kern_batched = self._run_DM_serial(max_memory=7.5 * fbytes)
+        self.assertEqual(kern_batched.batch, 7)
+        self.assertEqual(kern_batched.aux.shape[0], 7 * nmodes)
+        self.check_engine_output([P, P_batched])
+
+    def test_DM_batched_position_refinement(self):
+        # the grid search is deterministic, batches see the same shifts
+        pos_ref = u.Param(method="GridSearch", start=2, stop=8, interval=1, nshifts=4,
+                          amplitude=1e-6, max_shift=2e-6)
+        P, kern = self._run_DM_serial(position_refinement=pos_ref)
+        P_batched, kern_batched = self._run_DM_serial(position_refinement=pos_ref.copy(), batch_frames=7)
+        self.assertEqual(kern_batched.batch, 7)
+        self.check_engine_output([P, P_batched])
+        # the refined positions are kept in the address tables
+        prep = list(P.engines["engine00"].diff_info.values())[0]
+        prep_batched = list(P_batched.engines["engine00"].diff_info.values())[0]
+        self.assertTrue((prep.addr != prep.original_addr).any())
+        np.testing.assert_array_equal(prep_batched.addr, prep.addr)
+
+    def test_ML_threaded(self):
+        out = []
+        for eng in ["ML_serial", "ML_threaded"]:
+            engine_params = u.Param()
+            engine_params.name = eng
+            engine_params.numiter = 10
+            engine_params.floating_intensities = True
+            engine_params.reg_del2 = True
+            if eng == "ML_threaded":
+                engine_params.num_threads = 3
+            # same simulated data for both runs
+            np.random.seed(1)
+            out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                           scanmodel="BlockFull", autosave=False, verbose_level="critical"))
+        self.check_engine_output(out)
+
+    def test_ML_batched(self):
+        out = []
+        for eng, batch in [("ML_serial", None), ("ML_serial", 7), ("ML_threaded", 7)]:
+            engine_params = u.Param()
+            engine_params.name = eng
+            engine_params.numiter = 10
+            engine_params.floating_intensities = True
+            engine_params.reg_del2 = True
+            engine_params.batch_frames = batch
+            if eng == "ML_threaded":
+                engine_params.num_threads = 3
+            # same simulated data for all runs
+            np.random.seed(1)
+            out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                           scanmodel="BlockFull", autosave=False, verbose_level="critical"))
+        self.check_engine_output(out[:2])
+        self.check_engine_output(out[::2])
+
+    def test_ML_max_memory(self):
+        engine_params = u.Param()
+        engine_params.name = "ML_serial"
+        engine_params.numiter = 2
+        np.random.seed(1)
+        P = tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                scanmodel="BlockFull", autosave=False, verbose_level="critical")
+        kern = list(P.engines["engine00"].kernels.values())[0]
+        nmodes = kern.GDK.nmodes
+        # aux and both line directions count towards the budget
+        engine_params.max_memory = 3 * 7.5 * kern.aux[:nmodes].nbytes
+        np.random.seed(1)
+        P = tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                scanmodel="BlockFull", autosave=False, verbose_level="critical")
+        kern = list(P.engines["engine00"].kernels.values())[0]
+        self.assertEqual(kern.batch, 7)
+        for buf in [kern.aux, kern.a, kern.b]:
+            self.assertEqual(buf.shape[0], 7 * nmodes)
+
+    def test_ML_batched_position_refinement(self):
+        out = []
+        for batch in [None, 7]:
+            engine_params = u.Param()
+            engine_params.name = "ML_serial"
+            engine_params.numiter = 10
+            engine_params.batch_frames = batch
+            engine_params.position_refinement = u.Param(method="GridSearch", start=2, stop=8, interval=1,
+                                                        nshifts=4, amplitude=1e-6, max_shift=2e-6)
+            # same simulated data for both runs
+            np.random.seed(1)
+            out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                           scanmodel="BlockFull", autosave=False, verbose_level="critical"))
+        self.check_engine_output(out)
+        prep, prep_batched = [list(P.engines["engine00"].diff_info.values())[0] for P in out]
+        self.assertTrue((prep.addr != prep.original_addr).any())
+        np.testing.assert_array_equal(prep_batched.addr, prep.addr)
+
+    def test_ML_cache_forward(self):
+        out = []
+        for eng, cache in [("ML_serial", False), ("ML_serial", True), ("ML_threaded", True)]:
+            engine_params = u.Param()
+            engine_params.name = eng
+            engine_params.numiter = 10
+            engine_params.floating_intensities = True
+            engine_params.cache_forward = cache
+            # spill part of the cache to the scratch file
+            engine_params.cache_ram_limit = 0.5
+            if eng == "ML_threaded":
+                engine_params.num_threads = 3
+            # same simulated data for all runs
+            np.random.seed(1)
+            out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                           scanmodel="BlockFull", autosave=False, verbose_level="critical"))
+        self.check_engine_output(out[:2])
+        self.check_engine_output(out[::2])
+
+    def test_ML_lbfgs_line_search(self):
+        out = []
+        for eng, cache in [("ML", False), ("ML_serial", True), ("ML_threaded", True)]:
+            engine_params = u.Param()
+            engine_params.name = eng
+            engine_params.numiter = 10
+            engine_params.search_direction = "lbfgs"
+            engine_params.line_search_steps = 3
+            engine_params.cache_forward = cache
+            if eng == "ML_threaded":
+                engine_params.num_threads = 3
+            # same simulated data for all runs
+            np.random.seed(1)
+            out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                           scanmodel="BlockFull", autosave=False, verbose_level="critical"))
+        self.check_engine_output(out[:2])
+        self.check_engine_output(out[1:])
+
+    def _ML_noise_model(self, ML_type):
+        out = []
+        for eng in ["ML", "ML_serial", "ML_threaded"]:
+            engine_params = u.Param()
+            engine_params.name = eng
+            engine_params.ML_type = ML_type
+            # single vs. double precision, the runs drift apart after a few iterations
+            engine_params.numiter = 5
+            engine_params.floating_intensities = True
+            engine_params.reg_del2 = True
+            if eng == "ML_threaded":
+                engine_params.num_threads = 3
+            # same simulated data for all runs
+            np.random.seed(1)
+            out.append(tu.EngineTestRunner(engine_params, output_path=self.outpath, init_correct_probe=True,
+                                           scanmodel="BlockFull", autosave=False, verbose_level="critical"))
+        self.check_engine_output(out[:2])
+        self.check_engine_output(out[1:])
+
+    def test_ML_poisson(self):
+        self._ML_noise_model("poisson")
+
+    def test_ML_euclid(self):
+        self._ML_noise_model("euclid")
+
+if __name__ == "__main__":
+    unittest.main()
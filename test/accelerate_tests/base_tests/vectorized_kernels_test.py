@@ -0,0 +1,148 @@
+'''
+Compares the vectorized gather/scatter kernels against the loop versions.
+'''
+
+import unittest
+import numpy as np
+from ptypy.accelerate.base.kernels import AuxiliaryWaveKernel, PoUpdateKernel, \
+    AuxiliaryWaveKernelVectorized, PoUpdateKernelVectorized
+
+COMPLEX_TYPE = np.complex64
+FLOAT_TYPE = np.float32
+INT_TYPE = np.int32
+
+
+class VectorizedKernelsTest(unittest.TestCase):
+
+    def prepare_arrays(self):
+        rng = np.random.default_rng(1234)
+        B, C = 6, 6  # frame size
+        D = 2  # number of probe modes
+        G = 2  # number of object modes
+        H, I = B + 5, C + 5  # object size
+        npos = 9
+        nmodes = D * G
+
+        def crandn(*shape):
+            return (rng.standard_normal(shape) + 1j * rng.standard_normal(shape)).astype(COMPLEX_TYPE)
+
+        probe = crandn(D, B, C)
+        obj = crandn(G, H, I)
+        exit_wave = crandn(npos * nmodes, B, C)
+        aux = crandn(npos * nmodes, B, C)
+
+        addr = np.zeros((npos, nmodes, 5, 3), dtype=INT_TYPE)
+        exit_idx = 0
+        for pos in range(npos):
+            # overlapping positions, some of them identical
+            ypos, xpos = rng.integers(0, H - B + 1), rng.integers(0, I - C + 1)
+            mode_idx = 0
+            for pr_mode in range(D):
+                for ob_mode in range(G):
+                    addr[pos, mode_idx] = np.array([[pr_mode, 0, 0],
+                                                    [ob_mode, ypos, xpos],
+                                                    [exit_idx, 0, 0],
+                                                    [pos, 0, 0],
+                                                    [pos, 0, 0]], dtype=INT_TYPE)
+                    mode_idx += 1
+                    exit_idx += 1
+        return addr, probe, obj, exit_wave, aux
+
+    def test_make_aux_make_exit(self):
+        addr, pr, ob, ex, aux = self.prepare_arrays()
+        AWK, AWKV = AuxiliaryWaveKernel(), AuxiliaryWaveKernelVectorized()
+
+        aux1, aux2 = aux.copy(), aux.copy()
+        AWK.make_aux(aux1, addr, ob, pr, ex, c_po=0.7, c_e=0.3)
+        AWKV.make_aux(aux2, addr, ob, pr, ex, c_po=0.7, c_e=0.3)
+        np.testing.assert_array_equal(aux1, aux2, err_msg="make_aux does not match the loop version")
+
+        ex1, ex2 = ex.copy(), ex.copy()
+        AWK.make_exit(aux1, addr, ob, pr, ex1, c_a=0.9, c_po=0.2, c_e=-1.1)
+        AWKV.make_exit(aux2, addr, ob, pr, ex2, c_a=0.9, c_po=0.2, c_e=-1.1)
+        np.testing.assert_array_equal(aux1, aux2, err_msg="make_exit aux does not match the loop version")
+        np.testing.assert_array_equal(ex1, ex2, err_msg="make_exit exit wave does not match the loop version")
+
+        for add in [False, True]:
+            AWK.build_aux_no_ex(aux1, addr, ob, pr, fac=2.0, add=add)
+            AWKV.build_aux_no_ex(aux2, addr, ob, pr, fac=2.0, add=add)
+            np.testing.assert_array_equal(aux1, aux2, err_msg="build_aux_no_ex does not match the loop version")
+
+    def test_ob_pr_update(self):
+        addr, pr, ob, ex, aux = self.prepare_arrays()
+        POK, POKV = PoUpdateKernel(), PoUpdateKernelVectorized()
+
+        ob1, ob2 = ob.copy(), ob.copy()
+        obn1, obn2 = np.ones(ob.shape, FLOAT_TYPE), np.ones(ob.shape, FLOAT_TYPE)
+        POK.ob_update(addr, ob1, obn1, pr, ex)
+        POKV.ob_update(addr, ob2, obn2, pr, ex)
+        np.testing.assert_array_equal(ob1, ob2, err_msg="ob_update does not match the loop version")
+        np.testing.assert_array_equal(obn1, obn2, err_msg="ob_update norm does not match the loop version")
+
+        pr1, pr2 = pr.copy(), pr.copy()
+        prn1, prn2 = np.ones(pr.shape, FLOAT_TYPE), np.ones(pr.shape, FLOAT_TYPE)
+        POK.pr_update(addr, pr1, prn1, ob, ex)
+        POKV.pr_update(addr, pr2, prn2, ob, ex)
+        np.testing.assert_array_equal(pr1, pr2, err_msg="pr_update does not match the loop version")
+        np.testing.assert_array_equal(prn1, prn2, err_msg="pr_update norm does not match the loop version")
+
+        POK.ob_update_ML(addr, ob1, pr, ex)
+        POKV.ob_update_ML(addr, ob2, pr, ex)
+        np.testing.assert_array_equal(ob1, ob2, err_msg="ob_update_ML does not match the loop version")
+
+        POK.pr_update_ML(addr, pr1, ob, ex)
+        POKV.pr_update_ML(addr, pr2, ob, ex)
+        np.testing.assert_array_equal(pr1, pr2, err_msg="pr_update_ML does not match the loop version")
+
+    def test_local_updates(self):
+        addr, pr, ob, ex, aux = self.prepare_arrays()
+        # the stochastic engines work on a single view at a time
+        addr = addr[:1]
+        addr[:, :, 3:, 0] = 0
+        POK, POKV = PoUpdateKernel(), PoUpdateKernelVectorized()
+
+        prn1, prn2 = np.zeros((1,) + pr.shape[-2:], FLOAT_TYPE), np.zeros((1,) + pr.shape[-2:], FLOAT_TYPE)
+        POK.pr_norm_local(addr, pr, prn1)
+        POKV.pr_norm_local(addr, pr, prn2)
+        np.testing.assert_array_equal(prn1, prn2, err_msg="pr_norm_local does not match the loop version")
+
+        obn1, obn2 = np.zeros_like(prn1), np.zeros_like(prn2)
+        POK.ob_norm_local(addr, ob, obn1)
+        POKV.ob_norm_local(addr, ob, obn2)
+        np.testing.assert_array_equal(obn1, obn2, err_msg="ob_norm_local does not match the loop version")
+
+        ob1, ob2 = ob.copy(), ob.copy()
+        POK.ob_update_local(addr, ob1, pr, ex, aux, prn1, a=0.1, b=0.9)
+        POKV.ob_update_local(addr, ob2, pr, ex, aux, prn2, a=0.1, b=0.9)
+        np.testing.assert_array_equal(ob1, ob2, err_msg="ob_update_local does not match the loop version")
+
+        pr1, pr2 = pr.copy(), pr.copy()
+        POK.pr_update_local(addr, pr1, ob, ex, aux, obn1, obn1.max(), a=0.1, b=0.9)
+        POKV.pr_update_local(addr, pr2, ob, ex, aux, obn2, obn2.max(), a=0.1, b=0.9)
+        np.testing.assert_array_equal(pr1, pr2, err_msg="pr_update_local does not match the loop version")
+
+    def test_wasp_updates(self):
+        addr, pr, ob, ex, aux = self.prepare_arrays()
+        POK, POKV = PoUpdateKernel(), PoUpdateKernelVectorized()
+
+        ob1, ob2 = ob.copy(), ob.copy()
+        nmr1, nmr2 = np.zeros_like(ob), np.zeros_like(ob)
+        dnm1, dnm2 = np.zeros(ob.shape, FLOAT_TYPE), np.zeros(ob.shape, FLOAT_TYPE)
+        POK.ob_update_wasp(addr, ob1, pr, ex, aux, nmr1, dnm1, alpha=0.5)
+        POKV.ob_update_wasp(addr, ob2, pr, ex, aux, nmr2, dnm2, alpha=0.5)
+        np.testing.assert_array_equal(ob1, ob2, err_msg="ob_update_wasp does not match the loop version")
+        np.testing.assert_array_equal(nmr1, nmr2, err_msg="ob_update_wasp numerator does not match the loop version")
+        np.testing.assert_array_equal(dnm1, dnm2, err_msg="ob_update_wasp denominator does not match the loop version")
+
+        pr1, pr2 = pr.copy(), pr.copy()
+        nmr1, nmr2 = np.zeros_like(pr), np.zeros_like(pr)
+        dnm1, dnm2 = np.zeros(pr.shape, FLOAT_TYPE), np.zeros(pr.shape, FLOAT_TYPE)
+        POK.pr_update_wasp(addr, pr1, ob, ex, aux, nmr1, dnm1, beta=0.5)
+        POKV.pr_update_wasp(addr, pr2, ob, ex, aux, nmr2, dnm2, beta=0.5)
+        np.testing.assert_array_equal(pr1, pr2, err_msg="pr_update_wasp does not match the loop version")
+        np.testing.assert_array_equal(nmr1, nmr2, err_msg="pr_update_wasp numerator does not match the loop version")
+        np.testing.assert_array_equal(dnm1, dnm2, err_msg="pr_update_wasp denominator does not match the loop version")
+
+
+if __name__ == '__main__':
+    unittest.main()
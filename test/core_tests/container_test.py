@@ -4,6 +4,7 @@ A test for the Container class
 
 import unittest
 from ptypy.core import Container, Storage, View, Base
+from ptypy import utils as u
 import numpy as np
 
 class ContainerTest(unittest.TestCase):
@@ -48,5 +49,72 @@ class ContainerTest(unittest.TestCase):
         assert np.all(
             C5.storages['S0'].data == 2)
 
+    def test_container_new_views(self):
+        # bulk creation must match creating the views one by one
+        coords = np.random.rand(20, 2) * 30.
+        active = np.random.rand(20) > 0.3
+        layers = np.arange(20) * 2
+
+        C1 = Container(data_type=float)
+        V1 = [View(container=C1, shape=(10, 12), coord=c, psize=1., storageID='S0', layer=l, active=a)
+              for c, l, a in zip(coords, layers, active)]
+        C2 = Container(data_type=float)
+        V2 = C2.new_views(coords, layers, storageID='S0', shape=(10, 12), psize=1., active=active)
+        C1.reformat()
+        C2.reformat()
+
+        assert len(V2) == 20
+        assert list(C2.views.values()) == V2
+        assert C1.storages['S0'].shape == C2.storages['S0'].shape
+        for v1, v2 in zip(V1, V2):
+            assert v1.ID == v2.ID
+            assert v2.storage is C2.storages['S0']
+            assert v1.active == v2.active
+            assert v1.layer == v2.layer
+            assert np.allclose(v1.coord, v2.coord)
+            if v1.active:
+                assert v1.dlayer == v2.dlayer
+                assert np.all(v1.dlow == v2.dlow)
+                assert np.all(v1.dhigh == v2.dhigh)
+                assert np.allclose(v1.sp, v2.sp)
+                C1[v1] = v1.layer
+                C2[v2] = v2.layer
+        assert np.allclose(C1.storages['S0'].data, C2.storages['S0'].data)
+
+
+    def test_container_view_records(self):
+        # records stay in sync with the views when the registry grows
+        C = Container(data_type=float)
+        V = [View(container=C, shape=4, coord=(i, 0), psize=1., storageID='S0', layer=i) for i in range(40)]
+        V += [V[-1].copy() for i in range(10)]
+        C.reformat()
+        recs = C.view_records
+        for v in V:
+            assert recs[v.numID]['ID'] == v.ID.encode()
+            assert recs[v.numID]['layer'] == v.layer
+            assert np.all(recs[v.numID]['dlow'][:2] == v.dlow)
+
+        # vectorized changes are seen by the views
+        rows = [v.numID for v in V[:10]]
+        dlow = [v.dlow.copy() for v in V[:10]]
+        recs['coord'][rows, 1] += 2.
+        C.storages['S0'].update_views()
+        for v, d in zip(V[:10], dlow):
+            assert v.coord[1] == 2.
+            assert np.all(v.dlow == d + [0, 2])
+
+
+    def test_container_allreduce_async(self):
+        C = Container(data_type=float)
+        V = [View(container=C, shape=4, coord=(i, 0), psize=1., storageID='S%d' % (i % 2)) for i in range(4)]
+        C.reformat()
+        C.fill(1.)
+        requests = C.allreduce_async()
+        self.assertEqual(len(requests), 2)
+        u.parallel.waitall(requests)
+        for s in C.storages.values():
+            np.testing.assert_array_equal(s.data, u.parallel.size)
+
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -104,7 +104,42 @@ class GeometryTest(unittest.TestCase):
         G = self.set_up_farfield()
         P = BasicFarfieldPropagator(G.p,ffttype="scipy")
         self. _basic_propagator_test(P)
-    
+
+    def _inplace_propagator_test(self, prop):
+
+        # Create random single precision stack
+        S = (4, 256, 256)
+        A = (np.random.random(S) + 1j * np.random.random(S)).astype(np.complex64)
+
+        B = prop.fw(A)
+        C = A.copy()
+        D = prop.fw(C, out=C)
+
+        # asserts
+        assert (B.dtype == np.complex64), "fw(x) has changed the precision of x"
+        assert (D is C), "fw(x, out=x) did not return x"
+        np.testing.assert_allclose(B, C, rtol=1e-6, err_msg="fw(x, out=x) did not return the same as fw(x)")
+        prop.bw(C, out=C)
+        np.testing.assert_allclose(A, C, rtol=1e-4, atol=1e-5, err_msg="bw(fw(x)) did not return the same as x")
+
+    def test_farfield_propagator_inplace(self):
+        G = self.set_up_farfield()
+        P = BasicFarfieldPropagator(G.p, ffttype="scipy", dtype=np.complex64)
+        self._inplace_propagator_test(P)
+
+    def test_nearfield_propagator_inplace(self):
+        G = self.set_up_nearfield()
+        P = BasicNearfieldPropagator(G.p, ffttype="scipy", dtype=np.complex64)
+        self._inplace_propagator_test(P)
+
+    def test_propagator_fft_workers(self):
+        G = self.set_up_farfield()
+        self.assertIsNone(G.propagator.FFTch.workers)
+        G.p.fft_workers = 2
+        P = geometry.get_propagator(G.p, dtype=np.complex64)
+        self.assertEqual(P.FFTch.workers, 2)
+        self._inplace_propagator_test(P)
+
 
 
 if __name__ == '__main__':
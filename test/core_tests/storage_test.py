@@ -52,6 +52,31 @@ class StorageTest(unittest.TestCase):
         S.reformat()
         assert np.allclose(S[V], 1.)
 
+    def test_storage_layer_index(self):
+        """
+        Test layer lookup in storages with a sparse layermap
+        """
+        C = Container(data_dims=2)
+        S = C.new_storage(psize=1., shape=8)
+        layers = [7, 3, 12]
+        views = [View(container=C, storageID=S.ID, coord=(0., 0.), shape=(8, 8), layer=l)
+                 for l in layers]
+        S.reformat()
+        assert S.layermap == sorted(layers)
+        for V in views:
+            assert S.layer_index(V.layer) == S.layermap.index(V.layer)
+            assert V.dlayer == S.layer_index(V.layer)
+        S[12] = 5.
+        assert np.allclose(S[views[2]], 5.)
+        self.assertRaises(ValueError, S.layer_index, 4)
+
+        # index follows changes of the layermap
+        S.layermap.append(20)
+        assert S.layer_index(20) == 3
+        S.layermap = [1, 2]
+        assert S.layer_index(2) == 1
+        assert '_layer_index' not in S._to_dict()
+
 
 if __name__ == '__main__':
     unittest.main()
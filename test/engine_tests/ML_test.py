@@ -7,8 +7,10 @@ This file is part of the PTYPY package.
 """
 
 import unittest
+import numpy as np
 from test import utils as tu
 from ptypy import utils as u
+from ptypy.engines.ML import LBFGS, ML
 import tempfile
 import shutil
 
@@ -64,5 +66,76 @@ class MLTest(unittest.TestCase):
 
         tu.EngineTestRunner(engine_params, propagator='nearfield', output_path=self.outpath)
 
+    def test_ML_farfield_lbfgs_line_search(self):
+        engine_params = u.Param()
+        engine_params.name = 'ML'
+        engine_params.numiter = 5
+        engine_params.floating_intensities = False
+        engine_params.reg_del2 = True
+        engine_params.reg_del2_amplitude = 0.01
+        engine_params.probe_update_start = 0
+        engine_params.search_direction = 'lbfgs'
+        engine_params.line_search_steps = 3
+        engine_params.cache_forward = True
+        tu.EngineTestRunner(engine_params, output_path=self.outpath)
+
+
+class LBFGSTest(unittest.TestCase):
+
+    def test_quadratic(self):
+        # L-BFGS with exact line search minimizes a quadratic in n steps
+        n = 6
+        rng = np.random.default_rng(0)
+        M = rng.standard_normal((n, n))
+        A = M @ M.T + n * np.eye(n)
+        b = rng.standard_normal(n)
+        x = np.zeros(n)
+        lbfgs = LBFGS(memory=n)
+        step = None
+        for it in range(n):
+            g = A @ x - b
+            d = lbfgs.direction([g], step)[0]
+            self.assertLess(np.dot(d, g), 0)
+            t = -np.dot(d, g) / np.dot(d, A @ d)
+            step = [t * d]
+            x = x + step[0]
+        np.testing.assert_allclose(x, np.linalg.solve(A, b), rtol=1e-6)
+
+    def test_precond(self):
+        lbfgs = LBFGS(memory=3)
+        g = [np.ones(4, dtype=np.complex64), np.ones(2, dtype=np.complex64)]
+        d = lbfgs.direction(g, None, [1., 2.])
+        np.testing.assert_array_equal(d[0], -g[0])
+        np.testing.assert_array_equal(d[1], -2 * g[1])
+
+class LineSearchTest(unittest.TestCase):
+
+    def test_backtracking(self):
+        # Newton steps on f(x) = sqrt(1 + x^2) - 1 overshoot far from the minimum
+        f = lambda x: np.sqrt(1 + x**2) - 1
+        eng = ML.__new__(ML)
+        eng.ptycho = u.Param(FType=np.float64)
+        eng.p = u.Param(line_search_steps=4, line_search_tol=1e-3)
+        eng.fw_cache = None
+        eng.ob_h = np.ones(1)
+        eng.pr_h = np.ones(1)
+        x = [2 ** (1 / 3.)]
+        visited = []
+
+        def line_coeffs():
+            visited.append(x[0])
+            return np.array([f(x[0]), x[0] / np.sqrt(1 + x[0]**2), 0.5 * (1 + x[0]**2)**-1.5])
+
+        def line_step(t):
+            x[0] += t
+
+        eng._line_coeffs = line_coeffs
+        eng._line_step = line_step
+        tmin = eng._line_search()
+        # -2 is accepted, 8 and 3 are rejected, backtracking towards -2 reaches 0.5
+        np.testing.assert_allclose(visited, [2 ** (1 / 3.), -2, 8, 3, 0.5])
+        np.testing.assert_allclose(x[0], 0.5)
+        np.testing.assert_allclose(tmin, 0.5 - 2 ** (1 / 3.))
+
 if __name__ == "__main__":
     unittest.main()
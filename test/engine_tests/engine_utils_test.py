@@ -84,5 +84,61 @@ class FourierUpdateTest(unittest.TestCase):
             #                              "Exit wave data diverges after fourier update")
         np.testing.assert_array_equal(error_LEGACY, error, "Error metrics diverge")
 
+
+class ForwardCacheTest(unittest.TestCase):
+    def test_put_get(self):
+        cache = eu.ForwardCache(ram_limit=1000)
+        a = np.arange(100, dtype=np.complex64).reshape(10, 10)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', a)
+        np.testing.assert_array_equal(cache.get('a'), a)
+        self.assertEqual(cache.ram, a.nbytes)
+
+        # buffers are reused once invalidated
+        buf = cache.get('a')
+        cache.invalidate()
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', 2 * a)
+        self.assertIs(cache.get('a'), buf)
+        np.testing.assert_array_equal(buf, 2 * a)
+        cache.close()
+
+    def test_spill(self):
+        cache = eu.ForwardCache(ram_limit=1000)
+        arrays = [np.full((10, 10), i, dtype=np.complex64) for i in range(3)]
+        for i, a in enumerate(arrays):
+            cache.put(i, a)
+        self.assertNotIsInstance(cache.get(0), np.memmap)
+        self.assertIsInstance(cache.get(1), np.memmap)
+        self.assertEqual(cache.spilled, 2 * arrays[0].nbytes)
+        for i, a in enumerate(arrays):
+            np.testing.assert_array_equal(cache.get(i), a)
+        cache.close()
+        self.assertIsNone(cache.get(0))
+
+class PatchMaxTest(unittest.TestCase):
+    def _random_updates(self, tolerance):
+        rng = np.random.default_rng(1)
+        ob = rng.random((2, 64, 64)) + 1j * rng.random((2, 64, 64))
+        power = lambda sl: u.abs2(ob[(slice(None),) + sl]).sum(axis=0)
+        pm = eu.PatchMax(power, tolerance)
+        for i in range(200):
+            corners = rng.integers(0, 48, size=(2, 2))
+            for y, x in corners:
+                ob[:, y:y + 16, x:x + 16] *= rng.uniform(0.5, 1.5)
+            exact = power((slice(None), slice(None))).max()
+            value = pm.update(corners, (16, 16))
+            self.assertGreaterEqual(value, exact * (1 - 1e-12))
+            self.assertLessEqual((1 - tolerance) * value, exact * (1 + 1e-12))
+        return pm
+
+    def test_exact(self):
+        self._random_updates(0.)
+
+    def test_tolerance(self):
+        exact = self._random_updates(0.)
+        relaxed = self._random_updates(0.2)
+        self.assertLess(relaxed.refreshes, exact.refreshes)
+
 if __name__ == "__main__":
     unittest.main()
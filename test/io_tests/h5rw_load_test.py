@@ -95,6 +95,29 @@ class H5rwLoadTest(unittest.TestCase):
         np.testing.assert_array_equal(content["array data"], out["array data"],
                                 err_msg="Can't read back in an array that we saved.")
 
+    def test_load_ndarray_lazy(self):
+        data = np.arange(100000, dtype=np.float64).reshape(100, 1000)
+        small = np.ones((3, 3))
+        content = {'array data': data, 'small': small}
+        io.h5write(self.filepath % "load_lazy_test", content=content)
+        out = io.h5read(self.filepath % "load_lazy_test", "content", lazy=True)["content"]
+        self.assertIsInstance(out["array data"], io.LazyDataset)
+        self.assertIsInstance(out["small"], np.ndarray)
+        self.assertEqual(out["array data"].shape, data.shape)
+        # compressed dataset, read through h5py
+        self.assertIsNone(out["array data"].memmap())
+        np.testing.assert_array_equal(out["array data"][2:4], data[2:4])
+        np.testing.assert_array_equal(out["array data"].load(), data)
+
+    def test_load_ndarray_lazy_memmap(self):
+        data = np.arange(100000, dtype=np.complex64).reshape(10, 100, 100)
+        with h5.File(self.filepath % "load_lazy_memmap_test", 'w') as f:
+            f.create_dataset('array data', data=data)
+        out = io.h5read(self.filepath % "load_lazy_memmap_test", lazy=True)
+        self.assertIsNotNone(out["array data"].memmap())
+        np.testing.assert_array_equal(out["array data"][3], data[3])
+        np.testing.assert_array_equal(np.asarray(out["array data"]), data)
+
     def test_load_numpy_record_array(self):
         data = np.recarray((8,), dtype=[('ID','<U16')])
         content = {'record array data': data}
@@ -158,6 +158,14 @@ class H5rwStoreTest(unittest.TestCase):
         except:
             self.fail(msg="This should not have produced an exception!")
 
+    def test_ignore_unsupported_per_call(self):
+        data = owntype()
+        content = {'Owntype data': data}
+        io.h5write(self.filepath % "store_dummytype_test", content=content, unsupported='ignore')
+        self.assertEqual(io.h5options['UNSUPPORTED'], 'fail')
+        out = io.h5read(self.filepath % "store_dummytype_test", 'content')['content']
+        self.assertNotIn('Owntype data', out)
+
     def test_pickle_unsupported(self):
         io.h5options['UNSUPPORTED'] = 'pickle'
 
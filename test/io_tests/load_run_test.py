@@ -105,4 +105,92 @@ class LoadRunTest(unittest.TestCase):
         for name, st in b.obj.storages.items():
             np.testing.assert_equal(st.data, P.obj.storages[name].data)
 
+    def test_load_run_lazy(self):
+        np.random.seed(1)
+        outpath = tempfile.mkdtemp(prefix='something')
+
+        file_path = outpath + os.sep + 'reconstruction.ptyr'
+        p = u.Param()
+        p.verbose_level = 0
+        p.io = u.Param()
+        p.io.home = outpath
+        p.io.rfile = file_path
+        p.io.autosave = u.Param(active=False)
+        p.io.autoplot = u.Param(active=False)
+        p.ipython_kernel = False
+        p.scans = u.Param()
+        p.scans.MF = u.Param()
+        p.scans.MF.name = 'Full'
+        p.scans.MF.propagation = "farfield"
+        p.scans.MF.data = u.Param()
+        p.scans.MF.data.name = 'MoonFlowerScan'
+        p.scans.MF.data.num_frames = 50
+        p.scans.MF.data.shape = 64
+        p.scans.MF.data.save = None
+        p.engines = u.Param()
+        p.engines.engine00 = u.Param()
+        p.engines.engine00.name = 'DM'
+        p.engines.engine00.numiter = 2
+
+        P = Ptycho(p, level=5)
+        P.finalize()
+
+        b = Ptycho.load_run(file_path, load_data=False)
+        np.testing.assert_equal(b.runtime.iter_info[-1]['iteration'], P.runtime.iter_info[-1]['iteration'])
+        for name, st in b.obj.storages.items():
+            self.assertFalse(st.is_loaded)
+            np.testing.assert_equal(st.data, P.obj.storages[name].data)
+            self.assertTrue(st.is_loaded)
+        for name, st in b.probe.storages.items():
+            np.testing.assert_equal(st.data, P.probe.storages[name].data)
+
+    def test_async_autosave(self):
+        np.random.seed(1)
+        outpath = tempfile.mkdtemp(prefix='something')
+
+        file_path = outpath + os.sep + 'reconstruction.ptyr'
+        p = u.Param()
+        p.verbose_level = 0
+        p.io = u.Param()
+        p.io.home = outpath
+        p.io.rfile = file_path
+        p.io.autosave = u.Param(active=True, interval=2, asynchronous=True)
+        p.io.autoplot = u.Param(active=False)
+        p.ipython_kernel = False
+        p.scans = u.Param()
+        p.scans.MF = u.Param()
+        p.scans.MF.name = 'Full'
+        p.scans.MF.propagation = "farfield"
+        p.scans.MF.data = u.Param()
+        p.scans.MF.data.name = 'MoonFlowerScan'
+        p.scans.MF.data.num_frames = 50
+        p.scans.MF.data.shape = 32
+        p.scans.MF.data.save = None
+        p.engines = u.Param()
+        p.engines.engine00 = u.Param()
+        p.engines.engine00.name = 'DM'
+        p.engines.engine00.numiter = 5
+
+        P = Ptycho(p, level=5)
+        P.finalize()
+
+        # All auto-saves are written, the final save is the latest state
+        dumps = sorted(os.listdir(os.path.join(outpath, 'dumps', P.runtime.run)))
+        self.assertEqual(len(dumps), 3)
+        b = Ptycho.load_run(file_path)
+        for name, st in b.obj.storages.items():
+            np.testing.assert_equal(st.data, P.obj.storages[name].data)
+
+    def test_async_autosave_error(self):
+        from ptypy.core.ptycho import BackgroundSaver
+        outpath = tempfile.mkdtemp(prefix='something')
+        # a file in place of the directory makes the write fail
+        blocker = os.path.join(outpath, 'blocker')
+        open(blocker, 'w').close()
+        saver = BackgroundSaver()
+        saver.put(os.path.join(blocker, 'dump.ptyr'), {}, {})
+        self.assertRaises(OSError, saver.flush)
+        saver.put(os.path.join(blocker, 'dump.ptyr'), {}, {})
+        self.assertRaises(OSError, saver.stop)
+        self.assertFalse(saver.thread.is_alive())
 
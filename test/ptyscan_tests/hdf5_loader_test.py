@@ -6,7 +6,7 @@ import shutil
 import numpy as np
 import ptypy
 from test.utils import PtyscanTestRunner
-from ptypy.experiment.hdf5_loader import Hdf5Loader
+from ptypy.experiment.hdf5_loader import Hdf5Loader, Hdf5LoaderFast
 from ptypy import utils as u
 
 
@@ -1598,6 +1598,105 @@ class Hdf5LoaderTestNoSWMR(unittest.TestCase):
         data_params.positions.fast_key = self.positions_fast_key
         output = PtyscanTestRunner(Hdf5Loader, data_params, auto_frames=k, cleanup=False)
 
+    def _compare_fast_loader(self, data_params, blocks):
+        ref = Hdf5Loader(data_params)
+        fast = Hdf5LoaderFast(data_params)
+        try:
+            loaded = [(indices, ref.load(indices), fast.load(indices)) for indices in blocks]
+            # frames handed out earlier are not overwritten by later prefetches
+            for indices, (intensities, positions, weights), (fast_intensities, fast_positions, fast_weights) in loaded:
+                for ii in indices:
+                    np.testing.assert_array_equal(fast_intensities[ii], intensities[ii])
+                    np.testing.assert_array_equal(fast_weights[ii], weights[ii])
+                    np.testing.assert_array_equal(fast_positions[ii], positions[ii])
+        finally:
+            fast._finalize()
+            ref._finalize()
+
+    def test_fast_loader_chunked_case_1(self):
+        '''
+        Hdf5LoaderFast reads chunked data with mask and darkfield like Hdf5Loader
+        '''
+        k = 40
+        frame_size_m = 20
+        frame_size_n = 20
+
+        positions_slow = np.arange(k)
+        positions_fast = np.arange(k)
+        with h5.File(self.positions_file, 'w') as f:
+            f[self.positions_slow_key] = positions_slow
+            f[self.positions_fast_key] = positions_fast
+
+        data = np.arange(k*frame_size_m*frame_size_n, dtype=float).reshape(k, frame_size_m, frame_size_n)
+        with h5.File(self.intensity_file, 'w') as f:
+            f.create_dataset(self.intensity_key, data=data, chunks=(7, frame_size_m, frame_size_n))
+
+        mask = np.ones(data.shape, dtype=int)
+        mask[:, ::3] = 0
+        with h5.File(self.mask_file, 'w') as f:
+            f[self.mask_key] = mask
+
+        dark = np.full(data.shape[-2:], 100.)
+        with h5.File(self.dark_file, 'w') as f:
+            f[self.dark_key] = dark
+
+        data_params = u.Param()
+        data_params.auto_center = False
+        data_params.intensities = u.Param()
+        data_params.intensities.file = self.intensity_file
+        data_params.intensities.key = self.intensity_key
+
+        data_params.mask = u.Param()
+        data_params.mask.file = self.mask_file
+        data_params.mask.key = self.mask_key
+
+        data_params.darkfield = u.Param()
+        data_params.darkfield.file = self.dark_file
+        data_params.darkfield.key = self.dark_key
+
+        data_params.positions = u.Param()
+        data_params.positions.file = self.positions_file
+        data_params.positions.slow_key = self.positions_slow_key
+        data_params.positions.fast_key = self.positions_fast_key
+
+        # consecutive blocks are prefetched, the last one is out of order
+        blocks = [list(range(0, 15)), list(range(15, 30)), list(range(30, 40)), [3, 4, 20, 21, 22]]
+        self._compare_fast_loader(data_params, blocks)
+
+    def test_fast_loader_mapped_raster_case_1(self):
+        '''
+        Hdf5LoaderFast reads runs of frames from data.shape (A, B, frame_size_m, frame_size_n)
+        '''
+        A = 6
+        B = 5
+        frame_size_m = 10
+        frame_size_n = 10
+
+        positions_slow = np.arange(A)
+        positions_fast = np.arange(B)
+        fast, slow = np.meshgrid(positions_fast, positions_slow)
+        with h5.File(self.positions_file, 'w') as f:
+            f[self.positions_slow_key] = slow
+            f[self.positions_fast_key] = fast
+
+        data = np.arange(A*B*frame_size_m*frame_size_n, dtype=float).reshape(A, B, frame_size_m, frame_size_n)
+        with h5.File(self.intensity_file, 'w') as f:
+            f[self.intensity_key] = data
+
+        data_params = u.Param()
+        data_params.auto_center = False
+        data_params.intensities = u.Param()
+        data_params.intensities.file = self.intensity_file
+        data_params.intensities.key = self.intensity_key
+
+        data_params.positions = u.Param()
+        data_params.positions.file = self.positions_file
+        data_params.positions.slow_key = self.positions_slow_key
+        data_params.positions.fast_key = self.positions_fast_key
+
+        blocks = [list(range(0, 12)), list(range(12, 24)), list(range(24, 30))]
+        self._compare_fast_loader(data_params, blocks)
+
 
 
 class Hdf5LoaderTestWithSWMR(unittest.TestCase):
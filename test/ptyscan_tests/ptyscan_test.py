@@ -5,8 +5,9 @@ test Scan `ptypy.core.data.MoonFlowerScan`
 
 from ptypy import utils as u
 from ptypy import io
-from ptypy.core.data import MoonFlowerScan
+from ptypy.core.data import MoonFlowerScan, FrameStack
 from .. import utils as tu
+import numpy as np
 import unittest
 global DATA
 DATA = u.Param(
@@ -50,6 +51,81 @@ class PtyscanTest(unittest.TestCase):
         self.assertEqual(out['msgs'][2], EOS,
             "Last auto call not identified as End of Scan (data.EOS)")
 
+    def test_moonflower_cropped_chunk_is_stacked(self):
+        '''
+        preprocessed frames stay one array, the iterable holds views into it
+        '''
+        pars = DATA.copy()
+        pars.orientation = 2
+        out = tu.PtyscanTestRunner(MoonFlowerScan, data_params=pars, auto_frames=50)
+        msg = out['msgs'][0]
+        chunk = msg['chunk']
+        self.assertTrue(chunk.data.is_stacked)
+        self.assertEqual(chunk.data.stack().shape, (50, 128, 128))
+        for frame in msg['iterable']:
+            self.assertIs(frame['data'].base, chunk.data.frames)
+            np.testing.assert_array_equal(frame['mask'], chunk.weights[frame['index']] > 0)
+
+    def test_preprocess_stages(self):
+        '''
+        registered stages are applied to blocks of frames, also on several threads
+        '''
+        raw = {}
+
+        def double(indices, frames, weights):
+            raw.update(zip(indices, frames.copy()))
+            return 2 * frames, weights
+
+        pars = DATA.copy()
+        pars.orientation = 2
+        pars.rebin = 2
+        pars.preprocess = u.Param(num_threads=3, block=16, dtype='float32')
+        MF = MoonFlowerScan(pars)
+        MF.add_preprocess_stage(double)
+        MF.initialize()
+        chunk = MF.auto(50)['chunk']
+        self.assertEqual(MF.preprocess_stages[0][0], 'double')
+        self.assertEqual(sorted(raw.keys()), chunk.data.indices)
+        self.assertEqual(chunk.data.frames.dtype, np.float32)
+        self.assertEqual(chunk.data.frames.shape, (50, 64, 64))
+        expected = u.rebin_2d(2 * np.array([raw[k] for k in chunk.data.indices])[:, ::-1, :], 2)
+        np.testing.assert_allclose(chunk.data.frames, expected, rtol=1e-6)
+        # the common weight is processed only once
+        self.assertEqual(chunk.weights.frames.strides[0], 0)
+        self.assertEqual(chunk.weights.frames.shape, (50, 64, 64))
+        np.testing.assert_array_equal(MF.meta.center, [31.5, 32])
+
+    def test_prefetch(self):
+        '''
+        the next chunk is prepared in the background
+        '''
+        pars = DATA.copy()
+        pars.preprocess = u.Param(prefetch=True)
+        # the other preprocessing parameters keep their defaults
+        self.assertEqual(MoonFlowerScan(pars).info.preprocess.num_threads, 1)
+        out = tu.PtyscanTestRunner(MoonFlowerScan, data_params=pars, auto_frames=30, ncalls=3)
+        self.assertEqual(len(out['msgs'][0]['iterable']), 30)
+        self.assertEqual(len(out['msgs'][1]['iterable']), 20)
+        self.assertEqual(out['msgs'][1]['chunk'].indices[0], 30)
+        from ptypy.core.data import EOS
+        self.assertEqual(out['msgs'][2], EOS)
+
+    def test_framestack(self):
+        stack = np.arange(24.).reshape(4, 2, 3)
+        fs = FrameStack.from_dict({5: stack[1], 6: stack[2], 7: stack[3]}, [7, 6])
+        self.assertEqual(fs.keys(), [7, 6, 5])
+        self.assertFalse(fs.is_stacked)
+        fs = FrameStack.from_dict({5: stack[1], 6: stack[2], 7: stack[3]})
+        self.assertTrue(fs.is_stacked)
+        self.assertTrue(np.shares_memory(fs.frames, stack))
+        np.testing.assert_array_equal(fs[6], stack[2])
+        self.assertIsNone(fs.get(8))
+        self.assertIn(7, fs)
+        self.assertEqual(dict(fs).keys(), {5, 6, 7})
+        sub = fs.subset([7, 8, 5])
+        self.assertEqual(sub.keys(), [7, 5])
+        np.testing.assert_array_equal(sub.stack(), stack[[3, 1]])
+
     def test_appended_ptyd(self):
         '''
         technically all of these tests do this, but this is explicit
@@ -0,0 +1,66 @@
+import unittest
+import numpy as np
+from ptypy.utils import parallel
+
+
+class ParallelTest(unittest.TestCase):
+
+    def test_tile_overlaps(self):
+        tiles = [((0, 0), (10, 10)),
+                 ((5, 8), (10, 10)),
+                 ((10, 0), (4, 4)),
+                 ((-3, -3), (3, 3))]
+        out = parallel.tile_overlaps(tiles, 0)
+        self.assertEqual(out, [(1, (slice(5, 10), slice(8, 10)))])
+        out = parallel.tile_overlaps(tiles, 1)
+        self.assertEqual(out, [(0, (slice(0, 5), slice(0, 2)))])
+        out = parallel.tile_overlaps(tiles, 2)
+        self.assertEqual(out, [])
+        self.assertEqual(parallel.tile_overlaps(tiles, 3), [])
+
+    def test_halo_exchange_single(self):
+        halo = parallel.HaloExchange((3, -2), (6, 5), 2)
+        self.assertEqual(halo.neighbours, [])
+        np.testing.assert_array_equal(halo.cover, np.ones((6, 5)))
+        a = np.random.rand(2, 6, 5)
+        b = a.copy()
+        halo.exchange(b)
+        np.testing.assert_array_equal(a, b)
+
+    def test_iallreduce(self):
+        a = np.arange(10.)
+        requests = [parallel.iallreduce(a), parallel.iallreduce(np.ones(3))]
+        parallel.waitall(requests)
+        np.testing.assert_array_equal(a, np.arange(10.) * parallel.size)
+
+
+    def test_lowp_codecs(self):
+        x = np.random.randn(1000).astype(np.float32) * 100
+        for precision, rtol in [('float16', 2 ** -11), ('bfloat16', 2 ** -8)]:
+            pack, unpack = parallel._CODECS[precision]
+            h = pack(x)
+            self.assertEqual(h.dtype, np.uint16)
+            np.testing.assert_allclose(unpack(h), x, rtol=rtol)
+        # round to nearest even
+        pack, unpack = parallel._CODECS['bfloat16']
+        np.testing.assert_array_equal(unpack(pack(np.array([1 + 2 ** -8, 1 + 3 * 2 ** -8], dtype=np.float32))),
+                                      [1., 1 + 2 ** -6])
+
+    def test_scatter_dict(self):
+        keys = [[i for i in range(10) if i % parallel.size == r] for r in range(parallel.size)]
+        dct = {i: np.full((4, 5), i, dtype=np.float32) for i in range(9)} if parallel.master else {}
+        out = parallel.scatter_dict(dct, keys)
+        self.assertEqual(sorted(out.keys()), [k for k in keys[parallel.rank] if k < 9])
+        for k, v in out.items():
+            np.testing.assert_array_equal(v, np.full((4, 5), k, dtype=np.float32))
+
+    def test_allreduce_box(self):
+        a = np.random.rand(2, 10, 12) + 1j
+        b = a.copy()
+        parallel.allreduce_box(b, (2, 3), (6, 9), 'bfloat16', np.zeros(a.shape, dtype=np.complex64))
+        if not parallel.MPIenabled:
+            np.testing.assert_array_equal(a, b)
+
+
+if __name__ == '__main__':
+    unittest.main()
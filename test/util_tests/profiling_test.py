@@ -0,0 +1,109 @@
+import unittest
+import json
+import os
+import tempfile
+import threading
+from ptypy.utils.profiling import Profiler
+
+
+class ProfilingTest(unittest.TestCase):
+
+    def test_disabled(self):
+        prof = Profiler()
+        with prof.region('a'):
+            prof.count('frames', 10)
+        self.assertEqual(prof.totals(), {})
+        self.assertEqual(prof.counters, {})
+        self.assertEqual(prof.events, [])
+
+    def test_nested_regions(self):
+        prof = Profiler(enabled=True)
+        for i in range(3):
+            with prof.region('outer'):
+                with prof.region('inner'):
+                    pass
+        totals = prof.totals()
+        self.assertEqual(sorted(totals.keys()), ['outer', 'outer/inner'])
+        self.assertEqual(totals['outer'][0], 3)
+        self.assertEqual(totals['outer/inner'][0], 3)
+        self.assertGreaterEqual(totals['outer'][1], totals['outer/inner'][1])
+        self.assertEqual(list(prof.totals(prefix='outer/').keys()), ['outer/inner'])
+
+    def test_region_exception(self):
+        prof = Profiler(enabled=True)
+        with self.assertRaises(ValueError):
+            with prof.region('a'):
+                raise ValueError()
+        with prof.region('b'):
+            pass
+        self.assertEqual(sorted(prof.totals().keys()), ['a', 'b'])
+
+    def test_threads(self):
+        prof = Profiler(enabled=True)
+
+        def work():
+            with prof.region('thread'):
+                with prof.region('inner'):
+                    prof.count('calls')
+
+        with prof.region('main'):
+            threads = [threading.Thread(target=work) for i in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        totals = prof.totals()
+        self.assertEqual(totals['thread/inner'][0], 4)
+        self.assertNotIn('main/thread', totals)
+        self.assertEqual(prof.counters['calls'], 4)
+
+    def test_counters(self):
+        prof = Profiler(enabled=True)
+        prof.count('frames', 10)
+        prof.count('frames', 5)
+        prof.count('calls')
+        self.assertEqual(prof.counters, {'frames': 15, 'calls': 1})
+
+    def test_max_events(self):
+        prof = Profiler(enabled=True, max_events=2)
+        for i in range(5):
+            with prof.region('a'):
+                pass
+        self.assertEqual(len(prof.events), 2)
+        self.assertEqual(prof.totals()['a'][0], 5)
+
+    def test_report(self):
+        prof = Profiler(enabled=True)
+        with prof.region('a'):
+            prof.count('bytes', 64)
+        rep = prof.report()
+        self.assertEqual(rep['regions']['a']['calls'], {'min': 1., 'max': 1., 'mean': 1.})
+        self.assertEqual(rep['counters']['bytes']['max'], 64)
+
+    def test_save(self):
+        prof = Profiler(enabled=True)
+        with prof.region('a'):
+            with prof.region('b'):
+                prof.count('frames', 2)
+        with tempfile.TemporaryDirectory() as tmp:
+            fname = os.path.join(tmp, 'profile.json')
+            prof.save(fname)
+            with open(fname) as f:
+                out = json.load(f)
+        regions = [e for e in out['traceEvents'] if e['ph'] == 'X']
+        counters = [e for e in out['traceEvents'] if e['ph'] == 'C']
+        self.assertEqual(sorted(e['args']['path'] for e in regions), ['a', 'a/b'])
+        self.assertEqual(counters[0]['args'], {'frames': 2})
+        self.assertIn('a/b', out['otherData']['regions'])
+
+    def test_clear(self):
+        prof = Profiler(enabled=True)
+        with prof.region('a'):
+            prof.count('frames')
+        prof.clear()
+        self.assertEqual(prof.totals(), {})
+        self.assertEqual(prof.counters, {})
+
+
+if __name__ == '__main__':
+    unittest.main()